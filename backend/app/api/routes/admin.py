@@ -0,0 +1,28 @@
+import secrets
+from fastapi import APIRouter, Depends, Header, HTTPException
+from app.core.config import settings
+from app.core.tracing import slow_request_log
+
+router = APIRouter()
+
+
+def require_admin(x_admin_token: str = Header(None)):
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail={"error": "ADMIN_DISABLED", "message": "Set ADMIN_TOKEN to enable admin endpoints"})
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail={"error": "FORBIDDEN", "message": "Invalid admin token"})
+
+
+@router.get("/slow-requests", dependencies=[Depends(require_admin)])
+def get_slow_requests():
+    """Span trees of the most recent requests over SLOW_REQUEST_THRESHOLD_MS, newest first."""
+    return {
+        "threshold_ms": settings.SLOW_REQUEST_THRESHOLD_MS,
+        "requests": slow_request_log.entries(),
+    }
+
+
+@router.delete("/slow-requests", dependencies=[Depends(require_admin)])
+def clear_slow_requests():
+    slow_request_log.clear()
+    return {"status": "cleared"}
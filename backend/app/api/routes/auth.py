@@ -1,17 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 from app.db.session import get_db
-from app.core.config import settings
+from app.core.config import settings, google_client_options
 from app.core.constants import SCOPES
 from app.services.token_service import TokenService
+from app.services.gmail_service import GmailService
+from app.services.mailbox_sync import MailboxSyncService
+from app.services.profile_service import ProfileService
+from app.services.cache_warmer import cache_warmer
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from datetime import datetime, timedelta
+import logging
 import os
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # Allow HTTP for local testing and relax scope validation
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
@@ -25,8 +31,8 @@ def login():
             "web": {
                 "client_id": settings.GOOGLE_CLIENT_ID,
                 "client_secret": settings.GOOGLE_CLIENT_SECRET,
-                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                "token_uri": "https://oauth2.googleapis.com/token",
+                "auth_uri": settings.GOOGLE_AUTH_URI,
+                "token_uri": settings.GOOGLE_TOKEN_URI,
             }
         },
         scopes=SCOPES,
@@ -44,14 +50,14 @@ def login():
 
 
 @router.get("/callback")
-def callback(request: Request, code: str, db: Session = Depends(get_db)):
+def callback(request: Request, code: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     flow = Flow.from_client_config(
         {
             "web": {
                 "client_id": settings.GOOGLE_CLIENT_ID,
                 "client_secret": settings.GOOGLE_CLIENT_SECRET,
-                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                "token_uri": "https://oauth2.googleapis.com/token",
+                "auth_uri": settings.GOOGLE_AUTH_URI,
+                "token_uri": settings.GOOGLE_TOKEN_URI,
             }
         },
         scopes=SCOPES,
@@ -61,7 +67,7 @@ def callback(request: Request, code: str, db: Session = Depends(get_db)):
     flow.fetch_token(code=code)
     credentials = flow.credentials
     try:
-        service = build('oauth2', 'v2', credentials=credentials)
+        service = build('oauth2', 'v2', credentials=credentials, client_options=google_client_options())
         user_info = service.userinfo().get().execute()
         email = user_info.get('email')
         if not email:
@@ -79,8 +85,26 @@ def callback(request: Request, code: str, db: Session = Depends(get_db)):
         refresh_token=credentials.refresh_token,
         expiry=expiry
     )
+    ProfileService.save(db, email, user_info.get('name'), user_info.get('picture'))
     
-    # Store user identity in session
+    if settings.GMAIL_PUSH_TOPIC:
+        try:
+            MailboxSyncService.start_watch(db, GmailService.from_tokens(TokenService.get_tokens(db, email=email)),
+                                           settings.GMAIL_PUSH_TOPIC)
+        except Exception as e:
+            # Login still works without push; the inbox falls back to polling
+            logger.warning(f"Could not start Gmail watch for {email}: {e}")
+
+    if settings.CACHE_WARMUP_ON_LOGIN:
+        # Runs while the browser follows the redirect, so the first inbox load is a cache hit
+        background_tasks.add_task(cache_warmer.warm_user, email)
+
+    # Store user identity in session. Logging in again while signed in links
+    # another account; the newest login becomes the active one.
+    accounts = request.session.get("accounts") or ([request.session["user"]] if request.session.get("user") else [])
+    if email not in accounts:
+        accounts.append(email)
+    request.session["accounts"] = accounts
     request.session["user"] = email
     
     return RedirectResponse(f"{settings.FRONTEND_URL}")
@@ -92,17 +116,35 @@ def status(request: Request, db: Session = Depends(get_db)):
     if not user_email:
         return {"authenticated": False}
         
-    tokens = TokenService.get_tokens(db, email=user_email)
-    return {"authenticated": tokens is not None}
+    return {"authenticated": TokenService.has_tokens(db, email=user_email)}
+
+
+@router.get("/accounts")
+def linked_accounts(request: Request):
+    """Accounts linked to this session; 'active' is the one single-account endpoints use."""
+    user_email = request.session.get("user")
+    if not user_email:
+        raise HTTPException(status_code=401, detail={"error": "AUTH_REQUIRED", "message": "User must login"})
+    return {"active": user_email, "accounts": request.session.get("accounts") or [user_email]}
 
 
 @router.get("/me")
-def get_user_profile(request: Request, db: Session = Depends(get_db)):
+def get_user_profile(request: Request, refresh: bool = Query(False, description="Re-read the profile from Google"),
+                     db: Session = Depends(get_db)):
     """Get the authenticated user's profile information."""
     user_email = request.session.get("user")
     if not user_email:
         raise HTTPException(status_code=401, detail={"error": "AUTH_REQUIRED", "message": "User must login"})
 
+    if not TokenService.has_tokens(db, email=user_email):
+        raise HTTPException(status_code=401, detail={"error": "AUTH_REQUIRED", "message": "User must login"})
+
+    # Stored at login; only go to Google when asked or for accounts linked before profiles were kept
+    if not refresh:
+        profile = ProfileService.get(db, user_email)
+        if profile is not None:
+            return profile
+
     tokens = TokenService.get_tokens(db, email=user_email)
     if not tokens:
         raise HTTPException(status_code=401, detail={"error": "AUTH_REQUIRED", "message": "User must login"})
@@ -111,23 +153,19 @@ def get_user_profile(request: Request, db: Session = Depends(get_db)):
         creds = Credentials(
             token=tokens.access_token,
             refresh_token=tokens.refresh_token,
-            token_uri="https://oauth2.googleapis.com/token",
+            token_uri=settings.GOOGLE_TOKEN_URI,
             client_id=settings.GOOGLE_CLIENT_ID,
             client_secret=settings.GOOGLE_CLIENT_SECRET
         )
         
         # Build the OAuth2 service to get user info
-        oauth2_service = build('oauth2', 'v2', credentials=creds)
+        oauth2_service = build('oauth2', 'v2', credentials=creds, client_options=google_client_options())
         user_info = oauth2_service.userinfo().get().execute()
-        
-        return {
-            "email": user_info.get("email"),
-            "name": user_info.get("name"),
-            "picture": user_info.get("picture")
-        }
     except Exception as e:
         raise HTTPException(status_code=401, detail={"error": "AUTH_FAILED", "message": str(e)})
 
+    return ProfileService.save(db, user_email, user_info.get("name"), user_info.get("picture"))
+
 
 @router.get("/logout")
 def logout(request: Request, db: Session = Depends(get_db)):
@@ -1,15 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
+import secrets
+from datetime import date
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from googleapiclient.errors import HttpError
 from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.services.token_service import TokenService
 from app.services.gmail_service import GmailService
-from app.schemas.email import EmailPreview, SendEmailRequest, EmailDetail, PaginatedEmails, ReplyEmailRequest, ForwardEmailRequest
+from app.services.outbox_service import OutboxService
+from app.services.outbox_worker import outbox_worker
+from app.services.gmail_service import HistoryExpiredError, pack_detail, unpack_detail
+from app.services.mailbox_sync import MailboxSyncService, apply_push_notification, build_delta, collect_changes, decode_push_envelope, invalidate_user_cache
+from app.services.mail_events import mail_events
+from app.services.unified_inbox import UnifiedInbox
+from app.services.sync_job_service import SyncJobService
+from app.services.full_sync_worker import full_sync_worker
+from app.services.mail_index import find_similar
+from app.services.context_builder import context_builder
+from app.services.mailbox_analytics import mailbox_analytics
+from app.services.contact_index import contact_index
+from app.services.label_writer import label_writer
+from app.services.label_counters import label_counters, sync_history
+from app.schemas.email import EmailPreview, ScoredEmail, SendEmailRequest, EmailDetail, PaginatedEmails, ReplyEmailRequest, ForwardEmailRequest, LabelChangeAccepted, ModifyLabelsRequest
+from app.schemas.outbox import OutboxAccepted, OutboxStatus
+from app.schemas.analytics import MailboxAnalytics
+from app.schemas.contact import ContactSuggestion
+from app.schemas.label import LabelInfo
+from app.schemas.sync import MailboxDelta, SyncJobStatus, WatchStatus
 from app.core.config import settings
-from app.core.cache import cache_response
+from app.core.blob_store import blob_store
+from app.core.cache import INBOX_NAMESPACE, LABEL_COUNTS_NAMESPACE, MESSAGE_DETAIL_NAMESPACE, SENT_NAMESPACE, cache_manager, cache_response
+from app.core.tracing import traced
 
 router = APIRouter()
 
 
+@traced("dependency.get_current_user")
+def get_current_user(request: Request, db: Session = Depends(get_db)) -> str:
+    """Session user with stored tokens, for routes that don't need a Gmail client."""
+    user_email = request.session.get("user")
+    if not user_email:
+        raise HTTPException(status_code=401, detail={"error": "AUTH_REQUIRED", "message": "User must login"})
+
+    if not TokenService.get_tokens(db, email=user_email):
+        request.session.clear()
+        raise HTTPException(status_code=401, detail={"error": "AUTH_REQUIRED", "message": "User must login again"})
+    TokenService.touch(db, user_email)
+    return user_email
+
+
+def _queue(db: Session, user_email: str, kind: str, payload: dict, idempotency_key: str) -> OutboxAccepted:
+    entry = OutboxService.enqueue(db, user_email, kind, payload, idempotency_key=idempotency_key)
+    outbox_worker.wake()
+    return OutboxAccepted(status=entry.status, outbox_id=entry.id)
+
+
+@traced("dependency.get_gmail_service")
 def get_gmail_service(request: Request, db: Session = Depends(get_db)) -> GmailService:
     user_email = request.session.get("user")
     if not user_email:
@@ -20,55 +66,300 @@ def get_gmail_service(request: Request, db: Session = Depends(get_db)) -> GmailS
         # If tokens are missing for the user (e.g. cleared but session remains), force relogin
         request.session.clear()
         raise HTTPException(status_code=401, detail={"error": "AUTH_REQUIRED", "message": "User must login again"})
-    
-    token_data = {
-        'access_token': tokens.access_token,
-        'refresh_token': tokens.refresh_token,
-        'client_id': settings.GOOGLE_CLIENT_ID,
-        'client_secret': settings.GOOGLE_CLIENT_SECRET
-    }
+    TokenService.touch(db, user_email)
     
     try:
-        service = GmailService(token_data)
+        service = GmailService.from_tokens(tokens)
         return service
     except Exception as e:
         # If refreshing fails or other auth issues
         raise HTTPException(status_code=401, detail={"error": "AUTH_FAILED", "message": str(e)})
 
+def get_linked_accounts(request: Request, db: Session = Depends(get_db)) -> dict:
+    """Stored tokens for every account linked to the session, keyed by email."""
+    user_email = request.session.get("user")
+    if not user_email:
+        raise HTTPException(status_code=401, detail={"error": "AUTH_REQUIRED", "message": "User must login"})
+    accounts = {}
+    for email in request.session.get("accounts") or [user_email]:
+        tokens = TokenService.get_tokens(db, email=email)
+        if tokens:
+            accounts[email] = tokens
+    if not accounts:
+        request.session.clear()
+        raise HTTPException(status_code=401, detail={"error": "AUTH_REQUIRED", "message": "User must login again"})
+    if user_email in accounts:
+        TokenService.touch(db, user_email)
+    return accounts
+
+unified_inbox = UnifiedInbox()
+
 @router.get("/inbox", response_model=PaginatedEmails)
+@cache_response(ttl_seconds=settings.MAILBOX_LIST_CACHE_TTL_SECONDS, namespace=INBOX_NAMESPACE,
+                cacheable=lambda page: not page.partial)
 def get_inbox(page_token: str = Query(None), service: GmailService = Depends(get_gmail_service)):
-    return service.list_inbox_emails(page_token=page_token)
+    page = service.list_inbox_emails(page_token=page_token)
+    page.messages = label_writer.overlay(service.user_email, page.messages, view_label='INBOX')
+    return page
+
+@router.get("/inbox/delta", response_model=MailboxDelta)
+def get_inbox_delta(since: str = Query(None, description="historyId from the previous delta"),
+                    service: GmailService = Depends(get_gmail_service)):
+    """
+    Inbox changes since a historyId. Without `since`, or when Gmail no longer
+    has that history, returns resync=true and the current historyId: reload
+    /inbox, then keep syncing from there.
+    """
+    if since is not None and not since.isdigit():
+        raise HTTPException(status_code=400, detail={"error": "INVALID_HISTORY_ID", "message": "since must be a Gmail historyId"})
+    if since is None:
+        return MailboxDelta(historyId=str(service.get_profile()['historyId']), resync=True)
+    try:
+        result = service.list_history(since)
+    except HistoryExpiredError:
+        return MailboxDelta(historyId=str(service.get_profile()['historyId']), resync=True)
+    return build_delta(service, collect_changes(result['history'], str(result['historyId'])))
+
+@router.get("/unified", response_model=PaginatedEmails)
+def get_unified_inbox(page_token: str = Query(None), max_results: int = Query(20, ge=1, le=100),
+                      accounts: dict = Depends(get_linked_accounts)):
+    """Inbox of every linked account merged by date; page_token is the composite cursor from the previous page."""
+    try:
+        return unified_inbox.list(accounts, page_token=page_token, max_results=max_results)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"error": "INVALID_PAGE_TOKEN", "message": str(e)})
 
 @router.get("/sent", response_model=PaginatedEmails)
+@cache_response(ttl_seconds=settings.MAILBOX_LIST_CACHE_TTL_SECONDS, namespace=SENT_NAMESPACE,
+                cacheable=lambda page: not page.partial)
 def get_sent(page_token: str = Query(None), service: GmailService = Depends(get_gmail_service)):
     return service.list_sent_emails(page_token=page_token)
 
 @router.get("/messages/{message_id}", response_model=EmailDetail)
-@cache_response(ttl_seconds=600)
+@cache_response(ttl_seconds=600, namespace=MESSAGE_DETAIL_NAMESPACE, encode=pack_detail, decode=unpack_detail)
 def get_message_detail(message_id: str, service: GmailService = Depends(get_gmail_service)):
-    return service.get_email_detail(message_id)
+    detail = service.get_email_detail(message_id)
+    label_writer.overlay(service.user_email, [detail])
+    return detail
+
+@router.post("/messages/modify", status_code=202, response_model=LabelChangeAccepted)
+def modify_labels(request: ModifyLabelsRequest, user_email: str = Depends(get_current_user)):
+    """
+    Add and remove labels on messages. Cached lists and details show the
+    change at once; Gmail gets it shortly after, batched with the user's
+    other changes.
+    """
+    if not request.addLabelIds and not request.removeLabelIds:
+        raise HTTPException(status_code=400, detail={"error": "EMPTY_CHANGE", "message": "Pass addLabelIds or removeLabelIds"})
+    if set(request.addLabelIds) & set(request.removeLabelIds):
+        raise HTTPException(status_code=400, detail={"error": "CONFLICTING_LABELS", "message": "A label is both added and removed"})
+    pending = label_writer.modify(user_email, request.ids, request.addLabelIds, request.removeLabelIds)
+    return LabelChangeAccepted(pending=pending)
+
+@router.post("/messages/{message_id}/read", status_code=202, response_model=LabelChangeAccepted)
+def mark_read(message_id: str, unread: bool = Query(False, description="Mark unread instead"),
+              user_email: str = Depends(get_current_user)):
+    if unread:
+        return LabelChangeAccepted(pending=label_writer.modify(user_email, [message_id], add=['UNREAD']))
+    return LabelChangeAccepted(pending=label_writer.modify(user_email, [message_id], remove=['UNREAD']))
 
-@router.post("/send")
-def send_email(request: SendEmailRequest, service: GmailService = Depends(get_gmail_service)):
-    service.send_email(request.to, request.subject, request.body)
-    return {"status": "sent"}
+@router.get("/messages/{message_id}/attachments/{attachment_id}")
+def get_attachment(message_id: str, attachment_id: str,
+                   part_id: str = Query(None, description="The attachment's part_id from the message detail"),
+                   service: GmailService = Depends(get_gmail_service)):
+    """
+    Attachment bytes, kept in the blob store and streamed from it on later
+    requests. Gmail hands out a new attachment id with every messages.get,
+    so the stored copy is found by part_id when the client passes it.
+    """
+    ref = f"{service.user_email}:attachment:{message_id}:" + (f"part:{part_id}" if part_id else attachment_id)
+    digest = blob_store.resolve(ref)
+    chunks = blob_store.iter_chunks(digest) if digest else None
+    if chunks is None:
+        data = service.get_attachment(message_id, attachment_id)
+        digest = blob_store.put(data)
+        blob_store.link(ref, digest)
+        # A concurrent put may already have evicted it; serve the bytes in hand
+        chunks = blob_store.iter_chunks(digest) or iter([data])
+    return StreamingResponse(chunks, media_type="application/octet-stream",
+                             headers={"Cache-Control": "private, max-age=86400", "ETag": f'"{digest}"'})
+
+@router.post("/send", status_code=202, response_model=OutboxAccepted)
+def send_email(request: SendEmailRequest, idempotency_key: str = Header(None),
+               user_email: str = Depends(get_current_user), db: Session = Depends(get_db)):
+    payload = {"to": list(request.to), "subject": request.subject, "body": request.body}
+    return _queue(db, user_email, "send", payload, idempotency_key)
 
 @router.get("/search", response_model=list[EmailPreview])
 @cache_response(ttl_seconds=300)
 def search_emails(q: str = Query(..., description="Gmail search query"), service: GmailService = Depends(get_gmail_service)):
-    return service.search_emails(q)
+    return label_writer.overlay(service.user_email, service.search_emails(q))
+
+@router.get("/similar", response_model=list[ScoredEmail])
+def similar_emails(q: str = Query(None, description="Free text to match"),
+                   message_id: str = Query(None, description="Find messages like this one instead"),
+                   k: int = Query(10, ge=1, le=100),
+                   user_email: str = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Nearest messages in the locally indexed mirror (filled by the full sync), best first."""
+    if not q and not message_id:
+        raise HTTPException(status_code=400, detail={"error": "MISSING_QUERY", "message": "Pass q or message_id"})
+    results = find_similar(db, user_email, text=q, message_id=message_id, k=k)
+    if results is None:
+        raise HTTPException(status_code=404, detail={"error": "NOT_FOUND", "message": "Message is not indexed"})
+    return results
+
+def _context_response(service: GmailService, kind: str, subject: str, history_id: str, items, budget: int):
+    key = context_builder.cache_key(service.user_email, kind, subject, history_id, budget)
+    cached = cache_manager.get(key)
+    if cached is not None:
+        body, source = iter([cached]), "hit"
+    else:
+        body, source = context_builder.stream(service, key, items, budget), "miss"
+    return StreamingResponse(body, media_type="text/plain; charset=utf-8",
+                             headers={"X-History-Id": history_id, "X-Context-Cache": source})
+
+@router.get("/threads/{thread_id}/context")
+def get_thread_context(thread_id: str, budget: int = Query(settings.CONTEXT_TOKEN_BUDGET, ge=100, le=100000),
+                       service: GmailService = Depends(get_gmail_service)):
+    """
+    The thread as plain text for a summarisation prompt, newest message
+    first, without quoted replies or signatures and cut to about `budget`
+    tokens. Streamed as each message is added.
+    """
+    try:
+        history_id, items = context_builder.thread_candidates(service, thread_id)
+    except HttpError as e:
+        if e.resp.status == 404:
+            raise HTTPException(status_code=404, detail={"error": "NOT_FOUND", "message": "Thread not found"})
+        raise
+    return _context_response(service, "thread", thread_id, history_id, items, budget)
+
+@router.get("/context/day")
+def get_day_context(day: date = Query(..., description="YYYY-MM-DD"),
+                    tz_offset: int = Query(0, ge=-720, le=840, description="Minutes east of UTC"),
+                    budget: int = Query(settings.CONTEXT_TOKEN_BUDGET, ge=100, le=100000),
+                    service: GmailService = Depends(get_gmail_service)):
+    """A day of inbox mail as summarisation context, unread messages first."""
+    history_id, items = context_builder.day_candidates(service, day, tz_offset)
+    return _context_response(service, "day", f"{day.isoformat()}{tz_offset:+d}", history_id, items, budget)
+
+@router.post("/messages/{message_id}/reply", status_code=202, response_model=OutboxAccepted)
+def reply_email(message_id: str, request: ReplyEmailRequest, idempotency_key: str = Header(None),
+                user_email: str = Depends(get_current_user), db: Session = Depends(get_db)):
+    payload = {"message_id": message_id, "body": request.body}
+    return _queue(db, user_email, "reply", payload, idempotency_key)
+
+@router.post("/messages/{message_id}/forward", status_code=202, response_model=OutboxAccepted)
+def forward_email(message_id: str, request: ForwardEmailRequest, idempotency_key: str = Header(None),
+                  user_email: str = Depends(get_current_user), db: Session = Depends(get_db)):
+    payload = {"message_id": message_id, "to": list(request.to), "body": request.body}
+    return _queue(db, user_email, "forward", payload, idempotency_key)
 
-@router.post("/messages/{message_id}/reply")
-def reply_email(message_id: str, request: ReplyEmailRequest, service: GmailService = Depends(get_gmail_service)):
-    service.reply_email(message_id, request.body)
-    return {"status": "sent"}
+@router.get("/outbox/{outbox_id}", response_model=OutboxStatus)
+def get_outbox_status(outbox_id: str, user_email: str = Depends(get_current_user), db: Session = Depends(get_db)):
+    entry = OutboxService.get(db, user_email, outbox_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail={"error": "NOT_FOUND", "message": "Outbox entry not found"})
+    return entry
 
-@router.post("/messages/{message_id}/forward")
-def forward_email(message_id: str, request: ForwardEmailRequest, service: GmailService = Depends(get_gmail_service)):
-    service.forward_email(message_id, request.to, request.body)
-    return {"status": "sent"}
+@router.get("/labels", response_model=list[LabelInfo])
+def get_labels(service: GmailService = Depends(get_gmail_service), db: Session = Depends(get_db)):
+    """
+    Every label with its message and unread counts, for folder badges.
+    Served from counters kept current by syncs and local actions; Gmail is
+    only asked on the first load and every LABEL_COUNTERS_REFRESH_SECONDS.
+    Without push or an SSE stream, a history check runs once the counters
+    are MAILBOX_LIST_CACHE_TTL_SECONDS old.
+    """
+    return label_counters.get(service, catch_up=lambda: sync_history(db, service))
+
+@router.get("/labels/counts")
+@cache_response(ttl_seconds=settings.MAILBOX_LIST_CACHE_TTL_SECONDS, namespace=LABEL_COUNTS_NAMESPACE)
+def get_label_counts(service: GmailService = Depends(get_gmail_service)):
+    """Message and thread totals for INBOX, SENT and UNREAD."""
+    return service.get_label_counts()
 
 @router.delete("/messages/{message_id}")
 def delete_email(message_id: str, service: GmailService = Depends(get_gmail_service)):
     service.delete_email(message_id)
+    label_counters.apply_local(service.user_email, [message_id], add=['TRASH'], remove=['INBOX'])
+    invalidate_user_cache(service.user_email, {message_id})
     return {"status": "deleted"}
+
+@router.post("/watch", response_model=WatchStatus)
+def start_watch(service: GmailService = Depends(get_gmail_service), db: Session = Depends(get_db)):
+    """Register (or renew) Gmail push notifications for the current user."""
+    if not settings.GMAIL_PUSH_TOPIC:
+        raise HTTPException(status_code=400, detail={"error": "PUSH_NOT_CONFIGURED", "message": "GMAIL_PUSH_TOPIC is not set"})
+    return MailboxSyncService.start_watch(db, service, settings.GMAIL_PUSH_TOPIC)
+
+@router.post("/sync/full", status_code=202, response_model=SyncJobStatus)
+def start_full_sync(restart: bool = Query(False), user_email: str = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Queue a full-mailbox sync, or resume one that failed or was cancelled."""
+    job = SyncJobService.start(db, user_email, restart=restart)
+    full_sync_worker.wake()
+    return job
+
+@router.get("/sync/full", response_model=SyncJobStatus)
+def get_full_sync(user_email: str = Depends(get_current_user), db: Session = Depends(get_db)):
+    job = SyncJobService.get(db, user_email)
+    if not job:
+        raise HTTPException(status_code=404, detail={"error": "NOT_FOUND", "message": "No full sync has been started"})
+    return job
+
+@router.delete("/sync/full", response_model=SyncJobStatus)
+def cancel_full_sync(user_email: str = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Stop the sync after the page in progress; POST resumes it from there."""
+    job = SyncJobService.cancel(db, user_email)
+    if not job:
+        raise HTTPException(status_code=404, detail={"error": "NOT_FOUND", "message": "No full sync has been started"})
+    return job
+
+@router.get("/analytics", response_model=MailboxAnalytics)
+def get_mailbox_analytics(days: int = Query(30, ge=1, le=366), top: int = Query(10, ge=1, le=100),
+                          tz_offset: int = Query(0, ge=-720, le=840, description="Minutes east of UTC"),
+                          user_email: str = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Top senders, daily and hourly volume, unread backlog by label and reply latency over the mirrored mailbox."""
+    analytics = mailbox_analytics.get(db, user_email, days=days, top=top, tz_offset_minutes=tz_offset)
+    if analytics is None:
+        raise HTTPException(status_code=404, detail={"error": "NOT_FOUND", "message": "No full sync has been started"})
+    return analytics
+
+@router.get("/contacts/suggest", response_model=list[ContactSuggestion])
+def suggest_contacts(prefix: str = Query("", max_length=200), limit: int = Query(8, ge=1, le=50),
+                     user_email: str = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Recipients matching the prefix by address or name word, ranked by how
+    often and how recently mail was exchanged. An empty prefix returns the
+    top contacts.
+    """
+    return contact_index.suggest(db, user_email, prefix, limit)
+
+@router.post("/push", status_code=204)
+def receive_push(background_tasks: BackgroundTasks, envelope: dict = Body(...), token: str = Query(None)):
+    """
+    Pub/Sub push endpoint. Acknowledges immediately and syncs in the
+    background; the subscription URL carries ?token= for verification.
+    """
+    expected = settings.GMAIL_PUSH_VERIFICATION_TOKEN
+    if not expected or not token or not secrets.compare_digest(token, expected):
+        raise HTTPException(status_code=403, detail={"error": "FORBIDDEN", "message": "Invalid push token"})
+    try:
+        email, history_id = decode_push_envelope(envelope)
+    except ValueError:
+        # Acknowledge anyway so Pub/Sub does not redeliver a message we can never read
+        return Response(status_code=204)
+    background_tasks.add_task(apply_push_notification, email, history_id)
+    return Response(status_code=204)
+
+@router.get("/events")
+def stream_mail_events(last_event_id: str = Header(None), user_email: str = Depends(get_current_user)):
+    """
+    Server-Sent Events with inbox deltas ('delta'), 'resync' when the client
+    must reload, and heartbeats. Browsers resume with Last-Event-ID.
+    """
+    return StreamingResponse(
+        mail_events.stream(user_email, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,185 @@
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+EMPTY = b""
+
+
+class BlobStore:
+    """
+    Content-addressed files on disk: a blob's name is the SHA-256 of its
+    bytes, so identical bodies and attachments are stored once and never
+    change. Reads go through mmap, leaving the bytes in the page cache
+    rather than the Python heap. Total size is capped with LRU eviction
+    (recency survives restarts through file mtimes).
+
+    Named refs map stable keys (e.g. a message's body) to a digest so a
+    restarted process can find blobs it wrote earlier.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or settings.BLOB_STORE_DIR
+        self.max_bytes = max_bytes or settings.BLOB_STORE_MAX_BYTES
+        self._lock = threading.Lock()
+        # digest -> size, least recently used first; loaded lazily from disk
+        self._index: Optional["OrderedDict[str, int]"] = None
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def _ref_path(self, name: str) -> str:
+        return os.path.join(self.root, "refs", hashlib.sha256(name.encode()).hexdigest())
+
+    def _load_index(self) -> "OrderedDict[str, int]":
+        if self._index is None:
+            entries = []
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, "blobs")):
+                for filename in filenames:
+                    if filename.startswith("."):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(dirpath, filename))
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, filename, stat.st_size))
+            entries.sort()
+            self._index = OrderedDict((digest, size) for _, digest, size in entries)
+            self.total_bytes = sum(self._index.values())
+        return self._index
+
+    def _write_atomic(self, path: str, data: bytes):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            # Readers (and other processes) only ever see complete files
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def put(self, data: bytes) -> str:
+        """Store bytes and return their digest. Storing existing content only refreshes its recency."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        with self._lock:
+            index = self._load_index()
+            if digest in index and os.path.exists(path):
+                index.move_to_end(digest)
+                return digest
+            self._write_atomic(path, data)
+            index[digest] = len(data)
+            self.total_bytes += len(data)
+            self._evict(keep=digest)
+        return digest
+
+    def _evict(self, keep: str):
+        index = self._index
+        while self.total_bytes > self.max_bytes and len(index) > 1:
+            digest, size = next(iter(index.items()))
+            if digest == keep:
+                index.move_to_end(digest)
+                continue
+            index.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.unlink(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def _forget(self, digest: str):
+        with self._lock:
+            size = self._load_index().pop(digest, None)
+            if size is not None:
+                self.total_bytes -= size
+
+    def open(self, digest: str) -> Optional[memoryview]:
+        """
+        Memory-map a blob read-only. The view stays valid even if the blob is
+        evicted meanwhile. Returns None when the blob is not (or no longer) stored.
+        """
+        path = self._blob_path(digest)
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                # mmap cannot map empty files
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)) if size else memoryview(EMPTY)
+        except FileNotFoundError:
+            self.misses += 1
+            self._forget(digest)
+            return None
+        self.hits += 1
+        with self._lock:
+            index = self._load_index()
+            if digest in index:
+                index.move_to_end(digest)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return view
+
+    def read_text(self, digest: str, encoding: str = "utf-8") -> Optional[str]:
+        view = self.open(digest)
+        if view is None:
+            return None
+        try:
+            return str(view, encoding)
+        finally:
+            view.release()
+
+    def iter_chunks(self, digest: str, chunk_size: int = 65536) -> Optional[Iterator[bytes]]:
+        """Stream a blob in chunks, for responses that should not hold it in memory."""
+        view = self.open(digest)
+        if view is None:
+            return None
+
+        def chunks():
+            try:
+                for offset in range(0, len(view), chunk_size):
+                    yield bytes(view[offset:offset + chunk_size])
+            finally:
+                view.release()
+        return chunks()
+
+    def link(self, name: str, digest: str):
+        self._write_atomic(self._ref_path(name), digest.encode())
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Digest a ref points to, if the ref exists and its blob is still stored."""
+        try:
+            with open(self._ref_path(name), "rb") as f:
+                digest = f.read().decode()
+        except FileNotFoundError:
+            return None
+        return digest if os.path.exists(self._blob_path(digest)) else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            index = self._load_index()
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'blobs': len(index),
+                'bytes': self.total_bytes,
+            }
+
+
+blob_store = BlobStore()
@@ -1,63 +1,353 @@
+import threading
 import time
-from functools import wraps
-from typing import Any, Dict, Optional, Callable
+import zlib
+from functools import lru_cache, wraps
+from typing import Any, Dict, List, Optional, Callable, Tuple
 import logging
+from pydantic import BaseModel, TypeAdapter
+from app.core.config import settings
+from app.core.deadline import CircuitOpenError, DeadlineExceeded, mark_stale
+from app.core.tracing import span
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib is used without it
+    zstandard = None
 
 logger = logging.getLogger(__name__)
 
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: type) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+
+def _serialize(value: Any) -> Optional[Tuple[str, type, bytes]]:
+    """JSON bytes for Pydantic models and lists of one model type; None for anything else."""
+    if isinstance(value, BaseModel):
+        return 'model', type(value), value.model_dump_json().encode()
+    if isinstance(value, list) and value and isinstance(value[0], BaseModel):
+        model = type(value[0])
+        if all(type(item) is model for item in value):
+            return 'models', model, _list_adapter(model).dump_json(value)
+    return None
+
+
+class CompressedEntry:
+    """A cached value kept as compressed JSON; decoded back into models on every hit."""
+    __slots__ = ('kind', 'model', 'codec', 'payload')
+
+    def __init__(self, kind: str, model: type, codec: str, payload: bytes):
+        self.kind = kind
+        self.model = model
+        self.codec = codec
+        self.payload = payload
+
+    def decode(self) -> Any:
+        if self.codec == 'zstd':
+            raw = zstandard.ZstdDecompressor().decompress(self.payload)
+        else:
+            raw = zlib.decompress(self.payload)
+        if self.kind == 'model':
+            return self.model.model_validate_json(raw)
+        return _list_adapter(self.model).validate_json(raw)
+
+
+def _resolve_codec(name: str) -> Optional[str]:
+    if name == 'auto':
+        return 'zstd' if zstandard is not None else 'zlib'
+    if name == 'zstd' and zstandard is None:
+        logger.warning("CACHE_COMPRESSION=zstd but zstandard is not installed; using zlib")
+        return 'zlib'
+    return None if name == 'none' else name
+
+
 class CacheManager:
-    def __init__(self):
+    def __init__(self, compression: Optional[str] = None, compress_min_bytes: Optional[int] = None,
+                 stale_seconds: Optional[float] = None):
         # keyed by (func_name, args, kwargs)
         self._cache: Dict[str, Dict[str, Any]] = {}
+        # How long past expiry an entry can still be served by get_stale
+        self.stale_seconds = settings.CACHE_STALE_SECONDS if stale_seconds is None else stale_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> Event set when the thread computing that key finishes
+        self._inflight: Dict[str, threading.Event] = {}
+        self._inflight_lock = threading.Lock()
+        # Models at least this big (as JSON) are stored compressed
+        self.codec = _resolve_codec(compression or settings.CACHE_COMPRESSION)
+        self.compress_min_bytes = (settings.CACHE_COMPRESS_MIN_BYTES if compress_min_bytes is None
+                                   else compress_min_bytes)
+        # Size accounting covers entries that could be serialized: bytes held vs their JSON size
+        self._size_lock = threading.Lock()
+        self.stored_bytes = 0
+        self.raw_bytes = 0
+        self.compressed_entries = 0
+
+    def _compress(self, raw: bytes) -> bytes:
+        if self.codec == 'zstd':
+            return zstandard.ZstdCompressor(level=3).compress(raw)
+        return zlib.compress(raw, 6)
+
+    def _encode(self, value: Any) -> Tuple[Any, int, int]:
+        """(what to store, bytes held, uncompressed JSON size)."""
+        serialized = _serialize(value) if self.codec else None
+        if serialized is None:
+            return value, 0, 0
+        kind, model, raw = serialized
+        if len(raw) < self.compress_min_bytes:
+            return value, len(raw), len(raw)
+        with span("cache.compress"):
+            payload = self._compress(raw)
+        return CompressedEntry(kind, model, self.codec, payload), len(payload), len(raw)
+
+    def _account(self, item: Optional[Dict[str, Any]], sign: int):
+        """Caller holds _size_lock."""
+        if item is None:
+            return
+        self.stored_bytes += sign * item['size']
+        self.raw_bytes += sign * item['raw_size']
+        if isinstance(item['value'], CompressedEntry):
+            self.compressed_entries += sign
+
+    def _drop(self, key: str) -> bool:
+        with self._size_lock:
+            item = self._cache.pop(key, None)
+            self._account(item, -1)
+        return item is not None
+
+    def _value(self, item: Dict[str, Any]) -> Any:
+        value = item['value']
+        if isinstance(value, CompressedEntry):
+            with span("cache.decompress"):
+                return value.decode()
+        return value
 
     def get(self, key: str) -> Optional[Any]:
         if key in self._cache:
-            item = self._cache[key]
-            if time.time() < item['expiry']:
-                logger.info(f"Cache hit for key: {key}")
-                return item['value']
-            else:
-                logger.info(f"Cache expired for key: {key}")
-                self._cache.pop(key, None)
+            item = self._cache.get(key)
+            now = time.time()
+            if item is not None and now < item['expiry']:
+                self.hits += 1
+                logger.debug(f"Cache hit for key: {key}")
+                return self._value(item)
+            # Expired entries are kept a while longer for get_stale
+            elif item is not None and now >= item['expiry'] + self.stale_seconds:
+                logger.debug(f"Cache expired for key: {key}")
+                self._drop(key)
+                self.evictions += 1
+        self.misses += 1
         return None
 
+    def get_stale(self, key: str) -> Optional[Any]:
+        """
+        The entry under key even if it expired up to stale_seconds ago, for
+        serving something while Gmail is unreachable.
+        """
+        item = self._cache.get(key)
+        if item is None or time.time() >= item['expiry'] + self.stale_seconds:
+            return None
+        logger.debug(f"Serving stale cache for key: {key}")
+        return self._value(item)
+
     def set(self, key: str, value: Any, ttl_seconds: int = 300):
-        self._cache[key] = {
-            'value': value,
-            'expiry': time.time() + ttl_seconds
+        stored, size, raw_size = self._encode(value)
+        item = {
+            'value': stored,
+            'expiry': time.time() + ttl_seconds,
+            'size': size,
+            'raw_size': raw_size,
         }
-        logger.info(f"Cache set for key: {key} with TTL: {ttl_seconds}s")
+        with self._size_lock:
+            self._account(self._cache.get(key), -1)
+            self._cache[key] = item
+            self._account(item, 1)
+        logger.debug(f"Cache set for key: {key} with TTL: {ttl_seconds}s")
+
+    def get_or_set(self, key: str, compute: Callable[[], Any], ttl_seconds: int = 300,
+                   cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Return the cached value, computing and storing it on a miss."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        return self.compute_once(key, compute, ttl_seconds, cacheable=cacheable)
+
+    def compute_once(self, key: str, compute: Callable[[], Any], ttl_seconds: int = 300,
+                     wait_seconds: float = 30, cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Compute and store a missing key, coalescing concurrent misses: callers
+        arriving while another thread computes the same key wait for its result
+        (e.g. the first inbox load racing the login warm-up) instead of
+        repeating the Gmail calls. Values failing `cacheable` are returned but
+        not stored.
+        """
+        with self._inflight_lock:
+            event = self._inflight.get(key)
+            owner = event is None
+            if owner:
+                event = self._inflight[key] = threading.Event()
+
+        if not owner:
+            with span("cache.wait"):
+                event.wait(wait_seconds)
+            value = self.get(key)
+            if value is not None:
+                return value
+            # The other computation failed or is too slow; do our own
+            return compute()
+
+        try:
+            value = compute()
+            if cacheable is None or cacheable(value):
+                with span("cache.store"):
+                    self.set(key, value, ttl_seconds)
+            return value
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def delete(self, key: str) -> bool:
+        return self._drop(key)
+
+    def invalidate_prefix(self, prefix: str, exclude: tuple = ()) -> int:
+        """Drop every key starting with prefix, except those starting with an excluded prefix."""
+        keys = [k for k in list(self._cache) if k.startswith(prefix) and not k.startswith(exclude)]
+        for key in keys:
+            self._drop(key)
+        if keys:
+            logger.debug(f"Cache invalidated {len(keys)} keys under: {prefix}")
+        return len(keys)
+
+    def update_prefix(self, prefix: str, update: Callable[[Any], Any]) -> int:
+        """
+        Rewrite live entries under prefix in place, keeping their expiry.
+        update gets the cached value and returns the new one, or None to
+        leave the entry as it is.
+        """
+        updated = 0
+        for key in [k for k in list(self._cache) if k.startswith(prefix)]:
+            item = self._cache.get(key)
+            if item is None or time.time() >= item['expiry']:
+                continue
+            value = item['value']
+            if isinstance(value, CompressedEntry):
+                value = value.decode()
+            value = update(value)
+            if value is None:
+                continue
+            stored, size, raw_size = self._encode(value)
+            replacement = {'value': stored, 'expiry': item['expiry'], 'size': size, 'raw_size': raw_size}
+            with self._size_lock:
+                # Skip entries replaced or dropped meanwhile
+                if self._cache.get(key) is not item:
+                    continue
+                self._account(item, -1)
+                self._cache[key] = replacement
+                self._account(replacement, 1)
+            updated += 1
+        return updated
 
     def clear(self):
-        self._cache.clear()
+        with self._size_lock:
+            self._cache.clear()
+            self.stored_bytes = self.raw_bytes = self.compressed_entries = 0
         logger.info("Cache cleared")
 
+    def stats(self) -> Dict[str, int]:
+        """Counters exposed on /metrics."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._cache),
+            'bytes': self.stored_bytes,
+            'raw_bytes': self.raw_bytes,
+            'compressed': self.compressed_entries,
+        }
+
 # Global cache manager instance
 cache_manager = CacheManager()
 
-def cache_response(ttl_seconds: int = 300):
+# Namespace of the /messages/{id} detail cache, shared with GmailService so
+# reply and forward can reuse a message the user has just opened.
+MESSAGE_DETAIL_NAMESPACE = "message_detail"
+# First pages of the mailbox lists, also filled by the cache warmer
+INBOX_NAMESPACE = "inbox"
+SENT_NAMESPACE = "sent"
+LABEL_COUNTS_NAMESPACE = "label_counts"
+CONTEXT_NAMESPACE = "context"
+ANALYTICS_NAMESPACE = "analytics"
+
+
+def build_cache_key(namespace: str, user: Optional[str], *args: Any, **kwargs: Any) -> str:
+    """Cache keys start with the user so accounts never share entries."""
+    return f"{user}:{namespace}:{str(args)}:{str(sorted(kwargs.items()))}"
+
+
+def _cache_user(kwargs: Dict[str, Any]) -> Optional[str]:
+    user = kwargs.get('user_email') or getattr(kwargs.get('service'), 'user_email', None)
+    return user if isinstance(user, str) else None
+
+
+def cache_response(ttl_seconds: int = 300, namespace: Optional[str] = None,
+                   encode: Optional[Callable[[Any], Any]] = None, decode: Optional[Callable[[Any], Any]] = None,
+                   cacheable: Optional[Callable[[Any], bool]] = None):
     """
     Decorator to cache the response of a function based on its arguments.
     Works for both sync and async functions if implemented accordingly, 
     but for now we focus on the sync routes in gmail.py.
+    Entries are scoped to the user of the injected 'service' (or 'user_email').
+    encode/decode convert between the response and what is stored (e.g. a
+    reference into the blob store); decode returning None counts as a miss.
+    Responses failing `cacheable` (e.g. partial pages) are not stored.
+    When Gmail is unavailable (circuit open) or the request deadline passes,
+    a recently expired entry is served instead and the response marked stale.
     """
     def decorator(func: Callable):
         @wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
-            # Create a unique key based on function name and arguments
-            # We skip 'service' or 'db' arguments usually if they are injected via Depends
-            # For simplicity, we just use func name and stringified args/kwargs
-            
-            # Filter out 'service' and 'db' from kwargs for key generation
-            cache_kwargs = {k: v for k, v in kwargs.items() if k not in ('service', 'db')}
-            key = f"{func.__name__}:{str(args)}:{str(sorted(cache_kwargs.items()))}"
+            # Filter out injected dependencies from kwargs for key generation
+            cache_kwargs = {k: v for k, v in kwargs.items() if k not in ('service', 'db', 'user_email')}
+            key = build_cache_key(namespace or func.__name__, _cache_user(kwargs), *args, **cache_kwargs)
             
-            cached_value = cache_manager.get(key)
+            with span("cache.lookup"):
+                cached_value = cache_manager.get(key)
             if cached_value is not None:
-                return cached_value
-            
-            result = func(*args, **kwargs)
-            cache_manager.set(key, result, ttl_seconds)
-            return result
+                if decode is None:
+                    return cached_value
+                value = decode(cached_value)
+                if value is not None:
+                    return value
+                cache_manager.delete(key)
+
+            def load() -> Any:
+                if encode is None:
+                    return cache_manager.compute_once(key, lambda: func(*args, **kwargs), ttl_seconds,
+                                                      cacheable=cacheable)
+
+                computed = []
+                def compute():
+                    computed.append(func(*args, **kwargs))
+                    return encode(computed[0])
+                stored = cache_manager.compute_once(key, compute, ttl_seconds,
+                                                    cacheable=cacheable and (lambda _: cacheable(computed[0])))
+                if computed:
+                    return computed[0]
+                # Another request computed it while we waited
+                value = decode(stored)
+                return value if value is not None else func(*args, **kwargs)
+
+            try:
+                return load()
+            except (CircuitOpenError, DeadlineExceeded):
+                stale = cache_manager.get_stale(key)
+                if stale is not None and decode is not None:
+                    stale = decode(stale)
+                if stale is None:
+                    raise
+                mark_stale()
+                return stale
         return wrapper
     return decorator
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "MailFlowAI Backend"
@@ -7,6 +8,11 @@ class Settings(BaseSettings):
     GOOGLE_CLIENT_ID: str
     GOOGLE_CLIENT_SECRET: str
     GOOGLE_REDIRECT_URI: str
+
+    # Point these at loadtest.fake_gmail to run without real Google services
+    GOOGLE_AUTH_URI: str = "https://accounts.google.com/o/oauth2/auth"
+    GOOGLE_TOKEN_URI: str = "https://oauth2.googleapis.com/token"
+    GOOGLE_API_ENDPOINT: Optional[str] = None
     
     SECRET_KEY: str
 
@@ -14,6 +20,125 @@ class Settings(BaseSettings):
     FRONTEND_URL: str
     
     DATABASE_URL: str = "sqlite:///./dev.db"
+
+    # Per-user Gmail scheduling. Gmail allows 250 quota units per user per second.
+    GMAIL_QUOTA_UNITS_PER_SECOND: float = 250
+    GMAIL_MAX_CONCURRENCY: int = 10
+    GMAIL_MAX_RETRIES: int = 4
+    GMAIL_BACKOFF_BASE_SECONDS: float = 0.5
+    GMAIL_BACKOFF_MAX_SECONDS: float = 16
+    # Users whose quota bucket, concurrency limit and breakers are kept in memory
+    GMAIL_SCHEDULER_CACHED_USERS: int = 10000
+    # Time limits for Gmail: per socket operation, and per API request for all its calls
+    # together (pages return what they have with partial=true); SSE and push are exempt
+    GMAIL_HTTP_TIMEOUT_SECONDS: float = 10
+    REQUEST_DEADLINE_SECONDS: float = 20
+    # After this many consecutive failures of a Gmail method for a user, fail it
+    # fast (serving stale cache where there is one) and try again after the reset time
+    GMAIL_BREAKER_FAILURES: int = 5
+    GMAIL_BREAKER_RESET_SECONDS: float = 30
+
+    # Background sender threads draining the outbox (0 disables them)
+    OUTBOX_WORKERS: int = 2
+    OUTBOX_POLL_SECONDS: float = 1.0
+    OUTBOX_MAX_ATTEMPTS: int = 8
+
+    # Full-mailbox backfill into mirrored_messages (0 runners disables it)
+    FULL_SYNC_RUNNERS: int = 1
+    FULL_SYNC_FETCH_WORKERS: int = 4
+    FULL_SYNC_PAGE_SIZE: int = 500
+    FULL_SYNC_BATCH_SIZE: int = 50
+    # Kept below GMAIL_QUOTA_UNITS_PER_SECOND so the user's own requests aren't starved
+    FULL_SYNC_UNITS_PER_SECOND: float = 150
+    FULL_SYNC_POLL_SECONDS: float = 5.0
+
+    # Index message bodies and attachment descriptors in the full sync (fetches format=raw)
+    FULL_SYNC_FETCH_BODIES: bool = False
+
+    # Raw-message MIME parsing in a process pool (0 workers parses in the calling thread)
+    MIME_PARSE_WORKERS: int = 2
+    # Messages queued or being parsed before submitters block
+    MIME_PARSE_MAX_PENDING: int = 64
+    # Smaller messages are parsed inline; the process round trip costs more than the parse
+    MIME_PARSE_INLINE_BYTES: int = 16384
+    # Build /messages/{id} from format=raw (adds attachment descriptors) instead of format=full
+    MESSAGE_DETAIL_FROM_RAW: bool = False
+
+    # Gmail push notifications (users.watch). Watching is off unless a Pub/Sub
+    # topic is configured; the push subscription must append ?token=<value>.
+    GMAIL_PUSH_TOPIC: Optional[str] = None
+    GMAIL_PUSH_VERIFICATION_TOKEN: Optional[str] = None
+
+    # Live inbox updates over SSE (GET /api/gmail/events)
+    MAIL_EVENTS_POLL_SECONDS: float = 30
+    MAIL_EVENTS_HEARTBEAT_SECONDS: float = 15
+    MAIL_EVENTS_BUFFER_SIZE: int = 200
+
+    # Cached models whose JSON is at least this big are stored compressed
+    # ('auto' uses zstd when the zstandard package is installed, else zlib; 'none' disables)
+    CACHE_COMPRESSION: str = "auto"
+    CACHE_COMPRESS_MIN_BYTES: int = 1024
+
+    # Expired entries are kept this much longer and served while Gmail is unavailable
+    CACHE_STALE_SECONDS: int = 600
+
+    # First inbox/sent pages and label counts are cached this long (sync invalidates them sooner)
+    MAILBOX_LIST_CACHE_TTL_SECONDS: int = 60
+
+    # Cache warm-up after login and, optionally, for recently active users at startup
+    CACHE_WARMUP_ON_LOGIN: bool = True
+    CACHE_WARMUP_ON_STARTUP: bool = False
+    CACHE_WARMUP_ACTIVE_WITHIN_HOURS: float = 24
+    CACHE_WARMUP_QUOTA_UNITS: int = 250
+
+    # On-disk content-addressed store for message bodies and attachments (LRU beyond the cap)
+    BLOB_STORE_DIR: str = "./blob_store"
+    BLOB_STORE_MAX_BYTES: int = 512 * 1024 * 1024
+
+    # Summarisation contexts (GET /api/gmail/threads/{id}/context, /api/gmail/context/day)
+    CONTEXT_TOKEN_BUDGET: int = 4000
+    CONTEXT_MAX_MESSAGES: int = 50
+    # Entries are keyed by historyId, so they never go stale; the TTL only bounds memory
+    CONTEXT_CACHE_TTL_SECONDS: int = 3600
+
+    # GET /api/gmail/analytics: mailboxes whose columns stay in memory, and how long results are cached
+    ANALYTICS_CACHED_MAILBOXES: int = 8
+    ANALYTICS_CACHE_TTL_SECONDS: int = 300
+
+    # Recipient autocomplete (GET /api/gmail/contacts/suggest): users kept in memory, and how
+    # quickly a contact's old messages stop counting towards its rank
+    CONTACTS_CACHED_USERS: int = 100
+    CONTACTS_HALF_LIFE_DAYS: float = 90
+
+    # Label changes (POST /api/gmail/messages/modify) are written to Gmail this long after a
+    # user's first unwritten change, so changes made in between share batchModify calls
+    LABEL_WRITE_DELAY_SECONDS: float = 2.0
+    LABEL_WRITE_MAX_ATTEMPTS: int = 5
+
+    # GET /api/gmail/labels: counters are kept current from history and local actions,
+    # and refetched from Gmail this often to pick up new labels and anything missed.
+    # Users without push or an SSE stream get a history check once counters are
+    # MAILBOX_LIST_CACHE_TTL_SECONDS old. Counters are kept for this many users.
+    LABEL_COUNTERS_REFRESH_SECONDS: float = 900
+    LABEL_COUNTERS_CACHED_USERS: int = 1000
+
+    # Per-user hashed text vectors of mirrored messages for GET /api/gmail/similar
+    MAIL_INDEX_DIR: str = "./mail_index"
+    # Changing the dimension needs the index directory removed and a full sync restarted
+    MAIL_INDEX_DIM: int = 256
+
+    # /api/auth/me serves the profile stored at login from memory for this long
+    PROFILE_CACHE_TTL_SECONDS: int = 86400
+    # /api/auth/status trusts its in-memory token-presence answer for this long
+    # (logins and logouts on this process update it immediately)
+    TOKEN_PRESENCE_TTL_SECONDS: float = 300
+
+    # Requests slower than this keep their full span tree for /api/admin/slow-requests
+    SLOW_REQUEST_THRESHOLD_MS: float = 1000
+    SLOW_REQUEST_BUFFER_SIZE: int = 100
+
+    # Admin endpoints are disabled unless a token is configured
+    ADMIN_TOKEN: Optional[str] = None
     
     class Config:
         env_file = ".env"
@@ -23,3 +148,10 @@ def get_settings():
     return Settings()
 
 settings = get_settings()
+
+
+def google_client_options():
+    """client_options for googleapiclient.discovery.build, honouring GOOGLE_API_ENDPOINT."""
+    if settings.GOOGLE_API_ENDPOINT:
+        return {"api_endpoint": settings.GOOGLE_API_ENDPOINT}
+    return None
@@ -0,0 +1,109 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from app.core.config import settings
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before a Gmail call could start."""
+
+
+class CircuitOpenError(Exception):
+    """Calls to a Gmail method kept failing, so it is not tried again until the breaker lets a trial call through."""
+
+    def __init__(self, user: str, method: str, retry_in: float):
+        super().__init__(f"Gmail {method} unavailable for {user}; retrying in {retry_in:.0f}s")
+        self.method = method
+        self.retry_in = retry_in
+
+
+class RequestBudget:
+    """Mutable per-request state shared with worker threads through a context var."""
+
+    __slots__ = ("deadline", "stale")
+
+    def __init__(self, deadline: float):
+        # time.monotonic() value after which no new Gmail call starts
+        self.deadline = deadline
+        # Set when any part of the response came from an expired cache entry
+        self.stale = False
+
+
+_budget: ContextVar[Optional[RequestBudget]] = ContextVar("request_budget", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: float):
+    """Give the enclosed code `seconds` to finish, or less if an outer scope ends sooner."""
+    outer = _budget.get()
+    deadline = time.monotonic() + seconds
+    budget = RequestBudget(min(deadline, outer.deadline) if outer is not None else deadline)
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        if outer is not None:
+            outer.stale = outer.stale or budget.stale
+        _budget.reset(token)
+
+
+@contextmanager
+def no_deadline():
+    """Run work started by a request but outliving it (a BackgroundTask) without the request's deadline."""
+    token = _budget.set(None)
+    try:
+        yield
+    finally:
+        _budget.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current deadline; None outside any (background jobs)."""
+    budget = _budget.get()
+    return None if budget is None else budget.deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check_deadline(what: str = "request"):
+    if expired():
+        raise DeadlineExceeded(f"Deadline passed before {what}")
+
+
+def mark_stale():
+    budget = _budget.get()
+    if budget is not None:
+        budget.stale = True
+
+
+class DeadlineMiddleware:
+    """
+    Pure ASGI middleware giving each request REQUEST_DEADLINE_SECONDS for
+    its Gmail calls, and a `Warning: 110` header when it served stale
+    cache. Long-lived streams and the push endpoint, whose sync runs after
+    the response, are exempt.
+    """
+
+    EXEMPT_PATHS = ("/api/gmail/events", "/api/gmail/push")
+
+    def __init__(self, app, seconds: Optional[float] = None):
+        self.app = app
+        self.seconds = seconds or settings.REQUEST_DEADLINE_SECONDS
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        with deadline_scope(self.seconds) as budget:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start" and budget.stale:
+                    message["headers"] = list(message.get("headers", [])) + [(b"warning", b'110 - "Response is Stale"')]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,182 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+
+REQUEST_LATENCY = Histogram(
+    "mailflow_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "mailflow_http_requests_in_flight",
+    "HTTP requests currently being served",
+)
+
+GMAIL_API_LATENCY = Histogram(
+    "mailflow_gmail_api_duration_seconds",
+    "Gmail API call latency by method",
+    ["method", "outcome"],
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+GMAIL_CALLS_PER_REQUEST = Histogram(
+    "mailflow_gmail_calls_per_request",
+    "Number of Gmail API calls made while serving one HTTP request",
+    ["route"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+)
+
+GMAIL_RETRIES = Counter(
+    "mailflow_gmail_retries_total",
+    "Gmail API calls retried by the quota scheduler",
+    ["method", "reason"],
+)
+
+GMAIL_CIRCUIT_OPENED = Counter(
+    "mailflow_gmail_circuit_opened_total",
+    "Times a per-user circuit breaker opened for a Gmail method",
+    ["method"],
+)
+
+TOKEN_REFRESHES = Counter(
+    "mailflow_token_refreshes_total",
+    "OAuth access token refreshes performed during Gmail API calls",
+)
+
+LABEL_CHANGES = Counter(
+    "mailflow_label_changes_total",
+    "Message label changes queued by the write-behind buffer, written to Gmail or dropped",
+    ["stage"],
+)
+
+
+class RequestStats:
+    """Mutable per-request counters shared with worker threads through a context var."""
+
+    __slots__ = ("gmail_calls",)
+
+    def __init__(self):
+        self.gmail_calls = 0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def observe_gmail_call(method: str, duration: float, outcome: str = "ok"):
+    """Record a single Gmail API call. Called by GmailService after every execute()."""
+    GMAIL_API_LATENCY.labels(method=method, outcome=outcome).observe(duration)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.gmail_calls += 1
+
+
+def _route_label(scope) -> str:
+    # FastAPI stores the matched route on the scope, which gives us the path
+    # template ("/api/gmail/messages/{message_id}") rather than raw paths.
+    # Routes inside included routers may only know their own suffix, so the
+    # router prefix is recovered from the leading segments of the real path.
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if not template:
+        return "unmatched"
+    suffix_segments = template.strip("/").split("/")
+    path_segments = scope["path"].strip("/").split("/")
+    prefix = path_segments[:max(len(path_segments) - len(suffix_segments), 0)]
+    if not prefix:
+        return template
+    return "/" + "/".join(prefix) + template
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route latency and in-flight requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            route = _route_label(scope)
+            REQUEST_LATENCY.labels(
+                method=scope["method"], route=route, status=str(status_holder["status"])
+            ).observe(duration)
+            GMAIL_CALLS_PER_REQUEST.labels(route=route).observe(stats.gmail_calls)
+            _request_stats.reset(token)
+
+
+class CacheCollector:
+    """Exposes CacheManager statistics at scrape time so the hot path only bumps ints."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def collect(self):
+        stats = self.cache.stats()
+        for name in ("hits", "misses", "evictions"):
+            counter = CounterMetricFamily(f"mailflow_cache_{name}", f"CacheManager {name}")
+            counter.add_metric([], stats[name])
+            yield counter
+        size = GaugeMetricFamily("mailflow_cache_entries", "Entries currently held by CacheManager")
+        size.add_metric([], stats["size"])
+        yield size
+        for name, key, help_text in (
+            ("bytes", "bytes", "Bytes held by serializable cache entries (compressed size where compressed)"),
+            ("raw_bytes", "raw_bytes", "JSON size of the same entries before compression"),
+            ("compressed_entries", "compressed", "Cache entries stored compressed"),
+        ):
+            gauge = GaugeMetricFamily(f"mailflow_cache_{name}", help_text)
+            gauge.add_metric([], stats[key])
+            yield gauge
+
+
+def register_cache_collector(cache):
+    REGISTRY.register(CacheCollector(cache))
+
+
+class BlobStoreCollector:
+    """Exposes BlobStore statistics at scrape time."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def collect(self):
+        stats = self.store.stats()
+        for name in ("hits", "misses", "evictions"):
+            counter = CounterMetricFamily(f"mailflow_blob_store_{name}", f"BlobStore {name}")
+            counter.add_metric([], stats[name])
+            yield counter
+        for name, help_text in (("blobs", "Blobs currently stored"), ("bytes", "Bytes currently stored")):
+            gauge = GaugeMetricFamily(f"mailflow_blob_store_{name}", help_text)
+            gauge.add_metric([], stats[name])
+            yield gauge
+
+
+def register_blob_store_collector(store):
+    REGISTRY.register(BlobStoreCollector(store))
+
+
+def render_metrics():
+    """Return the Prometheus text exposition and its content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
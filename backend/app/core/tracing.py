@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+
+class Span:
+    """A timed unit of work. Children are appended from any thread serving the request."""
+
+    __slots__ = ("name", "start", "end", "children")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: List["Span"] = []
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        origin = self.start if origin is None else origin
+        return {
+            "name": self.name,
+            "offset_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration_ms, 3),
+            "children": [child.to_dict(origin) for child in list(self.children)],
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str):
+    """
+    Time a block as a child of the current span.
+    Outside of a traced request this is a no-op so services stay usable from scripts and tests.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.finish()
+        _current_span.reset(token)
+
+
+def traced(name: str):
+    """Decorator form of span() for service methods."""
+    def decorator(func: Callable):
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SlowRequestLog:
+    """Fixed-size ring buffer of span trees for requests over the slow threshold."""
+
+    def __init__(self, maxlen: int):
+        self._entries = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def record(self, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries.append(entry)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+slow_request_log = SlowRequestLog(settings.SLOW_REQUEST_BUFFER_SIZE)
+
+
+def _server_timing(root: Span, responded_at: float) -> str:
+    # Aggregate same-named spans (e.g. twenty gmail.messages.get calls) into one metric
+    totals: Dict[str, List[float]] = {}
+
+    def walk(node: Span):
+        for child in list(node.children):
+            entry = totals.setdefault(child.name, [0.0, 0])
+            entry[0] += child.duration_ms
+            entry[1] += 1
+            walk(child)
+
+    walk(root)
+
+    parts = []
+    for name, (duration, count) in totals.items():
+        part = f"{name};dur={duration:.1f}"
+        if count > 1:
+            part += f';desc="x{count}"'
+        parts.append(part)
+
+    # Whatever happens after the last traced span and before headers go out
+    # is response validation and JSON encoding.
+    finished = [child.end for child in list(root.children) if child.end is not None]
+    if finished:
+        parts.append(f"serialize;dur={max(responded_at - max(finished), 0) * 1000:.1f}")
+    parts.append(f"total;dur={(responded_at - root.start) * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware that opens a root span per request, reports the span
+    summary in a Server-Timing header and keeps slow requests for inspection.
+    """
+
+    def __init__(self, app, threshold_ms: Optional[float] = None, log: Optional[SlowRequestLog] = None):
+        self.app = app
+        self.threshold_ms = settings.SLOW_REQUEST_THRESHOLD_MS if threshold_ms is None else threshold_ms
+        self.log = log or slow_request_log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        root = Span("request")
+        token = _current_span.set(root)
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+                header = _server_timing(root, time.perf_counter()).encode("latin-1")
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            root.finish()
+            _current_span.reset(token)
+            if root.duration_ms >= self.threshold_ms:
+                self.log.record({
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status_holder["status"],
+                    "duration_ms": round(root.duration_ms, 3),
+                    "recorded_at": datetime.utcnow().isoformat(),
+                    "spans": root.to_dict(),
+                })
@@ -1,6 +1,6 @@
 from app.db.base import Base
 from app.db.session import engine
-from app.models import gmail_token # Import models to ensure they are registered
+from app.models import gmail_token, outbox_message, mailbox_sync_state, user_profile, sync_job, mirrored_message # Import models to ensure they are registered
 
 def init_db():
     Base.metadata.create_all(bind=engine)
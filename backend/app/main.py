@@ -1,8 +1,21 @@
-from fastapi import FastAPI
+import math
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.core.config import settings
 from app.api.router import api_router
+from app.api.routes import metrics
+from app.core.cache import cache_manager
+from app.core.blob_store import blob_store
+from app.core.deadline import CircuitOpenError, DeadlineExceeded, DeadlineMiddleware
+from app.core.metrics import MetricsMiddleware, register_blob_store_collector, register_cache_collector
+from app.core.tracing import TracingMiddleware
 from app.db.init_db import init_db
+from app.services.outbox_worker import outbox_worker
+from app.services.cache_warmer import cache_warmer
+from app.services.full_sync_worker import full_sync_worker
+from app.services.label_writer import label_writer
+from app.services.mime_parser import mime_parser
 import uvicorn
 
 from starlette.middleware.sessions import SessionMiddleware
@@ -29,12 +42,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Time budget for Gmail calls made while handling a request
+app.add_middleware(DeadlineMiddleware)
+
+@app.exception_handler(DeadlineExceeded)
+def on_deadline_exceeded(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": {"error": "DEADLINE_EXCEEDED", "message": str(exc)}})
+
+@app.exception_handler(CircuitOpenError)
+def on_circuit_open(request: Request, exc: CircuitOpenError):
+    return JSONResponse(status_code=503, headers={"Retry-After": str(max(math.ceil(exc.retry_in), 1))},
+                        content={"detail": {"error": "GMAIL_UNAVAILABLE", "message": str(exc)}})
+
+# Outermost middleware so latency covers sessions and CORS too
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+register_cache_collector(cache_manager)
+register_blob_store_collector(blob_store)
+
 # Initialize Database
 @app.on_event("startup")
 def on_startup():
     init_db()
+    outbox_worker.start()
+    full_sync_worker.start()
+    label_writer.start()
+    if settings.CACHE_WARMUP_ON_STARTUP:
+        cache_warmer.start_background()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    outbox_worker.stop()
+    full_sync_worker.stop()
+    # Writes whatever label changes are still buffered
+    label_writer.stop()
+    mime_parser.shutdown()
 
 app.include_router(api_router, prefix="/api")
+app.include_router(metrics.router)
 
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1 +1,6 @@
 from app.models.gmail_token import GmailToken
+from app.models.outbox_message import OutboxMessage
+from app.models.mailbox_sync_state import MailboxSyncState
+from app.models.user_profile import UserProfile
+from app.models.sync_job import SyncJob
+from app.models.mirrored_message import MirroredMessage
@@ -21,3 +21,6 @@ class GmailToken(Base):
 
     # Expiry time of the access token
     expiry = Column(DateTime, nullable=False)
+
+    # Last login or authenticated request, to within LAST_SEEN_INTERVAL_SECONDS; picks users for cache warm-up
+    last_seen_at = Column(DateTime, nullable=True)
@@ -0,0 +1,20 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, String
+from app.db.base import Base
+
+class MailboxSyncState(Base):
+    """
+    Last Gmail historyId we have synced for a user, plus the users.watch
+    registration backing push notifications.
+    """
+    __tablename__ = "mailbox_sync_state"
+
+    email = Column(String, primary_key=True)
+
+    # Gmail historyIds are uint64; stored as strings like the API returns them
+    history_id = Column(String, nullable=True)
+
+    # When the current users.watch registration lapses (Gmail caps it at 7 days)
+    watch_expiration = Column(DateTime, nullable=True)
+
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,34 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text
+from app.db.base import Base
+
+class MirroredMessage(Base):
+    """
+    Local copy of a message's metadata, filled by the full-mailbox sync.
+    Body text and attachment descriptors are only kept when the sync runs
+    with FULL_SYNC_FETCH_BODIES.
+    """
+    __tablename__ = "mirrored_messages"
+    __table_args__ = (
+        Index("ix_mirrored_messages_user_date", "user_email", "internal_date"),
+    )
+
+    user_email = Column(String, primary_key=True)
+    id = Column(String, primary_key=True)
+
+    thread_id = Column(String, nullable=True)
+    sender = Column(Text, nullable=False, default="")
+    # To and Cc, comma separated as in the headers
+    recipients = Column(Text, nullable=False, default="")
+    subject = Column(Text, nullable=False, default="")
+    snippet = Column(Text, nullable=False, default="")
+    internal_date = Column(DateTime, nullable=True)
+    # Space separated Gmail label ids
+    label_ids = Column(Text, nullable=False, default="")
+    size_estimate = Column(Integer, nullable=True)
+
+    # Plain text body (HTML reduced to text) and JSON encoded attachment descriptors
+    body_text = Column(Text, nullable=True)
+    attachments = Column(Text, nullable=True)
+
+    synced_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
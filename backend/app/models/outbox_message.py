@@ -0,0 +1,39 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, String, Text, UniqueConstraint
+from app.db.base import Base
+
+class OutboxMessage(Base):
+    """
+    Outgoing email accepted by the API but not yet confirmed by Gmail.
+    Sender workers deliver rows per user in created_at order and retry transient failures.
+    """
+    __tablename__ = "outbox_messages"
+    __table_args__ = (
+        UniqueConstraint("user_email", "idempotency_key", name="uq_outbox_user_idempotency_key"),
+    )
+
+    id = Column(String, primary_key=True)
+
+    user_email = Column(String, index=True, nullable=False)
+
+    # 'send', 'reply' or 'forward'
+    kind = Column(String, nullable=False)
+
+    # JSON encoded arguments for the matching GmailService method
+    payload = Column(Text, nullable=False)
+
+    # Client supplied Idempotency-Key header, if any
+    idempotency_key = Column(String, nullable=True)
+
+    # 'queued', 'sending', 'sent' or 'failed'
+    status = Column(String, index=True, nullable=False, default="queued")
+
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # Gmail message id once sent
+    gmail_message_id = Column(String, nullable=True)
+
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
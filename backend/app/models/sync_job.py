@@ -0,0 +1,36 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, String, Text
+from app.db.base import Base
+
+class SyncJob(Base):
+    """
+    Full-mailbox backfill for one user. The messages.list page token is
+    checkpointed after every page, so a restarted worker resumes where the
+    previous one stopped instead of starting over.
+    """
+    __tablename__ = "sync_jobs"
+
+    user_email = Column(String, primary_key=True)
+
+    # 'queued', 'running', 'completed', 'failed' or 'cancelled'
+    status = Column(String, index=True, nullable=False, default="queued")
+
+    # Next messages.list page to fetch; NULL before the first page and after the last (pages_done tells which)
+    page_token = Column(String, nullable=True)
+
+    # historyId when the job started; incremental sync continues from here
+    history_id = Column(String, nullable=True)
+
+    # messagesTotal from the profile when the job started, for progress reporting
+    messages_total = Column(Integer, nullable=True)
+
+    pages_done = Column(Integer, nullable=False, default=0)
+    messages_synced = Column(Integer, nullable=False, default=0)
+    messages_failed = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # Bumped at every checkpoint; a 'running' job that stops updating belongs to a dead worker
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,16 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, String
+from app.db.base import Base
+
+class UserProfile(Base):
+    """
+    Google profile captured at login so /api/auth/me does not call userinfo
+    on every page load.
+    """
+    __tablename__ = "user_profiles"
+
+    email = Column(String, primary_key=True)
+    name = Column(String, nullable=True)
+    picture = Column(String, nullable=True)
+
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
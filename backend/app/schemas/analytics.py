@@ -0,0 +1,39 @@
+from datetime import date
+from typing import List, Optional
+from pydantic import BaseModel
+
+class SenderCount(BaseModel):
+    sender: str # address, lower-cased
+    name: Optional[str] = None
+    messages: int
+    unread: int
+
+class DayCount(BaseModel):
+    day: date
+    messages: int
+
+class LabelBacklog(BaseModel):
+    label: str
+    unread: int
+
+class ReplyLatency(BaseModel):
+    """Time from a received message to the user's first reply after it in the same thread."""
+    replies: int
+    median_seconds: Optional[float] = None
+    p90_seconds: Optional[float] = None
+    mean_seconds: Optional[float] = None
+
+class MailboxAnalytics(BaseModel):
+    """Aggregates over the mirrored mailbox (see POST /api/gmail/sync/full)."""
+    history_id: Optional[str] = None
+    messages: int
+    received: int
+    unread: int
+    top_senders: List[SenderCount]
+    # Received messages per day over the requested window, oldest first
+    per_day: List[DayCount]
+    # Received messages by hour of day (24 entries) and by weekday, Monday first (7 entries)
+    per_hour: List[int]
+    per_weekday: List[int]
+    unread_by_label: List[LabelBacklog]
+    reply_latency: ReplyLatency
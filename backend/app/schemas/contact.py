@@ -0,0 +1,11 @@
+from typing import Optional
+from pydantic import BaseModel
+
+class ContactSuggestion(BaseModel):
+    address: str
+    name: Optional[str] = None
+    # Messages exchanged with the contact in the mirrored mailbox
+    messages: int
+
+    class Config:
+        from_attributes = True
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, PrivateAttr
 from datetime import datetime
 from typing import List, Optional
 
@@ -9,12 +9,26 @@ class EmailPreview(BaseModel):
     snippet: str
     date: datetime
     unread: bool
+    # Owning account, set in the unified multi-account inbox
+    account: Optional[str] = None
+
+class ScoredEmail(EmailPreview):
+    # Cosine similarity to the query, 0..1
+    score: float
 
 class SendEmailRequest(BaseModel):
     to: List[EmailStr]
     subject: str
     body: str
 
+class AttachmentInfo(BaseModel):
+    filename: str
+    mime_type: str
+    size: int
+    content_id: Optional[str] = None
+    # Pass as ?part_id= when downloading, so the stored copy is found again
+    part_id: Optional[str] = None
+
 class EmailDetail(BaseModel):
     id: str
     sender: str
@@ -23,10 +37,22 @@ class EmailDetail(BaseModel):
     body: str
     dataset: str # 'inbox' or 'sent' etc, metadata if needed
     unread: bool
+    labelIds: List[str] = []
+    # Kept so reply_email can answer from the detail cache
+    threadId: Optional[str] = None
+    replyTo: Optional[str] = None
+    messageIdHeader: Optional[str] = None
+    references: Optional[str] = None
+    # Only filled when the detail is built from the raw message
+    attachments: List[AttachmentInfo] = []
+    # Blob store digest of the body, when GmailService already stored it
+    _body_digest: Optional[str] = PrivateAttr(default=None)
 
 class PaginatedEmails(BaseModel):
     messages: List[EmailPreview]
     nextPageToken: Optional[str] = None
+    # True when the request deadline or an open circuit cut the page short; reload to get the rest
+    partial: bool = False
 
 class ReplyEmailRequest(BaseModel):
     body: str
@@ -34,3 +60,12 @@ class ReplyEmailRequest(BaseModel):
 class ForwardEmailRequest(BaseModel):
     to: List[EmailStr]
     body: str
+
+class ModifyLabelsRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=1000)
+    addLabelIds: List[str] = []
+    removeLabelIds: List[str] = []
+
+class LabelChangeAccepted(BaseModel):
+    # The user's messages with changes not yet written to Gmail
+    pending: int
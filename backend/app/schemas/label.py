@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+class LabelInfo(BaseModel):
+    id: str
+    name: str
+    type: str # 'system' or 'user'
+    messagesTotal: int = 0
+    messagesUnread: int = 0
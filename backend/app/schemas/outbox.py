@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+class OutboxAccepted(BaseModel):
+    status: str
+    outbox_id: str
+
+class OutboxStatus(BaseModel):
+    id: str
+    kind: str
+    status: str # 'queued', 'sending', 'sent' or 'failed'
+    attempts: int
+    last_error: Optional[str] = None
+    gmail_message_id: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
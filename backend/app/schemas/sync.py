@@ -0,0 +1,40 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+from app.schemas.email import EmailPreview
+
+class WatchStatus(BaseModel):
+    history_id: Optional[str] = None
+    watch_expiration: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class MessageLabels(BaseModel):
+    id: str
+    labelIds: List[str]
+
+class MailboxDelta(BaseModel):
+    """Inbox changes between two Gmail historyIds."""
+    historyId: str
+    added: List[EmailPreview] = []
+    deleted: List[str] = []
+    labelsChanged: List[MessageLabels] = []
+    # History expired: the client must reload the inbox from scratch
+    resync: bool = False
+
+class SyncJobStatus(BaseModel):
+    """Progress of a full-mailbox sync."""
+    status: str # 'queued', 'running', 'completed', 'failed' or 'cancelled'
+    history_id: Optional[str] = None
+    messages_total: Optional[int] = None
+    pages_done: int
+    messages_synced: int
+    messages_failed: int
+    last_error: Optional[str] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,112 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from app.core.cache import INBOX_NAMESPACE, LABEL_COUNTS_NAMESPACE, SENT_NAMESPACE, build_cache_key, cache_manager
+from app.core.config import settings
+from app.core.deadline import no_deadline
+from app.db.session import SessionLocal
+from app.models.gmail_token import GmailToken
+from app.services.gmail_scheduler import quota_cost
+from app.services.gmail_service import GmailService
+from app.services.profile_service import ProfileService
+from app.services.token_service import TokenService
+
+logger = logging.getLogger(__name__)
+
+# Page sizes used by GmailService.list_inbox_emails / list_sent_emails defaults
+INBOX_PAGE_SIZE = 20
+SENT_PAGE_SIZE = 10
+LABEL_IDS = ('INBOX', 'SENT', 'UNREAD')
+
+
+class CacheWarmer:
+    """
+    Prefills the cache entries a freshly opened app asks for first: inbox
+    and sent first pages, label counts and the profile. The entries use the
+    same keys as the routes, so the first page load is a cache hit.
+    """
+
+    def __init__(self, session_factory: Callable = SessionLocal,
+                 service_factory: Callable = GmailService.from_tokens,
+                 quota_budget: Optional[int] = None):
+        self.session_factory = session_factory
+        self.service_factory = service_factory
+        self.quota_budget = quota_budget or settings.CACHE_WARMUP_QUOTA_UNITS
+
+    def _steps(self, service: GmailService):
+        """(name, estimated quota units, cache key, ttl, compute, cacheable) in priority order."""
+        email = service.user_email
+        list_cost, get_cost = quota_cost('messages.list'), quota_cost('messages.get')
+        # Like the routes, never store a page cut short
+        complete = lambda page: not page.partial
+        return [
+            ("inbox", list_cost + INBOX_PAGE_SIZE * get_cost,
+             build_cache_key(INBOX_NAMESPACE, email, page_token=None), settings.MAILBOX_LIST_CACHE_TTL_SECONDS,
+             service.list_inbox_emails, complete),
+            ("labels", len(LABEL_IDS) * quota_cost('labels.get'),
+             build_cache_key(LABEL_COUNTS_NAMESPACE, email), settings.MAILBOX_LIST_CACHE_TTL_SECONDS,
+             lambda: service.get_label_counts(LABEL_IDS), None),
+            ("sent", list_cost + SENT_PAGE_SIZE * get_cost,
+             build_cache_key(SENT_NAMESPACE, email, page_token=None), settings.MAILBOX_LIST_CACHE_TTL_SECONDS,
+             service.list_sent_emails, complete),
+        ]
+
+    def warm_user(self, email: str) -> List[str]:
+        """Warm one user's cache within the quota budget. Returns the steps that ran."""
+        # After login this runs as a BackgroundTask, inside the callback's already partly spent deadline
+        with no_deadline():
+            return self._warm_user(email)
+
+    def _warm_user(self, email: str) -> List[str]:
+        db = self.session_factory()
+        try:
+            tokens = TokenService.get_tokens(db, email=email)
+            if not tokens:
+                return []
+            ProfileService.get(db, email)
+            service = self.service_factory(tokens)
+        finally:
+            db.close()
+
+        warmed, spent = ["profile"], 0
+        for name, estimate, key, ttl, compute, cacheable in self._steps(service):
+            if spent + estimate > self.quota_budget:
+                logger.info(f"Cache warm-up for {email} skipped {name}: quota budget spent")
+                continue
+            before = service.scheduler.units_used
+            try:
+                cache_manager.get_or_set(key, compute, ttl, cacheable=cacheable)
+                warmed.append(name)
+            except Exception as e:
+                logger.warning(f"Cache warm-up for {email} failed at {name}: {e}")
+            spent += max(service.scheduler.units_used - before, 0)
+        return warmed
+
+    def recently_active(self, within: timedelta) -> List[str]:
+        """Users who logged in or made an authenticated request within `within`."""
+        db = self.session_factory()
+        try:
+            since = datetime.utcnow() - within
+            return [row.email for row in db.query(GmailToken.email).filter(GmailToken.last_seen_at >= since).all()]
+        finally:
+            db.close()
+
+    def warm_recent(self, within: Optional[timedelta] = None) -> int:
+        within = within or timedelta(hours=settings.CACHE_WARMUP_ACTIVE_WITHIN_HOURS)
+        users = self.recently_active(within)
+        for email in users:
+            self.warm_user(email)
+        if users:
+            logger.info(f"Warmed cache for {len(users)} recently active users")
+        return len(users)
+
+    def start_background(self) -> threading.Thread:
+        """Warm recently active users without delaying startup."""
+        thread = threading.Thread(target=self.warm_recent, name="cache-warmer", daemon=True)
+        thread.start()
+        return thread
+
+
+cache_warmer = CacheWarmer()
@@ -0,0 +1,200 @@
+import bisect
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from email.utils import getaddresses
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.tracing import span
+from app.models.mirrored_message import MirroredMessage
+
+# How much one message counts towards a contact: people you write to matter most
+SENT_TO_WEIGHT = 2.0
+SENDER_WEIGHT = 1.0
+# Other To/Cc addresses on mail you received
+CO_RECIPIENT_WEIGHT = 0.25
+# Prefix matches examined per query; a one-letter prefix may match thousands of keys
+MAX_SCAN = 2000
+# Up to this many new keys are inserted one by one; more (a first load) are sorted in together
+INSORT_LIMIT = 256
+
+
+@dataclass
+class Contact:
+    address: str
+    name: Optional[str] = None
+    messages: int = 0
+    # Sum of message weights, each halved every half-life, as of `updated`
+    score: float = 0.0
+    updated: float = 0.0
+
+    def observe(self, when: float, weight: float, half_life: float):
+        if when >= self.updated:
+            self.score = self.score * 0.5 ** ((when - self.updated) / half_life) + weight
+            self.updated = when
+        else:
+            self.score += weight * 0.5 ** ((self.updated - when) / half_life)
+        self.messages += 1
+
+    def rank(self, now: float, half_life: float) -> float:
+        return self.score * 0.5 ** (max(now - self.updated, 0) / half_life)
+
+
+class UserContacts:
+    """
+    One user's contacts plus a sorted list of (search key, address) pairs:
+    the address and each word of the display name. A prefix query is a
+    bisect to the first key at or after the prefix and a scan while keys
+    still start with it.
+    """
+
+    def __init__(self, owner: str, half_life: float):
+        self.owner = owner.lower()
+        self.half_life = half_life
+        self.contacts: Dict[str, Contact] = {}
+        self.keys: List[Tuple[str, str]] = []
+        # Keys added since the last prefix query
+        self._pending: List[Tuple[str, str]] = []
+        # Empty-prefix results by limit, until the next change
+        self._top: Dict[int, List[Contact]] = {}
+        # Gmail ids of sent mail counted before the mirror had it, so the mirrored row isn't counted again
+        self.sent_ids: Set[str] = set()
+
+    def _sorted_keys(self) -> List[Tuple[str, str]]:
+        if len(self._pending) > INSORT_LIMIT:
+            self.keys.extend(self._pending)
+            self.keys.sort()
+        else:
+            for entry in self._pending:
+                bisect.insort(self.keys, entry)
+        self._pending = []
+        return self.keys
+
+    def observe(self, header: str, when: float, weight: float):
+        for name, address in getaddresses([header]):
+            address = address.strip().lower()
+            if "@" not in address or address == self.owner:
+                continue
+            contact = self.contacts.get(address)
+            if contact is None:
+                contact = self.contacts[address] = Contact(address=address)
+                self._pending.append((address, address))
+            if name and not contact.name:
+                contact.name = name.strip()
+                for word in contact.name.lower().replace('"', "").split():
+                    self._pending.append((word, address))
+            contact.observe(when, weight, self.half_life)
+            self._top.clear()
+
+    def add_message(self, sender: str, recipients: str, when: float, sent: bool):
+        if sent:
+            self.observe(recipients, when, SENT_TO_WEIGHT)
+        else:
+            self.observe(sender, when, SENDER_WEIGHT)
+            self.observe(recipients, when, CO_RECIPIENT_WEIGHT)
+
+    def suggest(self, prefix: str, limit: int, now: Optional[float] = None) -> List[Contact]:
+        now = time.time() if now is None else now
+        prefix = prefix.strip().lower()
+        rank = lambda c: (c.rank(now, self.half_life), c.address)
+        if not prefix:
+            # Ranks decay at the same rate for everyone, so the order only changes with new mail
+            if limit not in self._top:
+                self._top[limit] = heapq.nlargest(limit, self.contacts.values(), key=rank)
+            return self._top[limit]
+        keys = self._sorted_keys()
+        matched = set()
+        i = bisect.bisect_left(keys, (prefix, ""))
+        end = min(i + MAX_SCAN, len(keys))
+        while i < end and keys[i][0].startswith(prefix):
+            matched.add(keys[i][1])
+            i += 1
+        return heapq.nlargest(limit, (self.contacts[address] for address in matched), key=rank)
+
+
+class ContactIndex:
+    """
+    Recipient autocomplete over From/To/Cc of mirrored messages. A user's
+    contacts are loaded from mirrored_messages on their first query and
+    kept current by the full sync, incremental mirror updates and sent
+    outbox mail. Only the most recently queried users stay in memory.
+    """
+
+    def __init__(self, max_users: Optional[int] = None, half_life_days: Optional[float] = None):
+        self.max_users = max_users or settings.CONTACTS_CACHED_USERS
+        self.half_life = (half_life_days or settings.CONTACTS_HALF_LIFE_DAYS) * 86400
+        self._users: "OrderedDict[str, UserContacts]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _loaded(self, email: str) -> Optional[UserContacts]:
+        with self._lock:
+            contacts = self._users.get(email)
+            if contacts is not None:
+                self._users.move_to_end(email)
+            return contacts
+
+    def load(self, db: Session, email: str) -> UserContacts:
+        contacts = self._loaded(email)
+        if contacts is not None:
+            return contacts
+        with span("contacts.load"):
+            contacts = UserContacts(email, self.half_life)
+            rows = db.query(
+                MirroredMessage.sender, MirroredMessage.recipients,
+                MirroredMessage.internal_date, MirroredMessage.label_ids,
+            ).filter(MirroredMessage.user_email == email).yield_per(10000)
+            for sender, recipients, internal_date, label_ids in rows:
+                contacts.add_message(sender, recipients, internal_date.timestamp() if internal_date else 0,
+                                     'SENT' in label_ids.split())
+            # Sort the keys here rather than under the lock on the first query
+            contacts._sorted_keys()
+        with self._lock:
+            # Another request may have loaded the user meanwhile; keep the first
+            contacts = self._users.setdefault(email, contacts)
+            self._users.move_to_end(email)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return contacts
+
+    def drop(self, email: str):
+        """Forget a loaded user; their next query reads the mirror again."""
+        with self._lock:
+            self._users.pop(email, None)
+
+    def add_messages(self, email: str, messages: Iterable[MirroredMessage]):
+        """Fold new mirrored rows into a loaded user; unloaded users read them from the table later."""
+        contacts = self._loaded(email)
+        if contacts is None:
+            return
+        with self._lock:
+            for m in messages:
+                if m.id in contacts.sent_ids:
+                    contacts.sent_ids.discard(m.id)
+                    continue
+                contacts.add_message(m.sender, m.recipients, m.internal_date.timestamp() if m.internal_date else 0,
+                                     'SENT' in m.label_ids.split())
+
+    def add_sent(self, email: str, recipients: Iterable[str], when: Optional[datetime] = None,
+                 message_id: Optional[str] = None):
+        """Count mail sent from the app right away; `message_id` keeps its mirrored copy from counting twice."""
+        contacts = self._loaded(email)
+        if contacts is None:
+            return
+        with self._lock:
+            if message_id is not None:
+                contacts.sent_ids.add(message_id)
+            contacts.observe(", ".join(recipients), when.timestamp() if when else time.time(), SENT_TO_WEIGHT)
+
+    def suggest(self, db: Session, email: str, prefix: str, limit: int = 8) -> List[Contact]:
+        contacts = self.load(db, email)
+        with span("contacts.suggest"), self._lock:
+            return contacts.suggest(prefix, limit)
+
+
+contact_index = ContactIndex()
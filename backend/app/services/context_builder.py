@@ -0,0 +1,202 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Generator, Iterator, List, Optional, Set, Tuple
+
+from googleapiclient.errors import HttpError
+
+from app.core.cache import CONTEXT_NAMESPACE, build_cache_key, cache_manager
+from app.core.config import settings
+from app.core.deadline import CircuitOpenError, DeadlineExceeded
+from app.core.tracing import span
+from app.services.gmail_service import GmailService, _index_headers
+from app.services.mime_parser import html_to_text
+
+# Rough size of a token for English text in current LLM tokenizers
+CHARS_PER_TOKEN = 4
+# Smallest body worth sending; lower-ranked messages are dropped rather than cut shorter
+MIN_SECTION_TOKENS = 24
+# Paragraphs shorter than this ("Thanks,") may repeat without being quoted text
+DEDUPE_MIN_CHARS = 40
+CONTEXT_HEADERS = ['From', 'Subject']
+
+HTML_RE = re.compile(r"<(html|body|div|p|br|table|span)\b", re.IGNORECASE)
+# A line that starts the quoted previous message; everything after it is dropped
+QUOTE_START_RE = re.compile(
+    r"^(On\s.{0,200}\swrote:|-{2,}\s*(Original|Forwarded) Message\s*-{2,}|_{10,})$", re.IGNORECASE
+)
+# A line that starts a signature or mobile footer; everything after it is dropped
+SIGNATURE_RE = re.compile(r"^(--|Sent from my \w+.*|Get Outlook for \w+.*)$", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Cut text to about `tokens` tokens at a word boundary."""
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit - 2)
+    return text[:cut if cut > limit // 2 else limit - 2].rstrip() + " …"
+
+
+def clean_body(body: str) -> str:
+    """
+    Reduce a message body to what the sender wrote: HTML becomes text and
+    quoted replies (">" lines, "On ... wrote:", Outlook "From:/Sent:"
+    headers) and signatures are cut off.
+    """
+    if HTML_RE.search(body):
+        body = html_to_text(body)
+    lines = body.replace("\r\n", "\n").split("\n")
+    kept = []
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith(">"):
+            continue
+        if QUOTE_START_RE.match(stripped) or SIGNATURE_RE.match(line.rstrip()):
+            break
+        # Outlook quotes start with a From: line directly followed by Sent: or Date:
+        if stripped.startswith("From:") and i + 1 < len(lines) and \
+                lines[i + 1].strip().startswith(("Sent:", "Date:")):
+            break
+        kept.append(stripped)
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(kept)).strip()
+
+
+def dedupe_paragraphs(text: str, seen: Set[str]) -> str:
+    """Drop paragraphs already included for an earlier message; adds the rest to `seen`."""
+    kept = []
+    for paragraph in text.split("\n\n"):
+        normalized = " ".join(paragraph.lower().split())
+        if len(normalized) >= DEDUPE_MIN_CHARS:
+            digest = hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+        kept.append(paragraph)
+    return "\n\n".join(kept)
+
+
+def _omitted(count: int, reason: str) -> str:
+    return f"[{count} more message{'s' if count > 1 else ''} omitted {reason}]\n"
+
+
+@dataclass
+class ContextItem:
+    """A message considered for the context, from metadata only."""
+    message_id: str
+    sender: str
+    subject: str
+    date: datetime
+    unread: bool
+
+
+def _item(m: dict) -> ContextItem:
+    headers = _index_headers(m.get('payload', {}).get('headers', []))
+    return ContextItem(
+        message_id=m['id'],
+        sender=headers.get('from', ""),
+        subject=headers.get('subject', ""),
+        date=datetime.fromtimestamp(int(m['internalDate']) / 1000),
+        unread='UNREAD' in m.get('labelIds', []),
+    )
+
+
+class ContextBuilder:
+    """
+    Assembles model-ready text for summarising a thread or a day of inbox
+    mail. Candidates are ranked from metadata (a thread newest first, a day
+    unread then newest first) and bodies are fetched in that order, so
+    fetching stops once the token budget is spent. Each message gets a
+    fair share of what is left, and shares unused by short messages go to
+    the next ones. Finished contexts are cached under the thread's or
+    mailbox's historyId, which changes whenever the underlying mail does.
+    """
+
+    def __init__(self, max_messages: Optional[int] = None, cache_ttl: Optional[int] = None):
+        self.max_messages = max_messages or settings.CONTEXT_MAX_MESSAGES
+        self.cache_ttl = cache_ttl or settings.CONTEXT_CACHE_TTL_SECONDS
+
+    def thread_candidates(self, service: GmailService, thread_id: str) -> Tuple[str, List[ContextItem]]:
+        """(thread historyId, messages newest first)."""
+        thread = service.get_thread(thread_id, metadata_headers=CONTEXT_HEADERS)
+        items = [_item(m) for m in thread.get('messages', [])]
+        items.sort(key=lambda item: item.date, reverse=True)
+        return str(thread.get('historyId', "")), items[:self.max_messages]
+
+    def day_candidates(self, service: GmailService, day: date, tz_offset_minutes: int = 0) -> Tuple[str, List[ContextItem]]:
+        """(mailbox historyId, the day's inbox messages unread first, then newest first)."""
+        history_id = str(service.get_profile().get('historyId', ""))
+        start = datetime(day.year, day.month, day.day, tzinfo=timezone(timedelta(minutes=tz_offset_minutes)))
+        end = start + timedelta(days=1)
+        ids, _ = service.list_message_ids(
+            max_results=self.max_messages, label_ids=['INBOX'],
+            query=f"after:{int(start.timestamp())} before:{int(end.timestamp())}",
+        )
+        messages, _ = service.get_messages_batch(ids, metadata_headers=CONTEXT_HEADERS) if ids else ({}, {})
+        items = [_item(m) for m in messages.values()]
+        items.sort(key=lambda item: (item.unread, item.date), reverse=True)
+        return history_id, items
+
+    def cache_key(self, user: str, kind: str, subject: str, history_id: str, budget: int) -> str:
+        return build_cache_key(CONTEXT_NAMESPACE, user, kind, subject, history_id=history_id, budget=budget)
+
+    def _body(self, service: GmailService, message_id: str) -> str:
+        # Messages opened in the app are usually still in the detail cache
+        detail = service.get_cached_detail(message_id) or service.get_email_detail(message_id)
+        return detail.body
+
+    def build(self, service: GmailService, items: List[ContextItem], budget: int) -> Generator[str, None, bool]:
+        """
+        Yield the context one message section at a time. The response is
+        already under way, so when the deadline passes or Gmail's breaker
+        opens the rest is marked omitted instead of raising; the generator
+        then returns False.
+        """
+        remaining, seen = budget, set()
+        for position, item in enumerate(items):
+            left = len(items) - position
+            marker = " | unread" if item.unread else ""
+            header = f"[{position + 1}] {item.date:%Y-%m-%d %H:%M} | From: {item.sender} | Subject: {item.subject}{marker}\n"
+            header_tokens = estimate_tokens(header)
+            if remaining - header_tokens < MIN_SECTION_TOKENS:
+                yield _omitted(left, "to fit the token budget")
+                return True
+            share = max(remaining // left - header_tokens, MIN_SECTION_TOKENS)
+            with span("context.section"):
+                try:
+                    body = self._body(service, item.message_id)
+                except HttpError as e:
+                    if e.resp.status != 404:
+                        raise
+                    # Deleted since the candidates were listed
+                    continue
+                except (DeadlineExceeded, CircuitOpenError):
+                    yield _omitted(left, "because Gmail did not answer in time")
+                    return False
+                body = dedupe_paragraphs(clean_body(body), seen)
+            section = header + (truncate_to_tokens(body, share) if body else "(nothing new)") + "\n\n"
+            remaining -= estimate_tokens(section)
+            yield section
+        return True
+
+    def stream(self, service: GmailService, key: str, items: List[ContextItem], budget: int) -> Iterator[str]:
+        """build(), caching the full text once the client has received all of it (unless it was cut short)."""
+        parts, sections = [], self.build(service, items, budget)
+        while True:
+            try:
+                part = next(sections)
+            except StopIteration as done:
+                complete = done.value
+                break
+            parts.append(part)
+            yield part
+        if complete:
+            cache_manager.set(key, "".join(parts), self.cache_ttl)
+
+
+context_builder = ContextBuilder()
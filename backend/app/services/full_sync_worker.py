@@ -0,0 +1,327 @@
+import base64
+import contextvars
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.mirrored_message import MirroredMessage
+from app.models.sync_job import SyncJob
+from app.services.gmail_scheduler import TokenBucket, classify_error, quota_cost
+from app.services.contact_index import ContactIndex, contact_index
+from app.services.gmail_service import GmailService, HistoryExpiredError, _index_headers
+from app.services.mail_index import MailIndex, mail_index
+from app.services.mailbox_analytics import MailboxAnalyticsService, mailbox_analytics
+from app.services.mailbox_sync import MailboxChanges, MailboxSyncService, add_change_listener
+from app.services.mime_parser import MimeParser, ParsedMessage, mime_parser
+from app.services.sync_job_service import SyncJobService
+from app.services.token_service import TokenService
+
+logger = logging.getLogger(__name__)
+
+# A job stuck in 'running' without a checkpoint this long belongs to a worker that died
+STALE_RUNNING_SECONDS = 300
+
+MIRROR_HEADERS = ['From', 'To', 'Cc', 'Subject']
+
+
+class SyncInterrupted(Exception):
+    """The worker is shutting down; the job goes back to the queue."""
+
+
+def mirror_row(email: str, m: dict, parsed: Optional[ParsedMessage] = None) -> MirroredMessage:
+    """
+    Build a mirrored_messages row from a format=metadata messages.get
+    response, or from a format=raw one plus its parse result.
+    """
+    if parsed is not None:
+        headers = parsed.headers
+    else:
+        headers = _index_headers(m.get('payload', {}).get('headers', []))
+    internal_date = m.get('internalDate')
+    return MirroredMessage(
+        user_email=email,
+        id=m['id'],
+        thread_id=m.get('threadId'),
+        sender=headers.get('from', ""),
+        recipients=", ".join(v for v in (headers.get('to'), headers.get('cc')) if v),
+        subject=headers.get('subject', ""),
+        snippet=m.get('snippet', ""),
+        internal_date=datetime.fromtimestamp(int(internal_date) / 1000) if internal_date else None,
+        label_ids=" ".join(m.get('labelIds', [])),
+        size_estimate=m.get('sizeEstimate'),
+        body_text=parsed.text if parsed is not None else None,
+        attachments=json.dumps([asdict(a) for a in parsed.attachments]) if parsed is not None else None,
+        # Set even when nothing else changed, so a restarted job can tell which rows it saw again
+        synced_at=datetime.utcnow(),
+    )
+
+
+def _is_not_found(error: Exception) -> bool:
+    return isinstance(error, HttpError) and error.resp.status == 404
+
+
+class FullSyncWorker:
+    """
+    Background threads that backfill mirrored_messages for queued sync jobs.
+    Each page of messages.list is split into HTTP batches fetched by a pool
+    of threads (one GmailService per thread, the Google client is not
+    thread-safe), then checkpointed. Besides the per-user scheduler, a job
+    is held to FULL_SYNC_UNITS_PER_SECOND so interactive requests keep
+    part of the user's quota. With fetch_bodies, raw messages go through
+    the MIME process pool, whose bounded queue also paces the fetchers.
+    Synced messages are added to the similarity and contact indexes, and
+    once a user has a sync job, on_changes keeps their mirror and indexes
+    current.
+    """
+
+    def __init__(self, session_factory: Callable = SessionLocal,
+                 service_factory: Callable = GmailService.from_tokens,
+                 runners: Optional[int] = None, fetch_workers: Optional[int] = None,
+                 page_size: Optional[int] = None, batch_size: Optional[int] = None,
+                 units_per_second: Optional[float] = None, poll_seconds: Optional[float] = None,
+                 max_retries: Optional[int] = None, fetch_bodies: Optional[bool] = None,
+                 parser: MimeParser = mime_parser, index: MailIndex = mail_index,
+                 contacts: ContactIndex = contact_index, analytics: MailboxAnalyticsService = mailbox_analytics):
+        self.session_factory = session_factory
+        self.service_factory = service_factory
+        self.runners = settings.FULL_SYNC_RUNNERS if runners is None else runners
+        self.fetch_workers = fetch_workers or settings.FULL_SYNC_FETCH_WORKERS
+        self.page_size = page_size or settings.FULL_SYNC_PAGE_SIZE
+        self.batch_size = batch_size or settings.FULL_SYNC_BATCH_SIZE
+        self.units_per_second = units_per_second or settings.FULL_SYNC_UNITS_PER_SECOND
+        self.poll_seconds = poll_seconds or settings.FULL_SYNC_POLL_SECONDS
+        self.max_retries = settings.GMAIL_MAX_RETRIES if max_retries is None else max_retries
+        self.fetch_bodies = settings.FULL_SYNC_FETCH_BODIES if fetch_bodies is None else fetch_bodies
+        self.parser = parser
+        self.index = index
+        self.contacts = contacts
+        self.analytics = analytics
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        if self._threads or self.runners <= 0:
+            return
+        db = self.session_factory()
+        try:
+            requeued = SyncJobService.requeue_stale(db, STALE_RUNNING_SECONDS)
+            if requeued:
+                logger.warning(f"Requeued {requeued} full sync jobs left in 'running'")
+        finally:
+            db.close()
+
+        self._stop.clear()
+        for i in range(self.runners):
+            thread = threading.Thread(target=self._run, name=f"full-sync-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            db = self.session_factory()
+            try:
+                processed = self.process_one(db)
+            except Exception as e:
+                logger.exception(f"Full sync worker error: {e}")
+                processed = False
+            finally:
+                db.close()
+            if not processed:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+
+    def process_one(self, db) -> bool:
+        """Run one queued job to completion (or until shutdown). Returns False when nothing was queued."""
+        job = SyncJobService.claim_next(db)
+        if job is None:
+            return False
+        self.run_job(db, job)
+        return True
+
+    def run_job(self, db, job: SyncJob):
+        tokens = TokenService.get_tokens(db, email=job.user_email)
+        if not tokens:
+            SyncJobService.mark_failed(db, job, "User is no longer logged in")
+            return
+
+        throttle = TokenBucket(rate=self.units_per_second, capacity=self.units_per_second)
+        # Fetch threads' services live as long as this run, so a re-login's credentials apply to the next one
+        services = threading.local()
+        try:
+            service = self.service_factory(tokens)
+            if job.history_id is None:
+                profile = service.get_profile()
+                job.history_id = profile.get('historyId')
+                job.messages_total = profile.get('messagesTotal')
+                db.commit()
+
+            with ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="full-sync-fetch") as pool:
+                while not SyncJobService.pages_done(job):
+                    if self._stop.is_set():
+                        raise SyncInterrupted()
+                    if SyncJobService.is_cancelled(db, job):
+                        logger.info(f"Full sync for {job.user_email} cancelled after {job.pages_done} pages")
+                        return
+                    ids, next_page_token = service.list_message_ids(job.page_token, self.page_size)
+                    chunks = [ids[i:i + self.batch_size] for i in range(0, len(ids), self.batch_size)]
+                    futures = [pool.submit(contextvars.copy_context().run, self._fetch_chunk,
+                                           services, tokens, chunk, throttle)
+                               for chunk in chunks]
+                    rows, failed = [], 0
+                    for future in futures:
+                        chunk_rows, chunk_failed = future.result()
+                        rows.extend(chunk_rows)
+                        failed += chunk_failed
+                    # Indexed before the checkpoint: a crash in between re-indexes the page, never skips it
+                    self.index.add(job.user_email, rows)
+                    self.contacts.add_messages(job.user_email, rows)
+                    SyncJobService.checkpoint(db, job, rows, next_page_token, failed)
+            if self.finish(db, job, service):
+                logger.info(f"Full sync for {job.user_email} completed: {job.messages_synced} messages")
+        except SyncInterrupted:
+            db.rollback()
+            SyncJobService.requeue(db, job)
+        except Exception as e:
+            db.rollback()
+            logger.exception(f"Full sync for {job.user_email} failed: {e}")
+            SyncJobService.mark_failed(db, job, str(e))
+
+    def finish(self, db, job: SyncJob, service: GmailService) -> bool:
+        """
+        Close the gaps a backfill leaves: drop rows (and index entries) of
+        messages gone since an earlier run (every row still in Gmail was
+        written again by this one), then apply history from the job's
+        snapshot up to where incremental sync took over. When Gmail no longer
+        has that history the job starts over. Contacts are reloaded from the
+        finished mirror, since pages written twice (a resumed or restarted
+        job) were counted twice. The job is marked completed only after all
+        of this, so one interrupted here resumes here. Returns False when
+        the job was restarted instead.
+        """
+        if job.started_at is not None:
+            stale = (MirroredMessage.user_email == job.user_email, MirroredMessage.synced_at < job.started_at)
+            gone_ids = [row.id for row in db.query(MirroredMessage.id).filter(*stale)]
+            if gone_ids:
+                db.query(MirroredMessage).filter(*stale).delete(synchronize_session=False)
+                db.commit()
+                self.index.remove(job.user_email, gone_ids)
+        try:
+            changes = MailboxSyncService.catch_up(db, job.user_email, service, job.history_id)
+        except HistoryExpiredError:
+            logger.warning(f"History {job.history_id} expired during the full sync for {job.user_email}; restarting it")
+            SyncJobService.start(db, job.user_email, restart=True)
+            return False
+        if changes is not None and changes.changed:
+            self.on_changes(db, job.user_email, changes)
+        self.contacts.drop(job.user_email)
+        SyncJobService.complete(db, job)
+        return True
+
+    def on_changes(self, db, email: str, changes: MailboxChanges):
+        """Change listener registered with MailboxSyncService: apply incremental changes to the mirror."""
+        job = SyncJobService.get(db, email)
+        if job is None:
+            return
+        if changes.resync:
+            # History was lost, so the mirror may have missed anything. An
+            # unfinished job catches up (or restarts) when it completes.
+            if job.status == "completed":
+                logger.warning(f"Mailbox history lost for {email}; restarting the full sync")
+                SyncJobService.start(db, email, restart=True)
+                self.wake()
+            return
+        before = self.analytics.mirror_version(job)
+        if changes.deleted:
+            db.query(MirroredMessage).filter(
+                MirroredMessage.user_email == email, MirroredMessage.id.in_(changes.deleted)
+            ).delete(synchronize_session=False)
+            self.index.remove(email, changes.deleted)
+        for message_id, label_ids in changes.labels.items():
+            db.query(MirroredMessage).filter(
+                MirroredMessage.user_email == email, MirroredMessage.id == message_id
+            ).update({"label_ids": " ".join(label_ids)}, synchronize_session=False)
+
+        added = sorted(changes.added)
+        if added:
+            # History replayed after a backfill names messages the backfill already copied
+            mirrored = {row.id for row in db.query(MirroredMessage.id).filter(
+                MirroredMessage.user_email == email, MirroredMessage.id.in_(added))}
+            added = [message_id for message_id in added if message_id not in mirrored]
+        tokens = TokenService.get_tokens(db, email=email) if added else None
+        mirrored_rows = []
+        if tokens:
+            throttle = TokenBucket(rate=self.units_per_second, capacity=self.units_per_second)
+            services = threading.local()
+            for i in range(0, len(added), self.batch_size):
+                rows, _ = self._fetch_chunk(services, tokens, added[i:i + self.batch_size], throttle)
+                self.index.add(email, rows)
+                self.contacts.add_messages(email, rows)
+                for row in rows:
+                    db.merge(row)
+                mirrored_rows.extend(rows)
+        # Readers of the mirror (e.g. analytics) version it by the job's last update
+        job.updated_at = datetime.utcnow()
+        db.commit()
+        self.analytics.apply(email, before, self.analytics.mirror_version(job), mirrored_rows,
+                             changes.deleted, changes.labels)
+
+    def _fetch_chunk(self, services: threading.local, tokens, message_ids: List[str],
+                     throttle: TokenBucket) -> Tuple[List[MirroredMessage], int]:
+        """
+        Fetch one batch, retrying throttled sub-requests. Returns (rows,
+        permanently failed count). `services` holds the calling thread's
+        GmailService for one job run or listener call.
+        """
+        service = getattr(services, "service", None)
+        if service is None:
+            service = services.service = self.service_factory(tokens)
+        pending, fetched, failed = list(message_ids), [], 0
+        for attempt in range(self.max_retries + 1):
+            if self._stop.is_set():
+                raise SyncInterrupted()
+            throttle.acquire(len(pending) * quota_cost('messages.get'))
+            if self.fetch_bodies:
+                messages, errors = service.get_messages_batch(pending, format='raw')
+            else:
+                messages, errors = service.get_messages_batch(pending, metadata_headers=MIRROR_HEADERS)
+            fetched.extend(messages.values())
+            # Messages deleted since the page was listed simply drop out
+            retry = [mid for mid, error in errors.items() if classify_error(error) is not None]
+            failed += sum(1 for mid, error in errors.items() if mid not in retry and not _is_not_found(error))
+            if not retry or attempt == self.max_retries:
+                failed += len(retry)
+                break
+            pending = retry
+            service.scheduler.sleep(service.scheduler.backoff(attempt))
+
+        if not self.fetch_bodies:
+            return [mirror_row(tokens.email, m) for m in fetched], failed
+        parsed = self.parser.parse_many(
+            (base64.urlsafe_b64decode(m.pop('raw')) for m in fetched), text_only=True
+        )
+        # Unparseable messages are still mirrored from their headers, but reported
+        failed += sum(1 for p in parsed if p.failed)
+        return [mirror_row(tokens.email, m, p) for m, p in zip(fetched, parsed)], failed
+
+
+full_sync_worker = FullSyncWorker()
+add_change_listener(full_sync_worker.on_changes)
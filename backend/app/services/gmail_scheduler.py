@@ -0,0 +1,317 @@
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, TypeVar
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from app.core.config import settings
+from app.core.deadline import CircuitOpenError, DeadlineExceeded, check_deadline, remaining
+from app.core.metrics import GMAIL_CIRCUIT_OPENED, GMAIL_RETRIES
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Gmail per-method quota unit costs
+# https://developers.google.com/gmail/api/reference/quota
+QUOTA_UNITS: Dict[str, int] = {
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.send": 100,
+    "messages.trash": 5,
+    "messages.modify": 5,
+    "messages.batchModify": 50,
+    "messages.attachments.get": 5,
+    "threads.get": 10,
+    "history.list": 2,
+    "labels.list": 1,
+    "labels.get": 1,
+    "getProfile": 1,
+    "watch": 100,
+    "stop": 50,
+}
+DEFAULT_QUOTA_UNITS = 5
+
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def quota_cost(method: str) -> int:
+    return QUOTA_UNITS.get(method, DEFAULT_QUOTA_UNITS)
+
+
+def _error_reason(error: HttpError) -> Optional[str]:
+    try:
+        details = error.error_details
+    except Exception:
+        return None
+    if isinstance(details, list) and details and isinstance(details[0], dict):
+        return details[0].get("reason")
+    return None
+
+
+def classify_error(error: Exception) -> Optional[str]:
+    """Return 'throttled' or 'transient' for retryable Gmail errors, None otherwise."""
+    if not isinstance(error, HttpError):
+        return None
+    status = error.resp.status
+    if status == 429 or (status == 403 and _error_reason(error) in RATE_LIMIT_REASONS):
+        return "throttled"
+    if status in RETRYABLE_STATUSES:
+        return "transient"
+    return None
+
+
+def is_outage(error: Exception) -> bool:
+    """Failures that say Gmail is unwell rather than the request wrong: throttling, 5xx, timeouts, network."""
+    return classify_error(error) is not None or isinstance(error, (OSError, httplib2.HttpLib2Error))
+
+
+def _retry_after(error: HttpError) -> Optional[float]:
+    value = error.resp.get("retry-after") if hasattr(error.resp, "get") else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Refills `rate` units per second up to `capacity`; acquire() blocks until
+    enough units exist, but not past the request's deadline.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, units: float):
+        # Costs larger than the bucket (HTTP batches) are paid in installments
+        while units > self.capacity:
+            self.acquire(self.capacity)
+            units -= self.capacity
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= units:
+                    self.tokens -= units
+                    return
+                wait = (units - self.tokens) / self.rate
+            left = remaining()
+            if left is not None:
+                if left <= 0:
+                    raise DeadlineExceeded("Deadline passed while waiting for Gmail quota")
+                wait = min(wait, left)
+            time.sleep(wait)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit: each success grows the limit by 1/limit (about +1
+    per round of requests), each throttle halves it.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 50):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify()
+
+    def on_success(self):
+        with self.condition:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify()
+
+    def on_throttle(self):
+        with self.condition:
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+class CircuitBreaker:
+    """
+    Closed until `threshold` consecutive outage failures, then open for
+    `reset_seconds`: calls fail at once instead of waiting on Gmail. After
+    that a single trial call goes through (half-open); success closes the
+    breaker and failure opens it again.
+    """
+
+    def __init__(self, threshold: int, reset_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.trial or self.clock() >= self.opened_at + self.reset_seconds else "open"
+
+    def retry_in(self) -> Optional[float]:
+        """None when a call may go ahead (claiming the trial slot if half-open), else seconds to wait."""
+        with self.lock:
+            if self.opened_at is None:
+                return None
+            wait = self.opened_at + self.reset_seconds - self.clock()
+            if wait > 0 or self.trial:
+                return max(wait, 0)
+            self.trial = True
+            return None
+
+    def on_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def on_failure(self) -> bool:
+        """Returns True when this failure opened the breaker."""
+        with self.lock:
+            self.failures += 1
+            if not self.trial and (self.opened_at is not None or self.failures < self.threshold):
+                return False
+            self.opened_at = self.clock()
+            self.trial = False
+            return True
+
+
+class GmailScheduler:
+    """
+    Per-user gate for Gmail API calls: charges quota units against a token
+    bucket, bounds concurrency adaptively and retries throttled or transient
+    failures with jittered exponential backoff. A circuit breaker per method
+    fails calls fast while Gmail keeps failing them, and no call or retry
+    starts once the request's deadline has passed.
+    """
+
+    def __init__(self, user: str, units_per_second: Optional[float] = None, max_concurrency: Optional[int] = None,
+                 max_retries: Optional[int] = None, backoff_base: Optional[float] = None,
+                 backoff_max: Optional[float] = None, sleep: Callable[[float], None] = time.sleep):
+        self.user = user
+        rate = units_per_second or settings.GMAIL_QUOTA_UNITS_PER_SECOND
+        self.bucket = TokenBucket(rate=rate, capacity=rate)
+        concurrency = max_concurrency or settings.GMAIL_MAX_CONCURRENCY
+        self.limiter = AdaptiveConcurrencyLimiter(initial=concurrency, maximum=concurrency * 4)
+        self.max_retries = settings.GMAIL_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = backoff_base or settings.GMAIL_BACKOFF_BASE_SECONDS
+        self.backoff_max = backoff_max or settings.GMAIL_BACKOFF_MAX_SECONDS
+        self.sleep = sleep
+        self.units_used = 0
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.breakers_lock = threading.Lock()
+
+    def breaker(self, method: str) -> CircuitBreaker:
+        breaker = self.breakers.get(method)
+        if breaker is None:
+            with self.breakers_lock:
+                breaker = self.breakers.setdefault(method, CircuitBreaker(
+                    settings.GMAIL_BREAKER_FAILURES, settings.GMAIL_BREAKER_RESET_SECONDS))
+        return breaker
+
+    def _record_failure(self, breaker: CircuitBreaker, method: str, error: Exception):
+        if not is_outage(error):
+            # Gmail answered; the request itself was wrong
+            breaker.on_success()
+        elif breaker.on_failure():
+            GMAIL_CIRCUIT_OPENED.labels(method=method).inc()
+            logger.warning(f"Circuit opened for {method} ({self.user}) for {breaker.reset_seconds}s: {error}")
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def execute(self, call: Callable[[], T], method: str, units: Optional[int] = None) -> T:
+        """`units` overrides the method's quota cost, e.g. for a batch of several calls."""
+        cost = quota_cost(method) if units is None else units
+        breaker = self.breaker(method)
+        attempt = 0
+        last_error: Optional[Exception] = None
+        while True:
+            try:
+                check_deadline(method)
+            except DeadlineExceeded:
+                # A retry cut off by the deadline counts as the failure it was retrying (and ends a trial)
+                if last_error is not None:
+                    self._record_failure(breaker, method, last_error)
+                raise
+            # Retries of a call already let through (maybe as the trial) don't ask again
+            retry_in = breaker.retry_in() if attempt == 0 else None
+            if retry_in is not None:
+                raise CircuitOpenError(self.user, method, retry_in)
+            self.bucket.acquire(cost)
+            self.units_used += cost
+            with self.limiter.slot():
+                try:
+                    result = call()
+                except Exception as error:
+                    kind = classify_error(error)
+                    delay = (_retry_after(error) or self.backoff(attempt)) if kind is not None else 0
+                    left = remaining()
+                    if kind is None or attempt >= self.max_retries or (left is not None and delay >= left):
+                        self._record_failure(breaker, method, error)
+                        raise
+                    if kind == "throttled":
+                        self.limiter.on_throttle()
+                    last_error = error
+                else:
+                    self.limiter.on_success()
+                    breaker.on_success()
+                    return result
+
+            GMAIL_RETRIES.labels(method=method, reason=kind).inc()
+            logger.info(f"Retrying {method} for {self.user} after {kind} error in {delay:.2f}s (attempt {attempt + 1})")
+            self.sleep(delay)
+            attempt += 1
+
+
+# Least recently used first; a user evicted while a call is running keeps that scheduler until it returns
+_schedulers: "OrderedDict[str, GmailScheduler]" = OrderedDict()
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(user: Optional[str]) -> GmailScheduler:
+    """
+    Schedulers are shared by every request and background job acting for
+    the same user; only the GMAIL_SCHEDULER_CACHED_USERS most recently
+    active users keep theirs.
+    """
+    key = user or "anonymous"
+    with _schedulers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            scheduler = _schedulers[key] = GmailScheduler(key)
+            while len(_schedulers) > settings.GMAIL_SCHEDULER_CACHED_USERS:
+                _schedulers.popitem(last=False)
+        else:
+            _schedulers.move_to_end(key)
+    return scheduler
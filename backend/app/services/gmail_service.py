@@ -1,23 +1,92 @@
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
+from google_auth_httplib2 import AuthorizedHttp
 import base64
+import httplib2
+import logging
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from email import policy as email_policy
 from email.mime.text import MIMEText
+from email.parser import BytesHeaderParser
 from email.utils import parseaddr
 from datetime import datetime
+from typing import Optional
 from bs4 import BeautifulSoup
+from app.core.blob_store import blob_store
+from app.core.cache import MESSAGE_DETAIL_NAMESPACE, build_cache_key, cache_manager
+from app.core.config import settings, google_client_options
+from app.core.deadline import CircuitOpenError, DeadlineExceeded
+from app.core.metrics import observe_gmail_call, TOKEN_REFRESHES
+from app.core.tracing import span, traced
+from app.services.gmail_scheduler import get_scheduler, quota_cost
+from app.services.mime_parser import mime_parser
 from app.schemas.email import EmailPreview, EmailDetail, PaginatedEmails
 from app.schemas.email import PaginatedEmails
 
+logger = logging.getLogger(__name__)
+
+
+def _index_headers(headers) -> dict:
+    """Map lower-cased header names to their first value in a single pass."""
+    index = {}
+    for header in headers:
+        index.setdefault(header['name'].lower(), header['value'])
+    return index
+
+class HistoryExpiredError(Exception):
+    """The requested startHistoryId is older than Gmail keeps; the caller must do a full resync."""
+
+    def __init__(self, start_history_id):
+        super().__init__(f"History {start_history_id} is no longer available")
+        self.start_history_id = start_history_id
+
+
+# Headers a detail needs when its body is already in the blob store
+DETAIL_HEADERS = ['From', 'Subject', 'Reply-To', 'Message-ID', 'References']
+
+
+@dataclass
+class PackedDetail:
+    """Detail cache entry: the EmailDetail minus its body, which lives in the blob store."""
+    detail: EmailDetail
+    body_digest: str
+
+
+def pack_detail(detail: EmailDetail) -> PackedDetail:
+    digest = detail._body_digest or blob_store.put(detail.body.encode('utf-8'))
+    return PackedDetail(detail=detail.model_copy(update={'body': ""}), body_digest=digest)
+
+
+def unpack_detail(packed: PackedDetail) -> Optional[EmailDetail]:
+    """None when the body has been evicted from the blob store."""
+    body = blob_store.read_text(packed.body_digest)
+    if body is None:
+        return None
+    detail = packed.detail.model_copy(update={'body': body})
+    detail._body_digest = packed.body_digest
+    return detail
+
+
 class GmailService:
+    # Account the service acts for; keys the quota scheduler and cache entries
+    user_email: Optional[str] = None
+
     def __init__(self, token_data):
         """
         Initialize Gmail API client with credentials.
         token_data: Object containing access_token, refresh_token, token_uri, client_id, client_secret
+        and optionally the user's email, which keys the per-user quota scheduler.
         """
+        self.user_email = token_data.get('email')
+        self.scheduler = get_scheduler(self.user_email)
         self.creds = Credentials(
             token=token_data['access_token'],
             refresh_token=token_data['refresh_token'],
-            token_uri="https://oauth2.googleapis.com/token",
+            token_uri=settings.GOOGLE_TOKEN_URI,
             client_id=token_data['client_id'],
             client_secret=token_data['client_secret'],
             scopes=[
@@ -26,11 +95,49 @@ class GmailService:
                 "https://www.googleapis.com/auth/gmail.modify"
             ]
         )
-        self.service = build("gmail", "v1", credentials=self.creds)
+        # httplib2 waits forever by default; a hung connection would hold its thread
+        http = AuthorizedHttp(self.creds, http=httplib2.Http(timeout=settings.GMAIL_HTTP_TIMEOUT_SECONDS))
+        with span("gmail.build_client"):
+            self.service = build("gmail", "v1", http=http, client_options=google_client_options())
+
+
+    @classmethod
+    def from_tokens(cls, tokens) -> 'GmailService':
+        """Build a service from a stored GmailToken row."""
+        return cls({
+            'email': tokens.email,
+            'access_token': tokens.access_token,
+            'refresh_token': tokens.refresh_token,
+            'client_id': settings.GOOGLE_CLIENT_ID,
+            'client_secret': settings.GOOGLE_CLIENT_SECRET
+        })
+
+
+    def _execute(self, request, method: str, units: Optional[int] = None):
+        """
+        Execute a Gmail API request. Every call goes through here so the
+        service layer has one place for quota scheduling and instrumentation.
+        """
+        def attempt():
+            token_before = self.creds.token
+            start = time.perf_counter()
+            outcome = "ok"
+            try:
+                with span(f"gmail.{method}"):
+                    return request.execute()
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                observe_gmail_call(method, time.perf_counter() - start, outcome)
+                if self.creds.token != token_before:
+                    TOKEN_REFRESHES.inc()
+
+        return self.scheduler.execute(attempt, method, units)
 
 
     def _parse_header(self, headers, name):
-        """Helper to extract header value by name."""
+        """Helper to extract header value by name. Prefer _index_headers when reading several."""
         for header in headers:
             if header['name'].lower() == name.lower():
                 return header['value']
@@ -47,25 +154,43 @@ class GmailService:
         Recursively extract body from payload parts. 
         Prioritizes HTML, falls back to Plain Text.
         """
-        body = ""
-        if 'parts' in payload:
-            for part in payload['parts']:
-                if part['mimeType'] == 'text/html':
-                    data = part['body'].get('data')
-                    if data:
-                        body = base64.urlsafe_b64decode(data).decode('utf-8')
-                        break # Found HTML, stop looking
-                elif part['mimeType'] == 'text/plain':
-                     data = part['body'].get('data')
-                     if data:
-                         body = base64.urlsafe_b64decode(data).decode('utf-8')
-        elif 'body' in payload:
-             data = payload['body'].get('data')
-             if data:
-                 body = base64.urlsafe_b64decode(data).decode('utf-8')
-        return body
+        if 'parts' not in payload:
+            data = payload.get('body', {}).get('data')
+            return base64.urlsafe_b64decode(data).decode('utf-8') if data else ""
+
+        # Depth-first walk so HTML nested in multipart/mixed > multipart/alternative is found;
+        # plain text is only decoded if no HTML part exists anywhere.
+        plain_data = None
+        stack = list(reversed(payload['parts']))
+        while stack:
+            part = stack.pop()
+            if 'parts' in part:
+                stack.extend(reversed(part['parts']))
+                continue
+            mime_type = part.get('mimeType')
+            if mime_type == 'text/html':
+                data = part.get('body', {}).get('data')
+                if data:
+                    return base64.urlsafe_b64decode(data).decode('utf-8')
+            elif mime_type == 'text/plain' and plain_data is None:
+                plain_data = part.get('body', {}).get('data')
+        return base64.urlsafe_b64decode(plain_data).decode('utf-8') if plain_data else ""
+
 
+    def _build_preview(self, m, sender_header: str = 'From', unread=None) -> EmailPreview:
+        """Build a list row from a messages.get response, indexing its headers once."""
+        headers = _index_headers(m['payload']['headers'])
+        return EmailPreview(
+            id=m['id'],
+            sender=headers.get(sender_header.lower(), ""),
+            subject=headers.get('subject', ""),
+            snippet=m.get('snippet', ''),
+            date=self._parse_timestamp(m['internalDate']),
+            unread='UNREAD' in m['labelIds'] if unread is None else unread
+        )
 
+
+    @traced("service.list_inbox_emails")
     def list_inbox_emails(self, max_results: int = 20, page_token: str = "") -> 'PaginatedEmails':
         """List emails from Inbox."""
         kwargs = {
@@ -76,7 +201,7 @@ class GmailService:
         if page_token:
             kwargs['pageToken'] = page_token
             
-        results = self.service.users().messages().list(**kwargs).execute()
+        results = self._execute(self.service.users().messages().list(**kwargs), 'messages.list')
         messages = results.get('messages', [])
         next_page_token = results.get('nextPageToken')
         
@@ -86,32 +211,28 @@ class GmailService:
             return PaginatedEmails(messages=[], nextPageToken=None)
 
         # Batch get for better performance could be done here, but simple loop for now as per req
+        partial = False
         for msg in messages:
             # We need format=metadata to get headers for preview without full body
             # But snippet is also useful
             try:
-                m = self.service.users().messages().get(userId='me', id=msg['id'], format='full').execute()
-                
-                headers = m['payload']['headers']
-                sender = self._parse_header(headers, 'From')
-                subject = self._parse_header(headers, 'Subject')
-                date_obj = self._parse_timestamp(m['internalDate'])
-                
-                previews.append(EmailPreview(
-                    id=m['id'],
-                    sender=sender,
-                    subject=subject,
-                    snippet=m.get('snippet', ''),
-                    date=date_obj,
-                    unread='UNREAD' in m['labelIds']
-                ))
+                m = self._execute(self.service.users().messages().get(userId='me', id=msg['id'], format='full'), 'messages.get')
+                previews.append(self._build_preview(m))
+            except CircuitOpenError:
+                # Raised so cached routes can serve their last good page instead
+                raise
+            except DeadlineExceeded as e:
+                logger.warning(f"Returning {len(previews)} of {len(messages)} inbox messages: {e}")
+                partial = True
+                break
             except Exception as e:
-                print(f"Error fetching message {msg['id']}: {e}")
+                logger.warning(f"Error fetching message {msg['id']}: {e}")
                 continue
             
-        return PaginatedEmails(messages=previews, nextPageToken=next_page_token)
+        return PaginatedEmails(messages=previews, nextPageToken=next_page_token, partial=partial)
 
 
+    @traced("service.list_sent_emails")
     def list_sent_emails(self, max_results: int = 10, page_token: str = "") -> 'PaginatedEmails':
         """List emails from Sent folder."""
         kwargs = {
@@ -122,7 +243,7 @@ class GmailService:
         if page_token:
             kwargs['pageToken'] = page_token
 
-        results = self.service.users().messages().list(**kwargs).execute()
+        results = self._execute(self.service.users().messages().list(**kwargs), 'messages.list')
         messages = results.get('messages', [])
         next_page_token = results.get('nextPageToken')
         
@@ -131,50 +252,93 @@ class GmailService:
         if not messages:
             return PaginatedEmails(messages=[], nextPageToken=None)
 
+        partial = False
         for msg in messages:
              try:
-                 m = self.service.users().messages().get(userId='me', id=msg['id'], format='full').execute()
-                 headers = m['payload']['headers']
-                 sender = self._parse_header(headers, 'To') # For sent, showing To is usually more relevant, allowing flex
-                 subject = self._parse_header(headers, 'Subject')
-                 date_obj = self._parse_timestamp(m['internalDate'])
-                 
-                 previews.append(EmailPreview(
-                    id=m['id'],
-                    sender=sender,
-                    subject=subject,
-                    snippet=m.get('snippet', ''),
-                    date=date_obj,
-                    unread=False # Sent items are read usually
-                 ))
+                 m = self._execute(self.service.users().messages().get(userId='me', id=msg['id'], format='full'), 'messages.get')
+                 # For sent, showing To is usually more relevant; sent items are read
+                 previews.append(self._build_preview(m, sender_header='To', unread=False))
+             except CircuitOpenError:
+                 # Raised so cached routes can serve their last good page instead
+                 raise
+             except DeadlineExceeded as e:
+                 logger.warning(f"Returning {len(previews)} of {len(messages)} sent messages: {e}")
+                 partial = True
+                 break
              except Exception as e:
-                 print(f"Error fetching message {msg['id']}: {e}")
+                 logger.warning(f"Error fetching message {msg['id']}: {e}")
                  continue
                  
-        return PaginatedEmails(messages=previews, nextPageToken=next_page_token)
+        return PaginatedEmails(messages=previews, nextPageToken=next_page_token, partial=partial)
 
 
+    @traced("service.get_email_detail")
     def get_email_detail(self, message_id: str) -> EmailDetail:
         """Get full details of a specific email."""
-        m = self.service.users().messages().get(userId='me', id=message_id, format='full').execute()
-        
-        headers = m['payload']['headers']
-        sender = self._parse_header(headers, 'From')
-        subject = self._parse_header(headers, 'Subject')
+        if settings.MESSAGE_DETAIL_FROM_RAW:
+            return self._get_email_detail_raw(message_id)
+
+        # Bodies never change, so once stored (even by an earlier process)
+        # only headers and labels need fetching
+        body_ref = f"{self.user_email}:body:{message_id}" if self.user_email else None
+        body_digest = blob_store.resolve(body_ref) if body_ref else None
+        body = blob_store.read_text(body_digest) if body_digest else None
+        if body is not None:
+            m = self._execute(self.service.users().messages().get(
+                userId='me', id=message_id, format='metadata', metadataHeaders=DETAIL_HEADERS
+            ), 'messages.get')
+        else:
+            m = self._execute(self.service.users().messages().get(userId='me', id=message_id, format='full'), 'messages.get')
+            body = self._get_body(m['payload'])
+            if body_ref:
+                body_digest = blob_store.put(body.encode('utf-8'))
+                blob_store.link(body_ref, body_digest)
+
+        headers = _index_headers(m['payload']['headers'])
         date_obj = self._parse_timestamp(m['internalDate'])
-        body = self._get_body(m['payload'])
-        
-        return EmailDetail(
+
+        detail = EmailDetail(
             id=m['id'],
-            sender=sender,
-            subject=subject,
+            sender=headers.get('from', ""),
+            subject=headers.get('subject', ""),
             date=date_obj,
             body=body,
             dataset='gmail',
-            unread='UNREAD' in m['labelIds']
+            unread='UNREAD' in m['labelIds'],
+            labelIds=m['labelIds'],
+            threadId=m.get('threadId'),
+            replyTo=headers.get('reply-to'),
+            messageIdHeader=headers.get('message-id'),
+            references=headers.get('references')
+        )
+        detail._body_digest = body_digest
+        return detail
+
+
+    def _get_email_detail_raw(self, message_id: str) -> EmailDetail:
+        """Detail from format=raw, parsed in the MIME process pool; also lists attachments."""
+        m = self._execute(self.service.users().messages().get(userId='me', id=message_id, format='raw'), 'messages.get')
+        parsed = mime_parser.parse(base64.urlsafe_b64decode(m['raw']))
+        headers = parsed.headers
+
+        return EmailDetail(
+            id=m['id'],
+            sender=headers.get('from', ""),
+            subject=headers.get('subject', ""),
+            date=self._parse_timestamp(m['internalDate']),
+            body=parsed.html if parsed.html is not None else (parsed.text or ""),
+            dataset='gmail',
+            unread='UNREAD' in m['labelIds'],
+            labelIds=m['labelIds'],
+            threadId=m.get('threadId'),
+            replyTo=headers.get('reply-to'),
+            messageIdHeader=headers.get('message-id'),
+            references=headers.get('references'),
+            attachments=[asdict(a) for a in parsed.attachments]
         )
 
 
+    @traced("service.send_email")
     def send_email(self, to: list[str], subject: str, body: str):
         """Send an email."""
         message = MIMEText(body)
@@ -185,11 +349,12 @@ class GmailService:
         raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
         body = {'raw': raw_message}
         
-        self.service.users().messages().send(userId='me', body=body).execute()
+        return self._execute(self.service.users().messages().send(userId='me', body=body), 'messages.send')
 
+    @traced("service.search_emails")
     def search_emails(self, query: str) -> list[EmailPreview]:
         """Search emails using Gmail query parsing."""
-        results = self.service.users().messages().list(userId='me', q=query).execute()
+        results = self._execute(self.service.users().messages().list(userId='me', q=query), 'messages.list')
         messages = results.get('messages', [])
         previews = []
 
@@ -198,41 +363,36 @@ class GmailService:
 
         # Cap search results to avoid long waits for this MVP
         for msg in messages[:20]:
-             m = self.service.users().messages().get(userId='me', id=msg['id'], format='full').execute()
-             headers = m['payload']['headers']
-             sender = self._parse_header(headers, 'From')
-             subject = self._parse_header(headers, 'Subject')
-             date_obj = self._parse_timestamp(m['internalDate'])
-             
-             previews.append(EmailPreview(
-                id=m['id'],
-                sender=sender,
-                subject=subject,
-                snippet=m.get('snippet', ''),
-                date=date_obj,
-                unread='UNREAD' in m['labelIds']
-            ))
+             m = self._execute(self.service.users().messages().get(userId='me', id=msg['id'], format='full'), 'messages.get')
+             previews.append(self._build_preview(m))
         return previews
 
+    @traced("service.reply_email")
     def reply_email(self, original_message_id: str, body: str):
-        """Reply to an email."""
-        # Get original email to find threadId and headers
-        original = self.service.users().messages().get(userId='me', id=original_message_id, format='metadata').execute()
-        thread_id = original['threadId']
-        headers = original['payload']['headers']
-        
-        subject = self._parse_header(headers, 'Subject')
+        """Reply to an email. The messages.send response also carries the `to` the reply went to."""
+        # The user has usually just opened the message, so its cached detail
+        # carries the threadId and headers; otherwise fetch them from Gmail
+        cached = self.get_cached_detail(original_message_id)
+        if cached is not None and cached.threadId:
+            thread_id = cached.threadId
+            subject = cached.subject
+            reply_to = cached.replyTo or cached.sender
+            message_id_header = cached.messageIdHeader or ""
+            references = cached.references or ""
+        else:
+            original = self._execute(self.service.users().messages().get(userId='me', id=original_message_id, format='metadata'), 'messages.get')
+            thread_id = original['threadId']
+            headers = _index_headers(original['payload']['headers'])
+
+            subject = headers.get('subject', "")
+            # Should reply to Reply-To if present, else From
+            reply_to = headers.get('reply-to') or headers.get('from', "")
+            # Get Message-ID to set In-Reply-To and References
+            message_id_header = headers.get('message-id', "")
+            references = headers.get('references', "")
+
         if not subject.lower().startswith('re:'):
             subject = f"Re: {subject}"
-            
-        # Should reply to Reply-To if present, else From
-        reply_to = self._parse_header(headers, 'Reply-To')
-        if not reply_to:
-            reply_to = self._parse_header(headers, 'From')
-            
-        # Get Message-ID to set In-Reply-To and References
-        message_id_header = self._parse_header(headers, 'Message-ID')
-        references = self._parse_header(headers, 'References')
         
         message = MIMEText(body)
         message['to'] = reply_to
@@ -248,23 +408,250 @@ class GmailService:
             'threadId': thread_id
         }
         
-        self.service.users().messages().send(userId='me', body=body).execute()
+        sent = self._execute(self.service.users().messages().send(userId='me', body=body), 'messages.send')
+        if isinstance(sent, dict):
+            sent['to'] = reply_to
+        return sent
+
 
+    def get_cached_detail(self, message_id: str) -> Optional[EmailDetail]:
+        """EmailDetail cached by the /messages/{id} route for this user, if still fresh."""
+        packed = cache_manager.get(build_cache_key(MESSAGE_DETAIL_NAMESPACE, self.user_email, message_id=message_id))
+        return unpack_detail(packed) if packed is not None else None
 
+
+    @traced("service.forward_email")
     def forward_email(self, original_message_id: str, to: list[str], body: str):
-        """Forward an email."""
-        # Get original email content to include in body or attachment (simplest is inline body for now)
-        original_detail = self.get_email_detail(original_message_id)
-        
-        forward_body = f"{body}\n\n---------- Forwarded message ---------\nFrom: {original_detail.sender}\nDate: {original_detail.date}\nSubject: {original_detail.subject}\n\n{original_detail.body}"
-        
-        subject = original_detail.subject
+        """
+        Forward an email. The original is fetched once in raw form and attached
+        byte-for-byte as message/rfc822, so HTML and attachments survive and the
+        body is never decoded into Python strings.
+        """
+        original = self._execute(self.service.users().messages().get(userId='me', id=original_message_id, format='raw'), 'messages.get')
+        raw = base64.urlsafe_b64decode(original['raw'])
+
+        # Only the header block is parsed; the body stays as bytes
+        header_end = raw.find(b"\r\n\r\n")
+        if header_end < 0:
+            header_end = raw.find(b"\n\n")
+        headers = BytesHeaderParser(policy=email_policy.default).parsebytes(raw[:header_end if header_end >= 0 else len(raw)])
+        sender, date, subject = headers.get('From', ""), headers.get('Date', ""), headers.get('Subject', "")
+
+        intro = MIMEText(f"{body}\n\n---------- Forwarded message ---------\nFrom: {sender}\nDate: {date}\nSubject: {subject}\n")
         if not subject.lower().startswith('fwd:'):
-             subject = f"Fwd: {subject}"
-             
-        self.send_email(to, subject, forward_body)
+            subject = f"Fwd: {subject}"
+
+        boundary = f"mailflow_{uuid.uuid4().hex}"
+        outer_headers = [
+            ('MIME-Version', "1.0"),
+            ('Content-Type', f'multipart/mixed; boundary="{boundary}"'),
+            ('to', ", ".join(to)),
+            ('subject', subject),
+        ]
+
+        # The multipart envelope is assembled by hand so the original can be
+        # spliced in without the email package re-parsing and re-serialising it
+        delimiter = f"--{boundary}\r\n".encode()
+        message = b"".join([
+            *(email_policy.SMTP.fold_binary(name, value) for name, value in outer_headers),
+            b"\r\n", delimiter,
+            intro.as_bytes(policy=email_policy.SMTP),
+            b"\r\n", delimiter,
+            b"Content-Type: message/rfc822\r\n",
+            b'Content-Disposition: attachment; filename="forwarded.eml"\r\n\r\n',
+            raw,
+            f"\r\n--{boundary}--\r\n".encode(),
+        ])
+
+        send_body = {'raw': base64.urlsafe_b64encode(message).decode('utf-8')}
+        return self._execute(self.service.users().messages().send(userId='me', body=send_body), 'messages.send')
 
 
+    @traced("service.get_attachment")
+    def get_attachment(self, message_id: str, attachment_id: str) -> bytes:
+        """Decoded bytes of one attachment (messages.attachments.get)."""
+        result = self._execute(self.service.users().messages().attachments().get(
+            userId='me', messageId=message_id, id=attachment_id
+        ), 'messages.attachments.get')
+        return base64.urlsafe_b64decode(result['data'])
+
+
+    @traced("service.delete_email")
     def delete_email(self, message_id: str):
         """Move email to trash."""
-        self.service.users().messages().trash(userId='me', id=message_id).execute()
+        self._execute(self.service.users().messages().trash(userId='me', id=message_id), 'messages.trash')
+
+
+    @traced("service.batch_modify")
+    def batch_modify(self, message_ids: list[str], add_label_ids: Optional[list[str]] = None,
+                     remove_label_ids: Optional[list[str]] = None):
+        """messages.batchModify: add and remove labels on up to 1000 messages in one call."""
+        body = {'ids': message_ids}
+        if add_label_ids:
+            body['addLabelIds'] = add_label_ids
+        if remove_label_ids:
+            body['removeLabelIds'] = remove_label_ids
+        self._execute(self.service.users().messages().batchModify(userId='me', body=body), 'messages.batchModify')
+
+
+    @traced("service.watch")
+    def watch(self, topic_name: str, label_ids: Optional[list[str]] = None) -> dict:
+        """Start (or renew) push notifications to a Pub/Sub topic. Returns historyId and expiration (ms)."""
+        body = {'topicName': topic_name, 'labelIds': label_ids or ['INBOX'], 'labelFilterBehavior': 'include'}
+        return self._execute(self.service.users().watch(userId='me', body=body), 'watch')
+
+
+    @traced("service.stop_watch")
+    def stop_watch(self):
+        self._execute(self.service.users().stop(userId='me'), 'stop')
+
+
+    @traced("service.list_history")
+    def list_history(self, start_history_id: str, history_types: Optional[list[str]] = None) -> dict:
+        """
+        All history records after start_history_id, following every page.
+        Returns {'history': [...], 'historyId': <latest>}. Raises
+        HistoryExpiredError when Gmail no longer keeps that point (HTTP 404).
+        """
+        kwargs = {'userId': 'me', 'startHistoryId': start_history_id, 'maxResults': 500}
+        if history_types:
+            kwargs['historyTypes'] = history_types
+        records = []
+        while True:
+            try:
+                results = self._execute(self.service.users().history().list(**kwargs), 'history.list')
+            except HttpError as e:
+                if e.resp.status == 404:
+                    raise HistoryExpiredError(start_history_id) from e
+                raise
+            records.extend(results.get('history', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return {'history': records, 'historyId': results.get('historyId', start_history_id)}
+            kwargs['pageToken'] = page_token
+
+
+    @traced("service.get_profile")
+    def get_profile(self) -> dict:
+        """users.getProfile: emailAddress, messagesTotal, threadsTotal and the current historyId."""
+        return self._execute(self.service.users().getProfile(userId='me'), 'getProfile')
+
+
+    @traced("service.get_previews")
+    def get_previews(self, message_ids: list[str]) -> list[EmailPreview]:
+        """List rows for specific messages, skipping any that no longer exist."""
+        previews = []
+        for message_id in message_ids:
+            try:
+                m = self._execute(self.service.users().messages().get(
+                    userId='me', id=message_id, format='metadata', metadataHeaders=['From', 'Subject']
+                ), 'messages.get')
+            except HttpError as e:
+                if e.resp.status == 404:
+                    continue
+                raise
+            previews.append(self._build_preview(m))
+        return previews
+
+
+    @traced("service.get_label_counts")
+    def get_label_counts(self, label_ids: tuple = ('INBOX', 'SENT', 'UNREAD')) -> dict:
+        """Message and thread totals per label, from labels.get."""
+        counts = {}
+        for label_id in label_ids:
+            label = self._execute(self.service.users().labels().get(userId='me', id=label_id), 'labels.get')
+            counts[label_id] = {
+                'messagesTotal': label.get('messagesTotal', 0),
+                'messagesUnread': label.get('messagesUnread', 0),
+                'threadsTotal': label.get('threadsTotal', 0),
+                'threadsUnread': label.get('threadsUnread', 0),
+            }
+        return counts
+
+
+    @traced("service.get_labels")
+    def get_labels(self) -> list[dict]:
+        """
+        Every label from labels.list with its message counts, which only
+        labels.get returns; the gets go out in HTTP batches of 100.
+        """
+        labels = self._execute(self.service.users().labels().list(userId='me'), 'labels.list').get('labels', [])
+        details, errors = {}, {}
+
+        def collect(request_id, response, exception):
+            if exception is not None:
+                errors[request_id] = exception
+            else:
+                details[request_id] = response
+
+        for start in range(0, len(labels), 100):
+            chunk = labels[start:start + 100]
+            batch = self._new_batch(collect)
+            for label in chunk:
+                batch.add(self.service.users().labels().get(userId='me', id=label['id']), request_id=label['id'])
+            self._execute(batch, 'batch', units=len(chunk) * quota_cost('labels.get'))
+        for label_id in errors:
+            # Retried one at a time, through the scheduler's backoff
+            details[label_id] = self._execute(self.service.users().labels().get(userId='me', id=label_id), 'labels.get')
+        return [details[label['id']] for label in labels]
+
+
+    @traced("service.list_message_ids")
+    def list_message_ids(self, page_token: Optional[str] = None, max_results: int = 500,
+                         query: Optional[str] = None, label_ids: Optional[list[str]] = None) -> tuple[list[str], Optional[str]]:
+        """
+        One messages.list page, by default over the whole mailbox (excluding
+        spam and trash): ids and the next page token.
+        """
+        kwargs = {'userId': 'me', 'maxResults': max_results}
+        if page_token:
+            kwargs['pageToken'] = page_token
+        if query:
+            kwargs['q'] = query
+        if label_ids:
+            kwargs['labelIds'] = label_ids
+        results = self._execute(self.service.users().messages().list(**kwargs), 'messages.list')
+        return [m['id'] for m in results.get('messages', [])], results.get('nextPageToken')
+
+
+    @traced("service.get_thread")
+    def get_thread(self, thread_id: str, format: str = 'metadata', metadata_headers: Optional[list[str]] = None) -> dict:
+        """threads.get: the thread's historyId and its messages, oldest first."""
+        kwargs = {'userId': 'me', 'id': thread_id, 'format': format}
+        if format == 'metadata' and metadata_headers:
+            kwargs['metadataHeaders'] = metadata_headers
+        return self._execute(self.service.users().threads().get(**kwargs), 'threads.get')
+
+
+    def _new_batch(self, callback) -> BatchHttpRequest:
+        if settings.GOOGLE_API_ENDPOINT:
+            # new_batch_http_request() ignores api_endpoint and would post to Google
+            return BatchHttpRequest(callback=callback,
+                                    batch_uri=settings.GOOGLE_API_ENDPOINT.rstrip('/') + '/batch/gmail/v1')
+        return self.service.new_batch_http_request(callback=callback)
+
+
+    @traced("service.get_messages_batch")
+    def get_messages_batch(self, message_ids: list[str], format: str = 'metadata',
+                           metadata_headers: Optional[list[str]] = None) -> tuple[dict, dict]:
+        """
+        messages.get for up to 100 messages in one HTTP batch request. Quota is
+        still charged per message. Returns (messages by id, errors by id);
+        failed sub-requests are left for the caller to retry.
+        """
+        messages, errors = {}, {}
+
+        def collect(request_id, response, exception):
+            if exception is not None:
+                errors[request_id] = exception
+            else:
+                messages[request_id] = response
+
+        batch = self._new_batch(collect)
+        for message_id in message_ids:
+            kwargs = {'userId': 'me', 'id': message_id, 'format': format}
+            if metadata_headers:
+                kwargs['metadataHeaders'] = metadata_headers
+            batch.add(self.service.users().messages().get(**kwargs), request_id=message_id)
+        self._execute(batch, 'batch', units=len(message_ids) * quota_cost('messages.get'))
+        return messages, errors
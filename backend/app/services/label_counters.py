@@ -0,0 +1,197 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.cache import MESSAGE_DETAIL_NAMESPACE, build_cache_key, cache_manager
+from app.core.config import settings
+from app.core.tracing import span
+from app.schemas.label import LabelInfo
+from app.services.gmail_service import GmailService
+from app.services.mail_events import mail_events
+from app.services.mailbox_sync import MailboxChanges, MailboxSyncService, add_change_listener
+
+logger = logging.getLogger(__name__)
+
+
+def adjust(counts: Dict[str, LabelInfo], before: Iterable[str], after: Iterable[str]):
+    """Move one message's contribution to the counters from its old labels to its new ones."""
+    for labels, sign in ((set(before), -1), (set(after), 1)):
+        unread = 'UNREAD' in labels
+        for label_id in labels:
+            label = counts.get(label_id)
+            # Labels created since the last fetch appear with the next one
+            if label is None:
+                continue
+            label.messagesTotal = max(label.messagesTotal + sign, 0)
+            if unread:
+                label.messagesUnread = max(label.messagesUnread + sign, 0)
+
+
+def cached_labels(email: str, message_id: str) -> Optional[List[str]]:
+    """labelIds of a message from its cached detail (the user has usually just opened it)."""
+    packed = cache_manager.get(build_cache_key(MESSAGE_DETAIL_NAMESPACE, email, message_id=message_id))
+    if packed is None or not packed.detail.labelIds:
+        return None
+    return packed.detail.labelIds
+
+
+def sync_history(db: Session, service: GmailService) -> bool:
+    """
+    Catch-up for LabelCounters.get: run a history sync (one history.list
+    call) so changes made in other clients reach the counters through
+    on_changes. Only the counters are updated before returning; the other
+    change listeners run out of band. Skipped while push or an SSE stream
+    already syncs the user. Returns False when there was no stored
+    historyId to diff against.
+    """
+    email = service.user_email
+    state = MailboxSyncService.get_state(db, email)
+    hub = mail_events.hubs.get(email)
+    if MailboxSyncService.push_active(state) or (hub is not None and hub.subscribers):
+        return True
+    MailboxSyncService.sync(db, email, lambda tokens: service, inline=label_counters.on_changes)
+    return state is not None and bool(state.history_id)
+
+
+class LabelCounters:
+    """
+    Per-user label list with message counts, fetched once from labels.list
+    and labels.get and then kept current without API calls: local actions
+    (label changes, delete) and history deltas each move a message's
+    contribution from its old labels to its new ones. A local action
+    records the labels it assumed the message now has; when history later
+    reports the message, the delta is taken from that assumed state, so
+    the action is not counted twice and a wrong guess is corrected. When a
+    message's old labels are unknown the user's counters are dropped and
+    fetched again; they are also refetched every `refresh_seconds` to
+    pick up new labels and changes no sync reported. Counters that no
+    sync has confirmed for `max_lag_seconds` are brought up to date by the
+    caller's catch-up (see sync_history) or else refetched. Only the
+    `max_users` most recently read users are kept.
+    """
+
+    def __init__(self, refresh_seconds: Optional[float] = None, max_lag_seconds: Optional[float] = None,
+                 max_users: Optional[int] = None):
+        self.refresh_seconds = refresh_seconds or settings.LABEL_COUNTERS_REFRESH_SECONDS
+        self.max_lag_seconds = max_lag_seconds or settings.MAILBOX_LIST_CACHE_TTL_SECONDS
+        self.max_users = max_users or settings.LABEL_COUNTERS_CACHED_USERS
+        # email -> (monotonic fetch time, label id -> counters in labels.list order), least recently read first
+        self._users: "OrderedDict[str, Tuple[float, Dict[str, LabelInfo]]]" = OrderedDict()
+        # email -> monotonic time the counters were last known to include every change
+        self._confirmed: Dict[str, float] = {}
+        # email -> message id -> labels assumed after a local action, until history reports it
+        self._assumed: Dict[str, Dict[str, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def _current(self, email: str) -> Optional[Dict[str, LabelInfo]]:
+        """Caller holds _lock."""
+        entry = self._users.get(email)
+        if entry is None or time.monotonic() - entry[0] >= self.refresh_seconds:
+            return None
+        self._users.move_to_end(email)
+        return entry[1]
+
+    def get(self, service: GmailService, catch_up: Optional[Callable[[], bool]] = None) -> List[LabelInfo]:
+        """
+        `catch_up` is run when the counters may be missing changes; it
+        returns True once they are current (history applied via on_changes).
+        """
+        email = service.user_email
+        with self._lock:
+            counts = self._current(email)
+            lagging = counts is not None and \
+                time.monotonic() - self._confirmed.get(email, 0) >= self.max_lag_seconds
+            if counts is not None and not lagging:
+                return [label.model_copy() for label in counts.values()]
+        if lagging:
+            started = time.monotonic()
+            current = False
+            if catch_up is not None:
+                try:
+                    current = catch_up()
+                except Exception as e:
+                    logger.warning(f"Label counter catch-up failed for {email}: {e}")
+            with self._lock:
+                counts = self._current(email)
+                if counts is not None and current:
+                    self._confirmed[email] = max(self._confirmed.get(email, 0), started)
+                    return [label.model_copy() for label in counts.values()]
+                self._forget(email)
+        with span("labels.fetch"):
+            counts = {
+                label['id']: LabelInfo(
+                    id=label['id'], name=label.get('name', label['id']), type=label.get('type', 'user'),
+                    messagesTotal=label.get('messagesTotal', 0), messagesUnread=label.get('messagesUnread', 0),
+                )
+                for label in service.get_labels()
+            }
+        with self._lock:
+            now = time.monotonic()
+            self._users[email] = (now, counts)
+            self._users.move_to_end(email)
+            self._confirmed[email] = now
+            # Gmail's counts already include whatever it has applied; history adjusts the rest
+            self._assumed.pop(email, None)
+            while len(self._users) > self.max_users:
+                self._forget(next(iter(self._users)))
+            return [label.model_copy() for label in counts.values()]
+
+    def _forget(self, email: str):
+        """Caller holds _lock."""
+        self._users.pop(email, None)
+        self._confirmed.pop(email, None)
+        self._assumed.pop(email, None)
+
+    def drop(self, email: str):
+        with self._lock:
+            self._forget(email)
+
+    def apply_local(self, email: str, message_ids: Iterable[str], add: Iterable[str] = (),
+                    remove: Iterable[str] = ()):
+        """Count a change made through this app before Gmail reports it."""
+        add, remove = set(add), set(remove)
+        with self._lock:
+            entry = self._users.get(email)
+            if entry is None:
+                return
+            assumed = self._assumed.setdefault(email, {})
+            for message_id in message_ids:
+                before = assumed.get(message_id)
+                if before is None:
+                    before = cached_labels(email, message_id)
+                if before is None:
+                    logger.debug(f"Labels of {message_id} unknown; refetching counters for {email}")
+                    self._forget(email)
+                    return
+                after = sorted((set(before) | add) - remove)
+                adjust(entry[1], before, after)
+                assumed[message_id] = after
+
+    def on_changes(self, db: Session, email: str, changes: MailboxChanges):
+        """Mailbox change listener: apply history deltas."""
+        with self._lock:
+            entry = self._users.get(email)
+            if entry is None:
+                return
+            if changes.resync:
+                self._forget(email)
+                return
+            assumed = self._assumed.get(email, {})
+            for message_id in changes.changed:
+                before = assumed.pop(message_id, None)
+                if before is None:
+                    before = changes.before.get(message_id)
+                after = [] if message_id in changes.deleted else changes.labels.get(message_id)
+                if before is None or after is None:
+                    self._forget(email)
+                    return
+                adjust(entry[1], before, after)
+            self._confirmed[email] = time.monotonic()
+
+
+label_counters = LabelCounters()
+add_change_listener(label_counters.on_changes)
@@ -0,0 +1,255 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.cache import INBOX_NAMESPACE, LABEL_COUNTS_NAMESPACE, MESSAGE_DETAIL_NAMESPACE, cache_manager
+from app.core.config import settings
+from app.core.metrics import LABEL_CHANGES
+from app.db.session import SessionLocal
+from app.services.gmail_service import GmailService
+from app.services.label_counters import label_counters
+from app.services.mailbox_sync import MailboxChanges, add_change_listener, invalidate_user_cache
+from app.services.outbox_worker import is_retryable
+from app.services.token_service import TokenService
+
+logger = logging.getLogger(__name__)
+
+# messages.batchModify takes at most this many ids per call
+BATCH_MODIFY_LIMIT = 1000
+# /search results are cached under the route function's name
+SEARCH_NAMESPACE = "search_emails"
+
+# message id -> label -> True to add it, False to remove it
+Changes = Dict[str, Dict[str, bool]]
+
+
+def apply_changes(items: list, changes: Changes, view_label: Optional[str] = None) -> list:
+    """
+    Show label changes on previews or details: UNREAD sets the unread flag,
+    and items losing `view_label` (e.g. INBOX for an archived message) drop
+    out of the list. Items are updated in place.
+    """
+    kept = []
+    for item in items:
+        labels = changes.get(item.id)
+        if labels is None:
+            kept.append(item)
+            continue
+        if 'UNREAD' in labels:
+            item.unread = labels['UNREAD']
+        if getattr(item, 'labelIds', None):
+            item.labelIds = sorted((set(item.labelIds) | {l for l, on in labels.items() if on})
+                                   - {l for l, on in labels.items() if not on})
+        if view_label is None or labels.get(view_label, True):
+            kept.append(item)
+    return kept
+
+
+def apply_to_cache(email: str, changes: Changes):
+    """Update the user's cached inbox pages, search results and details so they show the changes at once."""
+    def patch_page(page):
+        page.messages = apply_changes(page.messages, changes, view_label='INBOX')
+        return page
+
+    def patch_detail(packed):
+        apply_changes([packed.detail], changes)
+        return packed
+
+    cache_manager.update_prefix(f"{email}:{MESSAGE_DETAIL_NAMESPACE}:", patch_detail)
+    cache_manager.update_prefix(f"{email}:{SEARCH_NAMESPACE}:", lambda previews: apply_changes(previews, changes))
+    if any(labels.get('INBOX') for labels in changes.values()):
+        # A message moved back to the inbox can't be placed without its preview
+        cache_manager.invalidate_prefix(f"{email}:{INBOX_NAMESPACE}:")
+    else:
+        cache_manager.update_prefix(f"{email}:{INBOX_NAMESPACE}:", patch_page)
+    cache_manager.invalidate_prefix(f"{email}:{LABEL_COUNTS_NAMESPACE}:")
+
+
+class LabelWriter:
+    """
+    Write-behind buffer for label changes (read/unread, archive, star).
+    modify() shows a change in the user's cached views at once and records
+    it; a background thread writes each user's changes `delay_seconds`
+    after the first one as few messages.batchModify calls as possible. The
+    latest change per message and label wins, and messages with the same
+    net change share a call. batchModify only adds and removes the labels
+    named, so changes made meanwhile in another client are kept. Anything
+    still pending is written on shutdown.
+    """
+
+    def __init__(self, session_factory: Callable = SessionLocal,
+                 service_factory: Callable = GmailService.from_tokens,
+                 delay_seconds: Optional[float] = None, max_attempts: Optional[int] = None):
+        self.session_factory = session_factory
+        self.service_factory = service_factory
+        self.delay_seconds = settings.LABEL_WRITE_DELAY_SECONDS if delay_seconds is None else delay_seconds
+        self.max_attempts = max_attempts or settings.LABEL_WRITE_MAX_ATTEMPTS
+        self._pending: Dict[str, Changes] = {}
+        # email -> monotonic time its changes are written
+        self._due: Dict[str, float] = {}
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="label-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush_all()
+
+    def modify(self, email: str, message_ids: Iterable[str], add: Iterable[str] = (),
+               remove: Iterable[str] = ()) -> int:
+        """Queue a change and show it in the cache. Returns how many of the user's messages await writing."""
+        change = {label: True for label in add}
+        change.update({label: False for label in remove})
+        changes = {message_id: dict(change) for message_id in message_ids}
+        with self._lock:
+            pending = self._pending.setdefault(email, {})
+            for message_id, labels in changes.items():
+                pending.setdefault(message_id, {}).update(labels)
+            self._due.setdefault(email, time.monotonic() + self.delay_seconds)
+            if len(pending) >= BATCH_MODIFY_LIMIT:
+                self._due[email] = 0
+            waiting = len(pending)
+        LABEL_CHANGES.labels(stage="queued").inc(len(changes))
+        # Counters read the old labels from the cached details, so go first
+        label_counters.apply_local(email, changes, add, remove)
+        apply_to_cache(email, changes)
+        self._wakeup.set()
+        return waiting
+
+    def overlay(self, email: str, items: list, view_label: Optional[str] = None) -> list:
+        """Apply the user's unwritten changes to previews or details just fetched from Gmail."""
+        with self._lock:
+            pending = self._pending.get(email)
+            if not pending:
+                return items
+            return apply_changes(items, pending, view_label)
+
+    def pending(self, email: str) -> Changes:
+        with self._lock:
+            return {message_id: dict(labels) for message_id, labels in self._pending.get(email, {}).items()}
+
+    def on_changes(self, db: Session, email: str, changes: MailboxChanges):
+        """Mailbox change listener: forget changes to messages deleted in Gmail."""
+        if not changes.deleted:
+            return
+        with self._lock:
+            pending = self._pending.get(email)
+            for message_id in changes.deleted & set(pending or ()):
+                del pending[message_id]
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            with self._lock:
+                due = [email for email, at in self._due.items() if at <= now]
+            for email in due:
+                try:
+                    self.flush(email)
+                except Exception as e:
+                    logger.exception(f"Label writer error for {email}: {e}")
+            with self._lock:
+                next_at = min(self._due.values(), default=None)
+            self._wakeup.wait(None if next_at is None else max(next_at - time.monotonic(), 0))
+            self._wakeup.clear()
+
+    def flush_all(self):
+        with self._lock:
+            emails = list(self._pending)
+        for email in emails:
+            try:
+                self.flush(email, final=True)
+            except Exception as e:
+                logger.exception(f"Label writer error for {email}: {e}")
+
+    def _groups(self, changes: Changes) -> Dict[Tuple[FrozenSet[str], FrozenSet[str]], List[str]]:
+        groups = defaultdict(list)
+        for message_id, labels in changes.items():
+            add = frozenset(label for label, on in labels.items() if on)
+            remove = frozenset(label for label, on in labels.items() if not on)
+            groups[(add, remove)].append(message_id)
+        return groups
+
+    def flush(self, email: str, final: bool = False) -> bool:
+        """
+        Write the user's pending changes. Returns False when a retryable
+        error left some for a later attempt (never with final=True, which
+        gives up instead).
+        """
+        with self._lock:
+            self._due.pop(email, None)
+            snapshot = {message_id: dict(labels) for message_id, labels in self._pending.get(email, {}).items()}
+        if not snapshot:
+            return True
+
+        db = self.session_factory()
+        try:
+            tokens = TokenService.get_tokens(db, email=email)
+        finally:
+            db.close()
+        done, dropped, retry = set(), set(), False
+        if not tokens:
+            logger.warning(f"Dropping {len(snapshot)} label changes for {email}: no longer logged in")
+            dropped.update(snapshot)
+        else:
+            service = None
+            for (add, remove), message_ids in self._groups(snapshot).items():
+                for start in range(0, len(message_ids), BATCH_MODIFY_LIMIT):
+                    chunk = message_ids[start:start + BATCH_MODIFY_LIMIT]
+                    if retry:
+                        continue
+                    try:
+                        service = service or self.service_factory(tokens)
+                        service.batch_modify(chunk, sorted(add), sorted(remove))
+                        done.update(chunk)
+                    except Exception as e:
+                        attempts = self._attempts.get(email, 0) + 1
+                        if is_retryable(e) and attempts < self.max_attempts and not final:
+                            logger.warning(f"Label changes for {email} failed (attempt {attempts}), retrying: {e}")
+                            self._attempts[email] = attempts
+                            retry = True
+                        else:
+                            logger.error(f"Dropping {len(chunk)} label changes for {email}: {e}")
+                            dropped.update(chunk)
+
+        with self._lock:
+            pending = self._pending.get(email, {})
+            for message_id in done | dropped:
+                # Changed again while this flush ran: keep it for the next one
+                if pending.get(message_id) == snapshot[message_id]:
+                    del pending[message_id]
+            if not pending:
+                self._pending.pop(email, None)
+            elif retry:
+                self._due[email] = time.monotonic() + min(2 ** self._attempts[email], 60)
+            else:
+                self._due.setdefault(email, time.monotonic() + self.delay_seconds)
+            if not retry:
+                self._attempts.pop(email, None)
+        LABEL_CHANGES.labels(stage="written").inc(len(done))
+        if dropped:
+            LABEL_CHANGES.labels(stage="dropped").inc(len(dropped))
+            # Undo the optimistic view: the next read comes from Gmail
+            invalidate_user_cache(email, dropped)
+            label_counters.drop(email)
+        return not retry
+
+
+label_writer = LabelWriter()
+add_change_listener(label_writer.on_changes)
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.gmail_service import GmailService
+from app.services.mailbox_sync import MailboxChanges, MailboxSyncService, add_change_listener, build_delta
+from app.services.token_service import TokenService
+
+logger = logging.getLogger(__name__)
+
+# Sent as the SSE retry field: how long browsers wait before reconnecting
+RECONNECT_MS = 3000
+
+
+@dataclass
+class MailEvent:
+    seq: int
+    id: str
+    event: str
+    data: dict
+
+    def encode(self) -> str:
+        return f"id: {self.id}\nevent: {self.event}\ndata: {json.dumps(self.data)}\n\n"
+
+
+class UserEventHub:
+    """
+    One user's recent events and open connections. Every tab subscribes to
+    the same hub, so a single upstream check fans out to all of them.
+    """
+
+    def __init__(self, email: str, epoch: str, buffer_size: int):
+        self.email = email
+        self.epoch = epoch
+        self.seq = 0
+        self.buffer: deque = deque(maxlen=buffer_size)
+        self.subscribers: Dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+        self.lock = threading.Lock()
+        self.poller: Optional[asyncio.Task] = None
+
+    def publish(self, event: str, data: dict) -> MailEvent:
+        """Thread-safe: called from sync workers as well as the event loop."""
+        with self.lock:
+            self.seq += 1
+            item = MailEvent(self.seq, f"{self.epoch}-{self.seq}", event, data)
+            self.buffer.append(item)
+            targets = list(self.subscribers.items())
+        for queue, loop in targets:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # Loop already closed; the subscriber is going away
+                pass
+        return item
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Tuple[asyncio.Queue, List[MailEvent]]:
+        """Register a connection and return the events it missed since last_event_id."""
+        queue: asyncio.Queue = asyncio.Queue()
+        with self.lock:
+            self.subscribers[queue] = asyncio.get_running_loop()
+            backlog = self._replay(last_event_id)
+        return queue, backlog
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self.lock:
+            self.subscribers.pop(queue, None)
+
+    def _replay(self, last_event_id: Optional[str]) -> List[MailEvent]:
+        if not last_event_id:
+            return []
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch == self.epoch and seq.isdigit():
+            seq = int(seq)
+            if seq >= self.seq:
+                return []
+            oldest = self.buffer[0].seq if self.buffer else self.seq + 1
+            if seq + 1 >= oldest:
+                return [e for e in self.buffer if e.seq > seq]
+        # Unknown id (server restarted) or events already dropped from the buffer
+        return [MailEvent(self.seq, f"{self.epoch}-{self.seq}", "resync", {"reason": "missed_events"})]
+
+
+class MailEventBroker:
+    """
+    Server-Sent Events for live inbox updates. While a user has at least one
+    open connection, one poller checks Gmail history for them (skipped while
+    push notifications are active, which publish through the same hub).
+    """
+
+    def __init__(self, session_factory: Callable = SessionLocal,
+                 service_factory: Callable = GmailService.from_tokens,
+                 poll_seconds: Optional[float] = None, heartbeat_seconds: Optional[float] = None,
+                 buffer_size: Optional[int] = None):
+        self.session_factory = session_factory
+        self.service_factory = service_factory
+        self.poll_seconds = poll_seconds or settings.MAIL_EVENTS_POLL_SECONDS
+        self.heartbeat_seconds = heartbeat_seconds or settings.MAIL_EVENTS_HEARTBEAT_SECONDS
+        self.buffer_size = buffer_size or settings.MAIL_EVENTS_BUFFER_SIZE
+        # Event ids embed the process start so ids from before a restart are recognised
+        self.epoch = format(int(time.time()), "x")
+        self.hubs: Dict[str, UserEventHub] = {}
+        self._lock = threading.Lock()
+
+    def hub(self, email: str) -> UserEventHub:
+        with self._lock:
+            if email not in self.hubs:
+                self.hubs[email] = UserEventHub(email, self.epoch, self.buffer_size)
+            return self.hubs[email]
+
+    async def stream(self, email: str, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        hub = self.hub(email)
+        queue, backlog = hub.subscribe(last_event_id)
+        if hub.poller is None or hub.poller.done():
+            hub.poller = asyncio.create_task(self._poll(email))
+        try:
+            yield f"retry: {RECONNECT_MS}\n\n"
+            for event in backlog:
+                yield event.encode()
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": heartbeat\n\n"
+                    continue
+                yield event.encode()
+        finally:
+            hub.unsubscribe(queue)
+            if not hub.subscribers and hub.poller is not None:
+                hub.poller.cancel()
+                hub.poller = None
+
+    async def _poll(self, email: str):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await asyncio.to_thread(self.check, email)
+            except Exception as e:
+                logger.warning(f"Mail event check failed for {email}: {e}")
+
+    def check(self, email: str):
+        """One upstream history check; changes reach subscribers through on_changes."""
+        db = self.session_factory()
+        try:
+            if not MailboxSyncService.push_active(MailboxSyncService.get_state(db, email)):
+                MailboxSyncService.sync(db, email, self.service_factory)
+        finally:
+            db.close()
+
+    def on_changes(self, db: Session, email: str, changes: MailboxChanges):
+        """Change listener registered with MailboxSyncService."""
+        hub = self.hubs.get(email)
+        if hub is None:
+            return
+        if not hub.subscribers:
+            # Between reconnects: don't spend Gmail calls on previews, but move
+            # seq so the reconnecting Last-Event-ID replays a resync
+            hub.publish("resync", {"historyId": changes.history_id, "reason": "changes_while_disconnected"})
+            return
+        if changes.resync:
+            hub.publish("resync", {"historyId": changes.history_id, "reason": "history_expired"})
+            return
+        tokens = TokenService.get_tokens(db, email=email)
+        if not tokens:
+            return
+        delta = build_delta(self.service_factory(tokens), changes)
+        hub.publish("delta", delta.model_dump(mode="json"))
+
+
+mail_events = MailEventBroker()
+add_change_listener(mail_events.on_changes)
@@ -0,0 +1,243 @@
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.tracing import span
+from app.models.mirrored_message import MirroredMessage
+from app.schemas.email import ScoredEmail
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[^\W_]{2,}", re.UNICODE)
+# Subjects say more per word than bodies
+SUBJECT_WEIGHT = 2.0
+
+
+class HashingVectorizer:
+    """
+    Offline text embedding: each token is hashed (crc32, stable across
+    processes) into one of `dim` buckets with a hash-derived sign,
+    term counts are damped with 1 + log(tf) and rows are L2-normalised,
+    so a dot product is the cosine similarity.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def _add_tokens(self, vector: np.ndarray, text: str, weight: float):
+        counts: Dict[str, int] = {}
+        for token in TOKEN_RE.findall(text.lower()):
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            h = zlib.crc32(token.encode())
+            vector[h % self.dim] += (weight if h & 0x80000000 else -weight) * (1.0 + math.log(count))
+
+    def embed(self, subject: str, body: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        self._add_tokens(vector, subject or "", SUBJECT_WEIGHT)
+        self._add_tokens(vector, body or "", 1.0)
+        norm = float(np.linalg.norm(vector))
+        if norm:
+            vector /= norm
+        return vector
+
+
+class VectorIndex:
+    """
+    One user's vectors in a memory-mapped float32 matrix (`vectors.f32`)
+    plus the message id of every row (`ids.txt`, append-only). Re-adding
+    a message overwrites its row; removing one zeroes it so it never
+    scores. The file grows by doubling and queries are one matrix-vector
+    product over the used rows.
+    """
+
+    def __init__(self, directory: str, dim: int):
+        self.directory = directory
+        self.dim = dim
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.ids_path = os.path.join(directory, "ids.txt")
+        self._lock = threading.Lock()
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, encoding="utf-8") as f:
+                self.ids = f.read().splitlines()
+            self.rows = {message_id: row for row, message_id in enumerate(self.ids)}
+        if os.path.exists(self.vectors_path):
+            capacity = os.path.getsize(self.vectors_path) // (4 * self.dim)
+            if capacity < len(self.ids):
+                # Vectors for the last ids never made it to disk; drop those ids
+                logger.warning(f"Mail index at {self.directory} is truncated; dropping {len(self.ids) - capacity} ids")
+                self.ids = self.ids[:capacity]
+                self.rows = {message_id: row for row, message_id in enumerate(self.ids)}
+                self._rewrite_ids()
+            if capacity:
+                self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _rewrite_ids(self):
+        tmp_path = self.ids_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(f"{message_id}\n" for message_id in self.ids))
+        os.replace(tmp_path, self.ids_path)
+
+    def _ensure_capacity(self, rows: int):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2, 1024)
+        if self._matrix is not None:
+            self._matrix.flush()
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        # Swapped in one assignment: queries holding the old mapping keep reading valid rows
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(new_capacity, self.dim))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def upsert(self, items: Iterable[Tuple[str, np.ndarray]]):
+        with self._lock:
+            new_ids = []
+            for message_id, vector in items:
+                row = self.rows.get(message_id)
+                if row is None:
+                    row = len(self.ids)
+                    self._ensure_capacity(row + 1)
+                    self.ids.append(message_id)
+                    self.rows[message_id] = row
+                    new_ids.append(message_id)
+                self._matrix[row] = vector
+            if self._matrix is not None:
+                self._matrix.flush()
+            if new_ids:
+                # Vectors are flushed before their ids are appended, so every listed id has a row
+                with open(self.ids_path, "a", encoding="utf-8") as f:
+                    f.write("".join(f"{message_id}\n" for message_id in new_ids))
+
+    def remove(self, message_ids: Iterable[str]):
+        with self._lock:
+            for message_id in message_ids:
+                row = self.rows.get(message_id)
+                if row is not None:
+                    self._matrix[row] = 0
+            if self._matrix is not None:
+                self._matrix.flush()
+
+    def _snapshot(self) -> Tuple[Optional[np.memmap], int]:
+        """The mapping and the row count it covers, read together while upsert may be growing the file."""
+        with self._lock:
+            return self._matrix, len(self.ids)
+
+    def vector(self, message_id: str) -> Optional[np.ndarray]:
+        matrix, count = self._snapshot()
+        row = self.rows.get(message_id)
+        if row is None or row >= count or matrix is None:
+            return None
+        return np.array(matrix[row])
+
+    def query(self, vector: np.ndarray, k: int, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+        """Top-k (message id, cosine similarity) pairs, best first; zero scores are dropped."""
+        matrix, count = self._snapshot()
+        if not count or matrix is None:
+            return []
+        scores = matrix[:count] @ vector
+        excluded = [row for row in (self.rows.get(m) for m in exclude) if row is not None and row < count]
+        if excluded:
+            scores[excluded] = 0
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[row], float(scores[row])) for row in top if scores[row] > 0]
+
+
+class MailIndex:
+    """Per-user VectorIndex instances under MAIL_INDEX_DIR, opened on first use."""
+
+    def __init__(self, root: Optional[str] = None, dim: Optional[int] = None):
+        self.root = root or settings.MAIL_INDEX_DIR
+        self.vectorizer = HashingVectorizer(dim or settings.MAIL_INDEX_DIM)
+        self._indexes: Dict[str, VectorIndex] = {}
+        self._lock = threading.Lock()
+
+    def for_user(self, email: str) -> VectorIndex:
+        index = self._indexes.get(email)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(email)
+                if index is None:
+                    directory = os.path.join(self.root, hashlib.sha256(email.encode()).hexdigest()[:32])
+                    index = self._indexes[email] = VectorIndex(directory, self.vectorizer.dim)
+        return index
+
+    def add(self, email: str, messages: Iterable) -> int:
+        """Index mirrored_messages rows (anything with id, subject, snippet and body_text)."""
+        with span("mail_index.add"):
+            items = [(m.id, self.vectorizer.embed(m.subject, m.body_text or m.snippet)) for m in messages]
+            if items:
+                self.for_user(email).upsert(items)
+            return len(items)
+
+    def remove(self, email: str, message_ids: Iterable[str]):
+        self.for_user(email).remove(message_ids)
+
+    def search(self, email: str, text: str, k: int = 10) -> List[Tuple[str, float]]:
+        with span("mail_index.search"):
+            # The query is embedded like a subject so short queries and subjects match alike
+            return self.for_user(email).query(self.vectorizer.embed(text, ""), k)
+
+    def similar_to(self, email: str, message_id: str, k: int = 10) -> Optional[List[Tuple[str, float]]]:
+        """None when the message is not indexed."""
+        with span("mail_index.search"):
+            index = self.for_user(email)
+            vector = index.vector(message_id)
+            if vector is None:
+                return None
+            return index.query(vector, k, exclude=[message_id])
+
+
+mail_index = MailIndex()
+
+
+def find_similar(db: Session, email: str, text: Optional[str] = None, message_id: Optional[str] = None,
+                 k: int = 10, index: MailIndex = mail_index) -> Optional[List[ScoredEmail]]:
+    """
+    Mirrored messages closest to a free-text query or to another message,
+    best first. None when message_id is not indexed.
+    """
+    hits = index.similar_to(email, message_id, k) if message_id else index.search(email, text or "", k)
+    if hits is None:
+        return None
+    if not hits:
+        return []
+    rows = {
+        row.id: row for row in db.query(MirroredMessage).filter(
+            MirroredMessage.user_email == email, MirroredMessage.id.in_([i for i, _ in hits])
+        )
+    }
+    return [
+        ScoredEmail(
+            id=row.id,
+            sender=row.sender,
+            subject=row.subject,
+            snippet=row.snippet,
+            date=row.internal_date or row.synced_at,
+            unread="UNREAD" in row.label_ids.split(),
+            score=score,
+        )
+        for message_id, score in hits if (row := rows.get(message_id)) is not None
+    ]
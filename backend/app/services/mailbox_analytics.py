@@ -0,0 +1,355 @@
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from email.utils import parseaddr
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.cache import ANALYTICS_NAMESPACE, build_cache_key, cache_manager
+from app.core.config import settings
+from app.core.tracing import span
+from app.models.mailbox_sync_state import MailboxSyncState
+from app.models.mirrored_message import MirroredMessage
+from app.schemas.analytics import DayCount, LabelBacklog, MailboxAnalytics, ReplyLatency, SenderCount
+from app.services.sync_job_service import SyncJobService
+
+logger = logging.getLogger(__name__)
+
+# One bit per label in a uint64 mask. System labels get the first bits so
+# they always fit; user labels beyond 64 in total are left out of the mask.
+MAX_LABELS = 64
+SYSTEM_LABELS = (
+    'INBOX', 'UNREAD', 'SENT', 'IMPORTANT', 'STARRED', 'DRAFT', 'SPAM', 'TRASH',
+    'CATEGORY_PERSONAL', 'CATEGORY_SOCIAL', 'CATEGORY_PROMOTIONS', 'CATEGORY_UPDATES', 'CATEGORY_FORUMS',
+)
+SECONDS_PER_DAY = 86400
+
+
+class ColumnCodes:
+    """
+    The string-to-integer tables behind a user's columns. They only ever
+    grow, so successive versions of the columns share one instance.
+    """
+
+    def __init__(self):
+        self.label_bits: Dict[str, int] = {name: i for i, name in enumerate(SYSTEM_LABELS)}
+        self.label_names: List[str] = list(SYSTEM_LABELS)
+        # Raw From headers differ in display names and case; each maps to its address's code
+        self.raw_senders: Dict[str, int] = {}
+        self.addresses: Dict[str, int] = {}
+        self.sender_addresses: List[str] = []
+        self.sender_names: List[Optional[str]] = []
+        self.threads: Dict[Optional[str], int] = {}
+        self.masks: Dict[str, int] = {}
+        self.dropped: Set[str] = set()
+
+    def sender(self, raw: str) -> int:
+        name, address = parseaddr(raw)
+        address = (address or raw).lower()
+        code = self.addresses.get(address)
+        if code is None:
+            code = self.addresses[address] = len(self.sender_addresses)
+            self.sender_addresses.append(address)
+            self.sender_names.append(name or None)
+        self.raw_senders[raw] = code
+        return code
+
+    def mask(self, label_ids: str) -> int:
+        mask = 0
+        for label in label_ids.split():
+            bit = self.label_bits.get(label)
+            if bit is None and len(self.label_bits) < MAX_LABELS:
+                bit = self.label_bits[label] = len(self.label_bits)
+                self.label_names.append(label)
+            if bit is None:
+                self.dropped.add(label)
+            else:
+                mask |= 1 << bit
+        self.masks[label_ids] = mask
+        return mask
+
+    def encode(self, rows: Iterable[Tuple[str, Optional[str], str, Optional[datetime], str]]) -> Tuple[np.ndarray, ...]:
+        """(ids, timestamps, senders, threads, labels) arrays for (id, thread_id, sender, internal_date, label_ids) rows."""
+        raw_senders, threads, masks = self.raw_senders, self.threads, self.masks
+        ids, timestamps, sender_codes, thread_codes, label_masks = [], [], [], [], []
+        for message_id, thread_id, sender, internal_date, label_ids in rows:
+            ids.append(message_id)
+            timestamps.append(int(internal_date.timestamp()) if internal_date else 0)
+            sender = sender or ""
+            code = raw_senders.get(sender)
+            sender_codes.append(code if code is not None else self.sender(sender))
+            thread_codes.append(threads.setdefault(thread_id, len(threads)))
+            mask = masks.get(label_ids)
+            label_masks.append(mask if mask is not None else self.mask(label_ids))
+        return (
+            np.array(ids, dtype=object),
+            np.array(timestamps, dtype=np.int64),
+            np.array(sender_codes, dtype=np.int32),
+            np.array(thread_codes, dtype=np.int32),
+            np.array(label_masks, dtype=np.uint64),
+        )
+
+
+@dataclass
+class MailboxColumns:
+    """
+    A user's mirrored messages as parallel arrays: one row per message,
+    strings replaced by integer codes so every aggregate is a NumPy
+    reduction instead of a Python loop.
+    """
+    ids: np.ndarray  # object, message ids
+    timestamps: np.ndarray  # int64 epoch seconds, 0 when unknown
+    senders: np.ndarray  # int32 index into sender_addresses
+    threads: np.ndarray  # int32 thread code
+    labels: np.ndarray  # uint64 bitmask over label_names
+    codes: ColumnCodes = field(default_factory=ColumnCodes)
+    # Row order by (thread, time), built on first use by reply latency
+    _thread_order: Optional[np.ndarray] = None
+    # Message id -> row, built on the first patch
+    _rows: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def sender_addresses(self) -> List[str]:
+        return self.codes.sender_addresses
+
+    @property
+    def sender_names(self) -> List[Optional[str]]:
+        return self.codes.sender_names
+
+    @property
+    def label_names(self) -> List[str]:
+        return self.codes.label_names
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[str, Optional[str], str, Optional[datetime], str]]) -> "MailboxColumns":
+        """Build from (id, thread_id, sender, internal_date, label_ids) tuples."""
+        codes = ColumnCodes()
+        columns = cls(*codes.encode(rows), codes=codes)
+        if codes.dropped:
+            logger.info(f"Mailbox analytics ignores {len(codes.dropped)} labels beyond the first {MAX_LABELS}")
+        return columns
+
+    def patched(self, added: Iterable[Tuple[str, Optional[str], str, Optional[datetime], str]] = (),
+                deleted: Iterable[str] = (), labels: Optional[Dict[str, List[str]]] = None) -> "MailboxColumns":
+        """
+        A new version with a mirror delta applied: rows deleted, relabelled
+        and appended with array operations, so only the changed messages go
+        through Python. This version must not be patched again afterwards.
+        """
+        rows = self._rows
+        if rows is None:
+            rows = dict(zip(self.ids.tolist(), range(len(self))))
+        self._rows = None
+        ids, timestamps, senders, threads, label_masks = self.ids, self.timestamps, self.senders, self.threads, self.labels
+
+        relabelled = [(rows[m], " ".join(label_ids)) for m, label_ids in (labels or {}).items() if m in rows]
+        if relabelled:
+            label_masks = label_masks.copy()
+            for row, label_ids in relabelled:
+                mask = self.codes.masks.get(label_ids)
+                label_masks[row] = mask if mask is not None else self.codes.mask(label_ids)
+
+        gone = sorted((rows.pop(m) for m in set(deleted) if m in rows), reverse=True)
+        if gone:
+            # Row order doesn't matter to any aggregate, so each deleted row is
+            # overwritten by the current last one and only moved ids are remapped
+            arrays = [ids.copy(), timestamps.copy(), senders.copy(), threads.copy(), label_masks.copy()]
+            last = len(ids)
+            for row in gone:
+                last -= 1
+                if row != last:
+                    for array in arrays:
+                        array[row] = array[last]
+                    rows[arrays[0][row]] = row
+            ids, timestamps, senders, threads, label_masks = (array[:last] for array in arrays)
+
+        new = [row for row in added if row[0] not in rows]
+        if new:
+            start = len(ids)
+            parts = self.codes.encode(new)
+            ids, timestamps, senders, threads, label_masks = (
+                np.concatenate((old, part)) for old, part in zip((ids, timestamps, senders, threads, label_masks), parts))
+            rows.update(zip(parts[0].tolist(), range(start, start + len(new))))
+
+        return MailboxColumns(ids, timestamps, senders, threads, label_masks, codes=self.codes, _rows=rows)
+
+    def has_label(self, name: str) -> np.ndarray:
+        if name not in self.label_names:
+            return np.zeros(len(self), dtype=bool)
+        return (self.labels & np.uint64(1 << self.label_names.index(name))) != 0
+
+    def thread_order(self) -> np.ndarray:
+        if self._thread_order is None:
+            self._thread_order = np.lexsort((self.timestamps, self.threads))
+        return self._thread_order
+
+
+def summarize(columns: MailboxColumns, today: date, days: int = 30, top: int = 10,
+              tz_offset_minutes: int = 0) -> MailboxAnalytics:
+    """
+    Aggregate the columns. Volumes cover received (non-SENT) mail in the
+    `days` days up to `today`, in the caller's time zone; senders, backlog
+    and reply latency cover the whole mirror.
+    """
+    sent = columns.has_label('SENT')
+    unread = columns.has_label('UNREAD')
+    received = ~sent
+
+    # Top senders of received mail: bincount is a group-by over integer codes
+    sender_count = len(columns.sender_addresses)
+    counts = np.bincount(columns.senders[received], minlength=sender_count)
+    unread_counts = np.bincount(columns.senders[received & unread], minlength=sender_count)
+    top_senders = []
+    if sender_count:
+        k = min(top, sender_count)
+        best = np.argpartition(-counts, k - 1)[:k]
+        best = best[np.lexsort((best, -counts[best]))]
+        top_senders = [
+            SenderCount(sender=columns.sender_addresses[i], name=columns.sender_names[i],
+                        messages=int(counts[i]), unread=int(unread_counts[i]))
+            for i in best if counts[i]
+        ]
+
+    # Day and hour buckets in the caller's local time
+    local = columns.timestamps + tz_offset_minutes * 60
+    first_day = (today - date(1970, 1, 1)).days - days + 1
+    day_index = local // SECONDS_PER_DAY - first_day
+    in_window = received & (columns.timestamps > 0) & (day_index >= 0) & (day_index < days)
+    per_day = np.bincount(day_index[in_window], minlength=days)
+    windowed = local[in_window]
+    per_hour = np.bincount((windowed // 3600) % 24, minlength=24)
+    # 1970-01-01 was a Thursday
+    per_weekday = np.bincount((windowed // SECONDS_PER_DAY + 3) % 7, minlength=7)
+
+    # Unread backlog per label: unpack each unread row's mask into 64 bits and sum the columns
+    bits = np.unpackbits(columns.labels[unread].astype('<u8').view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    label_totals = bits.sum(axis=0, dtype=np.int64)
+    unread_by_label = sorted(
+        (LabelBacklog(label=name, unread=int(label_totals[bit]))
+         for bit, name in enumerate(columns.label_names) if name != 'UNREAD' and label_totals[bit]),
+        key=lambda backlog: -backlog.unread,
+    )
+
+    return MailboxAnalytics(
+        messages=len(columns),
+        received=int(received.sum()),
+        unread=int(unread.sum()),
+        top_senders=top_senders,
+        per_day=[DayCount(day=today - timedelta(days=days - 1 - i), messages=int(n)) for i, n in enumerate(per_day)],
+        per_hour=per_hour.tolist(),
+        per_weekday=per_weekday.tolist(),
+        unread_by_label=unread_by_label,
+        reply_latency=reply_latency(columns, sent),
+    )
+
+
+def reply_latency(columns: MailboxColumns, sent: np.ndarray) -> ReplyLatency:
+    """
+    With rows ordered by (thread, time), a first reply is a sent row whose
+    predecessor is a received row of the same thread; the latency is the
+    gap between the two.
+    """
+    order = columns.thread_order()
+    threads, timestamps, is_sent = columns.threads[order], columns.timestamps[order], sent[order]
+    first_reply = is_sent[1:] & ~is_sent[:-1] & (threads[1:] == threads[:-1]) & (timestamps[:-1] > 0)
+    gaps = (timestamps[1:] - timestamps[:-1])[first_reply]
+    if not len(gaps):
+        return ReplyLatency(replies=0)
+    median, p90 = np.percentile(gaps, [50, 90])
+    return ReplyLatency(replies=len(gaps), median_seconds=float(median), p90_seconds=float(p90),
+                        mean_seconds=float(gaps.mean()))
+
+
+class MailboxAnalyticsService:
+    """
+    Keeps the columns of recently queried mailboxes in memory, versioned
+    by the sync job's last update, which the full sync and incremental
+    mirror updates both advance. Incremental updates patch the columns
+    with their delta (apply()); any other change reloads them from the
+    mirror. Results are cached under the mailbox's historyId plus that
+    version.
+    """
+
+    def __init__(self, max_mailboxes: Optional[int] = None, cache_ttl: Optional[int] = None):
+        self.max_mailboxes = max_mailboxes or settings.ANALYTICS_CACHED_MAILBOXES
+        self.cache_ttl = cache_ttl or settings.ANALYTICS_CACHE_TTL_SECONDS
+        self._columns: "OrderedDict[str, Tuple[str, MailboxColumns]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def mirror_version(job) -> str:
+        return job.updated_at.isoformat()
+
+    def version(self, db: Session, email: str) -> Optional[Tuple[Optional[str], str]]:
+        """(historyId, mirror version) of the user's mirror; None when it was never synced."""
+        job = SyncJobService.get(db, email)
+        if job is None:
+            return None
+        state = db.get(MailboxSyncState, email)
+        history_id = (state.history_id if state is not None else None) or job.history_id
+        return history_id, self.mirror_version(job)
+
+    def columns(self, db: Session, email: str, version: str) -> MailboxColumns:
+        with self._lock:
+            entry = self._columns.get(email)
+            if entry is not None and entry[0] == version:
+                self._columns.move_to_end(email)
+                return entry[1]
+        with span("analytics.load_columns"):
+            rows = db.query(
+                MirroredMessage.id, MirroredMessage.thread_id, MirroredMessage.sender,
+                MirroredMessage.internal_date, MirroredMessage.label_ids,
+            ).filter(MirroredMessage.user_email == email).yield_per(10000)
+            columns = MailboxColumns.from_rows(rows)
+        with self._lock:
+            self._columns[email] = (version, columns)
+            self._columns.move_to_end(email)
+            while len(self._columns) > self.max_mailboxes:
+                self._columns.popitem(last=False)
+        return columns
+
+    def apply(self, email: str, before: str, after: str, added: Iterable[MirroredMessage] = (),
+              deleted: Iterable[str] = (), labels: Optional[Dict[str, List[str]]] = None):
+        """
+        Patch loaded columns with a mirror delta that moved the version from
+        `before` to `after`. Columns at any other version (another update
+        got in between) are dropped and reloaded on the next query.
+        """
+        with self._lock:
+            entry = self._columns.get(email)
+            if entry is None:
+                return
+            if entry[0] != before:
+                del self._columns[email]
+                return
+            with span("analytics.patch_columns"):
+                rows = [(m.id, m.thread_id, m.sender, m.internal_date, m.label_ids) for m in added]
+                self._columns[email] = (after, entry[1].patched(rows, deleted, labels))
+
+    def get(self, db: Session, email: str, days: int = 30, top: int = 10, tz_offset_minutes: int = 0,
+            today: Optional[date] = None) -> Optional[MailboxAnalytics]:
+        """None when the user has never started a full sync."""
+        versioned = self.version(db, email)
+        if versioned is None:
+            return None
+        history_id, version = versioned
+        today = today or (datetime.utcnow() + timedelta(minutes=tz_offset_minutes)).date()
+        key = build_cache_key(ANALYTICS_NAMESPACE, email, version=f"{history_id}:{version}", today=today.isoformat(),
+                              days=days, top=top, tz_offset=tz_offset_minutes)
+
+        def compute():
+            with span("analytics.summarize"):
+                result = summarize(self.columns(db, email, version), today, days, top, tz_offset_minutes)
+            result.history_id = history_id
+            return result
+        return cache_manager.get_or_set(key, compute, self.cache_ttl)
+
+
+mailbox_analytics = MailboxAnalyticsService()
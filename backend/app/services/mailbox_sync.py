@@ -0,0 +1,305 @@
+import base64
+import json
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.cache import MESSAGE_DETAIL_NAMESPACE, build_cache_key, cache_manager
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.mailbox_sync_state import MailboxSyncState
+from app.schemas.sync import MailboxDelta, MessageLabels
+from app.services.gmail_service import GmailService, HistoryExpiredError
+from app.services.token_service import TokenService
+
+logger = logging.getLogger(__name__)
+
+# Renew users.watch when it lapses within this window
+WATCH_RENEW_BEFORE = timedelta(days=1)
+
+_user_locks: Dict[str, threading.Lock] = {}
+_user_locks_lock = threading.Lock()
+
+
+# Called as listener(db, email, changes) after every sync that found changes
+_change_listeners: List[Callable] = []
+# Listeners a request-path sync does not wait for (see MailboxSyncService.sync), one batch at a time
+_background_listeners = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mailbox-listeners")
+
+
+def add_change_listener(listener: Callable):
+    _change_listeners.append(listener)
+
+
+def _notify(db: Session, email: str, changes: "MailboxChanges", listeners: Optional[List[Callable]] = None):
+    for listener in _change_listeners if listeners is None else listeners:
+        try:
+            listener(db, email, changes)
+        except Exception as e:
+            logger.warning(f"Mailbox change listener failed for {email}: {e}")
+
+
+def _notify_in_background(email: str, changes: "MailboxChanges", listeners: List[Callable],
+                          session_factory: Callable) -> Future:
+    def run():
+        db = session_factory()
+        try:
+            _notify(db, email, changes, listeners)
+        finally:
+            db.close()
+    return _background_listeners.submit(run)
+
+
+def _user_lock(email: str) -> threading.Lock:
+    # Pub/Sub may deliver notifications for one user concurrently
+    with _user_locks_lock:
+        return _user_locks.setdefault(email, threading.Lock())
+
+
+def decode_push_envelope(envelope: dict) -> Tuple[str, str]:
+    """
+    Extract (emailAddress, historyId) from a Pub/Sub push request body:
+    {"message": {"data": base64(json), "messageId": ...}, "subscription": ...}
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(envelope["message"]["data"] + "=="))
+        return data["emailAddress"], str(data["historyId"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Malformed push notification: {e}") from e
+
+
+@dataclass
+class MailboxChanges:
+    """Message ids touched between two historyIds."""
+    history_id: str
+    added: Set[str] = field(default_factory=set)
+    deleted: Set[str] = field(default_factory=set)
+    labels_changed: Set[str] = field(default_factory=set)
+    # Latest labelIds seen in history for each touched message
+    labels: Dict[str, List[str]] = field(default_factory=dict)
+    # labelIds each touched message had before its first change in the window (empty for new mail)
+    before: Dict[str, List[str]] = field(default_factory=dict)
+    # True when history expired and everything cached for the user was dropped
+    resync: bool = False
+
+    @property
+    def changed(self) -> Set[str]:
+        return self.added | self.deleted | self.labels_changed
+
+
+def collect_changes(history: list, history_id: str) -> MailboxChanges:
+    changes = MailboxChanges(history_id=history_id)
+    for record in history:
+        for item in record.get('messagesAdded', []):
+            changes.added.add(item['message']['id'])
+            changes.before.setdefault(item['message']['id'], [])
+        for item in record.get('messagesDeleted', []):
+            changes.deleted.add(item['message']['id'])
+            if 'labelIds' in item['message']:
+                changes.before.setdefault(item['message']['id'], item['message']['labelIds'])
+        for key, undo in (('labelsAdded', False), ('labelsRemoved', True)):
+            for item in record.get(key, []):
+                message = item['message']
+                if 'labelIds' in message:
+                    current = set(message['labelIds'])
+                    changed = set(item.get('labelIds', []))
+                    changes.before.setdefault(message['id'], sorted(current | changed if undo else current - changed))
+        for key in ('labelsAdded', 'labelsRemoved'):
+            for item in record.get(key, []):
+                changes.labels_changed.add(item['message']['id'])
+        for key in ('messagesAdded', 'labelsAdded', 'labelsRemoved'):
+            for item in record.get(key, []):
+                if 'labelIds' in item['message']:
+                    changes.labels[item['message']['id']] = item['message']['labelIds']
+    # Messages added and deleted within the window never need fetching
+    changes.added -= changes.deleted
+    changes.labels_changed -= changes.deleted
+    return changes
+
+
+def invalidate_user_cache(email: str, message_ids: Optional[Set[str]] = None) -> int:
+    """
+    Drop a user's list/search entries and the detail entries of the given
+    messages. With message_ids=None every entry for the user goes.
+    """
+    if message_ids is None:
+        return cache_manager.invalidate_prefix(f"{email}:")
+    dropped = cache_manager.invalidate_prefix(
+        f"{email}:", exclude=(f"{email}:{MESSAGE_DETAIL_NAMESPACE}:",)
+    )
+    for message_id in message_ids:
+        dropped += cache_manager.delete(build_cache_key(MESSAGE_DETAIL_NAMESPACE, email, message_id=message_id))
+    return dropped
+
+
+def build_delta(service: GmailService, changes: MailboxChanges) -> MailboxDelta:
+    """Turn history changes into what an inbox view needs: previews for new inbox mail, ids and labels for the rest."""
+    if changes.resync:
+        return MailboxDelta(historyId=changes.history_id, resync=True)
+    inbox_added = sorted(i for i in changes.added if 'INBOX' in changes.labels.get(i, ['INBOX']))
+    relabeled = sorted(i for i in changes.labels_changed - changes.added if i in changes.labels)
+    return MailboxDelta(
+        historyId=changes.history_id,
+        added=service.get_previews(inbox_added) if inbox_added else [],
+        deleted=sorted(changes.deleted),
+        labelsChanged=[MessageLabels(id=i, labelIds=changes.labels[i]) for i in relabeled],
+    )
+
+
+class MailboxSyncService:
+    @staticmethod
+    def get_state(db: Session, email: str) -> Optional[MailboxSyncState]:
+        return db.query(MailboxSyncState).filter(MailboxSyncState.email == email).first()
+
+    @staticmethod
+    def _save_state(db: Session, email: str, **values) -> MailboxSyncState:
+        state = MailboxSyncService.get_state(db, email)
+        if state is None:
+            state = MailboxSyncState(email=email)
+            db.add(state)
+        for key, value in values.items():
+            setattr(state, key, value)
+        db.commit()
+        db.refresh(state)
+        return state
+
+    @staticmethod
+    def start_watch(db: Session, service: GmailService, topic_name: str) -> MailboxSyncState:
+        """Register users.watch and remember where incremental sync starts."""
+        response = service.watch(topic_name)
+        expiration = datetime.utcfromtimestamp(int(response['expiration']) / 1000)
+        values = {'watch_expiration': expiration}
+        state = MailboxSyncService.get_state(db, service.user_email)
+        if state is None or not state.history_id:
+            values['history_id'] = str(response['historyId'])
+        return MailboxSyncService._save_state(db, service.user_email, **values)
+
+    @staticmethod
+    def push_active(state: Optional[MailboxSyncState]) -> bool:
+        """True while a users.watch registration delivers this user's changes."""
+        return bool(settings.GMAIL_PUSH_TOPIC) and state is not None and \
+            state.watch_expiration is not None and state.watch_expiration > datetime.utcnow()
+
+    @staticmethod
+    def watch_due(state: Optional[MailboxSyncState]) -> bool:
+        return state is None or state.watch_expiration is None or \
+            state.watch_expiration - datetime.utcnow() < WATCH_RENEW_BEFORE
+
+    @staticmethod
+    def sync(db: Session, email: str, service_factory: Callable = GmailService.from_tokens,
+             target_history_id: Optional[str] = None, inline: Optional[Callable] = None,
+             session_factory: Callable = SessionLocal) -> Optional[MailboxChanges]:
+        """
+        Bring a user's cache up to date with Gmail: fetch history since the
+        stored historyId and invalidate only what changed. target_history_id
+        comes from a push notification; notifications at or below the stored
+        point are duplicates. With `inline`, only that listener runs before
+        returning and the others run on a background thread with a session
+        from session_factory, so a sync on a request path does not wait for
+        mirror fetches or previews. Returns None when there was nothing to do.
+        """
+        with _user_lock(email):
+            changes = MailboxSyncService._sync_locked(db, email, service_factory, target_history_id)
+        if changes is None:
+            return None
+        if inline is None:
+            _notify(db, email, changes)
+        else:
+            _notify(db, email, changes, [inline])
+            others = [listener for listener in _change_listeners if listener != inline]
+            if others:
+                _notify_in_background(email, changes, others, session_factory)
+        return changes
+
+    @staticmethod
+    def _sync_locked(db: Session, email: str, service_factory: Callable,
+                     target_history_id: Optional[str]) -> Optional[MailboxChanges]:
+        state = MailboxSyncService.get_state(db, email)
+        if target_history_id is not None and state is not None and state.history_id \
+                and int(target_history_id) <= int(state.history_id):
+            return None
+
+        tokens = TokenService.get_tokens(db, email=email)
+        if not tokens:
+            return None
+
+        if state is None or not state.history_id:
+            # Nothing to diff against yet
+            if target_history_id is None:
+                profile = service_factory(tokens).get_profile()
+                MailboxSyncService._save_state(db, email, history_id=str(profile['historyId']))
+                return None
+            invalidate_user_cache(email)
+            MailboxSyncService._save_state(db, email, history_id=target_history_id)
+            return MailboxChanges(history_id=target_history_id, resync=True)
+
+        service = service_factory(tokens)
+        try:
+            result = service.list_history(state.history_id)
+        except HistoryExpiredError:
+            logger.warning(f"History {state.history_id} expired for {email}, dropping cached mail")
+            invalidate_user_cache(email)
+            latest = target_history_id or str(service.get_profile()['historyId'])
+            MailboxSyncService._save_state(db, email, history_id=latest)
+            return MailboxChanges(history_id=latest, resync=True)
+
+        changes = collect_changes(result['history'], str(result['historyId']))
+        if changes.changed:
+            invalidate_user_cache(email, changes.changed)
+        if changes.history_id != state.history_id:
+            MailboxSyncService._save_state(db, email, history_id=changes.history_id)
+        return changes if changes.changed else None
+
+    @staticmethod
+    def catch_up(db: Session, email: str, service: GmailService, since: str) -> Optional[MailboxChanges]:
+        """
+        History from `since` (the full sync's snapshot) up to the point where
+        incremental sync took over, so changes made while the snapshot was
+        being copied are not lost. When no incremental sync has run yet, the
+        window ends now and incremental sync starts from there. Returns None
+        when incremental sync already covers everything after `since`.
+        Raises HistoryExpiredError.
+        """
+        with _user_lock(email):
+            state = MailboxSyncService.get_state(db, email)
+            if state is not None and state.history_id and int(state.history_id) <= int(since):
+                return None
+            result = service.list_history(since)
+            if state is not None and state.history_id:
+                until = state.history_id
+                history = [record for record in result['history'] if int(record['id']) <= int(until)]
+            else:
+                until, history = str(result['historyId']), result['history']
+                MailboxSyncService._save_state(db, email, history_id=until)
+        return collect_changes(history, until)
+
+    @staticmethod
+    def handle_notification(db: Session, email: str, history_id: str,
+                            service_factory: Callable = GmailService.from_tokens) -> Optional[MailboxChanges]:
+        """Apply one push notification. Duplicate and out-of-order notifications are ignored."""
+        return MailboxSyncService.sync(db, email, service_factory, target_history_id=history_id)
+
+
+def apply_push_notification(email: str, history_id: str, session_factory: Callable = SessionLocal,
+                            service_factory: Callable = GmailService.from_tokens) -> Optional[MailboxChanges]:
+    """Background task run for each accepted push notification."""
+    db = session_factory()
+    try:
+        changes = MailboxSyncService.handle_notification(db, email, history_id, service_factory)
+        state = MailboxSyncService.get_state(db, email)
+        if settings.GMAIL_PUSH_TOPIC and state is not None and MailboxSyncService.watch_due(state):
+            tokens = TokenService.get_tokens(db, email=email)
+            if tokens:
+                MailboxSyncService.start_watch(db, service_factory(tokens), settings.GMAIL_PUSH_TOPIC)
+        return changes
+    except Exception as e:
+        # The stored historyId only advances on success, so the next notification catches up
+        logger.exception(f"Push sync failed for {email}: {e}")
+        return None
+    finally:
+        db.close()
@@ -0,0 +1,241 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from email import policy as email_policy
+from email.parser import BytesParser
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional
+
+from app.core.config import settings
+from app.core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Headers kept in parse results; everything else stays in the raw message
+KEPT_HEADERS = ('from', 'to', 'cc', 'subject', 'date', 'reply-to', 'message-id', 'references', 'in-reply-to')
+
+
+@dataclass
+class AttachmentInfo:
+    filename: str
+    mime_type: str
+    size: int
+    content_id: Optional[str] = None
+    # Gmail's partId for the part ("1", "0.2"): stable across messages.get calls, unlike attachmentId
+    part_id: Optional[str] = None
+
+
+@dataclass
+class ParsedMessage:
+    """What the sync and detail paths need from a raw message; attachment bytes are never returned."""
+    headers: Dict[str, str] = field(default_factory=dict)
+    text: Optional[str] = None
+    html: Optional[str] = None
+    attachments: List[AttachmentInfo] = field(default_factory=list)
+    # Set when the message could not be parsed; headers are then best effort and bodies missing
+    failed: bool = False
+
+
+class _TextExtractor(HTMLParser):
+    SKIPPED = {'script', 'style', 'head'}
+    BREAKS = {'br', 'p', 'div', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks: List[str] = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self.skipping += 1
+        elif tag in self.BREAKS:
+            self.chunks.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED and self.skipping:
+            self.skipping -= 1
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.chunks.append(data)
+
+
+def html_to_text(html: str) -> str:
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    lines = (" ".join(line.split()) for line in "".join(extractor.chunks).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _decode_text(part) -> str:
+    try:
+        return part.get_content()
+    except (LookupError, UnicodeError, AssertionError):
+        # Unknown or lying charset: keep what can be decoded
+        payload = part.get_payload(decode=True) or b""
+        return payload.decode('utf-8', errors='replace')
+
+
+def _walk(part, part_id: str = ""):
+    """Like Message.walk(), with Gmail's part ids: children of the top part are "0", "1", theirs "0.0"."""
+    yield part_id, part
+    if part.is_multipart():
+        for i, child in enumerate(part.get_payload()):
+            yield from _walk(child, f"{part_id}.{i}" if part_id else str(i))
+
+
+def parse_raw(raw: bytes, text_only: bool = False) -> ParsedMessage:
+    """
+    Parse RFC 822 bytes into headers, the first text/plain and text/html
+    bodies and attachment descriptors. With text_only the HTML body is
+    reduced to text here (falling back to it when there is no plain part),
+    so index builders get one string back.
+    """
+    message = BytesParser(policy=email_policy.default).parsebytes(raw)
+    parsed = ParsedMessage()
+    for name in KEPT_HEADERS:
+        value = message.get(name)
+        if value is not None:
+            parsed.headers[name] = str(value)
+
+    for part_id, part in _walk(message):
+        if part.is_multipart():
+            continue
+        content_type = part.get_content_type()
+        filename = part.get_filename()
+        if filename or part.get_content_disposition() == 'attachment':
+            payload = part.get_payload(decode=True) or b""
+            parsed.attachments.append(AttachmentInfo(
+                filename=filename or "",
+                mime_type=content_type,
+                size=len(payload),
+                content_id=(part.get('Content-ID') or "").strip('<>') or None,
+                part_id=part_id,
+            ))
+        elif content_type == 'text/plain' and parsed.text is None:
+            parsed.text = _decode_text(part)
+        elif content_type == 'text/html' and parsed.html is None:
+            parsed.html = _decode_text(part)
+
+    if text_only:
+        if parsed.text is None and parsed.html is not None:
+            parsed.text = html_to_text(parsed.html)
+        parsed.html = None
+    return parsed
+
+
+def parse_headers(raw: bytes) -> ParsedMessage:
+    """
+    Fallback for messages parse_raw rejects: the legacy compat32 policy
+    keeps header values as the raw strings instead of parsing them.
+    """
+    parsed = ParsedMessage(failed=True)
+    try:
+        message = BytesParser(policy=email_policy.compat32).parsebytes(raw, headersonly=True)
+        for name in KEPT_HEADERS:
+            value = message.get(name)
+            if value is not None:
+                parsed.headers[name] = str(value)
+    except Exception as e:
+        logger.warning(f"Unparseable message headers: {e!r}")
+    return parsed
+
+
+def _parse_or_fallback(future: Future, raw: bytes, text_only: bool) -> ParsedMessage:
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        logger.warning("MIME parse pool broke; parsing inline")
+        try:
+            return parse_raw(raw, text_only)
+        except Exception as e:
+            logger.warning(f"Malformed message, keeping headers only: {e!r}")
+            return parse_headers(raw)
+    except Exception as e:
+        # Real-world mail trips the stdlib parser (odd addresses, NULs in charsets)
+        logger.warning(f"Malformed message, keeping headers only: {e!r}")
+        return parse_headers(raw)
+
+
+class MimeParser:
+    """
+    Runs parse_raw in a process pool so large messages don't hold the GIL
+    in the API or sync threads. At most `max_pending` messages are queued
+    or in flight; submit() blocks beyond that, which slows producers (e.g.
+    the full sync's fetch threads) to the pool's pace. Messages smaller
+    than `inline_bytes` are parsed in the calling thread, where the
+    process round trip would cost more than the parse. A message the
+    parser rejects comes back headers-only with `failed` set.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 inline_bytes: Optional[int] = None):
+        self.workers = settings.MIME_PARSE_WORKERS if workers is None else workers
+        self.max_pending = max_pending or settings.MIME_PARSE_MAX_PENDING
+        self.inline_bytes = settings.MIME_PARSE_INLINE_BYTES if inline_bytes is None else inline_bytes
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            # A pool whose worker died (e.g. OOM on a huge message) stays broken; replace it
+            if self._pool is not None and getattr(self._pool, "_broken", False):
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            if self._pool is None:
+                # spawn, not fork: the parent runs threads whose locks a fork would copy mid-use
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def submit(self, raw: bytes, text_only: bool = False) -> Future:
+        """Queue one message; blocks while max_pending messages are already waiting."""
+        if self.workers <= 0 or len(raw) < self.inline_bytes:
+            future = Future()
+            try:
+                future.set_result(parse_raw(raw, text_only))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        with span("mime.backpressure"):
+            self._slots.acquire()
+        try:
+            future = self._get_pool().submit(parse_raw, raw, text_only)
+        except BrokenProcessPool:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _submit_or_broken(self, raw: bytes, text_only: bool) -> Future:
+        try:
+            return self.submit(raw, text_only)
+        except BrokenProcessPool as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+
+    def parse(self, raw: bytes, text_only: bool = False) -> ParsedMessage:
+        with span("mime.parse"):
+            return _parse_or_fallback(self._submit_or_broken(raw, text_only), raw, text_only)
+
+    def parse_many(self, raws: Iterable[bytes], text_only: bool = False) -> List[ParsedMessage]:
+        """Parse several messages concurrently, results in input order."""
+        with span("mime.parse_many"):
+            raws = list(raws)
+            futures = [self._submit_or_broken(raw, text_only) for raw in raws]
+            return [_parse_or_fallback(future, raw, text_only) for raw, future in zip(raws, futures)]
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+mime_parser = MimeParser()
@@ -0,0 +1,121 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.outbox_message import OutboxMessage
+
+# Statuses that still hold a user's place in the send order
+PENDING_STATUSES = ("queued", "sending")
+
+
+class OutboxService:
+    @staticmethod
+    def enqueue(db: Session, email: str, kind: str, payload: dict, idempotency_key: Optional[str] = None) -> OutboxMessage:
+        """
+        Persist an outgoing email. Re-submitting the same idempotency key
+        returns the existing entry instead of queueing a duplicate.
+        """
+        if idempotency_key:
+            existing = OutboxService.get_by_idempotency_key(db, email, idempotency_key)
+            if existing:
+                return existing
+
+        entry = OutboxMessage(
+            id=uuid.uuid4().hex,
+            user_email=email,
+            kind=kind,
+            payload=json.dumps(payload),
+            idempotency_key=idempotency_key,
+            status="queued",
+        )
+        db.add(entry)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Concurrent request with the same key won the race
+            db.rollback()
+            return OutboxService.get_by_idempotency_key(db, email, idempotency_key)
+        db.refresh(entry)
+        return entry
+
+    @staticmethod
+    def get_by_idempotency_key(db: Session, email: str, idempotency_key: str) -> Optional[OutboxMessage]:
+        return db.query(OutboxMessage).filter(
+            OutboxMessage.user_email == email,
+            OutboxMessage.idempotency_key == idempotency_key
+        ).first()
+
+    @staticmethod
+    def get(db: Session, email: str, outbox_id: str) -> Optional[OutboxMessage]:
+        return db.query(OutboxMessage).filter(
+            OutboxMessage.id == outbox_id,
+            OutboxMessage.user_email == email
+        ).first()
+
+    @staticmethod
+    def claim_next(db: Session) -> Optional[OutboxMessage]:
+        """
+        Claim the next deliverable message. Only the oldest pending message of
+        each user is eligible, so one user's emails are sent in order and never
+        concurrently. The status flip is a compare-and-set, so several workers
+        (or processes) can share the table.
+        """
+        now = datetime.utcnow()
+        heads = db.query(
+            OutboxMessage.user_email,
+            func.min(OutboxMessage.created_at).label("created_at")
+        ).filter(OutboxMessage.status.in_(PENDING_STATUSES)).group_by(OutboxMessage.user_email).subquery()
+
+        candidates = db.query(OutboxMessage).join(
+            heads,
+            (OutboxMessage.user_email == heads.c.user_email) & (OutboxMessage.created_at == heads.c.created_at)
+        ).filter(
+            OutboxMessage.status == "queued",
+            OutboxMessage.next_attempt_at <= now
+        ).order_by(OutboxMessage.next_attempt_at).limit(10).all()
+
+        for candidate in candidates:
+            claimed = db.query(OutboxMessage).filter(
+                OutboxMessage.id == candidate.id,
+                OutboxMessage.status == "queued"
+            ).update({"status": "sending", "attempts": OutboxMessage.attempts + 1, "updated_at": now},
+                     synchronize_session=False)
+            db.commit()
+            if claimed:
+                db.refresh(candidate)
+                return candidate
+        return None
+
+    @staticmethod
+    def mark_sent(db: Session, entry: OutboxMessage, gmail_message_id: Optional[str]):
+        entry.status = "sent"
+        entry.gmail_message_id = gmail_message_id
+        entry.last_error = None
+        db.commit()
+
+    @staticmethod
+    def mark_retry(db: Session, entry: OutboxMessage, error: str, delay_seconds: float):
+        entry.status = "queued"
+        entry.last_error = error
+        entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay_seconds)
+        db.commit()
+
+    @staticmethod
+    def mark_failed(db: Session, entry: OutboxMessage, error: str):
+        entry.status = "failed"
+        entry.last_error = error
+        db.commit()
+
+    @staticmethod
+    def requeue_stale(db: Session, older_than_seconds: float) -> int:
+        """Return messages stuck in 'sending' (e.g. the worker died mid-send) to the queue."""
+        cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+        count = db.query(OutboxMessage).filter(
+            OutboxMessage.status == "sending",
+            OutboxMessage.updated_at < cutoff
+        ).update({"status": "queued"}, synchronize_session=False)
+        db.commit()
+        return count
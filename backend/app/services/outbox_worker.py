@@ -0,0 +1,140 @@
+import json
+import logging
+import random
+import threading
+from typing import Callable, List, Optional
+
+from app.core.config import settings
+from app.core.deadline import CircuitOpenError
+from app.db.session import SessionLocal
+from app.models.outbox_message import OutboxMessage
+from app.services.contact_index import contact_index
+from app.services.gmail_scheduler import is_outage
+from app.services.gmail_service import GmailService
+from app.services.mailbox_sync import invalidate_user_cache
+from app.services.outbox_service import OutboxService
+from app.services.token_service import TokenService
+
+logger = logging.getLogger(__name__)
+
+# A message stuck in 'sending' this long belongs to a worker that died
+STALE_SENDING_SECONDS = 300
+
+
+def deliver(service: GmailService, entry: OutboxMessage):
+    """Call the GmailService method matching the outbox entry's kind."""
+    payload = json.loads(entry.payload)
+    if entry.kind == "send":
+        return service.send_email(payload["to"], payload["subject"], payload["body"])
+    if entry.kind == "reply":
+        return service.reply_email(payload["message_id"], payload["body"])
+    if entry.kind == "forward":
+        return service.forward_email(payload["message_id"], payload["to"], payload["body"])
+    raise ValueError(f"Unknown outbox kind: {entry.kind}")
+
+
+def is_retryable(error: Exception) -> bool:
+    # Throttling and 5xx that outlived the scheduler's own retries, network failures and open breakers
+    return is_outage(error) or isinstance(error, CircuitOpenError)
+
+
+class OutboxWorker:
+    """
+    Background threads that drain the outbox table. The request path only
+    inserts a row and calls wake(); Gmail latency and retries happen here.
+    """
+
+    def __init__(self, session_factory: Callable = SessionLocal,
+                 service_factory: Callable = GmailService.from_tokens,
+                 workers: Optional[int] = None, poll_seconds: Optional[float] = None,
+                 max_attempts: Optional[int] = None):
+        self.session_factory = session_factory
+        self.service_factory = service_factory
+        self.workers = settings.OUTBOX_WORKERS if workers is None else workers
+        self.poll_seconds = poll_seconds or settings.OUTBOX_POLL_SECONDS
+        self.max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        if self._threads or self.workers <= 0:
+            return
+        db = self.session_factory()
+        try:
+            requeued = OutboxService.requeue_stale(db, STALE_SENDING_SECONDS)
+            if requeued:
+                logger.warning(f"Requeued {requeued} outbox messages left in 'sending'")
+        finally:
+            db.close()
+
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbox-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            db = self.session_factory()
+            try:
+                processed = self.process_one(db)
+            except Exception as e:
+                logger.exception(f"Outbox worker error: {e}")
+                processed = False
+            finally:
+                db.close()
+            if not processed:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+
+    def retry_delay(self, attempts: int) -> float:
+        return random.uniform(0, min(300, 2 ** attempts))
+
+    def process_one(self, db) -> bool:
+        """Deliver one queued message. Returns False when nothing was ready."""
+        entry = OutboxService.claim_next(db)
+        if entry is None:
+            return False
+
+        tokens = TokenService.get_tokens(db, email=entry.user_email)
+        if not tokens:
+            OutboxService.mark_failed(db, entry, "User is no longer logged in")
+            return True
+
+        try:
+            service = self.service_factory(tokens)
+            result = deliver(service, entry)
+        except Exception as e:
+            error = str(e)
+            if is_retryable(e) and entry.attempts < self.max_attempts:
+                delay = self.retry_delay(entry.attempts)
+                logger.warning(f"Outbox {entry.id} attempt {entry.attempts} failed, retrying in {delay:.1f}s: {error}")
+                OutboxService.mark_retry(db, entry, error, delay)
+            else:
+                logger.error(f"Outbox {entry.id} failed permanently: {error}")
+                OutboxService.mark_failed(db, entry, error)
+            return True
+
+        gmail_id = result.get("id") if isinstance(result, dict) else None
+        OutboxService.mark_sent(db, entry, gmail_id)
+        recipients = json.loads(entry.payload).get("to") or (
+            [result["to"]] if isinstance(result, dict) and result.get("to") else [])
+        if recipients:
+            contact_index.add_sent(entry.user_email, recipients, message_id=gmail_id)
+        # The sent list (and the thread for replies) changed
+        invalidate_user_cache(entry.user_email, set())
+        return True
+
+
+outbox_worker = OutboxWorker()
@@ -0,0 +1,44 @@
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.core.cache import build_cache_key, cache_manager
+from app.core.config import settings
+from app.core.tracing import traced
+from app.models.user_profile import UserProfile
+
+PROFILE_NAMESPACE = "profile"
+
+
+def _profile_key(email: str) -> str:
+    return build_cache_key(PROFILE_NAMESPACE, email)
+
+
+class ProfileService:
+    @staticmethod
+    @traced("profile.save")
+    def save(db: Session, email: str, name: Optional[str], picture: Optional[str]) -> dict:
+        """Upsert the stored profile and refresh its cache entry."""
+        profile = db.query(UserProfile).filter(UserProfile.email == email).first()
+        if profile is None:
+            profile = UserProfile(email=email)
+            db.add(profile)
+        profile.name = name
+        profile.picture = picture
+        db.commit()
+
+        data = {"email": email, "name": name, "picture": picture}
+        cache_manager.set(_profile_key(email), data, settings.PROFILE_CACHE_TTL_SECONDS)
+        return data
+
+    @staticmethod
+    @traced("profile.get")
+    def get(db: Session, email: str) -> Optional[dict]:
+        """Profile from memory, falling back to the stored row; None if never captured."""
+        data = cache_manager.get(_profile_key(email))
+        if data is not None:
+            return data
+        profile = db.query(UserProfile).filter(UserProfile.email == email).first()
+        if profile is None:
+            return None
+        data = {"email": profile.email, "name": profile.name, "picture": profile.picture}
+        cache_manager.set(_profile_key(email), data, settings.PROFILE_CACHE_TTL_SECONDS)
+        return data
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from sqlalchemy.orm import Session
+from app.models.mirrored_message import MirroredMessage
+from app.models.sync_job import SyncJob
+
+# A job in one of these states is still owned by the queue
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class SyncJobService:
+    @staticmethod
+    def get(db: Session, email: str) -> Optional[SyncJob]:
+        return db.query(SyncJob).filter(SyncJob.user_email == email).first()
+
+    @staticmethod
+    def start(db: Session, email: str, restart: bool = False) -> SyncJob:
+        """
+        Queue a full sync. An active job is returned as is; a failed or
+        cancelled one resumes from its checkpoint; `restart` (or a completed
+        job) starts over from the first page.
+        """
+        job = SyncJobService.get(db, email)
+        if job is None:
+            job = SyncJob(user_email=email)
+            db.add(job)
+        elif job.status in ACTIVE_STATUSES and not restart:
+            return job
+        if restart or job.status == "completed":
+            job.page_token = None
+            job.history_id = None
+            job.messages_total = None
+            job.pages_done = 0
+            job.messages_synced = 0
+            job.messages_failed = 0
+            job.started_at = None
+            job.completed_at = None
+        job.status = "queued"
+        job.last_error = None
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def cancel(db: Session, email: str) -> Optional[SyncJob]:
+        job = SyncJobService.get(db, email)
+        if job is not None and job.status in ACTIVE_STATUSES:
+            job.status = "cancelled"
+            db.commit()
+        return job
+
+    @staticmethod
+    def claim_next(db: Session) -> Optional[SyncJob]:
+        """Claim the oldest queued job; compare-and-set so several workers can share the table."""
+        candidates = db.query(SyncJob).filter(SyncJob.status == "queued").order_by(SyncJob.updated_at).limit(10).all()
+        for candidate in candidates:
+            claimed = db.query(SyncJob).filter(
+                SyncJob.user_email == candidate.user_email,
+                SyncJob.status == "queued"
+            ).update({"status": "running", "updated_at": datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+            if claimed:
+                db.refresh(candidate)
+                if candidate.started_at is None:
+                    candidate.started_at = datetime.utcnow()
+                    db.commit()
+                return candidate
+        return None
+
+    @staticmethod
+    def is_cancelled(db: Session, job: SyncJob) -> bool:
+        db.refresh(job)
+        return job.status == "cancelled"
+
+    @staticmethod
+    def checkpoint(db: Session, job: SyncJob, messages: Iterable[MirroredMessage],
+                   next_page_token: Optional[str], failed: int):
+        """
+        Store one page of messages and advance the page token in the same
+        transaction, so a crash either keeps both or neither. Re-running a
+        page after a crash overwrites the rows it already wrote.
+        """
+        synced = 0
+        for message in messages:
+            db.merge(message)
+            synced += 1
+        job.page_token = next_page_token
+        job.pages_done += 1
+        job.messages_synced += synced
+        job.messages_failed += failed
+        job.updated_at = datetime.utcnow()
+        db.commit()
+
+    @staticmethod
+    def pages_done(job: SyncJob) -> bool:
+        """Every page is stored and only finishing (catch-up) is left; a resumed job goes straight there."""
+        return job.pages_done > 0 and job.page_token is None
+
+    @staticmethod
+    def complete(db: Session, job: SyncJob):
+        job.status = "completed"
+        job.completed_at = datetime.utcnow()
+        job.updated_at = datetime.utcnow()
+        db.commit()
+
+    @staticmethod
+    def mark_failed(db: Session, job: SyncJob, error: str):
+        job.status = "failed"
+        job.last_error = error
+        db.commit()
+
+    @staticmethod
+    def requeue(db: Session, job: SyncJob):
+        """Hand a running job back to the queue (worker shutdown); it resumes from its checkpoint."""
+        if job.status == "running":
+            job.status = "queued"
+            db.commit()
+
+    @staticmethod
+    def requeue_stale(db: Session, older_than_seconds: float) -> int:
+        """Return jobs whose worker stopped checkpointing (e.g. died mid-page) to the queue."""
+        cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+        count = db.query(SyncJob).filter(
+            SyncJob.status == "running",
+            SyncJob.updated_at < cutoff
+        ).update({"status": "queued"}, synchronize_session=False)
+        db.commit()
+        return count
@@ -1,9 +1,21 @@
 from sqlalchemy.orm import Session
 from app.models.gmail_token import GmailToken
 from datetime import datetime
+import time
+from typing import Dict, Tuple
+from app.core.config import settings
+from app.core.tracing import traced
+
+# email -> (has stored tokens, monotonic time checked); lets /status skip the DB
+_token_presence: Dict[str, Tuple[bool, float]] = {}
+# last_seen_at is written at most this often per user, not on every request
+LAST_SEEN_INTERVAL_SECONDS = 300
+# email -> monotonic time last_seen_at was last written
+_last_seen: Dict[str, float] = {}
 
 class TokenService:
     @staticmethod
+    @traced("token_db.save_tokens")
     def save_tokens(db: Session, email: str, access_token: str, refresh_token: str, expiry: datetime) -> GmailToken:
         """
         Save or update tokens for a specific user.
@@ -14,7 +26,8 @@ class TokenService:
                 email=email,
                 access_token=access_token,
                 refresh_token=refresh_token,
-                expiry=expiry
+                expiry=expiry,
+                last_seen_at=datetime.utcnow()
             )
             db.add(token_entry)
         else:
@@ -23,12 +36,31 @@ class TokenService:
             if refresh_token:
                 token_entry.refresh_token = refresh_token
             token_entry.expiry = expiry
+            token_entry.last_seen_at = datetime.utcnow()
         
         db.commit()
         db.refresh(token_entry)
+        _token_presence[email] = (True, time.monotonic())
+        _last_seen[email] = time.monotonic()
         return token_entry
 
     @staticmethod
+    def touch(db: Session, email: str):
+        """
+        Record an authenticated request. Written at most every
+        LAST_SEEN_INTERVAL_SECONDS per user, so most requests skip the write.
+        """
+        now = time.monotonic()
+        last = _last_seen.get(email)
+        if last is not None and now - last < LAST_SEEN_INTERVAL_SECONDS:
+            return
+        _last_seen[email] = now
+        db.query(GmailToken).filter(GmailToken.email == email).update(
+            {"last_seen_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    @traced("token_db.get_tokens")
     def get_tokens(db: Session, email: str) -> GmailToken:
         """
         Retrieve the stored tokens for a specific user.
@@ -36,9 +68,24 @@ class TokenService:
         return db.query(GmailToken).filter(GmailToken.email == email).first()
 
     @staticmethod
+    @traced("token_db.clear_tokens")
     def clear_tokens(db: Session, email: str):
         """
         Clear stored tokens for a specific user (logout).
         """
         db.query(GmailToken).filter(GmailToken.email == email).delete()
         db.commit()
+        _token_presence[email] = (False, time.monotonic())
+
+    @staticmethod
+    def has_tokens(db: Session, email: str) -> bool:
+        """
+        Whether tokens are stored for a user, answered from memory when checked recently.
+        """
+        cached = _token_presence.get(email)
+        now = time.monotonic()
+        if cached is not None and now - cached[1] < settings.TOKEN_PRESENCE_TTL_SECONDS:
+            return cached[0]
+        present = TokenService.get_tokens(db, email=email) is not None
+        _token_presence[email] = (present, now)
+        return present
@@ -0,0 +1,142 @@
+import base64
+import contextvars
+import heapq
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core.cache import INBOX_NAMESPACE, build_cache_key, cache_manager
+from app.core.config import settings
+from app.core.deadline import DeadlineExceeded
+from app.schemas.email import EmailPreview, PaginatedEmails
+from app.services.cache_warmer import INBOX_PAGE_SIZE
+from app.services.gmail_service import GmailService
+from app.services.label_writer import label_writer
+
+logger = logging.getLogger(__name__)
+
+# Per-account position: the Gmail page token to fetch and how many of that page were already shown
+AccountCursor = Dict[str, object]
+
+
+def encode_cursor(cursors: Dict[str, AccountCursor]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(cursors, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(page_token: Optional[str]) -> Dict[str, AccountCursor]:
+    if not page_token:
+        return {}
+    try:
+        cursors = json.loads(base64.urlsafe_b64decode(page_token + "=" * (-len(page_token) % 4)))
+    except ValueError as e:
+        raise ValueError("Invalid unified page token") from e
+    if not isinstance(cursors, dict) or not all(
+        isinstance(c, dict) and isinstance(c.get("offset"), int) and isinstance(c.get("token"), (str, type(None)))
+        for c in cursors.values()
+    ):
+        raise ValueError("Invalid unified page token")
+    return cursors
+
+
+def merge_pages(pages: Dict[str, Tuple[List[EmailPreview], Optional[str]]],
+                cursors: Dict[str, AccountCursor], max_results: int) -> PaginatedEmails:
+    """
+    K-way merge of per-account pages (each newest first) into one page.
+    `pages` maps account -> (previews after the cursor offset, Gmail nextPageToken).
+    Stops early when an account with more mail on its next page runs out of
+    fetched candidates, so no older message is shown before one of its newer ones.
+    """
+    heap = []
+    for order, (account, (previews, _)) in enumerate(pages.items()):
+        if previews:
+            heap.append((-previews[0].date.timestamp(), order, account, 0))
+    heapq.heapify(heap)
+
+    merged: List[EmailPreview] = []
+    taken = {account: 0 for account in pages}
+    while heap and len(merged) < max_results:
+        _, order, account, index = heapq.heappop(heap)
+        previews, next_token = pages[account]
+        merged.append(previews[index].model_copy(update={"account": account}))
+        taken[account] += 1
+        if index + 1 < len(previews):
+            heapq.heappush(heap, (-previews[index + 1].date.timestamp(), order, account, index + 1))
+        elif next_token:
+            break
+
+    next_cursors: Dict[str, AccountCursor] = dict(cursors)
+    # Accounts that failed this time keep their cursor and are retried on the next page
+    more = any(account not in pages and cursor["offset"] >= 0 for account, cursor in cursors.items())
+    for account, (previews, next_token) in pages.items():
+        cursor = cursors.get(account, {"token": None, "offset": 0})
+        if taken[account] < len(previews):
+            next_cursors[account] = {"token": cursor["token"], "offset": cursor["offset"] + taken[account]}
+            more = True
+        elif next_token:
+            next_cursors[account] = {"token": next_token, "offset": 0}
+            more = True
+        else:
+            next_cursors[account] = {"token": None, "offset": -1}
+    return PaginatedEmails(messages=merged, nextPageToken=encode_cursor(next_cursors) if more else None)
+
+
+class UnifiedInbox:
+    """
+    Inbox across every account linked to a session. Accounts are queried in
+    parallel (one GmailService per worker thread, since the Google client is
+    not thread-safe), so a page costs as much as the slowest account.
+    """
+
+    def __init__(self, service_factory: Callable = GmailService.from_tokens, max_workers: int = 8):
+        self.service_factory = service_factory
+        self.max_workers = max_workers
+
+    def _fetch(self, email: str, tokens, cursor: AccountCursor,
+               max_results: int) -> Tuple[List[EmailPreview], Optional[str]]:
+        # Gmail pages are cached under the same key as /inbox, so continuing
+        # within a page (a later offset, same token) costs no new calls
+        if max_results == INBOX_PAGE_SIZE:
+            key = build_cache_key(INBOX_NAMESPACE, email, page_token=cursor["token"])
+        else:
+            key = build_cache_key(INBOX_NAMESPACE, email, page_token=cursor["token"], max_results=max_results)
+        page = cache_manager.get(key)
+        if page is None:
+            def compute() -> PaginatedEmails:
+                fetched = self.service_factory(tokens).list_inbox_emails(max_results=max_results,
+                                                                         page_token=cursor["token"] or "")
+                fetched.messages = label_writer.overlay(email, fetched.messages, view_label='INBOX')
+                return fetched
+            page = cache_manager.compute_once(key, compute, settings.MAILBOX_LIST_CACHE_TTL_SECONDS,
+                                              cacheable=lambda fetched: not fetched.partial)
+        if page.partial:
+            # The cursor offsets assume whole Gmail pages, so a cut-short page is retried instead
+            raise DeadlineExceeded("Inbox page cut short by the request deadline")
+        return page.messages[cursor["offset"]:], page.nextPageToken
+
+    def list(self, accounts: Dict[str, object], page_token: Optional[str] = None,
+             max_results: int = 20) -> PaginatedEmails:
+        """accounts maps email -> stored GmailToken row."""
+        decoded = decode_cursor(page_token)
+        cursors = {email: decoded.get(email, {"token": None, "offset": 0}) for email in accounts}
+        # offset -1 marks an account whose inbox is exhausted
+        active = {email: cursor for email, cursor in cursors.items() if cursor["offset"] >= 0}
+        if not active:
+            return PaginatedEmails(messages=[], nextPageToken=None)
+
+        pages: Dict[str, Tuple[List[EmailPreview], Optional[str]]] = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(active))) as pool:
+            # Each task runs in a copy of the request context so its spans and Gmail call counts are attributed
+            futures = {email: pool.submit(contextvars.copy_context().run, self._fetch, email, accounts[email], cursor,
+                                          max_results)
+                       for email, cursor in active.items()}
+            for email, future in futures.items():
+                try:
+                    pages[email] = future.result()
+                except Exception as e:
+                    # Leave the account's cursor where it was so the next page retries it
+                    logger.warning(f"Unified inbox: fetching {email} failed: {e}")
+
+        merged = merge_pages(pages, cursors, max_results)
+        merged.partial = len(pages) < len(active)
+        return merged
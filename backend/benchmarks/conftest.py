@@ -0,0 +1,28 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+# Settings are validated at import time; benchmarks never talk to Google.
+os.environ.setdefault("GOOGLE_CLIENT_ID", "bench")
+os.environ.setdefault("GOOGLE_CLIENT_SECRET", "bench")
+os.environ.setdefault("GOOGLE_REDIRECT_URI", "http://localhost:8000/callback")
+os.environ.setdefault("FRONTEND_URL", "http://localhost:3000")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from app.services.gmail_service import GmailService
+
+PAYLOAD_DIR = Path(__file__).parent / "payloads"
+PAYLOAD_NAMES = ["small", "huge_html", "nested_multipart", "mailing_list"]
+
+
+@pytest.fixture(params=PAYLOAD_NAMES)
+def payload(request):
+    return json.loads((PAYLOAD_DIR / f"{request.param}.json").read_text())
+
+
+@pytest.fixture
+def gmail_service():
+    # The parsing helpers never touch the API client, so skip discovery/build entirely.
+    return GmailService.__new__(GmailService)
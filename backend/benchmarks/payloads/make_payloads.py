@@ -0,0 +1,120 @@
+"""
+Regenerate the benchmark payloads in this directory.
+
+The payloads mirror the shape of real users.messages.get(format='full')
+responses captured from Gmail (header order, part nesting, base64url bodies),
+with personal data replaced by generated text.
+
+    python benchmarks/payloads/make_payloads.py
+"""
+import base64
+import json
+import random
+from pathlib import Path
+
+HERE = Path(__file__).parent
+rng = random.Random(2024)
+
+WORDS = ("the quarterly numbers look good please review the attached deck before our sync "
+         "we should ship the release next week once the regression is fixed thanks").split()
+
+
+def b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def words(n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def part(mime_type: str, text: str, part_id: str) -> dict:
+    return {"partId": part_id, "mimeType": mime_type, "filename": "",
+            "headers": [{"name": "Content-Type", "value": f'{mime_type}; charset="UTF-8"'}],
+            "body": {"size": len(text), "data": b64(text)}}
+
+
+def base_headers(subject: str) -> list:
+    return [
+        {"name": "Delivered-To", "value": "me@example.com"},
+        {"name": "Received", "value": "by 2002:a05:6358:1234 with SMTP id abc; Mon, 1 Jan 2024 10:00:00 -0800 (PST)"},
+        {"name": "MIME-Version", "value": "1.0"},
+        {"name": "Date", "value": "Mon, 1 Jan 2024 10:00:00 -0800"},
+        {"name": "Message-ID", "value": "<CAF=abc123@mail.gmail.com>"},
+        {"name": "Subject", "value": subject},
+        {"name": "From", "value": "Alice Johnson <alice@example.com>"},
+        {"name": "To", "value": "Me <me@example.com>"},
+    ]
+
+
+def message(msg_id: str, headers: list, payload: dict) -> dict:
+    payload["headers"] = headers
+    return {"id": msg_id, "threadId": msg_id, "labelIds": ["UNREAD", "IMPORTANT", "CATEGORY_PERSONAL", "INBOX"],
+            "snippet": words(25), "sizeEstimate": 0, "historyId": "123456", "internalDate": "1704132000000",
+            "payload": payload}
+
+
+def small():
+    text = words(60)
+    payload = {"partId": "", "mimeType": "multipart/alternative", "filename": "", "body": {"size": 0},
+               "parts": [part("text/plain", text, "0"), part("text/html", f"<div dir=\"ltr\">{text}</div>", "1")]}
+    return message("18c0a1b2c3d4e5f6", base_headers("Lunch tomorrow?"), payload)
+
+
+def huge_html():
+    rows = "".join(
+        f"<tr><td style=\"padding:8px;border:1px solid #ddd;font-family:Arial\">{words(8)}</td>"
+        f"<td style=\"padding:8px;border:1px solid #ddd\"><a href=\"https://example.com/t/{i}\">{words(3)}</a></td></tr>"
+        for i in range(1500)
+    )
+    html = f"<html><head><style>{'.c{color:#333}' * 200}</style></head><body><table>{rows}</table></body></html>"
+    payload = {"partId": "", "mimeType": "multipart/alternative", "filename": "", "body": {"size": 0},
+               "parts": [part("text/plain", words(400), "0"), part("text/html", html, "1")]}
+    return message("18c0a1b2c3d4e5f7", base_headers("Your monthly statement"), payload)
+
+
+def nested_multipart():
+    text = words(120)
+    alternative = {"partId": "0.0", "mimeType": "multipart/alternative", "filename": "", "headers": [], "body": {"size": 0},
+                   "parts": [part("text/plain", text, "0.0.0"), part("text/html", f"<p>{text}</p>", "0.0.1")]}
+    related = {"partId": "0", "mimeType": "multipart/related", "filename": "", "headers": [], "body": {"size": 0},
+               "parts": [alternative,
+                         {"partId": "0.1", "mimeType": "image/png", "filename": "logo.png", "headers": [],
+                          "body": {"size": 20480, "attachmentId": "ANGjdJ_logo"}}]}
+    attachments = [
+        {"partId": str(i), "mimeType": "application/pdf", "filename": f"report-{i}.pdf", "headers": [],
+         "body": {"size": 512000, "attachmentId": f"ANGjdJ_{i}"}}
+        for i in range(1, 4)
+    ]
+    forwarded = {"partId": "4", "mimeType": "message/rfc822", "filename": "", "headers": [], "body": {"size": 0},
+                 "parts": [{"partId": "4.0", "mimeType": "multipart/mixed", "filename": "", "headers": [], "body": {"size": 0},
+                            "parts": [part("text/plain", words(80), "4.0.0")]}]}
+    payload = {"partId": "", "mimeType": "multipart/mixed", "filename": "", "body": {"size": 0},
+               "parts": [related] + attachments + [forwarded]}
+    return message("18c0a1b2c3d4e5f8", base_headers("Fwd: Contract documents"), payload)
+
+
+def mailing_list():
+    headers = []
+    for i in range(171):
+        headers.append({"name": "Received", "value": f"from mx{i}.lists.example.org by relay{i}.example.net; Mon, 1 Jan 2024 10:00:{i % 60:02d} -0800"})
+    headers += [{"name": f"X-Custom-{i}", "value": words(6)} for i in range(15)]
+    headers += [
+        {"name": "List-Id", "value": "<dev.lists.example.org>"},
+        {"name": "List-Unsubscribe", "value": "<mailto:unsubscribe@lists.example.org>"},
+        {"name": "Precedence", "value": "list"},
+        {"name": "References", "value": " ".join(f"<msg{i}@lists.example.org>" for i in range(20))},
+        {"name": "In-Reply-To", "value": "<msg19@lists.example.org>"},
+        {"name": "Reply-To", "value": "dev@lists.example.org"},
+    ]
+    headers += base_headers("Re: [dev] Proposal: new build pipeline")
+    text = words(300)
+    payload = {"partId": "", "mimeType": "multipart/alternative", "filename": "", "body": {"size": 0},
+               "parts": [part("text/plain", text, "0"), part("text/html", f"<pre>{text}</pre>", "1")]}
+    return message("18c0a1b2c3d4e5f9", headers, payload)
+
+
+if __name__ == "__main__":
+    for name, build in [("small", small), ("huge_html", huge_html),
+                        ("nested_multipart", nested_multipart), ("mailing_list", mailing_list)]:
+        (HERE / f"{name}.json").write_text(json.dumps(build(), indent=1))
+        print(f"wrote {name}.json")
@@ -0,0 +1,60 @@
+"""
+Mailbox analytics over a synthetic 500k-message mirror: loading the
+columns once, then the per-request aggregation.
+
+    pytest benchmarks/test_analytics.py --no-cov
+"""
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.services.mailbox_analytics import MailboxColumns, summarize
+
+MESSAGES = 500_000
+TODAY = date(2024, 6, 1)
+LABEL_SETS = ["INBOX", "INBOX UNREAD", "INBOX UNREAD CATEGORY_PROMOTIONS", "INBOX CATEGORY_UPDATES",
+              "SENT", "INBOX IMPORTANT", "INBOX UNREAD Label_1", "Label_2"]
+
+
+def _rows(count):
+    rng = random.Random(7)
+    senders = [f"Sender {i} <sender{i}@example.com>" for i in range(5000)] + ["me@example.com"]
+    start = datetime(2024, 6, 1)
+    for i in range(count):
+        labels = rng.choice(LABEL_SETS)
+        sender = "me@example.com" if labels == "SENT" else rng.choice(senders)
+        yield (f"m{i}", f"t{rng.randrange(count // 3)}", sender,
+               start - timedelta(seconds=rng.randrange(365 * 86400)), labels)
+
+
+@pytest.fixture(scope="module")
+def columns():
+    columns = MailboxColumns.from_rows(_rows(MESSAGES))
+    # Built once per load in production; keep it out of the measured summary
+    columns.thread_order()
+    return columns
+
+
+def test_load_columns(benchmark):
+    rows = list(_rows(50_000))
+    result = benchmark.pedantic(MailboxColumns.from_rows, args=(rows,), rounds=3)
+    assert len(result) == 50_000
+
+
+def test_summarize_500k(benchmark, columns):
+    result = benchmark(summarize, columns, TODAY, 30, 10, 0)
+    assert result.messages == MESSAGES
+
+
+def test_patch_500k(benchmark, columns):
+    # The first patch builds the id -> row map; later ones only touch the changed rows
+    current = [columns.patched()]
+    deleted = iter(range(MESSAGES))
+
+    def patch():
+        i = next(deleted)
+        current[0] = current[0].patched(added=[(f"new{i}", "t1", "me@example.com", datetime(2024, 6, 1), "SENT")],
+                                        deleted={f"m{i}"}, labels={f"m{MESSAGES - 1 - i}": ["INBOX"]})
+    benchmark(patch)
+    assert len(current[0]) == MESSAGES
@@ -0,0 +1,57 @@
+"""
+Cost of compressed cache entries on the inbox page hot path (set on miss,
+decode on every hit) and the memory they save.
+
+    pytest benchmarks/test_cache_codec.py --no-cov
+"""
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.cache import CacheManager
+from app.schemas.email import EmailPreview, PaginatedEmails
+
+
+def _deep_size(obj, seen=None) -> int:
+    """Rough heap footprint of a model tree, for comparing against the compressed payload."""
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += _deep_size(obj.__dict__, seen)
+    return size
+
+
+@pytest.fixture
+def inbox_page(gmail_service, payload):
+    preview = gmail_service._build_preview(payload)
+    start = datetime(2024, 6, 1)
+    return PaginatedEmails(messages=[
+        preview.model_copy(update={"id": f"{preview.id}{i}", "date": start - timedelta(minutes=i)})
+        for i in range(20)
+    ], nextPageToken="token")
+
+
+def test_cache_hit_compressed(benchmark, inbox_page):
+    cache = CacheManager(compression="zlib", compress_min_bytes=0)
+    cache.set("inbox", inbox_page, ttl_seconds=60)
+
+    page = benchmark(cache.get, "inbox")
+    assert page == inbox_page
+    stats = cache.stats()
+    benchmark.extra_info["heap_bytes"] = _deep_size(inbox_page)
+    benchmark.extra_info["stored_bytes"] = stats["bytes"]
+    assert stats["bytes"] * 3 < _deep_size(inbox_page)
+
+
+def test_cache_hit_uncompressed(benchmark, inbox_page):
+    cache = CacheManager(compression="none")
+    cache.set("inbox", inbox_page, ttl_seconds=60)
+    assert benchmark(cache.get, "inbox") is inbox_page
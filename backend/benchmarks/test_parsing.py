@@ -0,0 +1,42 @@
+"""
+Hot paths run for every row of /inbox, /sent and /search and for every
+/messages/{id} request.
+
+    pytest benchmarks --no-cov --benchmark-compare --benchmark-compare-fail=mean:25%
+"""
+from app.services.gmail_service import _index_headers
+
+# The headers the service reads from one message across preview, detail and reply paths
+LOOKUPS = ["From", "Subject", "Reply-To", "Message-ID", "References"]
+
+
+def test_parse_header_scan(benchmark, gmail_service, payload):
+    headers = payload["payload"]["headers"]
+
+    def scan():
+        return [gmail_service._parse_header(headers, name) for name in LOOKUPS]
+
+    values = benchmark(scan)
+    assert values[0]
+
+
+def test_header_index_once(benchmark, gmail_service, payload):
+    headers = payload["payload"]["headers"]
+
+    def index_once():
+        index = _index_headers(headers)
+        return [index.get(name.lower(), "") for name in LOOKUPS]
+
+    values = benchmark(index_once)
+    assert values == [gmail_service._parse_header(headers, name) for name in LOOKUPS]
+
+
+def test_get_body(benchmark, gmail_service, payload):
+    body = benchmark(gmail_service._get_body, payload["payload"])
+    assert body
+
+
+def test_build_preview(benchmark, gmail_service, payload):
+    preview = benchmark(gmail_service._build_preview, payload)
+    assert preview.id == payload["id"]
+    assert preview.unread is True
@@ -0,0 +1,343 @@
+"""
+Local stand-in for the Google OAuth, userinfo and Gmail REST APIs.
+
+Run it next to the backend to exercise every endpoint without touching real
+Gmail quota:
+
+    python -m loadtest.fake_gmail --port 8001 --latency-ms 80 --error-rate 0.01
+
+and start the backend with
+
+    GOOGLE_API_ENDPOINT=http://localhost:8001/
+    GOOGLE_AUTH_URI=http://localhost:8001/o/oauth2/auth
+    GOOGLE_TOKEN_URI=http://localhost:8001/token
+
+The authorization code doubles as the account selector: exchanging the code
+``alice@example.com`` yields tokens for a synthetic mailbox owned by Alice.
+"""
+import argparse
+import asyncio
+import base64
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from email.parser import BytesParser, Parser
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlencode
+
+import httpx
+from fastapi import BackgroundTasks, Body, Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, RedirectResponse
+
+from loadtest.mailbox import SyntheticMailbox
+from loadtest.pubsub import LocalPublisher
+
+ACCESS_PREFIX = "fake-access:"
+REFRESH_PREFIX = "fake-refresh:"
+
+
+@dataclass
+class FakeGmailConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 429
+    mailbox_size: int = 500
+    default_email: str = "loadtest@example.com"
+    seed: Optional[int] = None
+    # Where users.watch notifications are pushed (the backend's /api/gmail/push)
+    push_endpoint: Optional[str] = None
+    push_token: Optional[str] = None
+
+
+class GmailError(Exception):
+    def __init__(self, status: int, reason: str, message: str):
+        self.status = status
+        self.reason = reason
+        self.message = message
+
+
+ERROR_REASONS = {
+    403: ("userRateLimitExceeded", "User Rate Limit Exceeded"),
+    404: ("notFound", "Requested entity was not found."),
+    429: ("rateLimitExceeded", "Rate Limit Exceeded"),
+    500: ("backendError", "Backend Error"),
+    503: ("backendError", "The service is currently unavailable."),
+}
+
+
+def render(mailbox: SyntheticMailbox, message: dict, format: str, metadata_headers: Optional[List[str]]) -> dict:
+    """A messages.get response body in the requested format."""
+    result = {k: v for k, v in message.items() if k != "payload"}
+    if format == "minimal":
+        return result
+    if format == "raw":
+        result["raw"] = base64.urlsafe_b64encode(mailbox.raw[message["id"]]).decode("ascii")
+        return result
+    payload = message["payload"]
+    if format == "metadata":
+        headers = payload["headers"]
+        if metadata_headers:
+            wanted = {h.lower() for h in metadata_headers}
+            headers = [h for h in headers if h["name"].lower() in wanted]
+        result["payload"] = {"mimeType": payload["mimeType"], "headers": headers}
+        return result
+    result["payload"] = payload
+    return result
+
+
+def create_app(config: Optional[FakeGmailConfig] = None) -> FastAPI:
+    config = config or FakeGmailConfig()
+    app = FastAPI(title="Fake Gmail API")
+    app.state.config = config
+    mailboxes: Dict[str, SyntheticMailbox] = {}
+    app.state.mailboxes = mailboxes
+    rng = random.Random(config.seed)
+    # email -> topicName for mailboxes with an active users.watch
+    watches: Dict[str, str] = {}
+    app.state.watches = watches
+    publisher = LocalPublisher(config.push_endpoint, config.push_token) if config.push_endpoint else None
+
+    def notify(background_tasks: BackgroundTasks, mailbox: SyntheticMailbox):
+        if publisher is not None and mailbox.email in watches:
+            background_tasks.add_task(publisher.publish, mailbox.email, mailbox.history_id)
+
+    def mailbox_for(email: str) -> SyntheticMailbox:
+        if email not in mailboxes:
+            mailboxes[email] = SyntheticMailbox(email, size=config.mailbox_size, seed=config.seed)
+        return mailboxes[email]
+
+    @app.exception_handler(GmailError)
+    async def gmail_error_handler(request: Request, exc: GmailError):
+        return JSONResponse(status_code=exc.status, content={
+            "error": {
+                "code": exc.status,
+                "message": exc.message,
+                "errors": [{"message": exc.message, "domain": "global", "reason": exc.reason}],
+            }
+        })
+
+    async def simulate(request: Request) -> SyntheticMailbox:
+        """Applies injected latency and errors, then resolves the caller's mailbox."""
+        auth = request.headers.get("authorization", "")
+        if not auth.startswith(f"Bearer {ACCESS_PREFIX}"):
+            raise GmailError(401, "authError", "Invalid Credentials")
+        if config.latency_ms or config.jitter_ms:
+            delay = max(config.latency_ms + rng.uniform(-config.jitter_ms, config.jitter_ms), 0)
+            await asyncio.sleep(delay / 1000)
+        if config.error_rate and rng.random() < config.error_rate:
+            reason, message = ERROR_REASONS.get(config.error_status, ("backendError", "Injected error"))
+            raise GmailError(config.error_status, reason, message)
+        return mailbox_for(auth[len(f"Bearer {ACCESS_PREFIX}"):])
+
+    # --- OAuth ---------------------------------------------------------
+
+    @app.get("/o/oauth2/auth")
+    def authorize(redirect_uri: str, state: str = "", login_hint: Optional[str] = None):
+        code = login_hint or config.default_email
+        return RedirectResponse(f"{redirect_uri}?{urlencode({'code': code, 'state': state})}")
+
+    @app.post("/token")
+    async def token(request: Request):
+        # Parsed by hand so the fake server does not need python-multipart
+        form = {k: v[0] for k, v in parse_qs((await request.body()).decode()).items()}
+        grant_type, code, refresh_token = form.get("grant_type"), form.get("code"), form.get("refresh_token")
+        if grant_type == "authorization_code":
+            email = code if code and "@" in code else config.default_email
+        elif grant_type == "refresh_token" and refresh_token and refresh_token.startswith(REFRESH_PREFIX):
+            email = refresh_token[len(REFRESH_PREFIX):]
+        else:
+            raise HTTPException(status_code=400, detail={"error": "invalid_grant"})
+        return {
+            "access_token": f"{ACCESS_PREFIX}{email}",
+            "refresh_token": f"{REFRESH_PREFIX}{email}",
+            "expires_in": 3600,
+            "token_type": "Bearer",
+            "scope": "https://mail.google.com/",
+        }
+
+    @app.get("/oauth2/v2/userinfo")
+    async def userinfo(mailbox: SyntheticMailbox = Depends(simulate)):
+        name = mailbox.email.split("@")[0].replace(".", " ").title()
+        return {"id": str(abs(hash(mailbox.email))), "email": mailbox.email, "verified_email": True,
+                "name": name, "picture": f"https://example.com/avatars/{name.replace(' ', '_')}.png"}
+
+    # --- Gmail -----------------------------------------------------------
+
+    @app.get("/gmail/v1/users/{user_id}/profile")
+    async def profile(user_id: str, mailbox: SyntheticMailbox = Depends(simulate)):
+        return {"emailAddress": mailbox.email, "messagesTotal": len(mailbox.messages),
+                "threadsTotal": len({m["threadId"] for m in mailbox.messages.values()}),
+                "historyId": str(mailbox.history_id)}
+
+    @app.get("/gmail/v1/users/{user_id}/messages")
+    async def list_messages(user_id: str, labelIds: Optional[List[str]] = Query(None), q: Optional[str] = None,
+                            maxResults: int = 100, pageToken: Optional[str] = None,
+                            mailbox: SyntheticMailbox = Depends(simulate)):
+        messages = mailbox.list(label_ids=labelIds, query=q)
+        offset = int(pageToken) if pageToken else 0
+        page = messages[offset:offset + min(maxResults, 500)]
+        result = {"messages": [{"id": m["id"], "threadId": m["threadId"]} for m in page],
+                  "resultSizeEstimate": len(messages)}
+        if offset + len(page) < len(messages):
+            result["nextPageToken"] = str(offset + len(page))
+        if not page:
+            result.pop("messages")
+        return result
+
+    @app.get("/gmail/v1/users/{user_id}/messages/{message_id}")
+    async def get_message(user_id: str, message_id: str, format: str = "full",
+                          metadataHeaders: Optional[List[str]] = Query(None),
+                          mailbox: SyntheticMailbox = Depends(simulate)):
+        message = mailbox.get(message_id)
+        if message is None:
+            raise GmailError(404, *ERROR_REASONS[404])
+        return render(mailbox, message, format, metadataHeaders)
+
+    @app.get("/gmail/v1/users/{user_id}/threads/{thread_id}")
+    async def get_thread(user_id: str, thread_id: str, format: str = "full",
+                         metadataHeaders: Optional[List[str]] = Query(None),
+                         mailbox: SyntheticMailbox = Depends(simulate)):
+        messages = sorted((m for m in mailbox.list() if m["threadId"] == thread_id), key=lambda m: int(m["internalDate"]))
+        if not messages:
+            raise GmailError(404, *ERROR_REASONS[404])
+        return {"id": thread_id, "historyId": max((m["historyId"] for m in messages), key=int),
+                "messages": [render(mailbox, m, format, metadataHeaders) for m in messages]}
+
+    @app.post("/gmail/v1/users/{user_id}/messages/send")
+    async def send_message(user_id: str, background_tasks: BackgroundTasks, body: dict = Body(...),
+                           mailbox: SyntheticMailbox = Depends(simulate)):
+        raw = base64.urlsafe_b64decode(body.get("raw", "") + "==")
+        result = mailbox.send(raw, thread_id=body.get("threadId"))
+        notify(background_tasks, mailbox)
+        return result
+
+    @app.post("/gmail/v1/users/{user_id}/messages/{message_id}/trash")
+    async def trash_message(user_id: str, message_id: str, background_tasks: BackgroundTasks,
+                            mailbox: SyntheticMailbox = Depends(simulate)):
+        result = mailbox.trash(message_id)
+        if result is None:
+            raise GmailError(404, *ERROR_REASONS[404])
+        notify(background_tasks, mailbox)
+        return result
+
+    @app.post("/gmail/v1/users/{user_id}/messages/batchModify")
+    async def batch_modify(user_id: str, background_tasks: BackgroundTasks, body: dict = Body(...),
+                           mailbox: SyntheticMailbox = Depends(simulate)):
+        mailbox.modify(body.get("ids", []), body.get("addLabelIds", []), body.get("removeLabelIds", []))
+        notify(background_tasks, mailbox)
+        return Response(status_code=204)
+
+    @app.post("/gmail/v1/users/{user_id}/watch")
+    async def watch(user_id: str, body: dict = Body(...), mailbox: SyntheticMailbox = Depends(simulate)):
+        watches[mailbox.email] = body.get("topicName", "")
+        expiration = int(time.time() * 1000) + 7 * 24 * 3600 * 1000
+        return {"historyId": str(mailbox.history_id), "expiration": str(expiration)}
+
+    @app.post("/gmail/v1/users/{user_id}/stop")
+    async def stop(user_id: str, mailbox: SyntheticMailbox = Depends(simulate)):
+        watches.pop(mailbox.email, None)
+        return Response(status_code=204)
+
+    @app.get("/gmail/v1/users/{user_id}/labels")
+    async def list_labels(user_id: str, mailbox: SyntheticMailbox = Depends(simulate)):
+        return {"labels": [{"id": label, "name": label, "type": "system"} for label in mailbox.labels()]}
+
+    @app.get("/gmail/v1/users/{user_id}/labels/{label_id}")
+    async def get_label(user_id: str, label_id: str, mailbox: SyntheticMailbox = Depends(simulate)):
+        return {"id": label_id, "name": label_id, "type": "system", **mailbox.label_counts(label_id)}
+
+    @app.get("/gmail/v1/users/{user_id}/history")
+    async def list_history(user_id: str, startHistoryId: int, labelId: Optional[str] = None,
+                           historyTypes: Optional[List[str]] = Query(None), maxResults: int = 100,
+                           pageToken: Optional[str] = None, mailbox: SyntheticMailbox = Depends(simulate)):
+        records = mailbox.history_since(startHistoryId)
+        if records is None:
+            raise GmailError(404, *ERROR_REASONS[404])
+        if labelId:
+            records = [r for r in records if any(labelId in ref["labelIds"] for ref in r["messages"])]
+        offset = int(pageToken) if pageToken else 0
+        page = records[offset:offset + min(maxResults, 500)]
+        result = {"historyId": str(mailbox.history_id)}
+        if page:
+            result["history"] = page
+        if offset + len(page) < len(records):
+            result["nextPageToken"] = str(offset + len(page))
+        return result
+
+    # --- Test controls (not part of the Gmail API) ---------------------------
+
+    @app.post("/_fake/users/{email}/deliver")
+    async def deliver(email: str, background_tasks: BackgroundTasks, count: int = 1):
+        """Drop new messages into a mailbox, as if they had just arrived."""
+        mailbox = mailbox_for(email)
+        ids = [mailbox.deliver()["id"] for _ in range(count)]
+        notify(background_tasks, mailbox)
+        return {"messages": ids, "historyId": str(mailbox.history_id)}
+
+    # --- Batch -------------------------------------------------------------
+
+    async def dispatch_part(client: httpx.AsyncClient, part) -> str:
+        request_line, _, rest = part.get_payload().partition("\n")
+        method, target, _ = request_line.strip().split(" ", 2)
+        inner = Parser().parsestr(rest)
+        headers = {k: v for k, v in inner.items() if k.lower() in ("authorization", "content-type")}
+        body = inner.get_payload() or None
+        response = await client.request(method, target, headers=headers, content=body)
+        return (
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <response-{part['Content-ID'].strip('<>')}>\r\n\r\n"
+            f"HTTP/1.1 {response.status_code} {response.reason_phrase}\r\n"
+            "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+            f"{response.text}\r\n"
+        )
+
+    @app.post("/batch/gmail/v1")
+    @app.post("/batch")
+    async def batch(request: Request):
+        raw = await request.body()
+        envelope = BytesParser().parsebytes(
+            f"Content-Type: {request.headers['content-type']}\r\n\r\n".encode() + raw
+        )
+        parts = envelope.get_payload()
+        if len(parts) > 100:
+            raise GmailError(400, "invalidArgument", "Too many requests in batch")
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://fake-gmail") as client:
+            responses = await asyncio.gather(*(dispatch_part(client, part) for part in parts))
+        boundary = f"batch_{uuid.uuid4().hex}"
+        content = "".join(f"--{boundary}\r\n{r}" for r in responses) + f"--{boundary}--\r\n"
+        return Response(content=content, media_type=f"multipart/mixed; boundary={boundary}")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gmail API server for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mean latency added to every Gmail call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter around the mean latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of Gmail calls that fail")
+    parser.add_argument("--error-status", type=int, default=429, help="HTTP status used for injected failures")
+    parser.add_argument("--mailbox-size", type=int, default=500, help="Messages generated per account")
+    parser.add_argument("--email", default="loadtest@example.com", help="Account used when the auth code is not an email")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--push-endpoint", default=None,
+                        help="Push users.watch notifications here, e.g. http://localhost:8000/api/gmail/push")
+    parser.add_argument("--push-token", default=None, help="Verification token appended to push requests")
+    args = parser.parse_args()
+
+    import uvicorn
+    config = FakeGmailConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        error_status=args.error_status, mailbox_size=args.mailbox_size,
+        default_email=args.email, seed=args.seed,
+        push_endpoint=args.push_endpoint, push_token=args.push_token,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
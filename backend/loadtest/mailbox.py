@@ -0,0 +1,227 @@
+"""
+Synthetic Gmail mailbox used by the fake Gmail server.
+
+Messages are generated deterministically from a seed so load test runs are
+repeatable. Mutations (send, trash, label changes) are recorded as history records the same
+way Gmail exposes them through users.history.list.
+"""
+import base64
+import hashlib
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+SENDERS = [
+    ("Alice Johnson", "alice@example.com"),
+    ("Bob Smith", "bob@example.org"),
+    ("GitHub", "notifications@github.com"),
+    ("Jira", "jira@company.atlassian.net"),
+    ("Newsletter", "news@weekly.example.com"),
+    ("Carol Diaz", "carol.diaz@example.net"),
+    ("Dan Brown", "dan@example.com"),
+    ("Billing", "billing@saas.example.io"),
+]
+
+SUBJECT_WORDS = [
+    "quarterly", "report", "meeting", "invoice", "update", "release", "review",
+    "design", "roadmap", "budget", "incident", "follow-up", "launch", "draft",
+]
+
+BODY_WORDS = [
+    "please", "find", "attached", "the", "latest", "numbers", "for", "our",
+    "project", "let", "me", "know", "if", "you", "have", "questions", "thanks",
+    "team", "deadline", "next", "week", "schedule", "call", "notes",
+]
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+class SyntheticMailbox:
+    def __init__(self, email: str, size: int = 500, seed: Optional[int] = None, sent_ratio: float = 0.15):
+        self.email = email
+        self.lock = threading.Lock()
+        self.messages: Dict[str, dict] = {}
+        self.raw: Dict[str, bytes] = {}
+        self.history: List[dict] = []
+        self.history_id = 1000
+        self._seq = 0
+        seed = seed if seed is not None else int(hashlib.sha1(email.encode()).hexdigest()[:8], 16)
+        self.rng = random.Random(seed)
+
+        now_ms = int(time.time() * 1000)
+        thread_ids: List[str] = []
+        for i in range(size):
+            # Roughly one in four messages continues an existing thread
+            if thread_ids and self.rng.random() < 0.25:
+                thread_id = self.rng.choice(thread_ids[-50:])
+            else:
+                thread_id = None
+            sent = self.rng.random() < sent_ratio
+            internal_date = now_ms - i * self.rng.randint(60_000, 3_600_000)
+            message = self._build_message(thread_id, sent=sent, internal_date=internal_date)
+            thread_ids.append(message["threadId"])
+
+        # History before the mailbox was generated is treated as expired
+        self.history_floor = self.history_id
+
+    def _next_id(self) -> str:
+        self._seq += 1
+        return hashlib.md5(f"{self.email}:{self._seq}".encode()).hexdigest()[:16]
+
+    def _build_message(self, thread_id: Optional[str], sent: bool, internal_date: int,
+                       to: Optional[List[str]] = None, subject: Optional[str] = None,
+                       text: Optional[str] = None, raw: Optional[bytes] = None) -> dict:
+        message_id = self._next_id()
+        thread_id = thread_id or message_id
+        name, address = self.rng.choice(SENDERS)
+        sender = f"{name} <{address}>"
+        if sent:
+            sender, to = self.email, to or [address]
+        else:
+            to = to or [self.email]
+        subject = subject or " ".join(self.rng.choice(SUBJECT_WORDS) for _ in range(self.rng.randint(2, 6))).capitalize()
+        text = text or " ".join(self.rng.choice(BODY_WORDS) for _ in range(self.rng.randint(20, 400)))
+        html = f"<html><body><p>{text}</p></body></html>"
+
+        labels = ["SENT"] if sent else ["INBOX", "CATEGORY_PERSONAL"]
+        if not sent and self.rng.random() < 0.3:
+            labels.append("UNREAD")
+
+        headers = [
+            {"name": "From", "value": sender},
+            {"name": "To", "value": ", ".join(to)},
+            {"name": "Subject", "value": subject},
+            {"name": "Date", "value": time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime(internal_date / 1000))},
+            {"name": "Message-ID", "value": f"<{message_id}@mail.example.com>"},
+            {"name": "MIME-Version", "value": "1.0"},
+        ]
+        message = {
+            "id": message_id,
+            "threadId": thread_id,
+            "labelIds": labels,
+            "snippet": text[:120],
+            "internalDate": str(internal_date),
+            "sizeEstimate": len(text) + len(html),
+            "payload": {
+                "mimeType": "multipart/alternative",
+                "headers": headers,
+                "body": {"size": 0},
+                "parts": [
+                    {"partId": "0", "mimeType": "text/plain", "headers": [], "body": {"size": len(text), "data": _b64(text.encode())}},
+                    {"partId": "1", "mimeType": "text/html", "headers": [], "body": {"size": len(html), "data": _b64(html.encode())}},
+                ],
+            },
+        }
+        if raw is None:
+            boundary = f"b_{message_id}"
+            head = "".join(f"{h['name']}: {h['value']}\r\n" for h in headers)
+            raw = (
+                f"{head}Content-Type: multipart/alternative; boundary=\"{boundary}\"\r\n\r\n"
+                f"--{boundary}\r\nContent-Type: text/plain; charset=\"utf-8\"\r\n\r\n{text}\r\n"
+                f"--{boundary}\r\nContent-Type: text/html; charset=\"utf-8\"\r\n\r\n{html}\r\n"
+                f"--{boundary}--\r\n"
+            ).encode()
+        self.messages[message_id] = message
+        self.raw[message_id] = raw
+        self.history_id += 1
+        message["historyId"] = str(self.history_id)
+        return message
+
+    def _record(self, **change):
+        self.history_id += 1
+        self.history.append({"id": str(self.history_id), **change})
+
+    def list(self, label_ids: Optional[List[str]] = None, query: Optional[str] = None) -> List[dict]:
+        with self.lock:
+            messages = sorted(self.messages.values(), key=lambda m: int(m["internalDate"]), reverse=True)
+        if label_ids:
+            messages = [m for m in messages if all(label in m["labelIds"] for label in label_ids)]
+        if query:
+            terms = [t for t in query.lower().split() if ":" not in t]
+            if terms:
+                messages = [m for m in messages if all(t in m["snippet"].lower() or t in _subject(m).lower() for t in terms)]
+        return messages
+
+    def get(self, message_id: str) -> Optional[dict]:
+        return self.messages.get(message_id)
+
+    def send(self, raw: bytes, thread_id: Optional[str] = None) -> dict:
+        with self.lock:
+            message = self._build_message(thread_id, sent=True, internal_date=int(time.time() * 1000), raw=raw)
+            self._record(messages=[_ref(message)], messagesAdded=[{"message": _ref(message)}])
+        return {"id": message["id"], "threadId": message["threadId"], "labelIds": message["labelIds"]}
+
+    def deliver(self) -> dict:
+        """Simulate a new incoming message, useful for exercising sync paths."""
+        with self.lock:
+            message = self._build_message(None, sent=False, internal_date=int(time.time() * 1000))
+            self._record(messages=[_ref(message)], messagesAdded=[{"message": _ref(message)}])
+        return message
+
+    def trash(self, message_id: str) -> Optional[dict]:
+        with self.lock:
+            message = self.messages.get(message_id)
+            if message is None:
+                return None
+            removed = [label for label in message["labelIds"] if label in ("INBOX", "UNREAD")]
+            message["labelIds"] = [label for label in message["labelIds"] if label not in removed] + ["TRASH"]
+            self._record(
+                messages=[_ref(message)],
+                labelsAdded=[{"message": _ref(message), "labelIds": ["TRASH"]}],
+                labelsRemoved=[{"message": _ref(message), "labelIds": removed}] if removed else [],
+            )
+        return _ref(message)
+
+    def modify(self, message_ids: List[str], add: List[str], remove: List[str]):
+        """Apply label changes to every existing message; unknown ids are ignored, as batchModify does."""
+        with self.lock:
+            for message_id in message_ids:
+                message = self.messages.get(message_id)
+                if message is None:
+                    continue
+                added = [label for label in add if label not in message["labelIds"]]
+                removed = [label for label in remove if label in message["labelIds"]]
+                if not added and not removed:
+                    continue
+                message["labelIds"] = [label for label in message["labelIds"] if label not in removed] + added
+                self._record(
+                    messages=[_ref(message)],
+                    labelsAdded=[{"message": _ref(message), "labelIds": added}] if added else [],
+                    labelsRemoved=[{"message": _ref(message), "labelIds": removed}] if removed else [],
+                )
+
+    def labels(self) -> List[str]:
+        with self.lock:
+            return sorted({label for m in self.messages.values() for label in m["labelIds"]})
+
+    def label_counts(self, label_id: str) -> dict:
+        with self.lock:
+            labeled = [m for m in self.messages.values() if label_id in m["labelIds"]]
+        unread = [m for m in labeled if "UNREAD" in m["labelIds"]]
+        return {
+            "messagesTotal": len(labeled),
+            "messagesUnread": len(unread),
+            "threadsTotal": len({m["threadId"] for m in labeled}),
+            "threadsUnread": len({m["threadId"] for m in unread}),
+        }
+
+    def history_since(self, start_history_id: int) -> Optional[List[dict]]:
+        """Records after start_history_id, or None when that point is older than we keep."""
+        with self.lock:
+            if start_history_id < self.history_floor:
+                return None
+            return [h for h in self.history if int(h["id"]) > start_history_id]
+
+
+def _ref(message: dict) -> dict:
+    return {"id": message["id"], "threadId": message["threadId"], "labelIds": list(message["labelIds"])}
+
+
+def _subject(message: dict) -> str:
+    for header in message["payload"]["headers"]:
+        if header["name"] == "Subject":
+            return header["value"]
+    return ""
@@ -0,0 +1,50 @@
+"""
+Local stand-in for the Cloud Pub/Sub push subscription that delivers Gmail
+watch notifications. It POSTs the same envelope Pub/Sub would send to the
+backend's /api/gmail/push endpoint.
+"""
+import base64
+import itertools
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def push_envelope(email: str, history_id, message_id: str, subscription: str) -> dict:
+    data = json.dumps({"emailAddress": email, "historyId": int(history_id)}).encode()
+    return {
+        "message": {
+            "data": base64.b64encode(data).decode("ascii"),
+            "messageId": message_id,
+            "publishTime": datetime.now(timezone.utc).isoformat(),
+        },
+        "subscription": subscription,
+    }
+
+
+class LocalPublisher:
+    """
+    Publishes Gmail notifications to a push endpoint. Pass `client` to
+    deliver in-process (e.g. a FastAPI TestClient) instead of over HTTP.
+    """
+
+    def __init__(self, push_endpoint: str, verification_token: Optional[str] = None,
+                 client: Optional[httpx.Client] = None, subscription: str = "projects/local/subscriptions/gmail-push"):
+        self.push_endpoint = push_endpoint
+        self.verification_token = verification_token
+        self.client = client or httpx.Client(timeout=10)
+        self.subscription = subscription
+        self._ids = itertools.count(1)
+
+    def publish(self, email: str, history_id) -> int:
+        envelope = push_envelope(email, history_id, str(next(self._ids)), self.subscription)
+        params = {"token": self.verification_token} if self.verification_token else None
+        response = self.client.post(self.push_endpoint, json=envelope, params=params)
+        if response.status_code >= 400:
+            logger.warning(f"Push to {self.push_endpoint} failed with {response.status_code}")
+        return response.status_code
@@ -0,0 +1,162 @@
+"""
+Drive the backend's /api/gmail/* endpoints at a fixed concurrency and report
+latency percentiles and throughput per endpoint.
+
+    python -m loadtest.run_load --base-url http://localhost:8000 --concurrency 20 --duration 30
+
+The script logs in through /api/auth/callback with a fake authorization code,
+so the backend must be pointed at loadtest.fake_gmail (see loadtest/README.md).
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+DEFAULT_MIX = "inbox=5,sent=2,detail=6,search=1"
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = int(weight or 1)
+    return weights
+
+
+class LoadRunner:
+    def __init__(self, base_url: str, concurrency: int, duration: float, total_requests: Optional[int],
+                 mix: Dict[str, int], account: str, seed: Optional[int] = None):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.duration = duration
+        self.total_requests = total_requests
+        self.mix = mix
+        self.account = account
+        self.rng = random.Random(seed)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.message_ids: List[str] = []
+        self.issued = 0
+
+    async def login(self, client: httpx.AsyncClient):
+        response = await client.get("/api/auth/callback", params={"code": self.account}, follow_redirects=False)
+        if response.status_code not in (302, 303, 307) or "session" not in client.cookies:
+            raise RuntimeError(f"Login failed ({response.status_code}): {response.text[:200]}")
+        inbox = await client.get("/api/gmail/inbox")
+        inbox.raise_for_status()
+        self.message_ids = [m["id"] for m in inbox.json()["messages"]]
+
+    def next_request(self):
+        names = list(self.mix)
+        name = self.rng.choices(names, weights=[self.mix[n] for n in names])[0]
+        if name == "inbox":
+            return name, "/api/gmail/inbox", None
+        if name == "sent":
+            return name, "/api/gmail/sent", None
+        if name == "search":
+            return name, "/api/gmail/search", {"q": self.rng.choice(["report", "meeting", "invoice", "update"])}
+        if name == "detail" and self.message_ids:
+            return name, f"/api/gmail/messages/{self.rng.choice(self.message_ids)}", None
+        return "inbox", "/api/gmail/inbox", None
+
+    def _has_budget(self, deadline: float) -> bool:
+        if self.total_requests is not None:
+            return self.issued < self.total_requests
+        return time.perf_counter() < deadline
+
+    async def worker(self, client: httpx.AsyncClient, deadline: float):
+        while self._has_budget(deadline):
+            self.issued += 1
+            name, path, params = self.next_request()
+            start = time.perf_counter()
+            try:
+                response = await client.get(path, params=params)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            self.latencies[name].append((time.perf_counter() - start) * 1000)
+            if not ok:
+                self.errors[name] += 1
+
+    async def run(self) -> dict:
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=60, limits=limits) as client:
+            await self.login(client)
+            start = time.perf_counter()
+            deadline = start + self.duration
+            await asyncio.gather(*(self.worker(client, deadline) for _ in range(self.concurrency)))
+            elapsed = time.perf_counter() - start
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        all_samples: List[float] = []
+        for name, samples in sorted(self.latencies.items()):
+            all_samples.extend(samples)
+            endpoints[name] = summarize(samples, self.errors[name], elapsed)
+        return {
+            "concurrency": self.concurrency,
+            "elapsed_s": round(elapsed, 2),
+            "overall": summarize(all_samples, sum(self.errors.values()), elapsed),
+            "endpoints": endpoints,
+        }
+
+
+def summarize(samples: List[float], errors: int, elapsed: float) -> dict:
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(samples, 50), 2),
+        "p95_ms": round(percentile(samples, 95), 2),
+        "p99_ms": round(percentile(samples, 99), 2),
+    }
+
+
+def print_report(report: dict):
+    print(f"concurrency={report['concurrency']} elapsed={report['elapsed_s']}s")
+    print(f"{'endpoint':<10} {'reqs':>7} {'errs':>6} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    rows = list(report["endpoints"].items()) + [("overall", report["overall"])]
+    for name, row in rows:
+        print(f"{name:<10} {row['requests']:>7} {row['errors']:>6} {row['throughput_rps']:>8} "
+              f"{row['p50_ms']:>8}ms {row['p95_ms']:>8}ms {row['p99_ms']:>8}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the MailFlowAI backend")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, default=None, help="Stop after this many requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted endpoint mix, e.g. inbox=5,detail=6")
+    parser.add_argument("--account", default="loadtest@example.com", help="Fake account to log in as")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    runner = LoadRunner(args.base_url, args.concurrency, args.duration, args.requests,
+                        parse_mix(args.mix), args.account, args.seed)
+    report = asyncio.run(runner.run())
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -137,3 +137,44 @@ def test_get_user_profile_error(mock_build, client: TestClient, db_session):
     
     assert response.status_code == 401
     assert response.json()["detail"]["error"] == "AUTH_FAILED"
+
+
+@patch("app.api.routes.auth.build")
+@patch("app.api.routes.auth.Flow")
+def test_profile_and_status_served_from_login_data(mock_flow_class, mock_build, client: TestClient, db_session):
+    """
+    /me returns the profile stored at /callback and /status answers from memory;
+    only /me?refresh=true goes back to Google.
+    """
+    from datetime import datetime, timedelta
+    from app.core.cache import cache_manager
+
+    cache_manager.clear()
+    mock_creds = MagicMock(token="access", refresh_token="refresh", expiry=datetime.utcnow() + timedelta(hours=1))
+    mock_flow_class.from_client_config.return_value.credentials = mock_creds
+    userinfo = mock_build.return_value.userinfo.return_value.get.return_value
+    userinfo.execute.return_value = {"email": "profile@example.com", "name": "Profile User", "picture": "http://example.com/p.jpg"}
+
+    assert client.get("/api/auth/callback?code=fake_code", follow_redirects=False).status_code == 307
+    assert userinfo.execute.call_count == 1
+
+    with patch.object(TokenService, "get_tokens", side_effect=AssertionError("DB should not be queried")):
+        assert client.get("/api/auth/status").json() == {"authenticated": True}
+        assert client.get("/api/auth/me").json() == {
+            "email": "profile@example.com", "name": "Profile User", "picture": "http://example.com/p.jpg"
+        }
+    assert userinfo.execute.call_count == 1
+
+    # A cold cache falls back to the stored row
+    cache_manager.clear()
+    assert client.get("/api/auth/me").json()["name"] == "Profile User"
+    assert userinfo.execute.call_count == 1
+
+    userinfo.execute.return_value = {"email": "profile@example.com", "name": "Renamed", "picture": None}
+    assert client.get("/api/auth/me", params={"refresh": "true"}).json()["name"] == "Renamed"
+    assert client.get("/api/auth/me").json()["name"] == "Renamed"
+    assert userinfo.execute.call_count == 2
+
+    client.get("/api/auth/logout")
+    assert client.get("/api/auth/status").json() == {"authenticated": False}
+    cache_manager.clear()
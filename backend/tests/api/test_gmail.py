@@ -3,7 +3,9 @@ from app.api.routes.gmail import get_gmail_service
 from unittest.mock import MagicMock
 from app.services.gmail_service import GmailService
 from app.schemas.email import EmailPreview, EmailDetail, PaginatedEmails
+from app.services.outbox_service import OutboxService
 from datetime import datetime
+import json
 
 def test_get_inbox_unauthenticated(client: TestClient):
     """
@@ -58,9 +60,25 @@ def test_get_message_detail(client_with_mocked_gmail: TestClient, mock_gmail_ser
     assert response.json()["id"] == "123"
     mock_gmail_service.get_email_detail.assert_called_with("123")
 
-def test_send_email_endpoint(client_with_mocked_gmail: TestClient, mock_gmail_service):
+def test_message_detail_cache_keeps_body_on_disk(client_with_mocked_gmail: TestClient, mock_gmail_service):
+    from app.core.cache import MESSAGE_DETAIL_NAMESPACE, build_cache_key, cache_manager
+    mock_gmail_service.user_email = "user@example.com"
+    mock_gmail_service.get_email_detail.return_value = EmailDetail(
+        id="123", sender="me", subject="Hi", date=datetime.utcnow(), body="<b>Big body</b>", dataset="gmail", unread=False
+    )
+
+    for _ in range(2):
+        response = client_with_mocked_gmail.get("/api/gmail/messages/123")
+        assert response.json()["body"] == "<b>Big body</b>"
+    mock_gmail_service.get_email_detail.assert_called_once()
+
+    # The cached entry references the blob store instead of holding the body
+    packed = cache_manager.get(build_cache_key(MESSAGE_DETAIL_NAMESPACE, "user@example.com", message_id="123"))
+    assert packed.detail.body == ""
+
+def test_send_email_endpoint(client_with_mocked_gmail: TestClient, mock_gmail_service, db_session):
     """
-    Test /gmail/send.
+    Test /gmail/send queues the email in the outbox and returns 202.
     """
     payload = {
         "to": ["user@example.com"],
@@ -68,10 +86,36 @@ def test_send_email_endpoint(client_with_mocked_gmail: TestClient, mock_gmail_se
         "body": "Body"
     }
     response = client_with_mocked_gmail.post("/api/gmail/send", json=payload)
-    assert response.status_code == 200
-    assert response.json() == {"status": "sent"}
-    
-    mock_gmail_service.send_email.assert_called_with(["user@example.com"], "Test", "Body")
+    assert response.status_code == 202
+    data = response.json()
+    assert data["status"] == "queued"
+
+    # Gmail is not called on the request path
+    mock_gmail_service.send_email.assert_not_called()
+
+    entry = OutboxService.get(db_session, "user@example.com", data["outbox_id"])
+    assert entry.kind == "send"
+    assert json.loads(entry.payload) == {"to": ["user@example.com"], "subject": "Test", "body": "Body"}
+
+def test_send_email_idempotency_key(client_with_mocked_gmail: TestClient):
+    payload = {"to": ["user@example.com"], "subject": "Test", "body": "Body"}
+    headers = {"Idempotency-Key": "compose-42"}
+    first = client_with_mocked_gmail.post("/api/gmail/send", json=payload, headers=headers).json()
+    second = client_with_mocked_gmail.post("/api/gmail/send", json=payload, headers=headers).json()
+    assert first["outbox_id"] == second["outbox_id"]
+
+def test_reply_and_forward_are_queued(client_with_mocked_gmail: TestClient):
+    reply = client_with_mocked_gmail.post("/api/gmail/messages/abc/reply", json={"body": "Thanks"})
+    forward = client_with_mocked_gmail.post("/api/gmail/messages/abc/forward", json={"to": ["x@example.com"], "body": "FYI"})
+    assert reply.status_code == 202
+    assert forward.status_code == 202
+
+    status = client_with_mocked_gmail.get(f"/api/gmail/outbox/{forward.json()['outbox_id']}")
+    assert status.status_code == 200
+    assert status.json()["kind"] == "forward"
+    assert status.json()["status"] == "queued"
+
+    assert client_with_mocked_gmail.get("/api/gmail/outbox/missing").status_code == 404
 
 def test_search_emails_endpoint(client_with_mocked_gmail: TestClient, mock_gmail_service):
     """
@@ -102,3 +146,87 @@ def test_service_error_handling(client_with_mocked_gmail: TestClient, mock_gmail
         assert response.status_code == 500
     except Exception:
         pass # TestClient might re-raise without specific config
+
+def test_inbox_delta(client_with_mocked_gmail: TestClient, mock_gmail_service):
+    mock_gmail_service.list_history.return_value = {
+        "history": [
+            {"id": "11", "messagesAdded": [{"message": {"id": "new", "labelIds": ["INBOX", "UNREAD"]}}]},
+            {"id": "12", "labelsRemoved": [{"message": {"id": "old", "labelIds": ["INBOX"]}, "labelIds": ["UNREAD"]}]},
+            {"id": "13", "messagesDeleted": [{"message": {"id": "gone"}}]},
+        ],
+        "historyId": "13",
+    }
+    mock_gmail_service.get_previews.return_value = [
+        EmailPreview(id="new", sender="a", subject="s", snippet="", date=datetime.utcnow(), unread=True)
+    ]
+
+    response = client_with_mocked_gmail.get("/api/gmail/inbox/delta", params={"since": "10"})
+    assert response.status_code == 200
+    data = response.json()
+    mock_gmail_service.list_history.assert_called_once_with("10")
+    mock_gmail_service.get_previews.assert_called_once_with(["new"])
+    assert data["historyId"] == "13"
+    assert [m["id"] for m in data["added"]] == ["new"]
+    assert data["deleted"] == ["gone"]
+    assert data["labelsChanged"] == [{"id": "old", "labelIds": ["INBOX"]}]
+    assert data["resync"] is False
+
+def test_inbox_delta_signals_resync_when_history_expired(client_with_mocked_gmail: TestClient, mock_gmail_service):
+    from app.services.gmail_service import HistoryExpiredError
+    mock_gmail_service.list_history.side_effect = HistoryExpiredError("10")
+    mock_gmail_service.get_profile.return_value = {"historyId": "99"}
+
+    response = client_with_mocked_gmail.get("/api/gmail/inbox/delta", params={"since": "10"})
+    assert response.json() == {"historyId": "99", "added": [], "deleted": [], "labelsChanged": [], "resync": True}
+    assert client_with_mocked_gmail.get("/api/gmail/inbox/delta", params={"since": "abc"}).status_code == 400
+
+def test_attachment_is_served_from_blob_store(client_with_mocked_gmail: TestClient, mock_gmail_service):
+    mock_gmail_service.user_email = "user@example.com"
+    mock_gmail_service.get_attachment.return_value = b"%PDF-1.4 attachment bytes"
+
+    for _ in range(2):
+        response = client_with_mocked_gmail.get("/api/gmail/messages/m1/attachments/a1")
+        assert response.status_code == 200
+        assert response.content == b"%PDF-1.4 attachment bytes"
+    mock_gmail_service.get_attachment.assert_called_once_with("m1", "a1")
+
+def test_attachment_is_found_by_part_id(client_with_mocked_gmail: TestClient, mock_gmail_service, mocker):
+    mock_gmail_service.user_email = "user@example.com"
+    mock_gmail_service.get_attachment.return_value = b"report bytes"
+
+    # Every messages.get hands out a new attachment id for the same part
+    for attachment_id in ("a1", "a2"):
+        response = client_with_mocked_gmail.get(f"/api/gmail/messages/m2/attachments/{attachment_id}",
+                                                params={"part_id": "1"})
+        assert response.content == b"report bytes"
+    mock_gmail_service.get_attachment.assert_called_once_with("m2", "a1")
+
+    # Evicted by a concurrent put before it could be opened: the fetched bytes are served
+    mocker.patch("app.api.routes.gmail.blob_store.iter_chunks", return_value=None)
+    response = client_with_mocked_gmail.get("/api/gmail/messages/m2/attachments/a3", params={"part_id": "2"})
+    assert (response.status_code, response.content) == (200, b"report bytes")
+
+def test_thread_context_is_streamed_then_cached(client_with_mocked_gmail: TestClient, mock_gmail_service):
+    mock_gmail_service.user_email = "user@example.com"
+    mock_gmail_service.get_cached_detail.return_value = None
+    mock_gmail_service.get_thread.return_value = {"historyId": "5", "messages": [{
+        "id": "m1", "internalDate": "1700000000000", "labelIds": ["INBOX"],
+        "payload": {"headers": [{"name": "From", "value": "bob@example.com"}, {"name": "Subject", "value": "Lunch"}]},
+    }]}
+    mock_gmail_service.get_email_detail.return_value = EmailDetail(
+        id="m1", sender="bob@example.com", subject="Lunch", date=datetime(2024, 1, 1),
+        body="<p>Noon works.</p>", dataset="gmail", unread=False,
+    )
+
+    first = client_with_mocked_gmail.get("/api/gmail/threads/t1/context", params={"budget": 500})
+    assert first.status_code == 200
+    assert first.headers["x-context-cache"] == "miss"
+    assert "From: bob@example.com | Subject: Lunch" in first.text and "Noon works." in first.text
+
+    second = client_with_mocked_gmail.get("/api/gmail/threads/t1/context", params={"budget": 500})
+    assert (second.headers["x-context-cache"], second.text) == ("hit", first.text)
+    mock_gmail_service.get_email_detail.assert_called_once_with("m1")
+
+    # A new historyId means the thread changed
+    mock_gmail_service.get_thread.return_value["historyId"] = "6"
+    assert client_with_mocked_gmail.get("/api/gmail/threads/t1/context").headers["x-context-cache"] == "miss"
@@ -1,5 +1,6 @@
 import pytest
 import os
+import tempfile
 
 # Set dummy env vars for testing before importing app modules
 os.environ["GOOGLE_CLIENT_ID"] = "test_client_id"
@@ -7,6 +8,14 @@ os.environ["GOOGLE_CLIENT_SECRET"] = "test_client_secret"
 os.environ["GOOGLE_REDIRECT_URI"] = "http://localhost:8000/callback"
 os.environ["FRONTEND_URL"] = "http://localhost:3000"
 os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+os.environ.setdefault("SECRET_KEY", "test_secret_key")
+# Tests drive the outbox worker explicitly instead of via background threads
+os.environ["OUTBOX_WORKERS"] = "0"
+os.environ["FULL_SYNC_RUNNERS"] = "0"
+# ...and never warm caches against the real Gmail API
+os.environ["CACHE_WARMUP_ON_LOGIN"] = "false"
+os.environ["BLOB_STORE_DIR"] = tempfile.mkdtemp(prefix="mailflow-blobs-")
+os.environ["MAIL_INDEX_DIR"] = tempfile.mkdtemp(prefix="mailflow-index-")
 
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
@@ -15,10 +24,11 @@ from sqlalchemy.pool import StaticPool
 from typing import Generator
 
 from app.main import app
+from app.core.cache import cache_manager
 from app.db.session import get_db
 from app.db.base import Base
 from app.services.gmail_service import GmailService
-from app.api.routes.gmail import get_gmail_service
+from app.api.routes.gmail import get_gmail_service, get_current_user
 
 # Setup in-memory SQLite database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -30,6 +40,13 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Cached responses are global; don't let them leak between tests."""
+    cache_manager.clear()
+    yield
+    cache_manager.clear()
+
 @pytest.fixture(scope="function")
 def db_session() -> Generator:
     """
@@ -73,5 +90,7 @@ def client_with_mocked_gmail(client, mock_gmail_service):
     Fixture that overrides the get_gmail_service dependency with a mock.
     """
     app.dependency_overrides[get_gmail_service] = lambda: mock_gmail_service
+    app.dependency_overrides[get_current_user] = lambda: "user@example.com"
     yield client
     app.dependency_overrides.pop(get_gmail_service, None)
+    app.dependency_overrides.pop(get_current_user, None)
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+from app.core.cache import INBOX_NAMESPACE, SENT_NAMESPACE, build_cache_key, cache_manager
+from app.core.deadline import deadline_scope, remaining
+from app.schemas.email import PaginatedEmails
+from app.services.cache_warmer import CacheWarmer
+from app.services.gmail_scheduler import GmailScheduler
+from app.services.token_service import TokenService
+
+
+class FakeService:
+    user_email = "user@example.com"
+
+    def __init__(self):
+        self.scheduler = GmailScheduler(self.user_email)
+        self.calls = []
+
+    def _spend(self, name, units):
+        self.calls.append(name)
+        self.scheduler.units_used += units
+        return PaginatedEmails(messages=[], nextPageToken=None)
+
+    def list_inbox_emails(self, max_results=20, page_token=""):
+        return self._spend("inbox", 105)
+
+    def list_sent_emails(self, max_results=10, page_token=""):
+        return self._spend("sent", 55)
+
+    def get_label_counts(self, label_ids=()):
+        self.calls.append("labels")
+        self.scheduler.units_used += 3
+        return {label: 0 for label in label_ids}
+
+
+def _save_user(db_session, expiry):
+    TokenService.save_tokens(db_session, email="user@example.com", access_token="a",
+                             refresh_token="r", expiry=expiry)
+
+
+def test_warm_user_fills_route_cache_keys(db_session, client_with_mocked_gmail, mock_gmail_service):
+    mock_gmail_service.user_email = "user@example.com"
+    _save_user(db_session, datetime.utcnow() + timedelta(minutes=30))
+    fake = FakeService()
+    warmer = CacheWarmer(session_factory=lambda: db_session, service_factory=lambda tokens: fake)
+
+    assert warmer.warm_user("user@example.com") == ["profile", "inbox", "labels", "sent"]
+    assert cache_manager.get(build_cache_key(INBOX_NAMESPACE, "user@example.com", page_token=None)) is not None
+
+    # The first inbox load after login is served from the warmed entry
+    response = client_with_mocked_gmail.get("/api/gmail/inbox")
+    assert response.status_code == 200
+    mock_gmail_service.list_inbox_emails.assert_not_called()
+
+
+def test_warm_user_respects_quota_budget(db_session):
+    _save_user(db_session, datetime.utcnow() + timedelta(minutes=30))
+    fake = FakeService()
+    warmer = CacheWarmer(session_factory=lambda: db_session, service_factory=lambda tokens: fake, quota_budget=150)
+
+    assert warmer.warm_user("user@example.com") == ["profile", "inbox", "labels"]
+    assert fake.calls == ["inbox", "labels"]
+    assert cache_manager.get(build_cache_key(SENT_NAMESPACE, "user@example.com", page_token=None)) is None
+
+
+def test_warm_up_runs_outside_the_login_deadline(db_session):
+    class PartialSent(FakeService):
+        def list_inbox_emails(self, max_results=20, page_token=""):
+            self.deadline_left = remaining()
+            return super().list_inbox_emails(max_results, page_token)
+
+        def list_sent_emails(self, max_results=10, page_token=""):
+            page = super().list_sent_emails(max_results, page_token)
+            page.partial = True
+            return page
+
+    _save_user(db_session, datetime.utcnow() + timedelta(minutes=30))
+    fake = PartialSent()
+    warmer = CacheWarmer(session_factory=lambda: db_session, service_factory=lambda tokens: fake)
+    # A BackgroundTask inherits the callback's deadline, here already spent
+    with deadline_scope(0):
+        assert warmer.warm_user("user@example.com") == ["profile", "inbox", "labels", "sent"]
+
+    assert fake.deadline_left is None
+    assert cache_manager.get(build_cache_key(INBOX_NAMESPACE, "user@example.com", page_token=None)) is not None
+    assert cache_manager.get(build_cache_key(SENT_NAMESPACE, "user@example.com", page_token=None)) is None
+
+
+def test_recently_active_uses_last_request(db_session, mocker):
+    _save_user(db_session, datetime.utcnow() - timedelta(days=3))
+    token = TokenService.get_tokens(db_session, email="user@example.com")
+    token.last_seen_at = datetime.utcnow() - timedelta(days=3)
+    db_session.commit()
+    warmer = CacheWarmer(session_factory=lambda: db_session)
+    assert warmer.recently_active(timedelta(hours=24)) == []
+    assert warmer.recently_active(timedelta(days=7)) == ["user@example.com"]
+
+    # A request refreshes it, although the stored access token is never rewritten
+    mocker.patch("app.services.token_service._last_seen", {})
+    TokenService.touch(db_session, "user@example.com")
+    assert warmer.recently_active(timedelta(hours=24)) == ["user@example.com"]
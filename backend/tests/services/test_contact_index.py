@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+from app.models.mirrored_message import MirroredMessage
+from app.services.contact_index import ContactIndex, UserContacts
+from app.services.outbox_service import OutboxService
+from app.services.outbox_worker import OutboxWorker
+from app.services.token_service import TokenService
+
+USER = "me@example.com"
+DAY = 86400
+NOW = 1_700_000_000
+
+
+def _contacts():
+    contacts = UserContacts(USER, half_life=30 * DAY)
+    contacts.add_message("Alice Smith <alice@example.com>", USER, NOW - DAY, sent=False)
+    contacts.add_message("Alan Turing <alan@example.org>", f"{USER}, Albert <albert@example.net>", NOW - 300 * DAY, sent=False)
+    contacts.add_message(USER, "alan@example.org", NOW - 299 * DAY, sent=True)
+    contacts.add_message(USER, '"Bob Jones" <bob@example.com>, alice@example.com', NOW - 2 * DAY, sent=True)
+    return contacts
+
+
+def test_prefix_matches_addresses_and_name_words():
+    contacts = _contacts()
+    assert [c.address for c in contacts.suggest("al", 10, now=NOW)] == \
+        ["alice@example.com", "alan@example.org", "albert@example.net"]
+    assert [c.address for c in contacts.suggest("SMI", 10, now=NOW)] == ["alice@example.com"]
+    assert [c.address for c in contacts.suggest("jones", 10, now=NOW)] == ["bob@example.com"]
+    assert contacts.suggest("zz", 10, now=NOW) == []
+    # The user's own address is never suggested
+    assert contacts.suggest("me", 10, now=NOW) == []
+
+
+def test_rank_prefers_frequent_and_recent_contacts():
+    contacts = _contacts()
+    alice = contacts.contacts["alice@example.com"]
+    assert (alice.name, alice.messages) == ("Alice Smith", 2)
+    # Bob got one recent mail; Alan two, but almost a year ago
+    assert [c.address for c in contacts.suggest("", 2, now=NOW)] == ["alice@example.com", "bob@example.com"]
+    contacts.add_message("alan@example.org", USER, NOW, sent=False)
+    contacts.add_message(USER, "alan@example.org", NOW, sent=True)
+    assert contacts.suggest("", 1, now=NOW)[0].address == "alan@example.org"
+
+
+def test_index_loads_from_mirror_and_updates_incrementally(db_session):
+    when = datetime.utcnow() - timedelta(days=1)
+    db_session.add_all([
+        MirroredMessage(user_email=USER, id="m1", sender="Carol <carol@example.com>", recipients=USER,
+                        internal_date=when, label_ids="INBOX"),
+        MirroredMessage(user_email=USER, id="m2", sender=USER, recipients="dave@example.com",
+                        internal_date=when, label_ids="SENT"),
+    ])
+    db_session.commit()
+    index = ContactIndex()
+
+    # Rows synced before the first query are read from the table then
+    index.add_messages(USER, [MirroredMessage(sender="x@example.com", recipients=USER, label_ids="INBOX")])
+    assert [c.address for c in index.suggest(db_session, USER, "")] == ["dave@example.com", "carol@example.com"]
+
+    index.add_messages(USER, [MirroredMessage(sender="Cathy <cathy@example.com>", recipients=USER,
+                                              internal_date=datetime.now(), label_ids="INBOX")])
+    index.add_sent(USER, ["carla@example.com"])
+    assert [c.address for c in index.suggest(db_session, USER, "ca")] == \
+        ["carla@example.com", "cathy@example.com", "carol@example.com"]
+
+
+def test_sent_outbox_mail_updates_contacts(db_session, mocker):
+    TokenService.save_tokens(db_session, USER, "access", "refresh", datetime.utcnow())
+    index = ContactIndex()
+    index.load(db_session, USER)
+    mocker.patch("app.services.outbox_worker.contact_index", index)
+    service = mocker.Mock()
+    service.send_email.return_value = {"id": "sent1"}
+    OutboxService.enqueue(db_session, USER, "send", {"to": ["erin@example.com"], "subject": "Hi", "body": "Hello"})
+
+    OutboxWorker(service_factory=lambda tokens: service, workers=0).process_one(db_session)
+    assert [c.address for c in index.suggest(db_session, USER, "erin")] == ["erin@example.com"]
+
+
+def test_sent_mail_is_counted_once_and_replies_count(db_session, mocker):
+    TokenService.save_tokens(db_session, USER, "access", "refresh", datetime.utcnow())
+    index = ContactIndex()
+    index.load(db_session, USER)
+    mocker.patch("app.services.outbox_worker.contact_index", index)
+    service = mocker.Mock()
+    service.send_email.return_value = {"id": "sent1"}
+    service.reply_email.return_value = {"id": "sent2", "to": "Gina <gina@example.com>"}
+    OutboxService.enqueue(db_session, USER, "send", {"to": ["erin@example.com"], "subject": "Hi", "body": "Hello"})
+    OutboxService.enqueue(db_session, USER, "reply", {"message_id": "m9", "body": "Thanks"})
+    worker = OutboxWorker(service_factory=lambda tokens: service, workers=0)
+    worker.process_one(db_session)
+    worker.process_one(db_session)
+
+    # Incremental sync later mirrors the same message with the SENT label
+    index.add_messages(USER, [MirroredMessage(user_email=USER, id="sent1", sender=USER, recipients="erin@example.com",
+                                              internal_date=datetime.now(), label_ids="SENT")])
+    assert [(c.address, c.messages) for c in index.suggest(db_session, USER, "erin")] == [("erin@example.com", 1)]
+    assert [(c.address, c.name) for c in index.suggest(db_session, USER, "gina")] == [("gina@example.com", "Gina")]
+
+
+def test_suggest_endpoint(client_with_mocked_gmail, db_session):
+    db_session.add(MirroredMessage(user_email="user@example.com", id="m1", sender="Frank <frank@example.com>",
+                                   recipients="user@example.com", internal_date=datetime.utcnow(), label_ids="INBOX"))
+    db_session.commit()
+    response = client_with_mocked_gmail.get("/api/gmail/contacts/suggest", params={"prefix": "fr"})
+    assert response.status_code == 200
+    assert response.json() == [{"address": "frank@example.com", "name": "Frank", "messages": 1}]
@@ -0,0 +1,130 @@
+import httplib2
+import pytest
+from datetime import datetime
+from googleapiclient.errors import HttpError
+from app.core.deadline import DeadlineExceeded
+from app.schemas.email import EmailDetail
+from app.services.context_builder import ContextBuilder, clean_body, estimate_tokens, truncate_to_tokens
+from app.services.gmail_service import GmailService
+
+
+def _message(message_id, minutes, unread=False, subject="Plans"):
+    return {
+        "id": message_id, "internalDate": str(1700000000000 + minutes * 60000),
+        "labelIds": ["INBOX", "UNREAD"] if unread else ["INBOX"],
+        "payload": {"headers": [{"name": "From", "value": f"{message_id}@example.com"},
+                                {"name": "Subject", "value": subject}]},
+    }
+
+
+def _detail(message_id, body):
+    return EmailDetail(id=message_id, sender="", subject="", date=datetime(2024, 1, 1), body=body,
+                       dataset="gmail", unread=False)
+
+
+@pytest.fixture
+def service(mocker):
+    service = mocker.Mock(spec=GmailService)
+    service.user_email = "user@example.com"
+    service.get_cached_detail.return_value = None
+    service.bodies = {}
+    service.get_email_detail.side_effect = lambda message_id: _detail(message_id, service.bodies[message_id])
+    return service
+
+
+def test_clean_body_strips_quotes_signatures_and_html():
+    body = (
+        "Sounds good, see you Friday.\n\n"
+        "-- \nJane Doe\nACME Corp\n"
+    )
+    assert clean_body(body) == "Sounds good, see you Friday."
+    assert clean_body("Yes.\n\nOn Mon, Jan 1, 2024 at 9:00 AM Bob <bob@example.com> wrote:\n> Lunch?") == "Yes."
+    assert clean_body("Agreed\n> quoted\nmore") == "Agreed\nmore"
+    assert clean_body("Fine\nFrom: Bob\nSent: Monday\nOld text") == "Fine"
+    assert clean_body("<html><body><p>Hi <b>there</b></p><style>p{}</style></body></html>") == "Hi there"
+    assert clean_body("Thanks\n\nSent from my iPhone") == "Thanks"
+
+
+def test_truncate_to_tokens_cuts_at_word_boundary():
+    text = "word " * 100
+    cut = truncate_to_tokens(text, 10)
+    assert cut.endswith(" …") and estimate_tokens(cut) <= 10
+    assert truncate_to_tokens("short", 10) == "short"
+
+
+def test_thread_context_ranks_dedupes_and_fits_budget(service):
+    quoted = "The venue is booked for Friday evening and the caterer confirmed the menu."
+    service.get_thread.return_value = {"historyId": "42", "messages": [
+        _message("m1", 0), _message("m2", 10), _message("m3", 20),
+    ]}
+    service.bodies = {
+        "m1": quoted,
+        "m2": "Great news.\n\n" + quoted,
+        "m3": "Can we move it to Saturday? " * 200,
+    }
+    builder = ContextBuilder()
+    history_id, items = builder.thread_candidates(service, "t1")
+    assert history_id == "42"
+    assert [item.message_id for item in items] == ["m3", "m2", "m1"]
+
+    sections = list(builder.build(service, items, budget=300))
+    text = "".join(sections)
+    assert sections[0].startswith("[1]") and "m3@example.com" in sections[0]
+    # The long newest message only takes its share, and the repeated paragraph appears once
+    assert text.count(quoted) == 1
+    assert "Great news." in text
+    assert estimate_tokens(text) <= 300 + 10
+
+
+def test_context_stops_fetching_when_budget_is_spent(service):
+    service.bodies = {f"m{i}": "Status update number %d with a few details. " % i * 10 for i in range(10)}
+    service.get_thread.return_value = {"historyId": "1", "messages": [_message(f"m{i}", i) for i in range(10)]}
+    builder = ContextBuilder()
+    _, items = builder.thread_candidates(service, "t1")
+
+    sections = list(builder.build(service, items, budget=150))
+    assert sections[-1].startswith("[") and "omitted to fit the token budget" in sections[-1]
+    assert service.get_email_detail.call_count < 10
+
+
+def test_context_skips_deleted_messages_and_uses_cached_details(service):
+    service.get_thread.return_value = {"historyId": "1", "messages": [_message("m1", 0), _message("m2", 1)]}
+    service.get_cached_detail.side_effect = lambda message_id: _detail(message_id, "From cache") if message_id == "m1" else None
+    service.get_email_detail.side_effect = HttpError(httplib2.Response({"status": 404}), b"{}")
+    builder = ContextBuilder()
+    _, items = builder.thread_candidates(service, "t1")
+
+    text = "".join(builder.build(service, items, budget=1000))
+    assert "From cache" in text and "m2@example.com" not in text
+
+
+def _raise(error):
+    raise error
+
+
+def test_context_marks_the_rest_omitted_when_the_deadline_passes(service, mocker):
+    service.bodies = {"m0": "First body."}
+    service.get_thread.return_value = {"historyId": "1", "messages": [_message(f"m{i}", -i) for i in range(3)]}
+    service.get_email_detail.side_effect = lambda message_id: (
+        _detail(message_id, service.bodies[message_id]) if message_id == "m0" else _raise(DeadlineExceeded()))
+    cache_set = mocker.patch("app.services.context_builder.cache_manager.set")
+    builder = ContextBuilder()
+    _, items = builder.thread_candidates(service, "t1")
+
+    sections = list(builder.stream(service, "key", items, budget=1000))
+    assert "First body." in sections[0]
+    assert sections[-1] == "[2 more messages omitted because Gmail did not answer in time]\n"
+    cache_set.assert_not_called()
+
+
+def test_day_candidates_put_unread_first(service):
+    service.get_profile.return_value = {"historyId": "77"}
+    service.list_message_ids.return_value = (["a", "b", "c"], None)
+    service.get_messages_batch.return_value = (
+        {"a": _message("a", 0, unread=True), "b": _message("b", 5), "c": _message("c", 3, unread=True)}, {}
+    )
+    history_id, items = ContextBuilder().day_candidates(service, datetime(2024, 1, 2).date(), tz_offset_minutes=60)
+    assert history_id == "77"
+    assert [item.message_id for item in items] == ["c", "a", "b"]
+    query = service.list_message_ids.call_args.kwargs["query"]
+    assert query == "after:1704150000 before:1704236400"
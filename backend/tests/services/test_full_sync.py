@@ -0,0 +1,266 @@
+import base64
+import httplib2
+import json
+import pytest
+from datetime import datetime
+from googleapiclient.errors import HttpError
+from app.models.mailbox_sync_state import MailboxSyncState
+from app.models.mirrored_message import MirroredMessage
+from app.services.full_sync_worker import FullSyncWorker
+from app.services.gmail_scheduler import GmailScheduler
+from app.services.mailbox_sync import MailboxChanges, MailboxSyncService
+from app.services.mime_parser import MimeParser
+from app.services.sync_job_service import SyncJobService
+from app.services.token_service import TokenService
+
+
+def _http_error(status):
+    return HttpError(httplib2.Response({"status": status}), b"{}")
+
+
+class FakeMailbox:
+    """Pages over message ids m0..m{n-1} like messages.list and serves metadata batches."""
+
+    def __init__(self, size, page_size):
+        self.ids = [f"m{i}" for i in range(size)]
+        self.page_size = page_size
+        self.scheduler = GmailScheduler("user@example.com", sleep=lambda seconds: None)
+        self.list_calls = []
+        self.gone = set()
+        self.throttle_once = set()
+        self.fail_on_page = None
+        self.history = []
+        self.malformed = set()
+
+    def get_profile(self):
+        return {"historyId": "900", "messagesTotal": len(self.ids)}
+
+    def list_message_ids(self, page_token=None, max_results=500):
+        self.list_calls.append(page_token)
+        if self.fail_on_page is not None and len(self.list_calls) == self.fail_on_page:
+            raise RuntimeError("worker crashed")
+        start = int(page_token or 0)
+        end = start + self.page_size
+        return self.ids[start:end], (str(end) if end < len(self.ids) else None)
+
+    def list_history(self, start_history_id, history_types=None):
+        records = [r for r in self.history if int(r["id"]) > int(start_history_id)]
+        return {"history": records, "historyId": self.history[-1]["id"] if self.history else start_history_id}
+
+    def get_messages_batch(self, message_ids, format="metadata", metadata_headers=None):
+        messages, errors = {}, {}
+        for mid in message_ids:
+            if mid in self.gone:
+                errors[mid] = _http_error(404)
+            elif mid in self.throttle_once:
+                self.throttle_once.discard(mid)
+                errors[mid] = _http_error(429)
+            elif format == "raw":
+                charset = "ut\x00f-8" if mid in self.malformed else "utf-8"
+                raw = (f"From: a@example.com\r\nTo: user@example.com\r\nSubject: Subject {mid}\r\n"
+                       f'Content-Type: text/html; charset="{charset}"\r\n\r\n<p>Body of <b>' + mid + "</b></p>\r\n").encode()
+                messages[mid] = {"id": mid, "threadId": f"t{mid}", "snippet": "hi", "internalDate": "1700000000000",
+                                 "labelIds": ["INBOX"], "raw": base64.urlsafe_b64encode(raw).decode()}
+            else:
+                messages[mid] = {
+                    "id": mid, "threadId": f"t{mid}", "snippet": "hi", "internalDate": "1700000000000",
+                    "labelIds": ["INBOX", "UNREAD"],
+                    "payload": {"headers": [{"name": "From", "value": "a@example.com"},
+                                            {"name": "To", "value": "user@example.com"},
+                                            {"name": "Subject", "value": f"Subject {mid}"}]},
+                }
+        return messages, errors
+
+
+@pytest.fixture
+def user(db_session):
+    TokenService.save_tokens(db_session, "user@example.com", "access", "refresh", datetime.utcnow())
+    return "user@example.com"
+
+
+def _worker(mailbox, **kwargs):
+    return FullSyncWorker(service_factory=lambda tokens: mailbox, runners=0, fetch_workers=3,
+                          page_size=10, batch_size=4, units_per_second=10000, **kwargs)
+
+
+def test_full_sync_mirrors_every_message(db_session, user):
+    mailbox = FakeMailbox(size=25, page_size=10)
+    mailbox.gone = {"m3"}
+    mailbox.throttle_once = {"m7", "m21"}
+    SyncJobService.start(db_session, user)
+
+    assert _worker(mailbox).process_one(db_session) is True
+
+    job = SyncJobService.get(db_session, user)
+    assert job.status == "completed"
+    assert (job.history_id, job.messages_total, job.pages_done) == ("900", 25, 3)
+    assert (job.messages_synced, job.messages_failed) == (24, 0)
+    rows = db_session.query(MirroredMessage).filter(MirroredMessage.user_email == user).all()
+    assert {r.id for r in rows} == set(mailbox.ids) - {"m3"}
+    row = next(r for r in rows if r.id == "m7")
+    assert (row.sender, row.recipients, row.subject, row.label_ids) == \
+        ("a@example.com", "user@example.com", "Subject m7", "INBOX UNREAD")
+
+
+def test_full_sync_resumes_from_checkpoint(db_session, user):
+    mailbox = FakeMailbox(size=25, page_size=10)
+    mailbox.fail_on_page = 2
+    SyncJobService.start(db_session, user)
+    worker = _worker(mailbox)
+
+    worker.process_one(db_session)
+    job = SyncJobService.get(db_session, user)
+    assert job.status == "failed"
+    assert (job.page_token, job.messages_synced) == ("10", 10)
+
+    # Starting again continues from the saved page token instead of the beginning
+    mailbox.fail_on_page = None
+    SyncJobService.start(db_session, user)
+    worker.process_one(db_session)
+    db_session.refresh(job)
+    assert job.status == "completed"
+    assert mailbox.list_calls == [None, "10", "10", "20"]
+    assert job.messages_synced == 25
+    assert db_session.query(MirroredMessage).count() == 25
+
+
+# Changes made after the job's snapshot (historyId 900)
+BACKFILL_HISTORY = [
+    {"id": "901", "messagesAdded": [{"message": {"id": "new", "labelIds": ["INBOX", "UNREAD"]}}]},
+    {"id": "902", "messagesDeleted": [{"message": {"id": "m1"}}]},
+    {"id": "903", "labelsRemoved": [{"message": {"id": "m2", "labelIds": ["INBOX"]}, "labelIds": ["UNREAD"]}]},
+]
+
+
+def _mirrored(db_session, user):
+    return {r.id: r.label_ids for r in db_session.query(MirroredMessage).filter(MirroredMessage.user_email == user)}
+
+
+def test_job_that_fails_while_finishing_resumes_the_catch_up(db_session, user):
+    mailbox = FakeMailbox(size=5, page_size=10)
+    mailbox.history = list(BACKFILL_HISTORY)
+    list_history = mailbox.list_history
+
+    def broken_history(*args, **kwargs):
+        raise RuntimeError("network")
+    mailbox.list_history = broken_history
+    SyncJobService.start(db_session, user)
+    worker = _worker(mailbox)
+
+    worker.process_one(db_session)
+    job = SyncJobService.get(db_session, user)
+    assert (job.status, job.page_token, job.pages_done) == ("failed", None, 1)
+
+    # Resuming skips the pages and only runs the catch-up
+    mailbox.list_history = list_history
+    SyncJobService.start(db_session, user)
+    worker.process_one(db_session)
+    db_session.refresh(job)
+    assert job.status == "completed"
+    assert mailbox.list_calls == [None]
+    assert "new" in _mirrored(db_session, user) and "m1" not in _mirrored(db_session, user)
+
+
+def test_changes_during_the_backfill_reach_the_mirror(db_session, user):
+    mailbox = FakeMailbox(size=5, page_size=10)
+    mailbox.history = BACKFILL_HISTORY
+    SyncJobService.start(db_session, user)
+    _worker(mailbox).process_one(db_session)
+
+    mirrored = _mirrored(db_session, user)
+    assert "new" in mirrored and "m1" not in mirrored
+    assert mirrored["m2"] == "INBOX"
+    # Incremental sync continues where the catch-up ended
+    assert MailboxSyncService.get_state(db_session, user).history_id == "903"
+
+
+def test_catch_up_stops_where_incremental_sync_took_over(db_session, user):
+    mailbox = FakeMailbox(size=5, page_size=10)
+    mailbox.history = BACKFILL_HISTORY
+    db_session.add(MailboxSyncState(email=user, history_id="902"))
+    db_session.commit()
+    SyncJobService.start(db_session, user)
+    _worker(mailbox).process_one(db_session)
+
+    mirrored = _mirrored(db_session, user)
+    assert "new" in mirrored and "m1" not in mirrored
+    # Left to the incremental sync, which reports it after 902
+    assert mirrored["m2"] == "INBOX UNREAD"
+    assert MailboxSyncService.get_state(db_session, user).history_id == "902"
+
+
+def test_lost_history_restarts_a_completed_sync(db_session, user):
+    mailbox = FakeMailbox(size=5, page_size=10)
+    worker = _worker(mailbox)
+    SyncJobService.start(db_session, user)
+    worker.process_one(db_session)
+
+    mailbox.ids.remove("m1")
+    worker.on_changes(db_session, user, MailboxChanges(history_id="950", resync=True))
+    job = SyncJobService.get(db_session, user)
+    assert (job.status, job.page_token) == ("queued", None)
+
+    worker.process_one(db_session)
+    db_session.refresh(job)
+    assert job.status == "completed"
+    # The row of the message deleted while history was lost is gone
+    assert set(_mirrored(db_session, user)) == {"m0", "m2", "m3", "m4"}
+
+
+def test_mirror_updates_use_the_current_credentials(db_session, user):
+    mailbox = FakeMailbox(size=5, page_size=10)
+    used_tokens = []
+
+    def service_factory(tokens):
+        used_tokens.append(tokens.access_token)
+        return mailbox
+    worker = FullSyncWorker(service_factory=service_factory, runners=0, page_size=10, batch_size=4,
+                            units_per_second=10000)
+    SyncJobService.start(db_session, user)
+    worker.process_one(db_session)
+
+    mailbox.ids.extend(["m5", "m6"])
+    worker.on_changes(db_session, user, MailboxChanges(history_id="901", added={"m5"}))
+    TokenService.save_tokens(db_session, user, "relogged", "refresh", datetime.utcnow())
+    used_tokens.clear()
+    worker.on_changes(db_session, user, MailboxChanges(history_id="902", added={"m6"}))
+    assert used_tokens == ["relogged"]
+    assert {"m5", "m6"} <= set(_mirrored(db_session, user))
+
+
+def test_full_sync_indexes_bodies(db_session, user):
+    mailbox = FakeMailbox(size=5, page_size=10)
+    SyncJobService.start(db_session, user)
+
+    _worker(mailbox, fetch_bodies=True, parser=MimeParser(workers=0)).process_one(db_session)
+
+    row = db_session.query(MirroredMessage).filter(MirroredMessage.id == "m2").one()
+    assert (row.sender, row.subject) == ("a@example.com", "Subject m2")
+    assert row.body_text == "Body of m2"
+    assert json.loads(row.attachments) == []
+
+
+def test_malformed_message_does_not_fail_the_sync(db_session, user):
+    mailbox = FakeMailbox(size=5, page_size=10)
+    mailbox.malformed = {"m3"}
+    SyncJobService.start(db_session, user)
+
+    _worker(mailbox, fetch_bodies=True, parser=MimeParser(workers=0)).process_one(db_session)
+
+    job = SyncJobService.get(db_session, user)
+    assert (job.status, job.messages_synced, job.messages_failed) == ("completed", 5, 1)
+    row = db_session.query(MirroredMessage).filter(MirroredMessage.id == "m3").one()
+    assert (row.subject, row.body_text) == ("Subject m3", None)
+
+
+def test_full_sync_api(client_with_mocked_gmail, db_session):
+    client = client_with_mocked_gmail
+    assert client.get("/api/gmail/sync/full").status_code == 404
+
+    response = client.post("/api/gmail/sync/full")
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+
+    response = client.delete("/api/gmail/sync/full")
+    assert response.json()["status"] == "cancelled"
+    assert client.get("/api/gmail/sync/full").json()["status"] == "cancelled"
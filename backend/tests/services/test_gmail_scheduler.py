@@ -0,0 +1,198 @@
+import json
+from collections import OrderedDict
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+from app.core.config import settings
+from app.core.deadline import CircuitOpenError, DeadlineExceeded, deadline_scope
+from app.services import gmail_scheduler
+from app.services.gmail_scheduler import (
+    AdaptiveConcurrencyLimiter, CircuitBreaker, GmailScheduler, TokenBucket, classify_error, get_scheduler, quota_cost
+)
+
+
+def http_error(status, reason=None, retry_after=None):
+    headers = {'status': status}
+    if retry_after is not None:
+        headers['retry-after'] = str(retry_after)
+    content = json.dumps({'error': {'code': status, 'message': 'err', 'errors': [{'reason': reason}] if reason else []}})
+    return HttpError(httplib2.Response(headers), content.encode('utf-8'))
+
+
+def failing(error):
+    def call():
+        raise error
+    return call
+
+
+@pytest.fixture
+def scheduler():
+    sleeps = []
+    s = GmailScheduler('user@example.com', units_per_second=1000, max_concurrency=8,
+                       max_retries=3, backoff_base=0.5, backoff_max=4, sleep=sleeps.append)
+    s.sleeps = sleeps
+    return s
+
+
+def test_classify_error():
+    assert classify_error(http_error(429)) == 'throttled'
+    assert classify_error(http_error(403, 'userRateLimitExceeded')) == 'throttled'
+    assert classify_error(http_error(403, 'insufficientPermissions')) is None
+    assert classify_error(http_error(503)) == 'transient'
+    assert classify_error(http_error(404)) is None
+    assert classify_error(ValueError('boom')) is None
+
+
+def test_quota_costs():
+    assert quota_cost('messages.send') == 100
+    assert quota_cost('messages.get') == 5
+    assert quota_cost('unknown.method') == 5
+
+
+def test_retries_throttled_calls_and_halves_concurrency(scheduler):
+    outcomes = [http_error(429, 'rateLimitExceeded'), http_error(429, 'rateLimitExceeded'), 'ok']
+
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert scheduler.execute(call, 'messages.get') == 'ok'
+    assert len(scheduler.sleeps) == 2
+    assert all(0 <= delay <= 4 for delay in scheduler.sleeps)
+    # Two multiplicative decreases from 8, then one additive increase
+    assert scheduler.limiter.limit == pytest.approx(2 + 1 / 2)
+    assert scheduler.units_used == 15
+
+
+def test_honours_retry_after(scheduler):
+    outcomes = [http_error(503, retry_after=3), 'ok']
+
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    scheduler.execute(call, 'messages.list')
+    assert scheduler.sleeps == [3.0]
+
+
+def test_gives_up_after_max_retries(scheduler):
+    def call():
+        raise http_error(429)
+
+    with pytest.raises(HttpError):
+        scheduler.execute(call, 'messages.get')
+    assert len(scheduler.sleeps) == 3
+
+
+def test_non_retryable_errors_raise_immediately(scheduler):
+    def call():
+        raise http_error(404)
+
+    with pytest.raises(HttpError):
+        scheduler.execute(call, 'messages.get')
+    assert scheduler.sleeps == []
+
+
+def test_token_bucket_waits_for_refill(monkeypatch):
+    clock = {'now': 0.0}
+    waits = []
+    monkeypatch.setattr('app.services.gmail_scheduler.time.monotonic', lambda: clock['now'])
+
+    def fake_sleep(seconds):
+        waits.append(seconds)
+        clock['now'] += seconds
+
+    monkeypatch.setattr('app.services.gmail_scheduler.time.sleep', fake_sleep)
+    bucket = TokenBucket(rate=100, capacity=100)
+    bucket.acquire(100)
+    bucket.acquire(50)
+    assert waits == [pytest.approx(0.5)]
+
+    # Batches costing more than the bucket holds are charged in full
+    waits.clear()
+    bucket.acquire(250)
+    assert sum(waits) == pytest.approx(2.5)
+
+
+def test_token_bucket_waits_no_longer_than_the_deadline(monkeypatch):
+    clock = {'now': 0.0}
+    waits = []
+    monkeypatch.setattr('app.services.gmail_scheduler.time.monotonic', lambda: clock['now'])
+
+    def fake_sleep(seconds):
+        waits.append(seconds)
+        clock['now'] += seconds
+
+    monkeypatch.setattr('app.services.gmail_scheduler.time.sleep', fake_sleep)
+    bucket = TokenBucket(rate=10, capacity=100)
+    bucket.acquire(100)
+    with deadline_scope(2):
+        with pytest.raises(DeadlineExceeded):
+            bucket.acquire(50)
+    assert waits == [pytest.approx(2)]
+
+
+def test_schedulers_are_kept_for_recent_users_only(monkeypatch):
+    monkeypatch.setattr(settings, 'GMAIL_SCHEDULER_CACHED_USERS', 2)
+    monkeypatch.setattr('app.services.gmail_scheduler._schedulers', OrderedDict())
+    first = get_scheduler('a@example.com')
+    get_scheduler('b@example.com')
+    assert get_scheduler('a@example.com') is first
+    get_scheduler('c@example.com')
+    assert get_scheduler('a@example.com') is first
+    assert list(gmail_scheduler._schedulers) == ['c@example.com', 'a@example.com']
+
+
+def test_limiter_bounds():
+    limiter = AdaptiveConcurrencyLimiter(initial=2, minimum=1, maximum=3)
+    for _ in range(10):
+        limiter.on_throttle()
+    assert limiter.limit == 1
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.limit == 3
+
+
+def test_circuit_breaker_fails_fast_then_lets_one_trial_through():
+    now = [0.0]
+    breaker = CircuitBreaker(threshold=2, reset_seconds=30, clock=lambda: now[0])
+    assert not breaker.on_failure()
+    assert breaker.on_failure()
+    assert breaker.state == "open" and breaker.retry_in() == 30
+
+    now[0] = 31
+    assert breaker.retry_in() is None
+    # Only one caller gets the trial
+    assert breaker.retry_in() == 0
+    breaker.on_success()
+    assert breaker.state == "closed" and breaker.retry_in() is None
+
+
+def test_scheduler_opens_circuit_on_outages_only(scheduler, monkeypatch):
+    monkeypatch.setattr(settings, "GMAIL_BREAKER_FAILURES", 2)
+
+    for _ in range(2):
+        with pytest.raises(HttpError):
+            scheduler.execute(failing(http_error(503)), 'messages.list')
+    with pytest.raises(CircuitOpenError):
+        scheduler.execute(lambda: 'ok', 'messages.list')
+    # Other methods have their own breaker, and a 404 is not an outage
+    with pytest.raises(HttpError):
+        scheduler.execute(failing(http_error(404)), 'messages.get')
+    assert scheduler.breaker('messages.get').state == "closed"
+
+
+def test_scheduler_respects_request_deadline(scheduler):
+    with deadline_scope(0):
+        with pytest.raises(DeadlineExceeded):
+            scheduler.execute(lambda: 'ok', 'messages.get')
+
+    # A retry that would outlast the deadline is not attempted
+    with deadline_scope(1):
+        with pytest.raises(HttpError):
+            scheduler.execute(failing(http_error(503, retry_after=3)), 'messages.get')
+    assert scheduler.sleeps == []
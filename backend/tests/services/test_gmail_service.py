@@ -267,3 +267,78 @@ class TestGmailService:
         
         results = gmail_service.search_emails("empty")
         assert results == []
+
+    def test_get_email_detail_nested_multipart(self, gmail_service, mock_service_resource):
+        # HTML nested inside multipart/mixed > multipart/alternative is preferred over plain text
+        html = base64.urlsafe_b64encode(b"<p>Nested</p>").decode('utf-8')
+        plain = base64.urlsafe_b64encode(b"Nested").decode('utf-8')
+        mock_service_resource.users().messages().get().execute.return_value = {
+            'id': 'nested',
+            'internalDate': '1609459200000',
+            'labelIds': [],
+            'payload': {
+                'mimeType': 'multipart/mixed',
+                'headers': [
+                    {'name': 'from', 'value': 'first@example.com'},
+                    {'name': 'From', 'value': 'second@example.com'}
+                ],
+                'parts': [
+                    {'mimeType': 'multipart/alternative', 'body': {}, 'parts': [
+                        {'mimeType': 'text/plain', 'body': {'data': plain}},
+                        {'mimeType': 'text/html', 'body': {'data': html}}
+                    ]},
+                    {'mimeType': 'application/pdf', 'filename': 'a.pdf', 'body': {'attachmentId': 'x'}}
+                ]
+            }
+        }
+
+        detail = gmail_service.get_email_detail('nested')
+        assert detail.body == "<p>Nested</p>"
+        # Header lookups are case-insensitive and keep the first occurrence
+        assert detail.sender == 'first@example.com'
+
+    def test_get_email_detail_from_raw(self, gmail_service, mock_service_resource, monkeypatch):
+        from email.message import EmailMessage
+        from app.core.config import settings
+        monkeypatch.setattr(settings, 'MESSAGE_DETAIL_FROM_RAW', True)
+
+        message = EmailMessage()
+        message['From'] = 'alice@example.com'
+        message['Subject'] = 'Invoice'
+        message.set_content("See attached")
+        message.add_alternative("<p>See attached</p>", subtype='html')
+        message.add_attachment(b"%PDF", maintype='application', subtype='pdf', filename='invoice.pdf')
+        mock_service_resource.users().messages().get().execute.return_value = {
+            'id': 'raw1', 'threadId': 't1', 'internalDate': '1609459200000', 'labelIds': ['UNREAD'],
+            'raw': base64.urlsafe_b64encode(message.as_bytes()).decode('ascii'),
+        }
+
+        detail = gmail_service.get_email_detail('raw1')
+        assert (detail.sender, detail.subject, detail.unread) == ('alice@example.com', 'Invoice', True)
+        assert detail.body.strip() == "<p>See attached</p>"
+        assert [(a.filename, a.size) for a in detail.attachments] == [('invoice.pdf', 4)]
+
+    def test_get_email_detail_reuses_stored_body(self, gmail_service, mock_service_resource):
+        from app.services.gmail_service import pack_detail, unpack_detail
+        gmail_service.user_email = 'body-store@example.com'
+        html = base64.urlsafe_b64encode(b"<p>Stored</p>").decode('utf-8')
+        mock_service_resource.users().messages().get().execute.return_value = {
+            'id': 'stored1', 'internalDate': '1609459200000', 'labelIds': [],
+            'payload': {'headers': [{'name': 'Subject', 'value': 'Hi'}], 'body': {'data': html}},
+        }
+        first = gmail_service.get_email_detail('stored1')
+
+        packed = pack_detail(first)
+        assert packed.detail.body == "" and packed.body_digest == first._body_digest
+        assert unpack_detail(packed).body == "<p>Stored</p>"
+
+        # A later process finds the body on disk and only asks Gmail for headers and labels
+        mock_service_resource.reset_mock()
+        mock_service_resource.users().messages().get().execute.return_value = {
+            'id': 'stored1', 'internalDate': '1609459200000', 'labelIds': ['UNREAD'],
+            'payload': {'headers': [{'name': 'Subject', 'value': 'Hi'}]},
+        }
+        second = gmail_service.get_email_detail('stored1')
+        assert second.body == "<p>Stored</p>"
+        assert second.unread is True
+        assert mock_service_resource.users().messages().get.call_args[1]['format'] == 'metadata'
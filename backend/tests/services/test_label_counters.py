@@ -0,0 +1,163 @@
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from app.core.cache import MESSAGE_DETAIL_NAMESPACE, build_cache_key, cache_manager
+from app.schemas.email import EmailDetail
+from app.services.gmail_service import pack_detail
+from app.services.label_counters import LabelCounters, sync_history
+from app.services.mailbox_sync import MailboxChanges, MailboxSyncService, _background_listeners, collect_changes
+from app.services.token_service import TokenService
+
+USER = "user@example.com"
+
+
+def _service():
+    service = MagicMock()
+    service.user_email = USER
+    service.get_labels.return_value = [
+        {"id": "INBOX", "name": "INBOX", "type": "system", "messagesTotal": 10, "messagesUnread": 3},
+        {"id": "UNREAD", "name": "UNREAD", "type": "system", "messagesTotal": 3, "messagesUnread": 3},
+        {"id": "TRASH", "name": "TRASH", "type": "system", "messagesTotal": 0, "messagesUnread": 0},
+        {"id": "Label_1", "name": "Work", "type": "user", "messagesTotal": 4, "messagesUnread": 1},
+    ]
+    return service
+
+
+def _counts(counters, service):
+    return {label.id: (label.messagesTotal, label.messagesUnread) for label in counters.get(service)}
+
+
+def _cache_detail(message_id, labels):
+    detail = EmailDetail(id=message_id, sender="a@example.com", subject="Hi", date=datetime(2024, 1, 1), body="",
+                         dataset="gmail", unread="UNREAD" in labels, labelIds=labels)
+    cache_manager.set(build_cache_key(MESSAGE_DETAIL_NAMESPACE, USER, message_id=message_id), pack_detail(detail))
+
+
+def test_collect_changes_records_labels_before_the_window():
+    changes = collect_changes([
+        {"id": "1", "messagesAdded": [{"message": {"id": "new", "labelIds": ["INBOX", "UNREAD"]}}]},
+        {"id": "2", "labelsRemoved": [{"message": {"id": "m1", "labelIds": ["INBOX"]}, "labelIds": ["UNREAD"]}]},
+        {"id": "3", "labelsAdded": [{"message": {"id": "m1", "labelIds": ["INBOX", "STARRED"]}, "labelIds": ["STARRED"]}]},
+        {"id": "4", "messagesDeleted": [{"message": {"id": "m2", "labelIds": ["TRASH"]}}]},
+    ], "4")
+    assert changes.before == {"new": [], "m1": ["INBOX", "UNREAD"], "m2": ["TRASH"]}
+    assert changes.labels["m1"] == ["INBOX", "STARRED"]
+
+
+def test_counters_follow_history_without_refetching():
+    counters, service = LabelCounters(), _service()
+    assert _counts(counters, service)["INBOX"] == (10, 3)
+
+    counters.on_changes(None, USER, collect_changes([
+        {"id": "1", "messagesAdded": [{"message": {"id": "new", "labelIds": ["INBOX", "UNREAD", "Label_1"]}}]},
+        {"id": "2", "labelsRemoved": [{"message": {"id": "m1", "labelIds": ["INBOX"]}, "labelIds": ["UNREAD"]}]},
+    ], "2"))
+    assert _counts(counters, service) == {
+        "INBOX": (11, 3), "UNREAD": (3, 3), "TRASH": (0, 0), "Label_1": (5, 2),
+    }
+    assert service.get_labels.call_count == 1
+
+    counters.on_changes(None, USER, MailboxChanges(history_id="3", resync=True))
+    _counts(counters, service)
+    assert service.get_labels.call_count == 2
+
+
+def test_local_actions_are_not_counted_twice():
+    counters, service = LabelCounters(), _service()
+    counters.get(service)
+    _cache_detail("m1", ["INBOX", "UNREAD"])
+
+    counters.apply_local(USER, ["m1"], remove=["UNREAD"])
+    assert _counts(counters, service)["INBOX"] == (10, 2)
+    # Gmail reports the same change once the write lands
+    counters.on_changes(None, USER, collect_changes([
+        {"id": "5", "labelsRemoved": [{"message": {"id": "m1", "labelIds": ["INBOX"]}, "labelIds": ["UNREAD"]}]},
+    ], "5"))
+    assert _counts(counters, service)["INBOX"] == (10, 2)
+
+    # A wrong guess (trash assumed to keep UNREAD) is corrected by history
+    _cache_detail("m2", ["INBOX", "UNREAD"])
+    counters.apply_local(USER, ["m2"], add=["TRASH"], remove=["INBOX"])
+    assert _counts(counters, service)["TRASH"] == (1, 1)
+    counters.on_changes(None, USER, collect_changes([
+        {"id": "6", "labelsAdded": [{"message": {"id": "m2", "labelIds": ["TRASH"]}, "labelIds": ["TRASH"]}]},
+    ], "6"))
+    assert _counts(counters, service)["TRASH"] == (1, 0)
+    assert service.get_labels.call_count == 1
+
+    # Without the message's labels the counters are fetched again
+    counters.apply_local(USER, ["unknown"], remove=["UNREAD"])
+    counters.get(service)
+    assert service.get_labels.call_count == 2
+
+
+def test_lagging_counters_catch_up_or_are_refetched(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.label_counters.time", SimpleNamespace(monotonic=lambda: now[0]))
+    counters, service = LabelCounters(max_lag_seconds=60), _service()
+    counters.get(service)
+
+    def catch_up():
+        # A history sync reports a message read in another client
+        counters.on_changes(None, USER, collect_changes([
+            {"id": "7", "labelsRemoved": [{"message": {"id": "m1", "labelIds": ["INBOX"]}, "labelIds": ["UNREAD"]}]},
+        ], "7"))
+        return True
+
+    now[0] += 61
+    counts = {label.id: label.messagesUnread for label in counters.get(service, catch_up=catch_up)}
+    assert counts["INBOX"] == 2
+    assert service.get_labels.call_count == 1
+
+    # Without a way to catch up, old counters are fetched again
+    now[0] += 61
+    counters.get(service)
+    assert service.get_labels.call_count == 2
+
+
+def test_catch_up_does_not_wait_for_other_listeners(db_session, monkeypatch):
+    counters, service = LabelCounters(), _service()
+    counters.get(service)
+    TokenService.save_tokens(db_session, USER, "access", "refresh", datetime.utcnow())
+    MailboxSyncService._save_state(db_session, USER, history_id="6")
+    service.list_history.return_value = {"history": [
+        {"id": "7", "labelsRemoved": [{"message": {"id": "m1", "labelIds": ["INBOX"]}, "labelIds": ["UNREAD"]}]},
+    ], "historyId": "7"}
+
+    # Stands in for the full-sync mirror fetching and parsing the changed messages
+    release, ran = threading.Event(), threading.Event()
+
+    def slow_listener(db, email, changes):
+        release.wait(5)
+        ran.set()
+
+    monkeypatch.setattr("app.services.label_counters.label_counters", counters)
+    monkeypatch.setattr("app.services.mailbox_sync._change_listeners", [counters.on_changes, slow_listener])
+    assert sync_history(db_session, service)
+    assert _counts(counters, service)["INBOX"] == (10, 2)
+    assert not ran.is_set()
+
+    release.set()
+    _background_listeners.submit(lambda: None).result(timeout=5)
+    assert ran.is_set()
+
+
+def test_counters_are_kept_for_recent_users_only():
+    counters, first, second = LabelCounters(max_users=1), _service(), _service()
+    second.user_email = "other@example.com"
+    counters.get(first)
+    counters.get(second)
+    counters.get(first)
+    assert first.get_labels.call_count == 2
+
+
+def test_labels_endpoint(client_with_mocked_gmail, mock_gmail_service, mocker):
+    mocker.patch("app.api.routes.gmail.label_counters", LabelCounters())
+    mock_gmail_service.user_email = USER
+    mock_gmail_service.get_labels.return_value = _service().get_labels.return_value
+    for _ in range(2):
+        response = client_with_mocked_gmail.get("/api/gmail/labels")
+        assert response.status_code == 200
+    assert response.json()[3] == {"id": "Label_1", "name": "Work", "type": "user", "messagesTotal": 4, "messagesUnread": 1}
+    mock_gmail_service.get_labels.assert_called_once()
@@ -0,0 +1,102 @@
+from datetime import datetime
+import httplib2
+from googleapiclient.errors import HttpError
+from app.core.cache import INBOX_NAMESPACE, MESSAGE_DETAIL_NAMESPACE, build_cache_key, cache_manager
+from app.schemas.email import EmailDetail, EmailPreview, PaginatedEmails
+from app.services.gmail_service import pack_detail
+from app.services.label_writer import LabelWriter
+from app.services.mailbox_sync import MailboxChanges
+from app.services.token_service import TokenService
+
+USER = "user@example.com"
+
+
+def _writer(db_session, service, **kwargs):
+    TokenService.save_tokens(db_session, USER, "access", "refresh", datetime.utcnow())
+    return LabelWriter(session_factory=lambda: db_session, service_factory=lambda tokens: service, **kwargs)
+
+
+def _preview(message_id, unread=True):
+    return EmailPreview(id=message_id, sender="a@example.com", subject="Hi", snippet="", date=datetime(2024, 1, 1),
+                        unread=unread)
+
+
+def test_changes_are_coalesced_into_batch_modify_calls(db_session, mocker):
+    service = mocker.Mock()
+    writer = _writer(db_session, service)
+
+    for message_id in ("m1", "m2", "m3"):
+        writer.modify(USER, [message_id], remove=["UNREAD"])
+    writer.modify(USER, ["m3"], add=["UNREAD"])
+    assert writer.modify(USER, ["m4"], add=["STARRED"], remove=["INBOX"]) == 4
+    assert writer.flush(USER)
+
+    calls = sorted((c.args for c in service.batch_modify.call_args_list), key=str)
+    assert calls == [
+        (["m1", "m2"], [], ["UNREAD"]),
+        (["m3"], ["UNREAD"], []),
+        (["m4"], ["STARRED"], ["INBOX"]),
+    ]
+    assert writer.pending(USER) == {}
+
+
+def test_cached_views_show_changes_before_they_are_written(db_session, mocker):
+    writer = _writer(db_session, mocker.Mock())
+    inbox_key = build_cache_key(INBOX_NAMESPACE, USER, page_token=None)
+    cache_manager.set(inbox_key, PaginatedEmails(messages=[_preview("m1"), _preview("m2"), _preview("m3")]))
+    detail = EmailDetail(id="m1", sender="a@example.com", subject="Hi", date=datetime(2024, 1, 1), body="Hello",
+                         dataset="gmail", unread=True)
+    detail_key = build_cache_key(MESSAGE_DETAIL_NAMESPACE, USER, message_id="m1")
+    cache_manager.set(detail_key, pack_detail(detail))
+
+    writer.modify(USER, ["m1"], remove=["UNREAD"])
+    writer.modify(USER, ["m3"], remove=["INBOX"])
+    page = cache_manager.get(inbox_key)
+    assert [(p.id, p.unread) for p in page.messages] == [("m1", False), ("m2", True)]
+    assert cache_manager.get(detail_key).detail.unread is False
+
+    # A page fetched from Gmail before the write still shows the change
+    fresh = writer.overlay(USER, [_preview("m1"), _preview("m2"), _preview("m3")], view_label="INBOX")
+    assert [(p.id, p.unread) for p in fresh] == [("m1", False), ("m2", True)]
+
+
+def test_failed_writes_are_retried_or_dropped(db_session, mocker):
+    service = mocker.Mock()
+    service.batch_modify.side_effect = HttpError(httplib2.Response({"status": 503}), b"{}")
+    writer = _writer(db_session, service)
+    writer.modify(USER, ["m1"], remove=["UNREAD"])
+    assert not writer.flush(USER)
+    assert writer.pending(USER) == {"m1": {"UNREAD": False}}
+
+    # Changes deleted in Gmail meanwhile are forgotten
+    writer.modify(USER, ["m2"], add=["STARRED"])
+    writer.on_changes(db_session, USER, MailboxChanges(history_id="9", deleted={"m2"}))
+    assert set(writer.pending(USER)) == {"m1"}
+
+    invalidate = mocker.patch("app.services.label_writer.invalidate_user_cache")
+    service.batch_modify.side_effect = HttpError(httplib2.Response({"status": 400}), b"{}")
+    assert writer.flush(USER)
+    assert writer.pending(USER) == {}
+    invalidate.assert_called_once_with(USER, {"m1"})
+
+
+def test_stop_writes_pending_changes(db_session, mocker):
+    service = mocker.Mock()
+    writer = _writer(db_session, service, delay_seconds=3600)
+    writer.start()
+    writer.modify(USER, ["m1"], remove=["UNREAD"])
+    assert not service.batch_modify.called
+    writer.stop()
+    service.batch_modify.assert_called_once_with(["m1"], [], ["UNREAD"])
+
+
+def test_modify_endpoints(client_with_mocked_gmail, db_session, mocker):
+    writer = mocker.patch("app.api.routes.gmail.label_writer")
+    writer.modify.return_value = 1
+    response = client_with_mocked_gmail.post("/api/gmail/messages/m1/read")
+    assert response.status_code == 202 and response.json() == {"pending": 1}
+    writer.modify.assert_called_with(USER, ["m1"], remove=["UNREAD"])
+
+    response = client_with_mocked_gmail.post("/api/gmail/messages/modify",
+                                             json={"ids": ["m1"], "addLabelIds": ["X"], "removeLabelIds": ["X"]})
+    assert response.status_code == 400
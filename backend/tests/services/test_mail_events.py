@@ -0,0 +1,75 @@
+import asyncio
+from unittest.mock import MagicMock
+from app.services.mail_events import MailEventBroker, UserEventHub
+from app.services.mailbox_sync import MailboxChanges
+
+
+def test_hub_fans_out_and_replays_after_last_event_id():
+    async def scenario():
+        hub = UserEventHub("user@example.com", epoch="e", buffer_size=10)
+        first, _ = hub.subscribe()
+        second, _ = hub.subscribe()
+        hub.publish("delta", {"n": 1})
+        hub.publish("delta", {"n": 2})
+        await asyncio.sleep(0)
+        assert first.qsize() == second.qsize() == 2
+
+        _, backlog = hub.subscribe("e-1")
+        assert [e.data["n"] for e in backlog] == [2]
+        _, backlog = hub.subscribe("e-2")
+        assert backlog == []
+
+    asyncio.run(scenario())
+
+
+def test_hub_asks_for_resync_when_events_were_dropped():
+    async def scenario():
+        hub = UserEventHub("user@example.com", epoch="e", buffer_size=2)
+        for n in range(5):
+            hub.publish("delta", {"n": n})
+        _, backlog = hub.subscribe("e-1")
+        assert [e.event for e in backlog] == ["resync"]
+        # Ids from before a restart carry another epoch
+        _, backlog = hub.subscribe("old-5")
+        assert [e.event for e in backlog] == ["resync"]
+
+    asyncio.run(scenario())
+
+
+def test_changes_are_only_expanded_for_connected_users(db_session):
+    gmail = MagicMock()
+    broker = MailEventBroker(service_factory=lambda tokens: gmail, poll_seconds=60, heartbeat_seconds=60, buffer_size=10)
+    broker.on_changes(db_session, "user@example.com", MailboxChanges(history_id="5", added={"m1"}))
+    gmail.get_previews.assert_not_called()
+
+    async def scenario():
+        hub = broker.hub("user@example.com")
+        queue, _ = hub.subscribe()
+        broker.on_changes(db_session, "user@example.com", MailboxChanges(history_id="6", resync=True))
+        await asyncio.sleep(0)
+        event = queue.get_nowait()
+        assert event.event == "resync"
+        assert event.data["historyId"] == "6"
+
+    asyncio.run(scenario())
+
+
+def test_changes_between_reconnects_are_not_lost(db_session):
+    gmail = MagicMock()
+    broker = MailEventBroker(service_factory=lambda tokens: gmail, poll_seconds=60, heartbeat_seconds=60, buffer_size=10)
+
+    async def scenario():
+        hub = broker.hub("user@example.com")
+        queue, _ = hub.subscribe()
+        hub.publish("delta", {"n": 1})
+        hub.unsubscribe(queue)
+
+        broker.on_changes(db_session, "user@example.com", MailboxChanges(history_id="6", added={"m1"}))
+        broker.on_changes(db_session, "user@example.com", MailboxChanges(history_id="7", deleted={"m2"}))
+        gmail.get_previews.assert_not_called()
+
+        _, backlog = hub.subscribe("e-1")
+        assert [(e.event, e.data["historyId"]) for e in backlog] == [("resync", "6"), ("resync", "7")]
+
+    broker.epoch = "e"
+    asyncio.run(scenario())
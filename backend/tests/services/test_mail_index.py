@@ -0,0 +1,169 @@
+import numpy as np
+import pytest
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+from app.models.mirrored_message import MirroredMessage
+from app.services.contact_index import ContactIndex
+from app.services.full_sync_worker import FullSyncWorker
+from app.services import mail_index as mail_index_module
+from app.services.mail_index import HashingVectorizer, MailIndex, find_similar
+from app.services.mailbox_sync import MailboxChanges
+from app.services.sync_job_service import SyncJobService
+from app.services.token_service import TokenService
+from tests.services.test_full_sync import BACKFILL_HISTORY, FakeMailbox
+
+USER = "user@example.com"
+
+MESSAGES = [
+    ("a1", "Quarterly invoice", "Please find the invoice for Q3 attached, payment due in 30 days"),
+    ("a2", "Invoice reminder", "Your invoice payment is overdue"),
+    ("b1", "Team offsite", "The offsite agenda: hiking, dinner and a planning session"),
+    ("b2", "Offsite dinner", "Dinner reservation for the team offsite is confirmed"),
+    ("c1", "Build failed", "The nightly build failed on the integration tests"),
+]
+
+
+def _row(message_id, subject, body, labels="INBOX"):
+    return MirroredMessage(user_email=USER, id=message_id, sender="a@example.com", subject=subject,
+                           snippet=body[:20], body_text=body, label_ids=labels,
+                           internal_date=datetime(2024, 1, 1))
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = MailIndex(root=str(tmp_path), dim=256)
+    index.add(USER, [_row(*m) for m in MESSAGES])
+    return index
+
+
+def test_vectorizer_is_deterministic_and_normalised():
+    vectorizer = HashingVectorizer(64)
+    first = vectorizer.embed("Invoice", "payment due")
+    assert first.dtype == np.float32
+    assert np.isclose(np.linalg.norm(first), 1.0)
+    assert np.array_equal(first, HashingVectorizer(64).embed("Invoice", "payment due"))
+    assert not vectorizer.embed("", "").any()
+
+
+def test_search_ranks_related_messages_first(index):
+    hits = index.search(USER, "invoice payment", k=2)
+    assert {message_id for message_id, _ in hits} == {"a1", "a2"}
+    assert hits[0][1] >= hits[1][1] > 0
+
+    similar = index.similar_to(USER, "b1", k=1)
+    assert [message_id for message_id, _ in similar] == ["b2"]
+    assert index.similar_to(USER, "missing") is None
+    assert index.search("other@example.com", "invoice") == []
+
+
+def test_index_persists_updates_and_removals(index, tmp_path):
+    index.add(USER, [_row("a2", "Build fixed", "The nightly build is green again")])
+    index.remove(USER, ["a1"])
+
+    reopened = MailIndex(root=str(tmp_path), dim=256)
+    assert len(reopened.for_user(USER)) == len(MESSAGES)
+    hits = [message_id for message_id, _ in reopened.search(USER, "nightly build", k=3)]
+    assert hits[:2] == ["a2", "c1"] or hits[:2] == ["c1", "a2"]
+    assert "a1" not in [message_id for message_id, _ in reopened.search(USER, "quarterly invoice", k=5)]
+
+
+def test_index_grows_past_initial_capacity(tmp_path):
+    index = MailIndex(root=str(tmp_path), dim=32)
+    rows = [SimpleNamespace(id=f"m{i}", subject=f"topic{i}", snippet="", body_text=None) for i in range(2500)]
+    index.add(USER, rows)
+    reopened = MailIndex(root=str(tmp_path), dim=32).for_user(USER)
+    assert len(reopened) == 2500
+    assert np.array_equal(reopened.vector("m1234"), index.vectorizer.embed("topic1234", ""))
+
+
+def test_query_during_growth_sees_the_indexed_rows(tmp_path, mocker):
+    index = MailIndex(root=str(tmp_path), dim=32)
+    rows = [SimpleNamespace(id=f"m{i}", subject="", snippet="", body_text=None) for i in range(1025)]
+    rows[7].subject = "invoice"
+    index.add(USER, rows[:1024])
+    vectors, readers, hits = index.for_user(USER), [], []
+    makedirs = mail_index_module.os.makedirs
+
+    def grow(*args, **kwargs):
+        # A /similar request arriving while upsert remaps the file
+        reader = threading.Thread(target=lambda: hits.extend(vectors.query(index.vectorizer.embed("invoice", ""), 1)))
+        reader.start()
+        reader.join(0.2)
+        readers.append(reader)
+        return makedirs(*args, **kwargs)
+    mocker.patch.object(mail_index_module.os, "makedirs", grow)
+
+    index.add(USER, rows[1024:])
+    for reader in readers:
+        reader.join()
+    assert len(readers) == 1
+    assert [message_id for message_id, _ in hits] == ["m7"]
+
+
+def test_find_similar_returns_mirrored_previews(db_session, index):
+    db_session.add_all([_row(*m) for m in MESSAGES[:3]] + [_row("c1", "Build failed", "failed", "INBOX UNREAD")])
+    db_session.commit()
+
+    results = find_similar(db_session, USER, text="invoice", k=3, index=index)
+    assert [r.id for r in results[:2]] in (["a1", "a2"], ["a2", "a1"])
+    assert all(r.score > 0 for r in results)
+    # Indexed but not mirrored (b2) drops out
+    assert "b2" not in [r.id for r in find_similar(db_session, USER, message_id="b1", index=index)]
+    assert find_similar(db_session, USER, message_id="nope", index=index) is None
+
+
+def test_full_sync_keeps_index_current(db_session, tmp_path):
+    TokenService.save_tokens(db_session, USER, "access", "refresh", datetime.utcnow())
+    mailbox = FakeMailbox(size=12, page_size=10)
+    index = MailIndex(root=str(tmp_path), dim=256)
+    worker = FullSyncWorker(service_factory=lambda tokens: mailbox, runners=0, fetch_workers=2,
+                            page_size=10, batch_size=4, units_per_second=10000, index=index)
+    SyncJobService.start(db_session, USER)
+    worker.process_one(db_session)
+    assert len(index.for_user(USER)) == 12
+
+    mailbox.ids.append("m12")
+    worker.on_changes(db_session, USER, MailboxChanges(
+        history_id="901", added={"m12"}, deleted={"m0"}, labels_changed={"m1"}, labels={"m1": ["INBOX"]},
+    ))
+    assert index.search(USER, "m12", k=1)[0][0] == "m12"
+    assert db_session.query(MirroredMessage).filter(MirroredMessage.id == "m0").count() == 0
+    assert db_session.get(MirroredMessage, (USER, "m1")).label_ids == "INBOX"
+    assert db_session.get(MirroredMessage, (USER, "m12")) is not None
+    assert "m0" not in [message_id for message_id, _ in index.search(USER, "m0", k=12)]
+
+
+def test_indexes_catch_up_after_backfill_and_rebuild_on_lost_history(db_session, tmp_path):
+    TokenService.save_tokens(db_session, USER, "access", "refresh", datetime.utcnow())
+    mailbox = FakeMailbox(size=5, page_size=10)
+    mailbox.history = BACKFILL_HISTORY
+    index, contacts = MailIndex(root=str(tmp_path), dim=256), ContactIndex()
+    contacts.load(db_session, USER)
+    worker = FullSyncWorker(service_factory=lambda tokens: mailbox, runners=0, fetch_workers=2,
+                            page_size=10, batch_size=4, units_per_second=10000, index=index, contacts=contacts)
+    SyncJobService.start(db_session, USER)
+    worker.process_one(db_session)
+    # Mail that arrived during the backfill is indexed; contacts reload from the finished mirror
+    assert index.search(USER, "new", k=1)[0][0] == "new"
+    assert "m1" not in [message_id for message_id, _ in index.search(USER, "m1", k=5)]
+    assert contacts._loaded(USER) is None
+
+    mailbox.ids.remove("m3")
+    worker.on_changes(db_session, USER, MailboxChanges(history_id="950", resync=True))
+    worker.process_one(db_session)
+    assert "m3" not in [message_id for message_id, _ in index.search(USER, "m3", k=5)]
+    assert [c.address for c in contacts.suggest(db_session, USER, "a")] == ["a@example.com"]
+
+
+def test_similar_endpoint(client_with_mocked_gmail, db_session, mocker):
+    find = mocker.patch("app.api.routes.gmail.find_similar", return_value=[])
+    assert client_with_mocked_gmail.get("/api/gmail/similar").status_code == 400
+
+    response = client_with_mocked_gmail.get("/api/gmail/similar", params={"q": "invoice", "k": 5})
+    assert response.status_code == 200
+    assert response.json() == []
+    assert find.call_args.kwargs == {"text": "invoice", "message_id": None, "k": 5}
+
+    find.return_value = None
+    assert client_with_mocked_gmail.get("/api/gmail/similar", params={"message_id": "x"}).status_code == 404
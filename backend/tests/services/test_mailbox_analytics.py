@@ -0,0 +1,152 @@
+from datetime import date, datetime, timedelta, timezone
+from app.models.mailbox_sync_state import MailboxSyncState
+from app.models.mirrored_message import MirroredMessage
+from app.services.full_sync_worker import FullSyncWorker
+from app.services.mail_index import MailIndex
+from app.services.mailbox_analytics import MailboxAnalyticsService, MailboxColumns, summarize
+from app.services.mailbox_sync import MailboxChanges
+from app.services.sync_job_service import SyncJobService
+from app.services.token_service import TokenService
+from tests.services.test_full_sync import FakeMailbox
+
+USER = "user@example.com"
+TODAY = date(2024, 3, 10)
+
+
+def _at(days_ago, hour):
+    # Naive local time, as mirror_row stores it, for the given UTC day and hour
+    utc = datetime.combine(TODAY - timedelta(days=days_ago), datetime.min.time(), timezone.utc) + timedelta(hours=hour)
+    return datetime.fromtimestamp(utc.timestamp())
+
+
+ROWS = [
+    # id, thread, sender, date, labels
+    ("m0", "t1", "Alice <alice@example.com>", _at(0, 9), "INBOX UNREAD"),
+    ("m1", "t1", USER, _at(0, 11), "SENT"),
+    ("m2", "t2", "alice@EXAMPLE.com", _at(1, 9), "INBOX"),
+    ("m3", "t2", USER, _at(1, 9.5), "SENT"),
+    ("m4", "t2", "Alice Smith <alice@example.com>", _at(1, 10), "INBOX"),
+    ("m5", "t2", USER, _at(1, 10.5), "SENT"),
+    ("m6", "t2", USER, _at(1, 12), "SENT"),
+    ("m7", "t3", "Bob <bob@example.com>", _at(2, 14), "INBOX UNREAD Label_7"),
+    ("m8", "t4", "Bob <bob@example.com>", _at(40, 14), "INBOX UNREAD CATEGORY_PROMOTIONS"),
+]
+
+
+def test_columns_encode_senders_and_labels():
+    columns = MailboxColumns.from_rows(ROWS)
+    assert len(columns) == len(ROWS)
+    assert columns.sender_addresses[:2] == ["alice@example.com", USER]
+    assert columns.senders[0] == columns.senders[2] == columns.senders[4]
+    assert columns.has_label("UNREAD").tolist() == [True, False, False, False, False, False, False, True, True]
+    assert "Label_7" in columns.label_names
+    assert not columns.has_label("missing").any()
+
+
+def test_summarize_aggregates():
+    result = summarize(MailboxColumns.from_rows(ROWS), TODAY, days=7, top=5)
+
+    assert (result.messages, result.received, result.unread) == (9, 5, 3)
+    assert [(s.sender, s.name, s.messages, s.unread) for s in result.top_senders] == [
+        ("alice@example.com", "Alice", 3, 1),
+        ("bob@example.com", "Bob", 2, 2),
+    ]
+    assert [d.messages for d in result.per_day] == [0, 0, 0, 0, 1, 2, 1]
+    assert result.per_day[-1].day == TODAY
+    # The 40-day-old message falls outside the window
+    assert sum(result.per_hour) == 4 and result.per_hour[9] == 2 and result.per_hour[14] == 1
+    assert result.per_weekday[6] == 1  # 2024-03-10 is a Sunday
+    assert [(b.label, b.unread) for b in result.unread_by_label][:1] == [("INBOX", 3)]
+    assert {b.label for b in result.unread_by_label} == {"INBOX", "Label_7", "CATEGORY_PROMOTIONS"}
+    # First replies only: 2h in t1, 30m twice in t2
+    latency = result.reply_latency
+    assert latency.replies == 3
+    assert latency.median_seconds == 1800
+    assert latency.mean_seconds == (7200 + 1800 + 1800) / 3
+
+
+def test_summarize_shifts_to_the_callers_time_zone():
+    columns = MailboxColumns.from_rows([("m1", "t1", "a@example.com", _at(0, 23), "INBOX")])
+    assert [d.messages for d in summarize(columns, TODAY, days=2).per_day] == [0, 1]
+    shifted = summarize(columns, TODAY + timedelta(days=1), days=2, tz_offset_minutes=120)
+    assert [d.messages for d in shifted.per_day] == [0, 1]
+    assert shifted.per_hour[1] == 1
+
+
+def test_empty_mailbox():
+    result = summarize(MailboxColumns.from_rows([]), TODAY, days=3)
+    assert result.messages == 0 and result.top_senders == [] and result.reply_latency.replies == 0
+
+
+def test_service_caches_until_the_mirror_changes(db_session, mocker):
+    service = MailboxAnalyticsService()
+    assert service.get(db_session, USER) is None
+
+    SyncJobService.start(db_session, USER)
+    db_session.add(MailboxSyncState(email=USER, history_id="500"))
+    db_session.add_all([
+        MirroredMessage(user_email=USER, id=message_id, thread_id=thread, sender=sender, internal_date=when, label_ids=labels)
+        for message_id, thread, sender, when, labels in ROWS
+    ])
+    db_session.commit()
+
+    load = mocker.spy(MailboxColumns, "from_rows")
+    first = service.get(db_session, USER, days=7, today=TODAY)
+    assert first.history_id == "500" and first.messages == 9
+    assert service.get(db_session, USER, days=7, today=TODAY) == first
+    assert service.get(db_session, USER, days=14, today=TODAY).messages == 9
+    assert load.call_count == 1
+
+    db_session.query(MirroredMessage).filter(MirroredMessage.id == "m0").delete()
+    job = SyncJobService.get(db_session, USER)
+    job.updated_at = datetime.utcnow() + timedelta(seconds=1)
+    db_session.commit()
+    assert service.get(db_session, USER, days=7, today=TODAY).messages == 8
+    assert load.call_count == 2
+
+
+def test_patched_columns_match_a_reload():
+    added = [("m9", "t3", USER, _at(0, 15), "SENT"), ("m10", "t5", "Carol <carol@example.com>", _at(0, 8), "INBOX Label_9")]
+    columns = MailboxColumns.from_rows(ROWS)
+    patched = columns.patched(added, deleted={"m2", "m8", "missing"}, labels={"m7": ["INBOX"], "m0": ["INBOX", "STARRED"]})
+
+    relabelled = {"m7": "INBOX", "m0": "INBOX STARRED"}
+    expected = [(m, t, f, d, relabelled.get(m, labels)) for m, t, f, d, labels in ROWS if m not in ("m2", "m8")] + added
+    assert summarize(patched, TODAY, days=7) == summarize(MailboxColumns.from_rows(expected), TODAY, days=7)
+    # The version patched from is left as it was
+    assert summarize(columns, TODAY, days=7) == summarize(MailboxColumns.from_rows(ROWS), TODAY, days=7)
+    again = patched.patched(deleted={"m10"}, labels={"m9": ["SENT", "STARRED"]})
+    assert sorted(again.ids) == sorted(m for m, *_ in expected if m != "m10")
+
+
+def test_mirror_updates_patch_loaded_columns(db_session, mocker, tmp_path):
+    TokenService.save_tokens(db_session, USER, "access", "refresh", datetime.utcnow())
+    SyncJobService.start(db_session, USER)
+    db_session.add_all([
+        MirroredMessage(user_email=USER, id=message_id, thread_id=thread, sender=sender, internal_date=when, label_ids=labels)
+        for message_id, thread, sender, when, labels in ROWS
+    ])
+    db_session.commit()
+    service = MailboxAnalyticsService()
+    mailbox = FakeMailbox(size=10, page_size=10)
+    worker = FullSyncWorker(service_factory=lambda tokens: mailbox, runners=0, units_per_second=10000,
+                            index=MailIndex(root=str(tmp_path)), analytics=service)
+    before = service.get(db_session, USER, days=7, today=TODAY)
+
+    load = mocker.spy(MailboxColumns, "from_rows")
+    worker.on_changes(db_session, USER, MailboxChanges(history_id="901", added={"m9"}, deleted={"m0"},
+                                                       labels={"m7": ["INBOX"]}))
+    after = service.get(db_session, USER, days=7, today=TODAY)
+    assert load.call_count == 0
+    # m0 (unread) deleted, m7 marked read, m9 (unread) added
+    assert (after.messages, after.unread) == (before.messages, before.unread - 1)
+    assert "m9" in {row.id for row in db_session.query(MirroredMessage)}
+
+
+def test_analytics_endpoint(client_with_mocked_gmail, db_session):
+    assert client_with_mocked_gmail.get("/api/gmail/analytics").status_code == 404
+    SyncJobService.start(db_session, USER)
+    response = client_with_mocked_gmail.get("/api/gmail/analytics", params={"days": 3})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["messages"] == 0 and len(data["per_day"]) == 3 and len(data["per_hour"]) == 24
@@ -0,0 +1,104 @@
+import pytest
+from datetime import datetime
+from unittest.mock import MagicMock
+from app.core.cache import MESSAGE_DETAIL_NAMESPACE, build_cache_key, cache_manager
+from app.core.config import settings
+from app.services.gmail_service import HistoryExpiredError
+from app.services.mailbox_sync import MailboxSyncService, decode_push_envelope
+from app.services.token_service import TokenService
+from loadtest.pubsub import push_envelope
+
+USER = "user@example.com"
+
+
+@pytest.fixture
+def user(db_session):
+    TokenService.save_tokens(db_session, USER, "access", "refresh", datetime.utcnow())
+    return USER
+
+
+@pytest.fixture
+def gmail():
+    service = MagicMock()
+    service.user_email = USER
+    return service
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache_manager.clear()
+    yield
+    cache_manager.clear()
+
+
+def _detail_key(message_id, user=USER):
+    return build_cache_key(MESSAGE_DETAIL_NAMESPACE, user, message_id=message_id)
+
+
+def test_decode_push_envelope():
+    assert decode_push_envelope(push_envelope(USER, 1234, "1", "sub")) == (USER, "1234")
+    with pytest.raises(ValueError):
+        decode_push_envelope({"message": {}})
+
+
+def test_notification_invalidates_only_changed_messages(db_session, user, gmail):
+    MailboxSyncService._save_state(db_session, USER, history_id="100")
+    gmail.list_history.return_value = {
+        "history": [
+            {"id": "101", "messagesAdded": [{"message": {"id": "new"}}]},
+            {"id": "102", "labelsRemoved": [{"message": {"id": "read"}, "labelIds": ["UNREAD"]}]},
+        ],
+        "historyId": "102",
+    }
+    cache_manager.set(_detail_key("read"), "stale", 60)
+    cache_manager.set(_detail_key("untouched"), "fresh", 60)
+    cache_manager.set(build_cache_key("search_emails", USER, q="report"), ["stale"], 60)
+    cache_manager.set(_detail_key("read", user="other@example.com"), "other user", 60)
+
+    changes = MailboxSyncService.handle_notification(db_session, USER, "102", service_factory=lambda t: gmail)
+
+    gmail.list_history.assert_called_once_with("100")
+    assert changes.added == {"new"}
+    assert changes.labels_changed == {"read"}
+    assert cache_manager.get(_detail_key("read")) is None
+    assert cache_manager.get(build_cache_key("search_emails", USER, q="report")) is None
+    assert cache_manager.get(_detail_key("untouched")) == "fresh"
+    assert cache_manager.get(_detail_key("read", user="other@example.com")) == "other user"
+    assert MailboxSyncService.get_state(db_session, USER).history_id == "102"
+
+
+def test_duplicate_notification_is_ignored(db_session, user, gmail):
+    MailboxSyncService._save_state(db_session, USER, history_id="200")
+    assert MailboxSyncService.handle_notification(db_session, USER, "150", service_factory=lambda t: gmail) is None
+    gmail.list_history.assert_not_called()
+
+
+def test_expired_history_drops_user_cache(db_session, user, gmail):
+    MailboxSyncService._save_state(db_session, USER, history_id="5")
+    gmail.list_history.side_effect = HistoryExpiredError("5")
+    cache_manager.set(_detail_key("m1"), "stale", 60)
+
+    changes = MailboxSyncService.handle_notification(db_session, USER, "900", service_factory=lambda t: gmail)
+
+    assert changes.resync is True
+    assert cache_manager.get(_detail_key("m1")) is None
+    assert MailboxSyncService.get_state(db_session, USER).history_id == "900"
+
+
+def test_push_endpoint_requires_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "GMAIL_PUSH_VERIFICATION_TOKEN", "secret")
+    response = client.post("/api/gmail/push", params={"token": "wrong"}, json=push_envelope(USER, 1, "1", "sub"))
+    assert response.status_code == 403
+
+
+def test_push_endpoint_schedules_sync(client, monkeypatch):
+    from app.api.routes import gmail as gmail_routes
+    from loadtest.pubsub import LocalPublisher
+
+    received = []
+    monkeypatch.setattr(settings, "GMAIL_PUSH_VERIFICATION_TOKEN", "secret")
+    monkeypatch.setattr(gmail_routes, "apply_push_notification", lambda email, history_id: received.append((email, history_id)))
+
+    publisher = LocalPublisher("/api/gmail/push", verification_token="secret", client=client)
+    assert publisher.publish(USER, 4321) == 204
+    assert received == [(USER, "4321")]
@@ -0,0 +1,62 @@
+from email.message import EmailMessage
+from app.services.mime_parser import MimeParser, html_to_text, parse_raw
+
+
+def _raw_message() -> bytes:
+    message = EmailMessage()
+    message['From'] = 'Alice <alice@example.com>'
+    message['To'] = 'bob@example.com'
+    message['Subject'] = 'Quarterly report'
+    message['Message-ID'] = '<abc@example.com>'
+    message.set_content("Numbers attached.")
+    message.add_alternative("<html><head><style>p {}</style></head><body><p>Numbers <b>attached</b>.</p></body></html>",
+                            subtype='html')
+    message.add_attachment(b"x" * 1000, maintype='application', subtype='pdf', filename='report.pdf')
+    return message.as_bytes()
+
+
+def test_parse_raw_extracts_bodies_and_attachments():
+    parsed = parse_raw(_raw_message())
+
+    assert parsed.headers['subject'] == 'Quarterly report'
+    assert parsed.headers['message-id'] == '<abc@example.com>'
+    assert parsed.text.strip() == "Numbers attached."
+    assert "<b>attached</b>" in parsed.html
+    assert [(a.filename, a.mime_type, a.size, a.part_id) for a in parsed.attachments] == \
+        [('report.pdf', 'application/pdf', 1000, '1')]
+
+
+def test_text_only_reduces_html():
+    message = EmailMessage()
+    message['Subject'] = 'HTML only'
+    message.set_content("<div>Hello<br>there &amp; <script>x()</script>bye</div>", subtype='html')
+
+    parsed = parse_raw(message.as_bytes(), text_only=True)
+    assert parsed.html is None
+    assert parsed.text == "Hello\nthere & bye"
+    assert html_to_text("<p>a</p><p>b</p>") == "a\nb"
+
+
+def test_process_pool_parses_in_order():
+    parser = MimeParser(workers=2, max_pending=2, inline_bytes=0)
+    try:
+        raws = [_raw_message().replace(b'Quarterly report', f'Report {i}'.encode()) for i in range(6)]
+        results = parser.parse_many(raws)
+        assert [r.headers['subject'] for r in results] == [f'Report {i}' for i in range(6)]
+        assert parser.parse(raws[0]).attachments[0].filename == 'report.pdf'
+    finally:
+        parser.shutdown()
+
+
+def test_malformed_message_falls_back_to_headers():
+    raw = (b'From: a@example.com\r\nTo: Undisclosed recipients:;, "x\\" <>\r\nSubject: Broken\r\n'
+           b'Content-Type: text/plain; charset="ut\x00f-8"\r\n\r\nbody\r\n')
+    for parser in (MimeParser(workers=0), MimeParser(workers=1, inline_bytes=0)):
+        try:
+            good, broken = parser.parse_many([_raw_message(), raw])
+            assert not good.failed
+            assert broken.failed and broken.text is None
+            assert broken.headers['subject'] == 'Broken'
+            assert parser.parse(raw).failed
+        finally:
+            parser.shutdown()
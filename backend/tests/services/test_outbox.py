@@ -0,0 +1,95 @@
+import json
+import httplib2
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+from googleapiclient.errors import HttpError
+from app.models.outbox_message import OutboxMessage
+from app.services.outbox_service import OutboxService
+from app.services.outbox_worker import OutboxWorker
+from app.services.token_service import TokenService
+
+
+@pytest.fixture
+def gmail():
+    service = MagicMock()
+    service.send_email.return_value = {"id": "gmail-1"}
+    return service
+
+
+@pytest.fixture
+def worker(gmail):
+    return OutboxWorker(service_factory=lambda tokens: gmail, workers=0, max_attempts=3)
+
+
+@pytest.fixture
+def user(db_session):
+    TokenService.save_tokens(db_session, "user@example.com", "access", "refresh", datetime.utcnow())
+    return "user@example.com"
+
+
+def test_worker_sends_and_records_gmail_id(db_session, worker, gmail, user):
+    entry = OutboxService.enqueue(db_session, user, "send", {"to": ["a@example.com"], "subject": "S", "body": "B"})
+
+    assert worker.process_one(db_session) is True
+    gmail.send_email.assert_called_once_with(["a@example.com"], "S", "B")
+
+    db_session.refresh(entry)
+    assert entry.status == "sent"
+    assert entry.attempts == 1
+    assert entry.gmail_message_id == "gmail-1"
+    assert worker.process_one(db_session) is False
+
+
+def test_per_user_ordering(db_session, worker, gmail, user):
+    first = OutboxService.enqueue(db_session, user, "send", {"to": ["a@example.com"], "subject": "1", "body": ""})
+    second = OutboxService.enqueue(db_session, user, "reply", {"message_id": "m1", "body": "2"})
+
+    # While the first message waits for a retry, the second must not overtake it
+    first.next_attempt_at = datetime.utcnow() + timedelta(minutes=5)
+    db_session.commit()
+    assert worker.process_one(db_session) is False
+
+    first.next_attempt_at = datetime.utcnow()
+    db_session.commit()
+    worker.process_one(db_session)
+    worker.process_one(db_session)
+    assert gmail.method_calls[0][0] == "send_email"
+    assert gmail.method_calls[1][0] == "reply_email"
+    db_session.refresh(second)
+    assert second.status == "sent"
+
+
+def test_transient_failure_is_retried_then_fails(db_session, worker, gmail, user):
+    gmail.send_email.side_effect = HttpError(httplib2.Response({"status": 503}), b"{}")
+    entry = OutboxService.enqueue(db_session, user, "send", {"to": ["a@example.com"], "subject": "S", "body": "B"})
+
+    for attempt in range(1, 4):
+        entry.next_attempt_at = datetime.utcnow()
+        db_session.commit()
+        worker.process_one(db_session)
+        db_session.refresh(entry)
+        assert entry.attempts == attempt
+
+    assert entry.status == "failed"
+    assert "503" in entry.last_error
+
+
+def test_permanent_failure_is_not_retried(db_session, worker, gmail, user):
+    gmail.send_email.side_effect = HttpError(httplib2.Response({"status": 400}), b"{}")
+    entry = OutboxService.enqueue(db_session, user, "send", {"to": ["a@example.com"], "subject": "S", "body": "B"})
+    worker.process_one(db_session)
+    db_session.refresh(entry)
+    assert entry.status == "failed"
+    assert entry.attempts == 1
+
+
+def test_requeue_stale_sending(db_session, user):
+    entry = OutboxService.enqueue(db_session, user, "send", {"to": [], "subject": "", "body": ""})
+    entry.status = "sending"
+    entry.updated_at = datetime.utcnow() - timedelta(hours=1)
+    db_session.commit()
+
+    assert OutboxService.requeue_stale(db_session, 300) == 1
+    db_session.refresh(entry)
+    assert entry.status == "queued"
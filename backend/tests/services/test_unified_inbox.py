@@ -0,0 +1,105 @@
+import pytest
+from datetime import datetime, timedelta
+from app.schemas.email import EmailPreview, PaginatedEmails
+from app.services.unified_inbox import UnifiedInbox, decode_cursor
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+class FakeAccount:
+    """Paginates a fixed newest-first inbox the way messages.list does."""
+
+    def __init__(self, name, minutes_ago):
+        self.previews = [
+            EmailPreview(id=f"{name}-{m}", sender=name, subject="", snippet="", date=NOW - timedelta(minutes=m), unread=False)
+            for m in sorted(minutes_ago)
+        ]
+        self.calls = 0
+
+    def list_inbox_emails(self, max_results=20, page_token=""):
+        self.calls += 1
+        start = int(page_token or 0)
+        end = start + max_results
+        return PaginatedEmails(messages=self.previews[start:end],
+                               nextPageToken=str(end) if end < len(self.previews) else None)
+
+
+def _walk(inbox, accounts, page_size):
+    pages, token = [], None
+    while True:
+        page = inbox.list(accounts, page_token=token, max_results=page_size)
+        pages.append(page.messages)
+        token = page.nextPageToken
+        if not token:
+            return pages
+
+
+def test_unified_inbox_merges_accounts_by_date():
+    fakes = {
+        "a@example.com": FakeAccount("a", [1, 4, 5, 9, 12, 13, 20]),
+        "b@example.com": FakeAccount("b", [2, 3, 10, 11]),
+        "c@example.com": FakeAccount("c", [6, 7, 8, 30, 31]),
+    }
+    inbox = UnifiedInbox(service_factory=lambda fake: fake)
+    pages = _walk(inbox, {email: fake for email, fake in fakes.items()}, page_size=3)
+
+    merged = [m for page in pages for m in page]
+    dates = [m.date for m in merged]
+    assert dates == sorted(dates, reverse=True)
+    assert len(merged) == 16
+    assert len({m.id for m in merged}) == 16
+    assert all(m.account == f"{m.sender}@example.com" for m in merged)
+    assert all(0 < len(page) <= 3 for page in pages)
+
+
+def test_failed_account_is_retried_on_next_page():
+    class Flaky(FakeAccount):
+        def list_inbox_emails(self, max_results=20, page_token=""):
+            if self.calls == 0:
+                self.calls += 1
+                raise RuntimeError("boom")
+            return super().list_inbox_emails(max_results, page_token)
+
+    accounts = {"a@example.com": FakeAccount("a", [1]), "b@example.com": Flaky("b", [2])}
+    inbox = UnifiedInbox(service_factory=lambda fake: fake)
+    first = inbox.list(accounts, max_results=5)
+    assert [m.id for m in first.messages] == ["a-1"]
+    assert first.nextPageToken is not None
+    assert first.partial
+
+    second = inbox.list(accounts, page_token=first.nextPageToken, max_results=5)
+    assert [m.id for m in second.messages] == ["b-2"]
+    assert second.nextPageToken is None
+    assert not second.partial
+
+
+def test_page_cut_short_by_deadline_is_refetched():
+    class Slow(FakeAccount):
+        def list_inbox_emails(self, max_results=20, page_token=""):
+            page = super().list_inbox_emails(max_results, page_token)
+            if self.calls == 1:
+                page.messages, page.partial = page.messages[:1], True
+            return page
+
+    accounts = {"a@example.com": FakeAccount("a", [1]), "b@example.com": Slow("b", [2, 3])}
+    inbox = UnifiedInbox(service_factory=lambda fake: fake)
+    first = inbox.list(accounts, max_results=5)
+    assert [m.id for m in first.messages] == ["a-1"] and first.partial
+    second = inbox.list(accounts, page_token=first.nextPageToken, max_results=5)
+    assert [m.id for m in second.messages] == ["b-2", "b-3"]
+
+
+def test_continuing_within_a_gmail_page_reuses_it():
+    fakes = {"a@example.com": FakeAccount("a", [1, 3, 5, 7]), "b@example.com": FakeAccount("b", [2, 4, 6, 8])}
+    inbox = UnifiedInbox(service_factory=lambda fake: fake)
+    pages = _walk(inbox, fakes, page_size=3)
+    assert [m.id for m in pages[0]] == ["a-1", "b-2", "a-3"]
+    assert sum(len(page) for page in pages) == 8
+    # Each account's two Gmail pages are fetched once, however many unified pages they span
+    assert len(pages) > 2
+    assert [fake.calls for fake in fakes.values()] == [2, 2]
+
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
@@ -0,0 +1,45 @@
+import os
+from app.core.blob_store import BlobStore
+
+
+def test_blob_store_dedupes_and_reads_through_mmap(tmp_path):
+    store = BlobStore(root=str(tmp_path), max_bytes=1000)
+    digest = store.put(b"hello body")
+    assert store.put(b"hello body") == digest
+    assert store.stats()['blobs'] == 1
+
+    view = store.open(digest)
+    assert bytes(view) == b"hello body"
+    view.release()
+    assert store.read_text(digest) == "hello body"
+    assert store.read_text(store.put(b"")) == ""
+    assert store.open("0" * 64) is None
+
+
+def test_blob_store_evicts_least_recently_used(tmp_path):
+    store = BlobStore(root=str(tmp_path), max_bytes=250)
+    first, second = store.put(b"a" * 100), store.put(b"b" * 100)
+    store.read_text(first)  # first is now the most recently used
+    third = store.put(b"c" * 100)
+
+    assert store.open(second) is None
+    assert store.read_text(first) == "a" * 100
+    assert store.read_text(third) == "c" * 100
+    assert store.stats()['bytes'] == 200
+    assert store.stats()['evictions'] == 1
+
+
+def test_blob_store_survives_restart(tmp_path):
+    store = BlobStore(root=str(tmp_path), max_bytes=250)
+    old, new = store.put(b"o" * 100), store.put(b"n" * 100)
+    store.link("user:body:m1", new)
+    os.utime(store._blob_path(old), (1, 1))
+
+    reopened = BlobStore(root=str(tmp_path), max_bytes=250)
+    assert reopened.resolve("user:body:m1") == new
+    assert reopened.resolve("user:body:unknown") is None
+    assert reopened.stats()['bytes'] == 200
+    # LRU order is rebuilt from mtimes, so the older blob goes first
+    reopened.put(b"x" * 100)
+    assert reopened.open(old) is None
+    assert reopened.read_text(new) == "n" * 100
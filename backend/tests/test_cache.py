@@ -37,3 +37,59 @@ def test_cache_decorator():
     time.sleep(2.1)
     assert expensive_func(10) == 20
     assert call_count == 3
+
+def test_compute_once_coalesces_concurrent_misses():
+    import threading
+    cache = CacheManager()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(2)
+        return "inbox"
+
+    owner = threading.Thread(target=cache.compute_once, args=("k", slow))
+    owner.start()
+    started.wait(2)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_set("k", slow)))
+    waiter.start()
+    release.set()
+    owner.join(2)
+    waiter.join(2)
+
+    assert results == ["inbox"]
+    assert len(calls) == 1
+
+def test_large_models_are_stored_compressed():
+    from datetime import datetime
+    from app.core.cache import CompressedEntry
+    from app.schemas.email import EmailPreview, PaginatedEmails
+
+    cache = CacheManager(compression="zlib", compress_min_bytes=512)
+    page = PaginatedEmails(messages=[
+        EmailPreview(id=str(i), sender="Alice <alice@example.com>", subject=f"Status update {i}",
+                     snippet="Here is the weekly status update for the project " * 3,
+                     date=datetime(2024, 1, 1, 12, i), unread=i % 2 == 0)
+        for i in range(20)
+    ], nextPageToken="next")
+    cache.set("inbox", page)
+    cache.set("small", EmailPreview(id="1", sender="a", subject="b", snippet="c", date=datetime(2024, 1, 1), unread=False))
+    cache.set("other", {"plain": "dict"})
+
+    assert isinstance(cache._cache["inbox"]["value"], CompressedEntry)
+    assert cache.get("inbox") == page
+    assert isinstance(cache._cache["small"]["value"], EmailPreview)
+    assert cache.get("other") == {"plain": "dict"}
+
+    stats = cache.stats()
+    assert stats["compressed"] == 1
+    inbox = cache._cache["inbox"]
+    assert inbox["raw_size"] > 3 * inbox["size"]
+    assert stats["bytes"] < stats["raw_bytes"]
+
+    cache.delete("inbox")
+    cache.invalidate_prefix("small")
+    assert cache.stats()["bytes"] == cache.stats()["raw_bytes"] == cache.stats()["compressed"] == 0
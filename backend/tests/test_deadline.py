@@ -0,0 +1,118 @@
+import time
+from datetime import datetime
+import pytest
+from app.core.cache import INBOX_NAMESPACE, build_cache_key, cache_manager, cache_response
+from app.core.deadline import CircuitOpenError, DeadlineExceeded, deadline_scope, remaining
+from app.schemas.email import EmailPreview, PaginatedEmails
+from app.services.gmail_scheduler import GmailScheduler
+from app.services.gmail_service import GmailService
+from unittest.mock import MagicMock
+
+USER = "user@example.com"
+
+
+def test_nested_scopes_keep_the_earliest_deadline():
+    with deadline_scope(10) as outer:
+        with deadline_scope(60):
+            assert remaining() <= 10
+        with deadline_scope(1) as inner:
+            assert remaining() <= 1
+            inner.stale = True
+        assert outer.stale
+    assert remaining() is None
+
+
+MESSAGE = {'id': '1', 'internalDate': '1609459200000', 'snippet': '', 'labelIds': ['INBOX'],
+           'payload': {'headers': [{'name': 'From', 'value': 'a@example.com'}]}}
+
+
+def _service():
+    service = GmailService({'access_token': 'test', 'refresh_token': 'test', 'client_id': 'test', 'client_secret': 'test'})
+    service.scheduler = GmailScheduler(USER, sleep=lambda seconds: None)
+    service.service = MagicMock()
+    service.service.users().messages().list().execute.return_value = {
+        'messages': [{'id': '1'}, {'id': '2'}, {'id': '3'}], 'nextPageToken': 'abc'}
+    return service
+
+
+def test_inbox_page_is_cut_short_at_the_deadline():
+    service = _service()
+
+    with deadline_scope(10) as budget:
+        def get():
+            # The first message uses up the rest of the budget
+            budget.deadline = time.monotonic()
+            return MESSAGE
+        service.service.users().messages().get().execute.side_effect = get
+        page = service.list_inbox_emails()
+
+    assert page.partial
+    assert [m.id for m in page.messages] == ['1']
+    assert page.nextPageToken == 'abc'
+
+
+def test_stale_entries_are_served_while_gmail_is_unavailable():
+    outage = []
+
+    @cache_response(ttl_seconds=0)
+    def lookup(x, service=None):
+        if outage:
+            raise outage[0]
+        return x * 2
+
+    assert lookup(2) == 4
+    outage.append(CircuitOpenError(USER, "messages.list", 30))
+    with deadline_scope(10) as budget:
+        assert lookup(2) == 4
+    assert budget.stale
+    with pytest.raises(CircuitOpenError):
+        lookup(3)
+
+
+def test_open_get_breaker_serves_the_last_good_page():
+    service = _service()
+    service.service.users().messages().get().execute.return_value = MESSAGE
+    inbox = cache_response(ttl_seconds=0, namespace=INBOX_NAMESPACE)(lambda service=None: service.list_inbox_emails())
+    assert len(inbox(service=service).messages) == 3
+
+    # messages.list still works, but every messages.get fails fast
+    breaker = service.scheduler.breaker('messages.get')
+    for _ in range(breaker.threshold):
+        breaker.on_failure()
+    with deadline_scope(10) as budget:
+        page = inbox(service=service)
+    assert budget.stale and not page.partial
+    assert len(page.messages) == 3
+    with pytest.raises(CircuitOpenError):
+        service.list_sent_emails()
+
+
+def test_unavailable_gmail_responses(client_with_mocked_gmail, mock_gmail_service):
+    mock_gmail_service.user_email = USER
+    mock_gmail_service.list_inbox_emails.side_effect = CircuitOpenError(USER, "messages.list", 12.5)
+    response = client_with_mocked_gmail.get("/api/gmail/inbox")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "13"
+    assert response.json()["detail"]["error"] == "GMAIL_UNAVAILABLE"
+
+    mock_gmail_service.list_inbox_emails.side_effect = DeadlineExceeded("Deadline passed before messages.list")
+    response = client_with_mocked_gmail.get("/api/gmail/inbox")
+    assert response.status_code == 504
+
+    # Partial pages are returned but not cached; an expired page is served stale
+    page = PaginatedEmails(messages=[EmailPreview(id="1", sender="a", subject="b", snippet="", date=datetime(2024, 1, 1),
+                                                  unread=False)], partial=True)
+    mock_gmail_service.list_inbox_emails.side_effect = None
+    mock_gmail_service.list_inbox_emails.return_value = page
+    assert client_with_mocked_gmail.get("/api/gmail/inbox").json()["partial"]
+    key = build_cache_key(INBOX_NAMESPACE, USER, page_token=None)
+    assert cache_manager.get(key) is None
+
+    page.partial = False
+    client_with_mocked_gmail.get("/api/gmail/inbox")
+    cache_manager._cache[key]['expiry'] = time.time() - 1
+    mock_gmail_service.list_inbox_emails.side_effect = CircuitOpenError(USER, "messages.list", 5)
+    response = client_with_mocked_gmail.get("/api/gmail/inbox")
+    assert response.status_code == 200
+    assert response.headers["warning"] == '110 - "Response is Stale"'
+    assert response.json()["messages"][0]["id"] == "1"
@@ -68,52 +68,106 @@ def test_reply_email(mock_gmail_service):
     assert "sender@example.com" in msg['To']
     assert msg['In-Reply-To'] == "<original@example.com>"
 
+def test_reply_email_uses_cached_detail(mock_gmail_service):
+    from datetime import datetime
+    from app.core.cache import MESSAGE_DETAIL_NAMESPACE, build_cache_key, cache_manager
+    from app.schemas.email import EmailDetail
+    from app.services.gmail_service import pack_detail
+
+    mock_gmail_service.user_email = "me@example.com"
+    detail = EmailDetail(id="12345", sender="sender@example.com", subject="Cached Subject",
+                         date=datetime(2024, 1, 1), body="", dataset="gmail", unread=False,
+                         threadId="thread123", replyTo="list@example.com",
+                         messageIdHeader="<original@example.com>", references="<root@example.com>")
+    cache_manager.set(build_cache_key(MESSAGE_DETAIL_NAMESPACE, "me@example.com", message_id="12345"), pack_detail(detail), 60)
+
+    try:
+        mock_gmail_service.reply_email("12345", "Thanks!")
+    finally:
+        cache_manager.clear()
+
+    # No metadata round-trip when the detail is cached
+    mock_gmail_service.service.users().messages().get.assert_not_called()
+
+    kwargs = mock_gmail_service.service.users().messages().send.call_args[1]
+    assert kwargs['body']['threadId'] == "thread123"
+    from email import message_from_bytes
+    msg = message_from_bytes(base64.urlsafe_b64decode(kwargs['body']['raw']))
+    assert msg['Subject'] == "Re: Cached Subject"
+    assert msg['To'] == "list@example.com"
+    assert msg['In-Reply-To'] == "<original@example.com>"
+    assert msg['References'] == "<root@example.com> <original@example.com>"
+
 def test_forward_email(mock_gmail_service):
     original_message_id = "12345"
     forward_to = ["recipient@example.com"]
     forward_body = "Check this out."
-    
-    # Mock original email detail retrieval
-    # We need to mock get_email_detail since forward_email calls it
-    # But get_email_detail calls service.get, so let's mock service.get return values
-    
-    mock_return_val = {
+
+    original_raw = (
+        b"From: original@sender.com\r\n"
+        b"Subject: Original Subject\r\n"
+        b"Content-Type: text/html; charset=utf-8\r\n\r\n"
+        b"<p>Original Body</p>\r\n"
+    )
+    mock_gmail_service.service.users().messages().get.return_value.execute.return_value = {
         "id": original_message_id,
-        "internalDate": "1600000000000",
-        "labelIds": [],
-        "payload": {
-            "headers": [
-                {"name": "Subject", "value": "Original Subject"},
-                {"name": "From", "value": "original@sender.com"}
-            ],
-            "body": {"data": base64.urlsafe_b64encode(b"Original Body").decode('utf-8')}
-        },
-        "snippet": "Original snippet"
+        "raw": base64.urlsafe_b64encode(original_raw).decode('utf-8'),
     }
 
-    mock_gmail_service.service.users().messages().get.return_value.execute.return_value = mock_return_val
-    
     # Execute forward
     mock_gmail_service.forward_email(original_message_id, forward_to, forward_body)
-    
-    # Verify send was called
+
+    # The original is fetched once, in raw form
+    mock_gmail_service.service.users().messages().get.assert_called_with(
+        userId='me', id=original_message_id, format='raw'
+    )
+
     send_mock = mock_gmail_service.service.users().messages().send
     assert send_mock.called
-    
-    # Check content
-    kwargs = send_mock.call_args[1]
-    raw = kwargs['body']['raw']
-    decoded_bytes = base64.urlsafe_b64decode(raw)
+
+    decoded_bytes = base64.urlsafe_b64decode(send_mock.call_args[1]['body']['raw'])
     from email import message_from_bytes
     msg = message_from_bytes(decoded_bytes)
-    
+
     assert msg['Subject'] == "Fwd: Original Subject"
     assert "recipient@example.com" in msg['To']
-    
-    payload = msg.get_payload()
-    # Payload might be a list if multipart or string if plain
-    body_content = payload if isinstance(payload, str) else payload[0].get_payload()
-    
-    assert "Check this out." in body_content
-    assert "---------- Forwarded message ---------" in body_content
-    assert "Original Body" in body_content
+
+    intro, attached = msg.get_payload()
+    intro_text = intro.get_payload(decode=True).decode()
+    assert "Check this out." in intro_text
+    assert "---------- Forwarded message ---------" in intro_text
+    assert "From: original@sender.com" in intro_text
+
+    # The original travels untouched as message/rfc822
+    assert attached.get_content_type() == "message/rfc822"
+    assert original_raw in decoded_bytes
+
+
+def test_forward_email_takes_the_intro_from_the_raw_headers(mock_gmail_service):
+    from datetime import datetime
+    from app.core.cache import MESSAGE_DETAIL_NAMESPACE, build_cache_key, cache_manager
+    from app.schemas.email import EmailDetail
+    from app.services.gmail_service import pack_detail
+
+    mock_gmail_service.user_email = "me@example.com"
+    detail = EmailDetail(id="12345", sender="Cached <cached@sender.com>", subject="Cached Subject",
+                         date=datetime(2024, 1, 1), body="", dataset="gmail", unread=False)
+    cache_manager.set(build_cache_key(MESSAGE_DETAIL_NAMESPACE, "me@example.com", message_id="12345"), pack_detail(detail), 60)
+    mock_gmail_service.service.users().messages().get.return_value.execute.return_value = {
+        "id": "12345",
+        "raw": base64.urlsafe_b64encode(b"From: Raw <raw@sender.com>\r\nDate: Mon, 01 Jan 2024 09:00:00 +0000\r\n"
+                                        b"Subject: Raw Subject\r\n\r\nbody").decode('utf-8'),
+    }
+
+    try:
+        mock_gmail_service.forward_email("12345", ["recipient@example.com"], "FYI")
+    finally:
+        cache_manager.clear()
+
+    decoded_bytes = base64.urlsafe_b64decode(
+        mock_gmail_service.service.users().messages().send.call_args[1]['body']['raw'])
+    from email import message_from_bytes
+    msg = message_from_bytes(decoded_bytes)
+    assert msg['Subject'] == "Fwd: Raw Subject"
+    intro_text = msg.get_payload()[0].get_payload(decode=True).decode()
+    assert "From: Raw <raw@sender.com>\r\nDate: Mon, 01 Jan 2024 09:00:00 +0000\r\n" in intro_text
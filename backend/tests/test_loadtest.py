@@ -0,0 +1,78 @@
+import base64
+from fastapi.testclient import TestClient
+from loadtest.fake_gmail import FakeGmailConfig, create_app
+from loadtest.run_load import parse_mix, percentile
+
+AUTH = {"Authorization": "Bearer fake-access:alice@example.com"}
+
+
+def fake_client(**config):
+    return TestClient(create_app(FakeGmailConfig(mailbox_size=30, seed=7, **config)))
+
+
+def test_token_exchange_selects_account():
+    client = fake_client()
+    response = client.post("/token", data={"grant_type": "authorization_code", "code": "alice@example.com"})
+    assert response.json()["access_token"] == "fake-access:alice@example.com"
+
+    info = client.get("/oauth2/v2/userinfo", headers=AUTH).json()
+    assert info["email"] == "alice@example.com"
+
+
+def test_list_get_send_trash_and_history():
+    client = fake_client()
+    start = client.get("/gmail/v1/users/me/profile", headers=AUTH).json()["historyId"]
+
+    page = client.get("/gmail/v1/users/me/messages", params={"labelIds": "INBOX", "maxResults": 5}, headers=AUTH).json()
+    assert len(page["messages"]) == 5
+    assert page["nextPageToken"] == "5"
+
+    message_id = page["messages"][0]["id"]
+    full = client.get(f"/gmail/v1/users/me/messages/{message_id}", headers=AUTH).json()
+    assert {p["mimeType"] for p in full["payload"]["parts"]} == {"text/plain", "text/html"}
+    metadata = client.get(f"/gmail/v1/users/me/messages/{message_id}",
+                          params={"format": "metadata", "metadataHeaders": "Subject"}, headers=AUTH).json()
+    assert [h["name"] for h in metadata["payload"]["headers"]] == ["Subject"]
+
+    raw = base64.urlsafe_b64encode(b"To: bob@example.org\r\nSubject: Hi\r\n\r\nHello").decode()
+    sent = client.post("/gmail/v1/users/me/messages/send", json={"raw": raw}, headers=AUTH).json()
+    assert sent["labelIds"] == ["SENT"]
+    client.post(f"/gmail/v1/users/me/messages/{message_id}/trash", headers=AUTH)
+
+    history = client.get("/gmail/v1/users/me/history", params={"startHistoryId": start}, headers=AUTH).json()
+    assert history["history"][0]["messagesAdded"][0]["message"]["id"] == sent["id"]
+    assert history["history"][1]["labelsAdded"][0]["labelIds"] == ["TRASH"]
+
+    expired = client.get("/gmail/v1/users/me/history", params={"startHistoryId": 1}, headers=AUTH)
+    assert expired.status_code == 404
+
+
+def test_batch_dispatches_each_part():
+    client = fake_client()
+    ids = [m["id"] for m in client.get("/gmail/v1/users/me/messages", params={"maxResults": 2}, headers=AUTH).json()["messages"]]
+    body = "".join(
+        f"--xyz\r\nContent-Type: application/http\r\nContent-ID: <req+{i}>\r\n\r\n"
+        f"GET /gmail/v1/users/me/messages/{message_id}?format=minimal HTTP/1.1\n"
+        f"Authorization: {AUTH['Authorization']}\n\n"
+        for i, message_id in enumerate(ids)
+    ) + "--xyz--\r\n"
+
+    response = client.post("/batch/gmail/v1", content=body, headers={"Content-Type": 'multipart/mixed; boundary="xyz"'})
+    assert response.status_code == 200
+    assert "Content-ID: <response-req+0>" in response.text
+    assert ids[1] in response.text
+
+
+def test_error_injection():
+    client = fake_client(error_rate=1.0, error_status=429)
+    response = client.get("/gmail/v1/users/me/messages", headers=AUTH)
+    assert response.status_code == 429
+    assert response.json()["error"]["errors"][0]["reason"] == "rateLimitExceeded"
+
+
+def test_report_helpers():
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 99) == 99
+    assert percentile([], 95) == 0.0
+    assert parse_mix("inbox=3,detail") == {"inbox": 3, "detail": 1}
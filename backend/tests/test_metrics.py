@@ -0,0 +1,46 @@
+from fastapi.testclient import TestClient
+from app.core.cache import cache_manager
+from app.core.metrics import observe_gmail_call
+from app.schemas.email import PaginatedEmails
+
+
+def test_metrics_endpoint_exposes_prometheus_text(client: TestClient):
+    client.get("/api/health")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'mailflow_http_request_duration_seconds_count{method="GET",route="/api/health",status="200"}' in body
+    assert "mailflow_http_requests_in_flight" in body
+    assert "mailflow_cache_entries" in body
+
+
+def test_cache_stats_reported(client: TestClient):
+    cache_manager.clear()
+    cache_manager.set("metrics_key", "value", ttl_seconds=60)
+    cache_manager.get("metrics_key")
+    cache_manager.get("missing_key")
+
+    stats = cache_manager.stats()
+    assert stats["size"] == 1
+    assert stats["hits"] >= 1
+    assert stats["misses"] >= 1
+
+    body = client.get("/metrics").text
+    assert "mailflow_cache_hits_total" in body
+    assert "mailflow_cache_evictions_total" in body
+
+
+def test_gmail_calls_counted_per_request(client_with_mocked_gmail: TestClient, mock_gmail_service):
+    def list_inbox(page_token=None):
+        observe_gmail_call("messages.list", 0.01)
+        observe_gmail_call("messages.get", 0.01)
+        return PaginatedEmails(messages=[], nextPageToken=None)
+
+    mock_gmail_service.list_inbox_emails.side_effect = list_inbox
+    client_with_mocked_gmail.get("/api/gmail/inbox")
+
+    body = client_with_mocked_gmail.get("/metrics").text
+    assert 'mailflow_gmail_api_duration_seconds_count{method="messages.list",outcome="ok"}' in body
+    assert 'mailflow_gmail_calls_per_request_sum{route="/api/gmail/inbox"} 2.0' in body
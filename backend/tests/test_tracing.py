@@ -0,0 +1,74 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.core.tracing import SlowRequestLog, TracingMiddleware, slow_request_log, span, traced
+from app.schemas.email import PaginatedEmails
+
+
+def test_span_is_noop_without_active_trace():
+    with span("outside") as s:
+        assert s is None
+
+    @traced("plain")
+    def plain(x):
+        return x + 1
+
+    assert plain(1) == 2
+
+
+def test_server_timing_header(client_with_mocked_gmail: TestClient, mock_gmail_service):
+    def list_inbox(page_token=None):
+        with span("gmail.messages.list"):
+            pass
+        for _ in range(3):
+            with span("gmail.messages.get"):
+                pass
+        return PaginatedEmails(messages=[], nextPageToken=None)
+
+    mock_gmail_service.list_inbox_emails.side_effect = list_inbox
+    response = client_with_mocked_gmail.get("/api/gmail/inbox")
+
+    timing = response.headers["server-timing"]
+    assert "gmail.messages.list;dur=" in timing
+    assert 'gmail.messages.get;dur=' in timing and 'desc="x3"' in timing
+    assert "serialize;dur=" in timing
+    assert "total;dur=" in timing
+
+
+def test_slow_requests_recorded_in_ring_buffer():
+    log = SlowRequestLog(maxlen=2)
+    app = FastAPI()
+
+    @app.get("/work")
+    def work():
+        with span("step"):
+            with span("inner"):
+                pass
+        return {"ok": True}
+
+    app.add_middleware(TracingMiddleware, threshold_ms=0, log=log)
+    client = TestClient(app)
+    for _ in range(3):
+        client.get("/work")
+
+    entries = log.entries()
+    assert len(entries) == 2
+    assert entries[0]["path"] == "/work"
+    assert entries[0]["status"] == 200
+    step = entries[0]["spans"]["children"][0]
+    assert step["name"] == "step"
+    assert step["children"][0]["name"] == "inner"
+
+
+def test_admin_slow_requests_requires_token(client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", None)
+    assert client.get("/api/admin/slow-requests").status_code == 403
+
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "s3cret")
+    assert client.get("/api/admin/slow-requests", headers={"X-Admin-Token": "nope"}).status_code == 403
+
+    slow_request_log.clear()
+    slow_request_log.record({"path": "/api/gmail/inbox", "duration_ms": 4200.0, "spans": {}})
+    response = client.get("/api/admin/slow-requests", headers={"X-Admin-Token": "s3cret"})
+    assert response.status_code == 200
+    assert response.json()["requests"][0]["path"] == "/api/gmail/inbox"
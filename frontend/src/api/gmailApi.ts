@@ -1,6 +1,9 @@
 import { apiClient as client } from './client';
-import type { EmailPreview, EmailDetail, SendEmailPayload, PaginatedResponse, ReplyEmailPayload, ForwardEmailPayload } from '../types/email';
+import type { EmailPreview, EmailDetail, ScoredEmail, SendEmailPayload, PaginatedResponse, ReplyEmailPayload, ForwardEmailPayload } from '../types/email';
 import type { UserProfile } from '../types/user';
+import type { MailboxAnalytics } from '../types/analytics';
+import type { ContactSuggestion } from '../types/contact';
+import type { LabelInfo } from '../types/label';
 import { env } from '../config/env';
 
 export const gmailApi = {
@@ -33,6 +36,14 @@ export const gmailApi = {
         return response.data;
     },
 
+    // Inbox of every account linked to the session, merged by date
+    getUnifiedInbox: async (pageToken?: string): Promise<PaginatedResponse> => {
+        const response = await client.get<PaginatedResponse>('/gmail/unified', {
+            params: { page_token: pageToken }
+        });
+        return response.data;
+    },
+
     getSent: async (pageToken?: string): Promise<PaginatedResponse> => {
         const response = await client.get<PaginatedResponse>('/gmail/sent', {
             params: { page_token: pageToken }
@@ -45,6 +56,14 @@ export const gmailApi = {
         return response.data;
     },
 
+    markRead: async (id: string, unread = false): Promise<void> => {
+        await client.post(`/gmail/messages/${id}/read`, null, { params: { unread } });
+    },
+
+    modifyLabels: async (ids: string[], addLabelIds: string[] = [], removeLabelIds: string[] = []): Promise<void> => {
+        await client.post('/gmail/messages/modify', { ids, addLabelIds, removeLabelIds });
+    },
+
     sendEmail: async (payload: SendEmailPayload): Promise<void> => {
         await client.post('/gmail/send', payload);
     },
@@ -66,5 +85,50 @@ export const gmailApi = {
             params: { q: query }
         });
         return response.data;
+    },
+
+    // Ranked against the local index of fully synced mail
+    findSimilarEmails: async (query: string, k = 10): Promise<ScoredEmail[]> => {
+        const response = await client.get<ScoredEmail[]>('/gmail/similar', {
+            params: { q: query, k }
+        });
+        return response.data;
+    },
+
+    // Plain-text summarisation context, trimmed to about `budget` tokens
+    getThreadContext: async (threadId: string, budget?: number): Promise<string> => {
+        const response = await client.get<string>(`/gmail/threads/${threadId}/context`, {
+            params: { budget },
+            responseType: 'text'
+        });
+        return response.data;
+    },
+
+    getDayContext: async (day: string, budget?: number): Promise<string> => {
+        const response = await client.get<string>('/gmail/context/day', {
+            params: { day, budget, tz_offset: -new Date().getTimezoneOffset() },
+            responseType: 'text'
+        });
+        return response.data;
+    },
+
+    // Needs a completed (or running) full sync; 404 otherwise
+    getAnalytics: async (days = 30): Promise<MailboxAnalytics> => {
+        const response = await client.get<MailboxAnalytics>('/gmail/analytics', {
+            params: { days, tz_offset: -new Date().getTimezoneOffset() }
+        });
+        return response.data;
+    },
+
+    getLabels: async (): Promise<LabelInfo[]> => {
+        const response = await client.get<LabelInfo[]>('/gmail/labels');
+        return response.data;
+    },
+
+    suggestContacts: async (prefix: string, limit = 8): Promise<ContactSuggestion[]> => {
+        const response = await client.get<ContactSuggestion[]>('/gmail/contacts/suggest', {
+            params: { prefix, limit }
+        });
+        return response.data;
     }
 };
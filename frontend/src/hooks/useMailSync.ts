@@ -1,14 +1,54 @@
 import { useEffect } from 'react';
 import { useMailStore } from '../store/mailStore';
+import { env } from '../config/env';
+import type { MailboxDelta } from '../types/email';
 
+// Live inbox updates over Server-Sent Events; falls back to polling when the
+// browser has no EventSource or the stream cannot be kept open.
 export const useMailSync = (intervalMs: number = 10000) => {
-    const { checkNewEmails } = useMailStore();
+    const { checkNewEmails, applyMailDelta, fetchInbox } = useMailStore();
 
     useEffect(() => {
-        const intervalId = setInterval(() => {
-            checkNewEmails();
-        }, intervalMs);
+        let intervalId: ReturnType<typeof setInterval> | null = null;
+        const startPolling = () => {
+            if (intervalId === null) {
+                intervalId = setInterval(() => {
+                    checkNewEmails();
+                }, intervalMs);
+            }
+        };
 
-        return () => clearInterval(intervalId);
-    }, [checkNewEmails, intervalMs]);
+        if (typeof EventSource === 'undefined') {
+            startPolling();
+            return () => {
+                if (intervalId !== null) clearInterval(intervalId);
+            };
+        }
+
+        // The browser reconnects on its own and sends Last-Event-ID so missed deltas are replayed
+        const source = new EventSource(`${env.BACKEND_URL}/gmail/events`, { withCredentials: true });
+        source.addEventListener('delta', (event) => {
+            applyMailDelta(JSON.parse((event as MessageEvent).data) as MailboxDelta);
+        });
+        source.addEventListener('resync', () => {
+            fetchInbox(undefined, true);
+        });
+        source.onopen = () => {
+            if (intervalId !== null) {
+                clearInterval(intervalId);
+                intervalId = null;
+            }
+        };
+        source.onerror = () => {
+            // CLOSED means the browser gave up (e.g. 401 or no SSE support upstream)
+            if (source.readyState === EventSource.CLOSED) {
+                startPolling();
+            }
+        };
+
+        return () => {
+            source.close();
+            if (intervalId !== null) clearInterval(intervalId);
+        };
+    }, [checkNewEmails, applyMailDelta, fetchInbox, intervalMs]);
 };
@@ -1,6 +1,6 @@
 
 import { create } from 'zustand';
-import type { EmailPreview, EmailDetail } from '../types/email';
+import type { EmailPreview, EmailDetail, MailboxDelta } from '../types/email';
 import { gmailApi } from '../api/gmailApi';
 import { useUIStore } from './uiStore';
 
@@ -45,6 +45,7 @@ interface MailState {
     fetchInbox: (pageToken?: string, silent?: boolean) => Promise<void>;
     fetchSent: (pageToken?: string, silent?: boolean) => Promise<void>;
     checkNewEmails: () => Promise<void>;
+    applyMailDelta: (delta: MailboxDelta) => void;
     openEmail: (id: string) => Promise<void>;
     searchEmails: (query: string) => Promise<void>;
     clearSearch: () => void;
@@ -288,11 +289,61 @@ export const useMailStore = create<MailState>((set, get) => ({
         }
     },
 
+    applyMailDelta: (delta: MailboxDelta) => {
+        if (delta.resync) {
+            get().fetchInbox(undefined, true);
+            return;
+        }
+
+        const removed = new Set(delta.deleted);
+        const unread = new Map<string, boolean>();
+        for (const change of delta.labelsChanged) {
+            if (!change.labelIds.includes('INBOX') || change.labelIds.includes('TRASH')) {
+                removed.add(change.id);
+            } else {
+                unread.set(change.id, change.labelIds.includes('UNREAD'));
+            }
+        }
+
+        const update = (emails: EmailPreview[]) => emails
+            .filter(e => !removed.has(e.id))
+            .map(e => unread.has(e.id) ? { ...e, unread: unread.get(e.id)! } : e);
+
+        set((s) => {
+            const knownIds = new Set(s.inboxSnapshot.map(e => e.id));
+            const added = delta.added.filter(e => !knownIds.has(e.id));
+            const isInboxView = s.inboxPage === 1 && !s.searchQuery;
+
+            if (added.length > 0 && !isInboxView) {
+                useUIStore.getState().showNotification(
+                    `You have ${added.length} new email${added.length > 1 ? 's' : ''}`,
+                    'info'
+                );
+            }
+
+            const inboxSnapshot = [...added, ...update(s.inboxSnapshot)];
+            return {
+                inboxSnapshot,
+                inboxEmails: isInboxView ? [...added, ...update(s.inboxEmails)] : update(s.inboxEmails),
+                newEmailsCount: isInboxView ? s.newEmailsCount : s.newEmailsCount + added.length,
+            };
+        });
+    },
+
     openEmail: async (id: string) => {
         set({ isLoading: true, error: null, selectedEmail: null });
         try {
             const email = await gmailApi.getMessage(id);
-            set({ selectedEmail: email, isLoading: false });
+            if (email.unread) {
+                // The server shows the change at once and writes it to Gmail in batches
+                gmailApi.markRead(id).catch(() => undefined);
+                email.unread = false;
+            }
+            set(state => ({
+                selectedEmail: email,
+                isLoading: false,
+                inboxEmails: state.inboxEmails.map(e => e.id === id ? { ...e, unread: false } : e),
+            }));
         } catch {
             set({ error: 'Failed to open email', isLoading: false });
         }
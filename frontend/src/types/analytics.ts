@@ -0,0 +1,24 @@
+export interface SenderCount {
+    sender: string;
+    name: string | null;
+    messages: number;
+    unread: number;
+}
+
+export interface MailboxAnalytics {
+    history_id: string | null;
+    messages: number;
+    received: number;
+    unread: number;
+    top_senders: SenderCount[];
+    per_day: { day: string; messages: number }[];
+    per_hour: number[];
+    per_weekday: number[];
+    unread_by_label: { label: string; unread: number }[];
+    reply_latency: {
+        replies: number;
+        median_seconds: number | null;
+        p90_seconds: number | null;
+        mean_seconds: number | null;
+    };
+}
@@ -0,0 +1,5 @@
+export interface ContactSuggestion {
+    address: string;
+    name: string | null;
+    messages: number;
+}
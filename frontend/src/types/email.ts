@@ -5,10 +5,17 @@ export interface EmailPreview {
     snippet: string;
     date: string;
     unread: boolean;
+    account?: string | null;
+}
+
+export interface ScoredEmail extends EmailPreview {
+    score: number;
 }
 
 export interface EmailDetail extends EmailPreview {
     body: string;
+    labelIds?: string[];
+    threadId?: string | null;
 }
 
 export interface SendEmailPayload {
@@ -20,6 +27,8 @@ export interface SendEmailPayload {
 export interface PaginatedResponse {
     messages: EmailPreview[];
     nextPageToken: string | null;
+    // Set when the request deadline cut the page short
+    partial?: boolean;
 }
 
 export interface ReplyEmailPayload {
@@ -30,3 +39,16 @@ export interface ForwardEmailPayload {
     to: string[];
     body: string;
 }
+
+export interface MessageLabels {
+    id: string;
+    labelIds: string[];
+}
+
+export interface MailboxDelta {
+    historyId: string;
+    added: EmailPreview[];
+    deleted: string[];
+    labelsChanged: MessageLabels[];
+    resync: boolean;
+}
@@ -0,0 +1,7 @@
+export interface LabelInfo {
+    id: string;
+    name: string;
+    type: 'system' | 'user';
+    messagesTotal: number;
+    messagesUnread: number;
+}